@@ -0,0 +1,26 @@
+"""add book_versions.book_id index
+
+Revision ID: 20261016_book_version_idx
+Revises: 20260123_add_user_profile
+Create Date: 2026-10-16 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261016_book_version_idx"
+down_revision: Union[str, Sequence[str], None] = "20260123_add_user_profile"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 书籍列表按主版本关联/排序时使用
+    op.create_index("ix_book_versions_book_id", "book_versions", ["book_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_book_versions_book_id", table_name="book_versions")
@@ -0,0 +1,29 @@
+"""add book version encoding
+
+Revision ID: 20261016_version_encoding
+Revises: 20261016_library_stats
+Create Date: 2026-10-16 22:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261016_version_encoding"
+down_revision: Union[str, Sequence[str], None] = "20261016_library_stats"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # TXT 编码检测结果：阅读器和 Bot 直接使用，不再重复检测
+    op.add_column("book_versions", sa.Column("encoding", sa.String(length=32), nullable=True))
+    op.add_column("book_versions", sa.Column("encoding_confidence", sa.Float(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("book_versions", "encoding_confidence")
+    op.drop_column("book_versions", "encoding")
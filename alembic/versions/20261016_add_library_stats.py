@@ -0,0 +1,43 @@
+"""add library stats
+
+Revision ID: 20261016_library_stats
+Revises: 20261016_sample_hash
+Create Date: 2026-10-16 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261016_library_stats"
+down_revision: Union[str, Sequence[str], None] = "20261016_sample_hash"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 首页统计的物化表，首次读取时计算
+    op.create_table(
+        "library_stats",
+        sa.Column("library_id", sa.Integer(), nullable=False),
+        sa.Column("book_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("author_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("group_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("total_size", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("new_books_7d", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("latest_book_ids", sa.Text(), nullable=True),
+        sa.Column("change_seq", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("refreshed_seq", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("refreshed_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["library_id"], ["libraries.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("library_id"),
+    )
+    op.create_index("ix_books_library_added", "books", ["library_id", "added_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_books_library_added", table_name="books")
+    op.drop_table("library_stats")
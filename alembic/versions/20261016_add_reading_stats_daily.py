@@ -0,0 +1,53 @@
+"""add reading stats daily
+
+Revision ID: 20261016_reading_stats_daily
+Revises: 20261016_version_encoding
+Create Date: 2026-10-16 23:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261016_reading_stats_daily"
+down_revision: Union[str, Sequence[str], None] = "20261016_version_encoding"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 阅读统计汇总表；已有会话全部标记为待汇总，由定时任务或首次查询统计时补齐
+    op.create_table(
+        "reading_stats_daily",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("date", sa.Date(), nullable=False),
+        sa.Column("hour", sa.Integer(), nullable=False),
+        sa.Column("book_id", sa.Integer(), nullable=False),
+        sa.Column("seconds", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("sessions", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("last_read_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["book_id"], ["books.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("user_id", "date", "hour", "book_id"),
+    )
+    op.add_column("reading_sessions", sa.Column("rolled_seconds", sa.Integer(), nullable=True))
+    op.add_column(
+        "reading_sessions",
+        sa.Column("rollup_pending", sa.Boolean(), nullable=False, server_default="1"),
+    )
+    op.create_index(
+        "ix_reading_sessions_rollup_pending",
+        "reading_sessions",
+        ["user_id"],
+        sqlite_where=sa.text("rollup_pending = 1"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_reading_sessions_rollup_pending", table_name="reading_sessions")
+    op.drop_column("reading_sessions", "rollup_pending")
+    op.drop_column("reading_sessions", "rolled_seconds")
+    op.drop_table("reading_stats_daily")
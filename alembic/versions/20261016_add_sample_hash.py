@@ -0,0 +1,33 @@
+"""add sample hash to book versions
+
+Revision ID: 20261016_sample_hash
+Revises: 20261016_scan_manifest
+Create Date: 2026-10-16 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261016_sample_hash"
+down_revision: Union[str, Sequence[str], None] = "20261016_scan_manifest"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 两段式去重：先比对 大小 + 采样Hash，碰撞时才计算完整Hash，因此 file_hash 允许为空
+    with op.batch_alter_table("book_versions") as batch_op:
+        batch_op.add_column(sa.Column("sample_hash", sa.String(length=32), nullable=True))
+        batch_op.alter_column("file_hash", existing_type=sa.String(length=64), nullable=True)
+        batch_op.create_index("ix_book_versions_size_sample", ["file_size", "sample_hash"])
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("book_versions") as batch_op:
+        batch_op.drop_index("ix_book_versions_size_sample")
+        batch_op.alter_column("file_hash", existing_type=sa.String(length=64), nullable=False)
+        batch_op.drop_column("sample_hash")
@@ -0,0 +1,36 @@
+"""add scan manifest fields
+
+Revision ID: 20261016_scan_manifest
+Revises: 20261016_book_version_idx
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261016_scan_manifest"
+down_revision: Union[str, Sequence[str], None] = "20261016_book_version_idx"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 增量扫描清单：记录文件 mtime/inode，未变化的文件无需重新解析和计算 Hash
+    op.add_column("book_versions", sa.Column("file_mtime_ns", sa.BigInteger(), nullable=True))
+    op.add_column("book_versions", sa.Column("file_inode", sa.BigInteger(), nullable=True))
+
+    op.add_column("scan_tasks", sa.Column("unchanged_files", sa.Integer(), nullable=True, server_default="0"))
+    op.add_column("scan_tasks", sa.Column("updated_files", sa.Integer(), nullable=True, server_default="0"))
+    op.add_column("scan_tasks", sa.Column("missing_files", sa.Integer(), nullable=True, server_default="0"))
+
+
+def downgrade() -> None:
+    op.drop_column("scan_tasks", "missing_files")
+    op.drop_column("scan_tasks", "updated_files")
+    op.drop_column("scan_tasks", "unchanged_files")
+    op.drop_column("book_versions", "file_inode")
+    op.drop_column("book_versions", "file_mtime_ns")
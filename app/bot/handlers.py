@@ -16,10 +16,13 @@ from sqlalchemy import select, desc, func, or_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload
 
+from app.core import reading_stats, search_index
+from app.core.encoding_detector import detect_file_encoding, is_probably_binary_file
 from app.database import get_db
-from app.models import User, Book, Library, Author, ReadingProgress, ReadingSession, BookVersion, Favorite
+from app.models import User, Book, Library, Author, ReadingProgress, ReadingStatsDaily, BookVersion, Favorite
 from app.utils.logger import logger
 from app.utils.permissions import (
+    build_book_access_clause,
     get_accessible_library_ids,
     filter_books_by_access,
     check_book_access,
@@ -88,115 +91,6 @@ def _clean_txt_chunk(content: str) -> str:
     return re.sub(r'[\u200b\u200c\u200d\ufeff]', '', content)
 
 
-def _is_probably_binary_file(file_path: Path, sample_size: int = 8192) -> bool:
-    """根据文件头部字节判断是否为二进制文件"""
-    try:
-        with open(file_path, 'rb') as f:
-            sample = f.read(sample_size)
-    except Exception as e:
-        logger.warning(f"读取文件样本失败: {file_path}, 错误: {e}")
-        return False
-
-    if not sample:
-        return False
-
-    if sample.startswith(b'\xff\xfe') or sample.startswith(b'\xfe\xff'):
-        return False
-
-    if b'\x00' in sample:
-        even_nulls = sum(1 for i in range(0, len(sample), 2) if sample[i] == 0)
-        odd_nulls = sum(1 for i in range(1, len(sample), 2) if sample[i] == 0)
-        if max(even_nulls, odd_nulls) / max(1, len(sample) // 2) > 0.6:
-            return False
-        return True
-
-    control_bytes = 0
-    for b in sample:
-        if b < 32 and b not in (9, 10, 13):
-            control_bytes += 1
-
-    return (control_bytes / len(sample)) > 0.1
-
-
-def _detect_txt_encoding(file_path: Path) -> Optional[str]:
-    """检测 TXT 文件编码"""
-    import chardet
-
-    if _is_probably_binary_file(file_path):
-        return None
-
-    def decode_quality(text: str) -> float:
-        if not text:
-            return 1.0
-        total = len(text)
-        replacement = text.count('\ufffd')
-        control = sum(1 for ch in text if ord(ch) < 32 and ch not in '\t\n\r')
-        return (replacement + control) / total
-
-    def cjk_ratio(text: str) -> float:
-        if not text:
-            return 0.0
-        total = len(text)
-        cjk = sum(1 for ch in text if '\u4e00' <= ch <= '\u9fff')
-        return cjk / total
-
-    candidates = [
-        'utf-8', 'utf-8-sig',
-        'gb18030', 'gbk', 'gb2312',
-        'big5',
-        'utf-16-le', 'utf-16-be',
-    ]
-
-    try:
-        with open(file_path, 'rb') as f:
-            raw_data = f.read(200000)
-    except Exception as e:
-        logger.error(f"读取编码检测样本失败: {e}")
-        return None
-
-    if raw_data.startswith(b'\xff\xfe'):
-        return 'utf-16-le'
-    if raw_data.startswith(b'\xfe\xff'):
-        return 'utf-16-be'
-
-    best_encoding = None
-    best_score = None
-    for encoding in candidates:
-        try:
-            decoded = raw_data.decode(encoding)
-        except UnicodeDecodeError:
-            continue
-        score = (decode_quality(decoded), -cjk_ratio(decoded))
-        if best_score is None or score < best_score:
-            best_score = score
-            best_encoding = encoding
-
-    if best_encoding:
-        return best_encoding
-
-    result = chardet.detect(raw_data)
-    detected = result.get('encoding')
-    if not detected:
-        return None
-
-    detected_lower = detected.lower()
-    if detected_lower in ('utf-16', 'utf_16'):
-        even_nulls = sum(1 for i in range(0, len(raw_data), 2) if raw_data[i] == 0)
-        odd_nulls = sum(1 for i in range(1, len(raw_data), 2) if raw_data[i] == 0)
-        if odd_nulls > even_nulls:
-            return 'utf-16-le'
-        if even_nulls > odd_nulls:
-            return 'utf-16-be'
-        return None
-
-    if detected_lower in ('utf-16le', 'utf_16le'):
-        return 'utf-16-le'
-    if detected_lower in ('utf-16be', 'utf_16be'):
-        return 'utf-16-be'
-
-    return detected
-
-
 def _read_txt_page(file_path: Path, offset: int, page_size: int, encoding: str) -> tuple[str, int]:
     """按字节读取 TXT 片段"""
     with open(file_path, 'rb') as f:
@@ -457,25 +351,21 @@ async def _perform_search(
                     await update.message.reply_text(msg)
                 return
             
-            # 搜索书籍（同时搜索书名和作者）
-            search_term = f"%{keyword}%"
+            # 搜索书籍（全文索引：书名、作者、简介、标签）
             query = (
                 select(Book)
                 .options(joinedload(Book.author), joinedload(Book.versions))
-                .outerjoin(Author, Book.author_id == Author.id)
-                .where(Book.library_id.in_(library_ids))
-                .where(or_(Book.title.like(search_term), Author.name.like(search_term)))
-                .order_by(desc(Book.added_at))
+                .where(build_book_access_clause(user, library_ids))
             )
+            query, rank = search_index.apply_book_search(query, keyword)
+            if rank is not None:
+                query = query.order_by(rank, desc(Book.added_at))
+            else:
+                query = query.order_by(desc(Book.added_at))
             
+            # 权限过滤已包含在查询条件中
             result = await db.execute(query)
-            all_books = result.unique().scalars().all()
-            
-            # 应用权限过滤
-            accessible_books = []
-            for book in all_books:
-                if await check_book_access(user, book.id, db):
-                    accessible_books.append(book)
+            accessible_books = result.unique().scalars().all()
             
             total = len(accessible_books)
             
@@ -584,14 +474,10 @@ async def _perform_author_books(
                 select(Book)
                 .options(joinedload(Book.author), joinedload(Book.versions))
                 .where(Book.author_id == author_id)
-                .where(Book.library_id.in_(library_ids))
+                .where(build_book_access_clause(user, library_ids))
                 .order_by(desc(Book.added_at))
             )
-            all_books = result.unique().scalars().all()
-            accessible = []
-            for book in all_books:
-                if await check_book_access(user, book.id, db):
-                    accessible.append(book)
+            accessible = result.unique().scalars().all()
 
             total = len(accessible)
             if total == 0:
@@ -696,12 +582,9 @@ async def _perform_library_books(
                 select(Book)
                 .options(joinedload(Book.author), joinedload(Book.versions))
                 .where(Book.library_id == library_id)
+                .where(build_book_access_clause(user, library_ids))
             )
-            books = result.unique().scalars().all()
-            accessible = []
-            for book in books:
-                if await check_book_access(user, book.id, db):
-                    accessible.append(book)
+            accessible = result.unique().scalars().all()
 
             filtered = [book for book in accessible if _book_has_format(book, format_code)]
 
@@ -835,18 +718,13 @@ async def _perform_recent(
             query = (
                 select(Book)
                 .options(joinedload(Book.author), joinedload(Book.versions))
-                .where(Book.library_id.in_(library_ids))
+                .where(build_book_access_clause(user, library_ids))
                 .order_by(desc(Book.added_at))
             )
             
+            # 权限过滤已包含在查询条件中
             result = await db.execute(query)
-            all_books = result.unique().scalars().all()
-            
-            # 应用权限过滤
-            accessible_books = []
-            for book in all_books:
-                if await check_book_access(user, book.id, db):
-                    accessible_books.append(book)
+            accessible_books = result.unique().scalars().all()
             
             total = len(accessible_books)
             
@@ -1452,7 +1330,15 @@ async def _perform_read_page(
             if session and session.get("file_path") == str(file_path):
                 encoding = session.get("encoding")
             if not encoding:
-                encoding = _detect_txt_encoding(file_path)
+                encoding = txt_version.encoding
+            if not encoding and not is_probably_binary_file(file_path):
+                detected = detect_file_encoding(file_path)
+                if detected:
+                    # 保存到版本，之后的阅读（含 Web 阅读器）不再检测
+                    encoding = detected.encoding
+                    txt_version.encoding = detected.encoding
+                    txt_version.encoding_confidence = detected.confidence
+                    await db.commit()
             if not encoding:
                 msg = "? 编码识别失败，请下载阅读"
                 if is_callback:
@@ -1639,13 +1525,10 @@ async def _perform_favorites(
                 .join(Book, Favorite.book_id == Book.id)
                 .options(joinedload(Book.author), joinedload(Book.versions))
                 .where(Favorite.user_id == user.id)
+                .where(build_book_access_clause(user))
                 .order_by(Favorite.created_at.desc())
             )
-            favorites = result.unique().all()
-            filtered = []
-            for favorite, book in favorites:
-                if await check_book_access(user, book.id, db):
-                    filtered.append((favorite, book))
+            filtered = result.unique().all()
 
             total = len(filtered)
             if total == 0:
@@ -1724,19 +1607,17 @@ async def _perform_continue(
                 return
             result = await db.execute(
                 select(ReadingProgress)
+                .join(Book, ReadingProgress.book_id == Book.id)
                 .options(joinedload(ReadingProgress.book).joinedload(Book.author))
                 .where(
                     ReadingProgress.user_id == user.id,
                     ReadingProgress.finished == False,
                     ReadingProgress.progress > 0
                 )
+                .where(build_book_access_clause(user))
                 .order_by(desc(ReadingProgress.last_read_at))
             )
-            progress_list = result.scalars().all()
-            filtered = []
-            for progress in progress_list:
-                if progress.book and await check_book_access(user, progress.book.id, db):
-                    filtered.append(progress)
+            filtered = result.scalars().all()
 
             total = len(filtered)
             if total == 0:
@@ -2026,15 +1907,13 @@ async def _perform_history(
                 return
             result = await db.execute(
                 select(ReadingProgress)
+                .join(Book, ReadingProgress.book_id == Book.id)
                 .options(joinedload(ReadingProgress.book).joinedload(Book.author))
                 .where(ReadingProgress.user_id == user.id)
+                .where(build_book_access_clause(user))
                 .order_by(desc(ReadingProgress.last_read_at))
             )
-            progress_list = result.scalars().all()
-            filtered = []
-            for progress in progress_list:
-                if progress.book and await check_book_access(user, progress.book.id, db):
-                    filtered.append(progress)
+            filtered = result.scalars().all()
 
             total = len(filtered)
             if total == 0:
@@ -2126,8 +2005,11 @@ async def stats_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             last_read_at = last_read_result.scalar()
 
+            # 累计阅读时长读取汇总表（先汇总该用户的待汇总会话）
+            user_id = user.id
+            await reading_stats.ensure_user_rollup(db, user_id)
             session_seconds_result = await db.execute(
-                select(func.sum(ReadingSession.duration_seconds)).where(ReadingSession.user_id == user.id)
+                select(func.sum(ReadingStatsDaily.seconds)).where(ReadingStatsDaily.user_id == user_id)
             )
             total_seconds = session_seconds_result.scalar() or 0
             hours = total_seconds // 3600
@@ -20,6 +20,17 @@ class ServerConfig(BaseModel):
 class DatabaseConfig(BaseModel):
     """数据库配置"""
     url: str = "sqlite+aiosqlite:///data/library.db"
+    # 以下仅对 SQLite 生效
+    journal_mode: str = "WAL"  # 日志模式（WAL 下读写互不阻塞）
+    synchronous: str = "NORMAL"  # 同步级别（WAL 下 NORMAL 已足够安全）
+    busy_timeout: int = 5000  # 等待写锁的超时时间（毫秒）
+    cache_size_mb: int = 64  # 每个连接的页缓存（MB）
+    mmap_size_mb: int = 256  # 内存映射读取大小（MB，0 为关闭）
+    read_pool_size: int = 5  # 只读连接池大小
+    write_batch_size: int = 64  # 写入队列单次合并提交的最大任务数
+    write_batch_window_ms: int = 5  # 写入队列合并等待时间（毫秒）
+    progress_flush_seconds: float = 5.0  # 阅读进度/心跳在内存中合并后批量写入的间隔（秒），0 表示每次立即写入
+    reading_session_retention_days: int = 365  # 已汇总的原始阅读会话保留天数，0 表示永久保留
 
 
 class DirectoriesConfig(BaseModel):
@@ -38,6 +49,10 @@ class ScannerConfig(BaseModel):
         ".txt", ".epub", ".mobi", ".azw3",
         ".zip", ".rar", ".7z", ".iso", ".tar.gz", ".tar.bz2"
     ])
+    prune_missing: bool = False  # 增量扫描时清理已从磁盘消失的文件记录（默认只汇报）
+    workers: int = 0  # 后台扫描解析进程数（0 = CPU 核数 - 1）
+    queue_size: int = 1000  # 目录遍历队列上限（背压）
+    batch_size: int = 100  # 每批写入数据库的文件数
 
 
 class ExtractorConfig(BaseModel):
@@ -51,6 +66,8 @@ class DeduplicatorConfig(BaseModel):
     """去重器配置"""
     enable: bool = True
     hash_algorithm: str = "md5"
+    # sample: 按 大小 -> 采样Hash 比对，碰撞时才计算完整Hash；full: 每个文件都计算完整Hash
+    hash_mode: str = "sample"
     similarity_threshold: float = 0.85
 
 
@@ -60,6 +77,7 @@ class SecurityConfig(BaseModel):
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 10080  # 7天
     share_token_expire_days: int = 30  # 收藏分享链接过期天数
+    access_cache_ttl: int = 300  # 用户访问上下文缓存时间（秒），0 表示不缓存
 
 
 class LoggingConfig(BaseModel):
@@ -79,6 +97,8 @@ class OPDSConfig(BaseModel):
     author: str = "Sooklib"
     description: str = "个人小说收藏"
     page_size: int = 50
+    auth_cache_ttl: int = 300  # 已验证凭据缓存时间（秒），0 表示不缓存
+    auth_cache_size: int = 256  # 已验证凭据缓存条目上限
 
 
 class ReleaseConfig(BaseModel):
@@ -105,6 +125,9 @@ class CoverConfig(BaseModel):
     thumbnail_height: int = 450  # 缩略图高度（像素）
     default_style: str = "gradient"  # 默认封面风格 (gradient/letter/book/minimal)
     cache_enabled: bool = True  # 是否启用缓存
+    rendition_widths: List[int] = Field(default_factory=lambda: [120, 240, 480])  # 多尺寸封面宽度（像素）
+    rendition_workers: int = 1  # 封面缩放进程数
+    pregenerate_on_scan: bool = True  # 扫描结束后为新书预生成多尺寸封面
 
 
 class BackupConfig(BaseModel):
@@ -135,6 +158,12 @@ class TelegramConfig(BaseModel):
     bind_code_expiry: int = 300  # 绑定授权码过期时间（秒，默认5分钟）
 
 
+class ReaderConfig(BaseModel):
+    """在线阅读配置"""
+    cache_build_workers: int = 2  # TXT 阅读缓存构建并发数
+    precompress_chapters: bool = True  # 构建缓存时预压缩各章节（gzip；安装 brotli 后同时生成 br）
+
+
 class Config(BaseModel):
     """主配置类"""
     server: ServerConfig = Field(default_factory=ServerConfig)
@@ -151,6 +180,7 @@ class Config(BaseModel):
     cover: CoverConfig = Field(default_factory=CoverConfig)
     backup: BackupConfig = Field(default_factory=BackupConfig)
     telegram: TelegramConfig = Field(default_factory=TelegramConfig)
+    reader: ReaderConfig = Field(default_factory=ReaderConfig)
 
     @classmethod
     def load(cls, config_path: str = "config/config.yaml") -> "Config":
@@ -177,6 +207,8 @@ class Config(BaseModel):
             config_data.setdefault("server", {})["port"] = int(server_port)
         if db_url := os.getenv("DATABASE_URL"):
             config_data.setdefault("database", {})["url"] = db_url
+        if journal_mode := os.getenv("DATABASE_JOURNAL_MODE"):
+            config_data.setdefault("database", {})["journal_mode"] = journal_mode
         if secret_key := os.getenv("SECRET_KEY"):
             config_data.setdefault("security", {})["secret_key"] = secret_key
         if log_level := os.getenv("LOG_LEVEL"):
@@ -187,6 +219,12 @@ class Config(BaseModel):
             config_data.setdefault("logging", {})["scan_detail_every"] = int(log_scan_detail_every)
         if scan_interval := os.getenv("SCAN_INTERVAL"):
             config_data.setdefault("scanner", {})["interval"] = int(scan_interval)
+        if scan_workers := os.getenv("SCAN_WORKERS"):
+            config_data.setdefault("scanner", {})["workers"] = int(scan_workers)
+        if cache_workers := os.getenv("READER_CACHE_BUILD_WORKERS"):
+            config_data.setdefault("reader", {})["cache_build_workers"] = int(cache_workers)
+        if precompress := os.getenv("READER_PRECOMPRESS_CHAPTERS"):
+            config_data.setdefault("reader", {})["precompress_chapters"] = precompress.strip().lower() in ("1", "true", "yes", "on")
         if backup_enabled := os.getenv("BACKUP_AUTO_ENABLED"):
             config_data.setdefault("backup", {})["auto_backup_enabled"] = backup_enabled.strip().lower() in ("1", "true", "yes", "on")
         if backup_schedule := os.getenv("BACKUP_AUTO_SCHEDULE"):
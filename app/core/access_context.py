@@ -0,0 +1,204 @@
+"""
+访问上下文缓存
+缓存已认证用户的行快照和权限信息，稳定状态下鉴权无需查询数据库
+
+每个用户的上下文包含：
+- User 行快照（命中时以 merge(load=False) 挂到当前会话，不发出 SQL）
+- 可访问书库 ID 集合（管理员为全部书库）
+- 年龄分级上限和解析后的屏蔽标签集合
+
+失效通过版本号实现：ORM 刷新时记录受影响的用户（User、LibraryPermission 变化）
+和全局变化（书库新增、删除或公开状态变化），在事务提交后递增对应版本号。
+缓存条目记录加载时的版本号，版本不一致即视为过期。
+绕过 ORM 的批量语句需手动调用 bump_user / bump_all。
+"""
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Optional, Set
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app.config import settings
+from app.models import Library, LibraryPermission, User
+
+
+# 最多缓存的用户数
+MAX_CONTEXTS = 1024
+
+_PENDING_KEY = "access_context_pending"
+_ALL_USERS = -1
+
+
+@dataclass(slots=True)
+class AccessContext:
+    """单个用户的访问上下文"""
+    user_id: int
+    fields: dict
+    library_ids: FrozenSet[int]
+    rating_limit: int
+    blocked_tags: Optional[str]
+    blocked_tag_ids: FrozenSet[int]
+    global_version: int
+    user_version: int
+    expires_at: float
+
+
+class AccessContextCache:
+    """进程内访问上下文缓存"""
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._global_version = 0
+        # 任意版本号变化时递增，用于判断加载期间是否有变更提交
+        self._bump_seq = 0
+        self._user_versions: Dict[int, int] = {}
+        # 用户名 -> 上下文
+        self._entries: "OrderedDict[str, AccessContext]" = OrderedDict()
+
+    # ===== 版本 =====
+
+    def bump_user(self, user_id: int) -> None:
+        """使某个用户的上下文失效"""
+        self._user_versions[user_id] = self._user_versions.get(user_id, 0) + 1
+        self._bump_seq += 1
+
+    def bump_all(self) -> None:
+        """使所有用户的上下文失效"""
+        self._global_version += 1
+        self._bump_seq += 1
+
+    def _valid(self, ctx: AccessContext) -> bool:
+        return (
+            ctx.global_version == self._global_version
+            and ctx.user_version == self._user_versions.get(ctx.user_id, 0)
+            and ctx.expires_at > time.monotonic()
+        )
+
+    # ===== 读取 =====
+
+    def peek(self, user: User) -> Optional[AccessContext]:
+        """
+        获取用户当前有效的上下文（不查询数据库）
+
+        Args:
+            user: 用户对象
+
+        Returns:
+            上下文；未缓存或已过期返回 None
+        """
+        ctx = self._entries.get(user.username)
+        if ctx is None or ctx.user_id != user.id or not self._valid(ctx):
+            return None
+        return ctx
+
+    async def get_user(self, db: AsyncSession, username: str) -> Optional[User]:
+        """
+        按用户名获取用户（挂在当前会话上），命中缓存时不查询数据库
+
+        Args:
+            db: 数据库会话
+            username: 用户名
+
+        Returns:
+            用户对象，不存在时返回 None
+        """
+        if self.ttl > 0:
+            ctx = self._entries.get(username)
+            if ctx is not None and self._valid(ctx):
+                self._entries.move_to_end(username)
+                user = User(**ctx.fields)
+                make_transient_to_detached(user)
+                return await db.merge(user, load=False)
+
+        # 先记录变更序号再读取：读取期间有变更提交时不缓存本次结果
+        bump_seq = self._bump_seq
+        result = await db.execute(select(User).where(User.username == username))
+        user = result.scalar_one_or_none()
+        if user is None or self.ttl <= 0:
+            return user
+
+        if user.is_admin:
+            result = await db.execute(select(Library.id))
+        else:
+            result = await db.execute(
+                select(Library.id).where(Library.is_public == True)
+                .union(
+                    select(LibraryPermission.library_id)
+                    .where(LibraryPermission.user_id == user.id)
+                )
+            )
+        library_ids = frozenset(result.scalars())
+        if bump_seq != self._bump_seq:
+            return user
+
+        from app.utils.permissions import RATING_HIERARCHY, parse_blocked_tag_ids
+
+        self._entries[username] = AccessContext(
+            user_id=user.id,
+            fields={attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs},
+            library_ids=library_ids,
+            rating_limit=RATING_HIERARCHY.get(user.age_rating_limit, 2),
+            blocked_tags=user.blocked_tags,
+            blocked_tag_ids=frozenset(parse_blocked_tag_ids(user)),
+            global_version=self._global_version,
+            user_version=self._user_versions.get(user.id, 0),
+            expires_at=time.monotonic() + self.ttl,
+        )
+        self._entries.move_to_end(username)
+        while len(self._entries) > MAX_CONTEXTS:
+            self._entries.popitem(last=False)
+        return user
+
+    def clear(self) -> None:
+        """清空缓存"""
+        self._entries.clear()
+        self.bump_all()
+
+
+# 全局访问上下文缓存实例
+access_context_cache = AccessContextCache(settings.security.access_cache_ttl)
+
+
+# ===== ORM 事件：提交后递增版本号 =====
+
+def _pending(session: Session) -> Set[int]:
+    return session.info.setdefault(_PENDING_KEY, set())
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_access_changes(session: Session, flush_context) -> None:
+    """记录本次刷新影响的用户和全局权限"""
+    user_ids = set()
+    for state, collection in (("new", session.new), ("dirty", session.dirty), ("deleted", session.deleted)):
+        for obj in collection:
+            if isinstance(obj, User):
+                if obj.id is not None:
+                    user_ids.add(obj.id)
+            elif isinstance(obj, LibraryPermission):
+                user_ids.add(obj.user_id)
+            elif isinstance(obj, Library):
+                if state == "dirty" and not inspect(obj).attrs.is_public.history.has_changes():
+                    continue
+                user_ids.add(_ALL_USERS)
+    if user_ids:
+        _pending(session).update(user_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_access_changes(session: Session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    for user_id in pending:
+        if user_id == _ALL_USERS:
+            access_context_cache.bump_all()
+        elif user_id is not None:
+            access_context_cache.bump_user(user_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_access_changes(session: Session, previous_transaction) -> None:
+    session.info.pop(_PENDING_KEY, None)
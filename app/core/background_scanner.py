@@ -9,16 +9,30 @@ from typing import List, Optional
 from contextlib import asynccontextmanager
 
 from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
-from app.models import Library, LibraryPath, ScanTask, Book, BookVersion, Author
+from app.database import AsyncSessionLocal, yield_write_gate
+from app.models import Library, LibraryPath, LibraryTag, ScanTask
 from app.core.extractor import Extractor
 from app.core.deduplicator import Deduplicator
-from app.core.metadata.epub_parser import EpubParser
-from app.core.metadata.mobi_parser import MobiParser
+from app.core.cover_renditions import schedule_scan_pregenerate
+from app.core.library_stats import refresh_library_stats
+from app.core import scan_manifest
+from app.core.scan_manifest import ScanManifest
+from app.core.scan_pipeline import (
+    ADD_VERSION,
+    EBOOK_FORMATS,
+    SKIP,
+    ScanBatchWriter,
+    ScanSession,
+    ScanWorkerPool,
+    determine_quality,
+    recompute_author_book_counts,
+    resolve_worker_count,
+    walk_files,
+)
 from app.core.metadata.txt_parser import TxtParser
-from app.utils.file_hash import calculate_file_hash
 from app.utils.logger import log
 from app.core.websocket import manager
 
@@ -31,26 +45,15 @@ class BackgroundScanner:
     
     def __init__(self):
         self.extractor = Extractor()
-        self.txt_parser = None  # 将在 worker 中初始化
-        self.epub_parser = EpubParser()
-        self.mobi_parser = MobiParser()
+        self.txt_parser = None  # 将在 worker 中初始化（解析在子进程中进行，这里只负责自定义规则及统计）
         self.supported_formats = settings.scanner.supported_formats
         
         # 扫描过程中的错误日志（格式: [{"file": ..., "error": ...}, ...]）
         self._error_logs: List[dict] = []
         self._detail_counter = 0
         
-        # 创建异步引擎（用于后台任务）
-        self.engine = create_async_engine(
-            settings.database.url,
-            echo=False,
-            pool_pre_ping=True,
-        )
-        self.async_session_maker = async_sessionmaker(
-            self.engine,
-            class_=AsyncSession,
-            expire_on_commit=False
-        )
+        # 与 Web 请求共用写引擎（同一套 PRAGMA 和写闸门）
+        self.async_session_maker = AsyncSessionLocal
     
     @asynccontextmanager
     async def get_session(self):
@@ -185,6 +188,8 @@ class BackgroundScanner:
             library_id: 书库ID
             db: 数据库会话
         """
+        scan_started = datetime.utcnow()
+        
         # 获取书库的所有路径
         result = await db.execute(
             select(Library).where(Library.id == library_id)
@@ -209,53 +214,123 @@ class BackgroundScanner:
         
         log.info(f"扫描路径: {enabled_paths}")
         
-        # 分批处理
-        BATCH_SIZE = 100  # 减小批次大小，更频繁地提交
+        # 加载扫描清单（增量扫描：未变化的文件只需 stat）
+        manifest = await ScanManifest.load(db, library_id, [Path(p) for p in enabled_paths])
+        
+        # 书库默认标签（新书自动关联）
+        result = await db.execute(
+            select(LibraryTag.tag_id).where(LibraryTag.library_id == library_id)
+        )
+        library_tag_ids = list(result.scalars())
+        
+        # 流水线：遍历线程 -> 解析进程池 -> 单一写入者
+        scanner_config = settings.scanner
+        batch_size = max(1, scanner_config.batch_size)
         PROGRESS_UPDATE_INTERVAL = 1000  # 每处理1000个文件更新一次进度
         
-        file_batch = []
-        total_discovered = 0
+        pool = ScanWorkerPool(
+            resolve_worker_count(scanner_config.workers),
+            self.txt_parser.custom_patterns
+        )
+        deduplicator = Deduplicator(db)
+        # 作者/标签名称 -> ID 映射，整个扫描期间复用
+        scan_session = ScanSession(db)
+        await scan_session.load()
+        writer = ScanBatchWriter(db, library_id, library_tag_ids, deduplicator, scan_session)
+        # 同时在途的解析任务上限（背压：解析跟不上时暂停从遍历队列取文件）
+        max_pending = pool.workers * 4
+        log.info(f"扫描流水线: {pool.workers} 个解析进程, 批次大小 {batch_size}")
+        
+        pending = set()
+        parsed: List[dict] = []
+        next_progress = PROGRESS_UPDATE_INTERVAL
+        
+        async def collect(return_when):
+            nonlocal pending
+            # 等待解析结果前提交清单补录等写入，等待期间不占用写闸门
+            await yield_write_gate(db, force=True)
+            done, pending = await asyncio.wait(pending, return_when=return_when)
+            parsed.extend(future.result() for future in done)
+        
+        async def flush_parsed():
+            nonlocal parsed, next_progress
+            await self._write_parsed(parsed, writer, task, db)
+            parsed = []
+            if task.processed_files >= next_progress:
+                next_progress = task.processed_files + PROGRESS_UPDATE_INTERVAL
+                if task.total_files > 0:
+                    task.progress = min(95, int(task.processed_files / task.total_files * 100))
+                await db.commit()
+                await self._broadcast_progress(task)
+                log.info(f"扫描进度: {task.processed_files}/{task.total_files} ({task.progress}%)")
         
-        # 遍历所有路径
-        for path_str in enabled_paths:
-            path = Path(path_str)
-            if not path.exists():
-                log.warning(f"路径不存在，跳过: {path}")
-                continue
-            
-            log.info(f"开始扫描路径: {path}")
-            
-            # 使用生成器发现文件（节省内存）
-            for file_path in self._discover_files_generator(path):
-                file_batch.append(file_path)
-                total_discovered += 1
+        try:
+            async for file_path in walk_files(
+                [Path(p) for p in enabled_paths],
+                self.supported_formats,
+                scanner_config.queue_size
+            ):
                 task.total_files += 1
+                # 有 Web 写入排队时先提交，避免连续的清单补录长时间占用写闸门
+                await yield_write_gate(db)
+                if await self._sync_known_file(file_path, task, manifest, deduplicator):
+                    continue
                 
-                # 达到批次大小，处理一批
-                if len(file_batch) >= BATCH_SIZE:
-                    await self._process_file_batch(file_batch, library_id, task, db)
-                    file_batch = []
-                    
-                    # 定期更新进度
-                    if task.processed_files % PROGRESS_UPDATE_INTERVAL == 0:
-                        if task.total_files > 0:
-                            task.progress = min(95, int(task.processed_files / task.total_files * 100))
-                        await db.commit()
-                        await self._broadcast_progress(task)
-                        log.info(f"扫描进度: {task.processed_files}/{task.total_files} ({task.progress}%)")
-        
-        # 处理剩余文件
-        if file_batch:
-            await self._process_file_batch(file_batch, library_id, task, db)
+                # 压缩包不在后台扫描中展开
+                if not file_path.name.lower().endswith(EBOOK_FORMATS):
+                    task.skipped_books += 1
+                    task.processed_files += 1
+                    continue
+                
+                pending.add(asyncio.ensure_future(pool.process(file_path)))
+                if len(pending) >= max_pending:
+                    await collect(asyncio.FIRST_COMPLETED)
+                if len(parsed) >= batch_size:
+                    await flush_parsed()
+            
+            if pending:
+                await collect(asyncio.ALL_COMPLETED)
+            if parsed:
+                await flush_parsed()
+        finally:
+            for future in pending:
+                future.cancel()
+            await asyncio.get_running_loop().run_in_executor(None, pool.shutdown)
+        
+        # 处理已从磁盘消失的文件
+        missing = manifest.missing()
+        if missing:
+            task.missing_files = len(missing)
+            log.warning(f"发现 {len(missing)} 个已消失的文件")
+            for entry in missing:
+                if len(self._error_logs) >= self.MAX_ERROR_LOGS:
+                    break
+                self._error_logs.append({
+                    "file": entry.display_path,
+                    "error": "文件已从磁盘消失",
+                    "type": "Missing"
+                })
+            if settings.scanner.prune_missing:
+                removed_books = await scan_manifest.remove_versions(db, missing)
+                log.info(f"已清理消失的文件记录: {len(missing)} 个版本, {removed_books} 本书")
         
         # 更新规则统计
         if self.txt_parser:
             await self.txt_parser.update_pattern_stats()
         
+        # 重新统计作者书籍数（一条 UPDATE）
+        await recompute_author_book_counts(db)
+        
+        # 刷新书库统计（首页使用）
+        await refresh_library_stats(db, [library.id])
+        
         # 更新书库最后扫描时间
         library.last_scan = datetime.utcnow()
         await db.commit()
         
+        # 后台为新书预生成多尺寸封面
+        await schedule_scan_pregenerate(db, library.id, scan_started)
+        
     async def _broadcast_progress(self, task: ScanTask):
         """广播进度"""
         await manager.broadcast({
@@ -268,130 +343,139 @@ class BackgroundScanner:
             "processed_files": task.processed_files,
             "added_books": task.added_books,
             "skipped_books": task.skipped_books,
+            "unchanged_files": task.unchanged_files,
+            "updated_files": task.updated_files,
+            "missing_files": task.missing_files,
             "error_count": task.error_count
         })
     
-    def _discover_files_generator(self, directory: Path):
+    async def _sync_known_file(
+        self,
+        file_path: Path,
+        task: ScanTask,
+        manifest: ScanManifest,
+        deduplicator: Deduplicator
+    ) -> bool:
         """
-        生成器方式发现文件（节省内存）
+        清单中已有的文件：未变化直接跳过，变化/移动原地更新
         
-        Args:
-            directory: 扫描目录
-            
-        Yields:
-            文件路径
-        """
-        for ext in self.supported_formats:
-            try:
-                for file_path in directory.rglob(f'*{ext}'):
-                    yield file_path
-            except Exception as e:
-                log.error(f"扫描目录失败: {directory}, 错误: {e}")
-    
-    async def _process_file_batch(self, files: List[Path], library_id: int, task: ScanTask, db: AsyncSession):
-        """
-        批量处理文件
-        
-        Args:
-            files: 文件路径列表
-            library_id: 书库ID
-            task: 扫描任务
-            db: 数据库会话
+        Returns:
+            是否已处理（新文件返回 False，交给解析进程）
         """
-        # 初始化去重器
-        deduplicator = Deduplicator(db)
+        try:
+            state = await scan_manifest.sync_known_file(
+                deduplicator.db,
+                manifest,
+                file_path,
+                deduplicator,
+                self._determine_quality
+            )
+        except Exception as e:
+            task.processed_files += 1
+            self._record_error(task, str(file_path), str(e)[:200], type(e).__name__)
+            return True
         
-        for file_path in files:
-            try:
-                self._detail_counter += 1
-                log_detail = self._should_log_detail()
-                # 处理单个文件
-                await self._process_single_file(file_path, library_id, task, db, deduplicator, log_detail)
-                task.processed_files += 1
-                
-            except Exception as e:
-                task.error_count += 1
-                error_msg = str(e)[:200]  # 限制错误消息长度
-                log.error(f"处理文件失败: {file_path}, 错误: {error_msg}")
-                
-                # 收集错误日志（限制数量）
-                if len(self._error_logs) < self.MAX_ERROR_LOGS:
-                    self._error_logs.append({
-                        "file": str(file_path),
-                        "error": error_msg,
-                        "type": type(e).__name__
-                    })
-        
-        # 批量提交
-        await db.commit()
+        if state is None:
+            return False
+        self._detail_counter += 1
+        self._count_manifest_state(state, task)
+        task.processed_files += 1
+        if self._should_log_detail() and state not in (scan_manifest.UNCHANGED, scan_manifest.BACKFILL):
+            log.info(f"扫描更新: {file_path} | {state}")
+        return True
     
-    async def _process_single_file(
-        self, 
-        file_path: Path, 
-        library_id: int, 
-        task: ScanTask, 
-        db: AsyncSession,
-        deduplicator: Deduplicator,
-        log_detail: bool
+    async def _write_parsed(
+        self,
+        results: List[dict],
+        writer: ScanBatchWriter,
+        task: ScanTask,
+        db: AsyncSession
     ):
         """
-        处理单个文件
+        汇总一批解析结果并写入数据库
         
         Args:
-            file_path: 文件路径
-            library_id: 书库ID
+            results: 解析进程返回的结果
+            writer: 批量写入器
             task: 扫描任务
             db: 数据库会话
-            deduplicator: 去重器
         """
-        # 提取元数据
-        metadata = self._extract_metadata(file_path)
+        items = []
+        for result in results:
+            task.processed_files += 1
+            self._merge_pattern_stats(result["pattern_stats"])
+            if result.get("error"):
+                self._record_error(task, result["path"], result["error"], result.get("error_type", "Error"))
+            elif not result["metadata"]:
+                task.skipped_books += 1
+                if self._should_log_result():
+                    log.info(f"扫描跳过: {result['path']} | 无法提取元数据")
+            else:
+                items.append(result)
         
-        if not metadata:
-            task.skipped_books += 1
-            if log_detail:
-                log.info(f"扫描跳过: {file_path} | 无法提取元数据")
+        if not items:
             return
         
-        # 去重检测
-        action, book_id, reason = await deduplicator.check_duplicate(
-            file_path,
-            metadata["title"],
-            metadata.get("author")
-        )
-        
-        if action == 'skip':
-            task.skipped_books += 1
-            if log_detail:
-                log.info(f"扫描跳过: {file_path} | {reason}")
-            return
-        elif action == 'add_version':
-            await self._save_book_version(file_path, book_id, metadata, db)
-            task.added_books += 1
-            if log_detail:
-                log.info(f"新增版本: {file_path} | {reason}")
-        else:  # new_book
-            await self._save_book(file_path, library_id, metadata, db)
+        # 先提交任务计数，写入失败回滚时不丢失
+        await writer.commit()
+        try:
+            outcomes = await writer.write(items)
+            await writer.commit()
+        except Exception as e:
+            await writer.rollback()
+            await db.refresh(task)
+            log.warning(f"批量写入失败，逐个重试: {e}")
+            outcomes = []
+            for item in items:
+                try:
+                    outcomes.extend(await writer.write([item]))
+                    await writer.commit()
+                except Exception as item_error:
+                    await writer.rollback()
+                    await db.refresh(task)
+                    self._record_error(task, item["path"], str(item_error)[:200], type(item_error).__name__)
+        
+        for item, action, reason in outcomes:
+            log_detail = self._should_log_result()
+            if action == SKIP:
+                task.skipped_books += 1
+                if log_detail:
+                    log.info(f"扫描跳过: {item['path']} | {reason}")
+                continue
             task.added_books += 1
             if log_detail:
-                log.info(f"新增书籍: {metadata['title']} | {metadata.get('author', 'Unknown')} | {file_path}")
+                metadata = item["metadata"]
+                if action == ADD_VERSION:
+                    log.info(f"新增版本: {item['path']} | {reason}")
+                else:
+                    log.info(f"新增书籍: {metadata['title']} | {metadata.get('author', 'Unknown')} | {item['path']}")
     
-    def _extract_metadata(self, file_path: Path) -> Optional[dict]:
-        """提取元数据"""
-        suffix = file_path.suffix.lower()
-        
-        try:
-            if suffix == '.txt':
-                return self.txt_parser.parse(file_path)
-            elif suffix == '.epub':
-                return self.epub_parser.parse(file_path)
-            elif suffix in ['.mobi', '.azw3']:
-                return self.mobi_parser.parse(file_path)
-            else:
-                return None
-        except Exception as e:
-            log.error(f"元数据提取失败: {file_path}, 错误: {e}")
-            return None
+    def _merge_pattern_stats(self, stats: dict):
+        """合并子进程中的自定义规则命中统计"""
+        for pattern_id, counts in stats.items():
+            total = self.txt_parser.pattern_stats.setdefault(pattern_id, {'matches': 0, 'successes': 0})
+            total['matches'] += counts['matches']
+            total['successes'] += counts['successes']
+    
+    def _record_error(self, task: ScanTask, file: str, error_msg: str, error_type: str):
+        """记录文件处理错误（限制数量）"""
+        task.error_count += 1
+        log.error(f"处理文件失败: {file}, 错误: {error_msg}")
+        if len(self._error_logs) < self.MAX_ERROR_LOGS:
+            self._error_logs.append({
+                "file": file,
+                "error": error_msg,
+                "type": error_type
+            })
+    
+    def _count_manifest_state(self, state: str, task: ScanTask):
+        """按清单比对结果累计任务统计"""
+        if state in (scan_manifest.UNCHANGED, scan_manifest.BACKFILL):
+            task.unchanged_files = (task.unchanged_files or 0) + 1
+        elif state == scan_manifest.DUPLICATE:
+            task.skipped_books += 1
+        else:
+            task.updated_files = (task.updated_files or 0) + 1
 
     def _should_log_detail(self) -> bool:
         if not settings.logging.scan_detail:
@@ -399,107 +483,14 @@ class BackgroundScanner:
         every = max(settings.logging.scan_detail_every, 1)
         return self._detail_counter % every == 0
     
-    async def _save_book(self, file_path: Path, library_id: int, metadata: dict, db: AsyncSession):
-        """保存新书籍"""
-        # 获取或创建作者
-        author_id = None
-        if metadata.get("author"):
-            author_id = await self._get_or_create_author(metadata["author"], db)
-        
-        # 创建书籍
-        book = Book(
-            library_id=library_id,
-            title=metadata["title"],
-            author_id=author_id,
-            cover_path=metadata.get("cover"),
-            description=metadata.get("description"),
-            publisher=metadata.get("publisher"),
-        )
-        
-        db.add(book)
-        await db.flush()
-        
-        # 创建主版本
-        file_hash = calculate_file_hash(file_path, settings.deduplicator.hash_algorithm)
-        
-        version = BookVersion(
-            book_id=book.id,
-            file_path=str(file_path.absolute().as_posix()),
-            file_name=file_path.name,
-            file_format=file_path.suffix.lower(),
-            file_size=file_path.stat().st_size,
-            file_hash=file_hash,
-            quality=self._determine_quality(file_path),
-            is_primary=True,
-        )
-        
-        db.add(version)
-    
-    async def _save_book_version(self, file_path: Path, book_id: int, metadata: dict, db: AsyncSession):
-        """为现有书籍添加新版本"""
-        file_hash = calculate_file_hash(file_path, settings.deduplicator.hash_algorithm)
-        
-        # 检查是否已有主版本
-        result = await db.execute(
-            select(BookVersion)
-            .where(BookVersion.book_id == book_id)
-            .where(BookVersion.is_primary == True)
-        )
-        has_primary = result.scalar_one_or_none() is not None
-        
-        version = BookVersion(
-            book_id=book_id,
-            file_path=str(file_path.absolute().as_posix()),
-            file_name=file_path.name,
-            file_format=file_path.suffix.lower(),
-            file_size=file_path.stat().st_size,
-            file_hash=file_hash,
-            quality=self._determine_quality(file_path),
-            is_primary=not has_primary,
-        )
-        
-        db.add(version)
+    def _should_log_result(self) -> bool:
+        """解析结果计入详细日志计数"""
+        self._detail_counter += 1
+        return self._should_log_detail()
     
     def _determine_quality(self, file_path: Path) -> str:
         """判断文件质量"""
-        file_format = file_path.suffix.lower()
-        file_size = file_path.stat().st_size
-        
-        format_quality = {
-            '.epub': 'high',
-            '.mobi': 'medium',
-            '.azw3': 'high',
-            '.txt': 'low',
-        }
-        
-        base_quality = format_quality.get(file_format, 'medium')
-        
-        if file_format in ['.epub', '.mobi', '.azw3']:
-            if file_size > 2 * 1024 * 1024:
-                return 'high'
-            elif file_size > 500 * 1024:
-                return 'medium'
-            else:
-                return 'low'
-        
-        return base_quality
-    
-    async def _get_or_create_author(self, author_name: str, db: AsyncSession) -> int:
-        """获取或创建作者"""
-        result = await db.execute(
-            select(Author).where(Author.name == author_name)
-        )
-        author = result.scalar_one_or_none()
-        
-        if author:
-            author.book_count += 1
-            return author.id
-        
-        author = Author(name=author_name, book_count=1)
-        db.add(author)
-        await db.flush()
-        
-        return author.id
+        return determine_quality(file_path.suffix.lower(), file_path.stat().st_size)
     
     async def get_task_status(self, task_id: int) -> Optional[dict]:
         """
@@ -526,6 +517,9 @@ class BackgroundScanner:
                 'processed_files': task.processed_files,
                 'added_books': task.added_books,
                 'skipped_books': task.skipped_books,
+                'unchanged_files': task.unchanged_files or 0,
+                'updated_files': task.updated_files or 0,
+                'missing_files': task.missing_files or 0,
                 'error_count': task.error_count,
                 'error_message': task.error_message,
                 'started_at': task.started_at.isoformat() if task.started_at else None,
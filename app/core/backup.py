@@ -504,11 +504,23 @@ class BackupManager:
                 raise ValueError(f"恢复的数据库文件无效: {e}")
             
             # 替换当前数据库（需要确保应用已停止或使用文件锁）
+            from app.database import dispose_engines
+            
             if self.db_path.exists():
+                # WAL 模式下先把日志合并回主文件，再复制
+                async with aiosqlite.connect(str(self.db_path)) as conn:
+                    await conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
                 backup_current = self.db_path.with_suffix('.db.old')
                 shutil.copy2(self.db_path, backup_current)
                 log.info(f"已备份当前数据库到: {backup_current}")
             
+            # 关闭连接池并删除旧数据库的 WAL 文件，避免被应用到恢复后的数据库
+            await dispose_engines()
+            for suffix in ("-wal", "-shm"):
+                sidecar = self.db_path.with_name(self.db_path.name + suffix)
+                if sidecar.exists():
+                    sidecar.unlink()
+            
             shutil.move(str(temp_db), str(self.db_path))
             log.info("数据库恢复完成")
             
@@ -0,0 +1,483 @@
+"""
+章节检测模块
+TXT 解析器（目录）和阅读器缓存构建共用的章节标题识别
+
+- 章节规则来自 config/system_settings.json，编译结果缓存到设置文件变化为止
+- 强规则、弱规则各自合并为一个交替正则，每个候选行只匹配一次
+- 由规则推导出以换行符开头的预筛正则，在整块文本上查找可能是标题的行，
+  只有这些行才进入 Python 校验；内联规则先用必含的字面字符（如“第”）定位行，再做正则搜索
+- ChapterScanner 按块流式输入，同时跟踪字符偏移和 UTF-8 字节偏移
+"""
+import hashlib
+import json
+import re
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.utils.logger import log
+
+try:
+    from re import _parser as _sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse as _sre_parse
+
+
+SETTINGS_FILE = Path("config/system_settings.json")
+
+DEFAULT_CHAPTER_SETTINGS = {
+    "chapter_max_title_length": 50,
+    "chapter_min_gap": 40,
+    "chapter_patterns_strong": [
+        r'^第[零一二三四五六七八九十百千万亿\d]+[章节卷集部篇回].*$',
+        r'^(正文\s*)?第[零一二三四五六七八九十百千万亿\d]+[章节卷集部篇回].*$',
+        r'^Chapter\s+\d+.*$',
+        r'^卷[零一二三四五六七八九十百千万亿\d]+.*$',
+        r'^(序章|楔子|引子|前言|后记|尾声|番外|终章|大结局).*$',
+        r'^[【\[\(].+[】\]\)]$',
+    ],
+    "chapter_patterns_weak": [
+        r'^\d{1,4}[\.、]\s*.*$',
+        r'^\d{1,4}\s+.*$',
+    ],
+    "chapter_inline_pattern": r'(正文\s*)?第[零一二三四五六七八九十百千万亿\d]+[章节卷集部篇回][^\n]{0,40}',
+}
+
+BODY_ONLY_TITLES = ('正文', '正文：', '正文:')
+
+# 超过此长度仍没有换行的行按正文处理，不再整行保留在内存中
+MAX_LINE_CHARS = 2 * 1024 * 1024
+
+# 规则去掉首尾锚点后仍含这些结构时，无法安全改写为整块预筛，退回逐行匹配
+_UNSAFE_FOR_PREFILTER = re.compile(r'(?<!\\)\$|(?<![\\\[])\^|\\[AZ]|\(\?<[=!]')
+
+
+def load_chapter_settings() -> Dict:
+    """读取章节规则设置（缺失或无效的项使用默认值）"""
+    chapter_settings = dict(DEFAULT_CHAPTER_SETTINGS)
+    if not SETTINGS_FILE.exists():
+        return chapter_settings
+
+    try:
+        data = json.loads(SETTINGS_FILE.read_text(encoding="utf-8"))
+    except Exception as e:
+        log.warning(f"加载章节规则设置失败，使用默认值: {e}")
+        return chapter_settings
+
+    strong = data.get("chapter_patterns_strong")
+    if isinstance(strong, list):
+        strong = [item.strip() for item in strong if isinstance(item, str) and item.strip()]
+        if strong:
+            chapter_settings["chapter_patterns_strong"] = strong
+
+    weak = data.get("chapter_patterns_weak")
+    if isinstance(weak, list):
+        weak = [item.strip() for item in weak if isinstance(item, str) and item.strip()]
+        if weak:
+            chapter_settings["chapter_patterns_weak"] = weak
+
+    inline_pattern = data.get("chapter_inline_pattern")
+    if isinstance(inline_pattern, str) and inline_pattern.strip():
+        chapter_settings["chapter_inline_pattern"] = inline_pattern.strip()
+
+    max_title_len = data.get("chapter_max_title_length")
+    if isinstance(max_title_len, int) and max_title_len > 0:
+        chapter_settings["chapter_max_title_length"] = max_title_len
+
+    min_gap = data.get("chapter_min_gap")
+    if isinstance(min_gap, int) and min_gap >= 0:
+        chapter_settings["chapter_min_gap"] = min_gap
+
+    return chapter_settings
+
+
+def _valid_patterns(patterns: List[str], label: str) -> List[str]:
+    valid = []
+    for pattern in patterns:
+        try:
+            re.compile(pattern, re.IGNORECASE)
+            valid.append(pattern)
+        except re.error as e:
+            log.warning(f"章节规则无效，已跳过: {label} -> {pattern} ({e})")
+    return valid
+
+
+def _combine(patterns: List[str]) -> List[re.Pattern]:
+    """合并为一个交替正则；无法合并（如组名重复）时逐条编译"""
+    if not patterns:
+        return []
+    try:
+        return [re.compile("|".join(f"(?:{pattern})" for pattern in patterns), re.IGNORECASE)]
+    except re.error:
+        return [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+
+
+def _build_prefilter(patterns: List[str]) -> Optional[re.Pattern]:
+    """
+    把行规则改写为整块预筛正则：匹配位置为标题行前的换行符
+
+    预筛只需是逐行匹配的超集：去掉行首 ^、允许行首空白、行尾 $ 允许尾随空白，
+    命中的行再用原规则校验。规则含其他锚点或后向断言时返回 None。
+    """
+    if not patterns:
+        return None
+    bodies = []
+    for pattern in patterns:
+        body = pattern[1:] if pattern.startswith('^') else pattern
+        anchored_end = body.endswith('$') and not body.endswith('\\$')
+        if anchored_end:
+            body = body[:-1]
+        if _UNSAFE_FOR_PREFILTER.search(body):
+            return None
+        if anchored_end:
+            body += r'(?=[^\S\n]*$)'
+        bodies.append(f"(?:{body})")
+    try:
+        return re.compile(
+            r"\n(?=[^\S\n]*(?:" + "|".join(bodies) + "))",
+            re.IGNORECASE | re.MULTILINE
+        )
+    except re.error:
+        return None
+
+
+def _required_literal(pattern: str) -> Optional[str]:
+    """
+    找出规则每次匹配都必须包含的一个字面字符（如内联规则中的“第”）
+
+    只看顶层序列中必选的字面量（含必选分组内的），大小写不敏感时跳过有大小写之分的字符；
+    找不到或解析失败返回 None。
+    """
+    def walk(items) -> Optional[str]:
+        for op, av in items:
+            if op is _sre_parse.LITERAL:
+                char = chr(av)
+                if char.lower() == char.upper():
+                    return char
+            elif op in (_sre_parse.MAX_REPEAT, _sre_parse.MIN_REPEAT) and av[0] >= 1:
+                found = walk(av[2])
+                if found:
+                    return found
+            elif op is _sre_parse.SUBPATTERN:
+                found = walk(av[-1])
+                if found:
+                    return found
+        return None
+
+    try:
+        return walk(_sre_parse.parse(pattern, re.IGNORECASE))
+    except Exception:
+        return None
+
+
+class ChapterRules:
+    """编译后的章节规则"""
+
+    def __init__(self, chapter_settings: Dict):
+        max_title_len = chapter_settings.get("chapter_max_title_length", 50)
+        min_gap = chapter_settings.get("chapter_min_gap", 40)
+        self.max_title_len = max_title_len if isinstance(max_title_len, int) and max_title_len > 0 else 50
+        self.min_gap = min_gap if isinstance(min_gap, int) and min_gap >= 0 else 40
+
+        strong = _valid_patterns(chapter_settings.get("chapter_patterns_strong", []), "strong")
+        weak = _valid_patterns(chapter_settings.get("chapter_patterns_weak", []), "weak")
+        self.strong = _combine(strong)
+        self.weak = _combine(weak)
+        self.prefilter = _build_prefilter(strong + weak)
+
+        self.inline: Optional[re.Pattern] = None
+        inline_pattern = chapter_settings.get("chapter_inline_pattern", "")
+        if isinstance(inline_pattern, str) and inline_pattern.strip():
+            try:
+                self.inline = re.compile(inline_pattern.strip(), re.IGNORECASE)
+            except re.error as e:
+                log.warning(f"章节内联规则无效，使用默认值: {e}")
+                self.inline = re.compile(DEFAULT_CHAPTER_SETTINGS["chapter_inline_pattern"], re.IGNORECASE)
+        # 内联规则的字面量预筛：只有包含该字符的行才需要正则搜索
+        self.inline_literal = _required_literal(self.inline.pattern) if self.inline else None
+
+        # 规则指纹：规则变化时目录缓存随之失效
+        self.fingerprint = hashlib.md5(json.dumps(
+            [self.max_title_len, self.min_gap, strong, weak, self.inline.pattern if self.inline else None],
+            ensure_ascii=False
+        ).encode("utf-8")).hexdigest()[:12]
+
+    def is_strong(self, line: str) -> bool:
+        return any(pattern.match(line) for pattern in self.strong)
+
+    def is_weak(self, line: str) -> bool:
+        return any(pattern.match(line) for pattern in self.weak)
+
+
+_rules_lock = threading.Lock()
+# ((设置文件 mtime_ns, 大小), 规则)
+_rules_cache: Optional[Tuple[Optional[tuple], ChapterRules]] = None
+
+
+def _settings_stamp() -> Optional[tuple]:
+    try:
+        stat = SETTINGS_FILE.stat()
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def get_chapter_rules() -> ChapterRules:
+    """获取当前章节规则（设置文件未变化时复用已编译的规则）"""
+    global _rules_cache
+    stamp = _settings_stamp()
+    cached = _rules_cache
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    with _rules_lock:
+        if _rules_cache is None or _rules_cache[0] != stamp:
+            _rules_cache = (stamp, ChapterRules(load_chapter_settings()))
+        return _rules_cache[1]
+
+
+def invalidate_chapter_rules() -> None:
+    """丢弃已编译的规则（保存设置后调用）"""
+    global _rules_cache
+    _rules_cache = None
+
+
+class ChapterScanner:
+    """
+    流式章节检测器
+
+    按任意大小的块输入已统一为 \\n 换行的文本，close() 返回候选标题：
+    {"title", "startOffset", "startByte"（track_bytes 时）, "strength", "is_body_only"}
+    强规则 strength=3，内联规则 2，弱规则（需相邻空行）1。
+    """
+
+    def __init__(self, rules: Optional[ChapterRules] = None, track_bytes: bool = False):
+        self.rules = rules or get_chapter_rules()
+        self.track_bytes = track_bytes
+        self.candidates: List[Dict] = []
+        self.lines = 0
+        # 未处理的文本，总是从行首开始
+        self._buf = ""
+        # _buf 起点的字符/字节偏移
+        self._offset = 0
+        self._byte_offset = 0
+        # _buf 第一行的上一行是否为空行（文件开头视为空行）
+        self._prev_blank = True
+        # _buf 第一行是超长行的后半部分（行首已丢弃，不能作为标题）
+        self._continued = False
+
+    def feed(self, text: str) -> None:
+        """输入一块文本（可在任意位置截断）"""
+        if not text:
+            return
+        buf = self._buf + text
+        last = buf.rfind('\n')
+        if last >= 0:
+            # 最后一个完整行留到下一块，等知道下一行是否为空行后再判断
+            end = buf.rfind('\n', 0, last) + 1
+            if end > 0:
+                self._scan(buf, end)
+                buf = buf[end:]
+                last -= end
+        if len(buf) - (last + 1) > MAX_LINE_CHARS:
+            buf = self._drop_long_line(buf, last)
+        self._buf = buf
+
+    def close(self) -> List[Dict]:
+        """处理剩余文本，返回全部候选标题"""
+        buf = self._buf
+        if buf:
+            data = buf if buf.endswith('\n') else buf + '\n'
+            self._scan(data, len(data))
+            if data is not buf:
+                # 补上的换行不计入偏移
+                self._offset -= 1
+                self._byte_offset -= 1
+            self._buf = ""
+        return self.candidates
+
+    def _drop_long_line(self, buf: str, last: int) -> str:
+        """超长行：先处理它之前的行，再把已收到的部分计入偏移后丢弃"""
+        if last >= 0:
+            self._scan(buf, last + 1)
+            buf = buf[last + 1:]
+        self._offset += len(buf)
+        if self.track_bytes:
+            self._byte_offset += len(buf.encode('utf-8'))
+        self._prev_blank = False
+        self._continued = True
+        return ""
+
+    def _line_starts(self, data: str, end: int) -> Iterator[int]:
+        """可能是标题的行首位置"""
+        prefilter = self.rules.prefilter
+        if prefilter is not None:
+            yield 0
+            # 预筛以换行符开头：位置 p 的换行符之后即为行首 p + 1
+            for match in prefilter.finditer(data, 0, end - 1):
+                yield match.start() + 1
+            return
+        start = 0
+        while start < end:
+            yield start
+            start = data.find('\n', start) + 1
+
+    def _scan(self, data: str, end: int) -> None:
+        """处理 data[:end] 中的完整行（end 位于换行符之后，其后的文本只用于判断下一行是否为空行）"""
+        rules = self.rules
+        max_len = rules.max_title_len
+        found: Dict[int, Tuple[int, str, int, bool]] = {}
+        self.lines += data.count('\n', 0, end)
+
+        # 1. 强规则 / 弱规则（只检查预筛命中的行）
+        for start in self._line_starts(data, end):
+            if start == 0 and self._continued:
+                continue
+            line_end = data.find('\n', start)
+            line = data[start:line_end].strip()
+            if not line or len(line) > max_len:
+                continue
+            is_body_only = line in BODY_ONLY_TITLES
+            if rules.is_strong(line):
+                found[start] = (start, line, 3, is_body_only)
+                continue
+            if start == 0:
+                prev_blank = self._prev_blank
+            else:
+                prev_start = data.rfind('\n', 0, start - 1) + 1
+                prev_blank = not data[prev_start:start - 1].strip()
+            next_end = data.find('\n', line_end + 1)
+            next_blank = not data[line_end + 1:next_end if next_end >= 0 else len(data)].strip()
+            if (prev_blank or next_blank) and rules.is_weak(line):
+                found[start] = (start, line, 1, is_body_only)
+
+        # 2. 内联规则（每行取第一个匹配；有字面量预筛时先用 str.find 定位行）
+        inline = rules.inline
+        literal = rules.inline_literal
+        pos = 0
+        while inline is not None and pos < end:
+            if literal:
+                hit = data.find(literal, pos, end)
+                if hit < 0:
+                    break
+                line_start = data.rfind('\n', 0, hit) + 1
+                line_end = data.find('\n', hit)
+                match = inline.search(data, line_start, line_end)
+            else:
+                match = inline.search(data, pos, end)
+                if match is None:
+                    break
+                line_start = data.rfind('\n', 0, match.start()) + 1
+                line_end = data.find('\n', match.start())
+                if match.end() > line_end:
+                    match = inline.search(data, line_start, line_end)
+            if (
+                match is not None
+                and line_start not in found
+                and not (line_start == 0 and self._continued)
+            ):
+                title = match.group().strip()
+                if title and len(title) <= max_len:
+                    found[line_start] = (match.start(), title, 2, False)
+            pos = line_end + 1
+
+        # 3. 记录候选（字节偏移按候选位置增量编码计算）
+        last = 0
+        byte_offset = self._byte_offset
+        for line_start in sorted(found):
+            position, title, strength, is_body_only = found[line_start]
+            candidate = {
+                "title": title,
+                "startOffset": self._offset + position,
+                "strength": strength,
+                "is_body_only": is_body_only,
+            }
+            if self.track_bytes:
+                byte_offset += len(data[last:position].encode('utf-8'))
+                last = position
+                candidate["startByte"] = byte_offset
+            self.candidates.append(candidate)
+
+        self._offset += end
+        if self.track_bytes:
+            self._byte_offset = byte_offset + len(data[last:end].encode('utf-8'))
+        last_start = data.rfind('\n', 0, end - 1) + 1
+        if last_start == 0 and self._continued:
+            self._prev_blank = False
+        else:
+            self._prev_blank = not data[last_start:end - 1].strip()
+        self._continued = False
+
+
+def build_chapters(
+    candidates: List[Dict],
+    total_length: int,
+    total_bytes: Optional[int] = None,
+    rules: Optional[ChapterRules] = None
+) -> List[Dict]:
+    """
+    候选标题 -> 章节列表
+
+    间距不超过 chapter_min_gap 的候选只保留强度高的，补齐结束位置，
+    第一章之前内容较多时补一个“序”。
+
+    Args:
+        candidates: ChapterScanner 的候选标题
+        total_length: 全文字符数
+        total_bytes: 全文字节数（为 None 时不输出字节偏移）
+        rules: 章节规则（默认当前规则）
+
+    Returns:
+        章节列表，没有候选时为空列表
+    """
+    min_gap = (rules or get_chapter_rules()).min_gap
+    with_bytes = total_bytes is not None
+
+    filtered: List[Dict] = []
+    for cand in sorted(candidates, key=lambda x: x["startOffset"]):
+        if filtered and cand["startOffset"] - filtered[-1]["startOffset"] <= min_gap:
+            if cand["strength"] > filtered[-1]["strength"]:
+                filtered[-1] = cand
+            continue
+        filtered.append(cand)
+
+    if any(not c.get("is_body_only") for c in filtered):
+        filtered = [c for c in filtered if not c.get("is_body_only")]
+
+    chapters = []
+    for i, match in enumerate(filtered):
+        next_match = filtered[i + 1] if i < len(filtered) - 1 else None
+        chapter = {
+            "title": match["title"],
+            "startOffset": match["startOffset"],
+            "endOffset": next_match["startOffset"] if next_match else total_length,
+        }
+        if with_bytes:
+            chapter["startByte"] = match["startByte"]
+            chapter["endByte"] = next_match["startByte"] if next_match else total_bytes
+        chapters.append(chapter)
+
+    if filtered and filtered[0]["startOffset"] > 100:
+        preface = {
+            "title": "序",
+            "startOffset": 0,
+            "endOffset": filtered[0]["startOffset"],
+        }
+        if with_bytes:
+            preface["startByte"] = 0
+            preface["endByte"] = filtered[0]["startByte"]
+        chapters.insert(0, preface)
+
+    return chapters
+
+
+def detect_chapters(content: str, rules: Optional[ChapterRules] = None) -> List[Dict]:
+    """
+    识别整段文本的章节（字符偏移）
+
+    Returns:
+        章节列表，没有识别到章节时为空列表
+    """
+    rules = rules or get_chapter_rules()
+    scanner = ChapterScanner(rules)
+    scanner.feed(content)
+    return build_chapters(scanner.close(), len(content), rules=rules)
@@ -0,0 +1,270 @@
+"""
+漫画（CBZ/ZIP）页面服务
+缓存解析后的页面列表和打开的 ZipFile，避免每次翻页都重新解析中央目录
+
+- 页面列表：按 (路径, mtime_ns, 大小) 缓存，文件变化后自动失效
+- ZipFile 句柄：按同样的键复用，超出上限时淘汰最久未用的；
+  句柄带引用计数，正在读取的句柄被淘汰后由最后一个使用者关闭
+- 缩放版本：按请求宽度生成 WebP 并保存在磁盘上，供重复访问和预取
+"""
+import hashlib
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from PIL import Image
+
+from app.config import settings
+from app.core.metadata.comic_parser import ComicParser
+from app.utils.logger import log
+
+
+COMIC_CACHE_DIR = Path(settings.directories.data) / "cache" / "comic"
+
+# 缓存的页面列表数量 / 同时打开的压缩包数量
+PAGE_LIST_CACHE_SIZE = 64
+HANDLE_POOL_SIZE = 16
+
+# 缩放宽度：限定范围并按步长取整，避免任意宽度产生大量缓存文件
+MIN_RENDITION_WIDTH = 160
+MAX_RENDITION_WIDTH = 2560
+RENDITION_WIDTH_STEP = 80
+RENDITION_QUALITY = 80
+
+# 预取最多页数
+MAX_PREFETCH_PAGES = 10
+
+IMAGE_MIME_TYPES = {
+    '.png': "image/png",
+    '.webp': "image/webp",
+    '.gif': "image/gif",
+    '.bmp': "image/bmp",
+}
+
+FileKey = Tuple[str, int, int]
+
+
+def file_key(file_path: Path) -> FileKey:
+    """(路径, mtime_ns, 大小)，文件变化后键随之变化"""
+    stat = file_path.stat()
+    return str(file_path), stat.st_mtime_ns, stat.st_size
+
+
+def key_digest(key: FileKey) -> str:
+    """文件键的短摘要（用于 ETag 和缓存目录名）"""
+    return hashlib.sha1(f"{key[0]}|{key[1]}|{key[2]}".encode("utf-8")).hexdigest()[:20]
+
+
+def normalize_width(width: int) -> int:
+    """把请求宽度限制在允许范围内并向上取整到步长"""
+    width = max(MIN_RENDITION_WIDTH, min(MAX_RENDITION_WIDTH, width))
+    return -(-width // RENDITION_WIDTH_STEP) * RENDITION_WIDTH_STEP
+
+
+def image_mime_type(filename: str) -> str:
+    return IMAGE_MIME_TYPES.get(Path(filename).suffix.lower(), "image/jpeg")
+
+
+@dataclass(slots=True)
+class _ArchiveHandle:
+    """打开的压缩包（users / evicted 由 ComicPageServer._lock 保护）"""
+    zf: zipfile.ZipFile
+    read_lock: threading.Lock = field(default_factory=threading.Lock)
+    users: int = 0
+    evicted: bool = False
+
+
+class ComicPageServer:
+    """漫画页面读取服务（线程安全，方法均为同步，供线程池调用）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pages: "OrderedDict[FileKey, List[Dict]]" = OrderedDict()
+        self._handles: "OrderedDict[FileKey, _ArchiveHandle]" = OrderedDict()
+        self._prefetch_executor: Optional[ThreadPoolExecutor] = None
+        self._prefetching: set = set()
+
+    # ===== 页面列表 / 句柄 =====
+
+    def _acquire(self, key: FileKey) -> _ArchiveHandle:
+        """取得压缩包句柄并增加引用计数，用完后须调用 _release"""
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is not None:
+                self._handles.move_to_end(key)
+                handle.users += 1
+                return handle
+        zf = zipfile.ZipFile(key[0], 'r')
+        to_close = []
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is not None:
+                to_close.append(zf)
+            else:
+                handle = _ArchiveHandle(zf)
+                self._handles[key] = handle
+                while len(self._handles) > HANDLE_POOL_SIZE:
+                    _, old = self._handles.popitem(last=False)
+                    old.evicted = True
+                    if old.users == 0:
+                        to_close.append(old.zf)
+            handle.users += 1
+        for old_zf in to_close:
+            old_zf.close()
+        return handle
+
+    def _release(self, handle: _ArchiveHandle) -> None:
+        """减少引用计数；已被淘汰且无人使用时关闭"""
+        with self._lock:
+            handle.users -= 1
+            close = handle.evicted and handle.users == 0
+        if close:
+            handle.zf.close()
+
+    @contextmanager
+    def _archive(self, key: FileKey) -> Iterator[zipfile.ZipFile]:
+        """持有读取锁使用压缩包（期间句柄不会被关闭）"""
+        handle = self._acquire(key)
+        try:
+            with handle.read_lock:
+                yield handle.zf
+        finally:
+            self._release(handle)
+
+    def get_pages(self, file_path: Path) -> Tuple[FileKey, List[Dict]]:
+        """
+        获取页面列表（自然排序的图片）
+
+        Returns:
+            (文件键, [{"filename", "size"}])
+        """
+        key = file_key(file_path)
+        with self._lock:
+            pages = self._pages.get(key)
+            if pages is not None:
+                self._pages.move_to_end(key)
+                return key, pages
+
+        with self._archive(key) as zf:
+            pages = ComicParser.list_images(zf)
+        with self._lock:
+            self._pages[key] = pages
+            while len(self._pages) > PAGE_LIST_CACHE_SIZE:
+                self._pages.popitem(last=False)
+        return key, pages
+
+    def read_page(self, file_path: Path, index: int) -> Optional[Tuple[FileKey, str, bytes]]:
+        """
+        读取原始页面图片
+
+        Returns:
+            (文件键, 图片文件名, 数据)；索引越界返回 None
+        """
+        key, pages = self.get_pages(file_path)
+        if index < 0 or index >= len(pages):
+            return None
+        filename = pages[index]["filename"]
+        with self._archive(key) as zf:
+            data = zf.read(filename)
+        return key, filename, data
+
+    # ===== 缩放版本 =====
+
+    def rendition_path(self, key: FileKey, index: int, width: int) -> Path:
+        return COMIC_CACHE_DIR / key_digest(key) / f"{index}-w{width}.webp"
+
+    def get_rendition(self, file_path: Path, index: int, width: int) -> Optional[Tuple[FileKey, Optional[Path]]]:
+        """
+        获取缩放后的 WebP 页面（不存在时生成）
+
+        Args:
+            file_path: 漫画文件路径
+            index: 页面索引
+            width: 已经过 normalize_width 的宽度
+
+        Returns:
+            (文件键, 缩放文件路径)；原图不比目标宽度大时路径为 None（直接用原图）；
+            索引越界返回 None
+        """
+        key, pages = self.get_pages(file_path)
+        if index < 0 or index >= len(pages):
+            return None
+        path = self.rendition_path(key, index, width)
+        if path.exists():
+            return key, path
+
+        page = self.read_page(file_path, index)
+        if page is None:
+            return None
+        _, _, data = page
+        with Image.open(BytesIO(data)) as image:
+            if image.width <= width:
+                return key, None
+            height = max(1, round(image.height * width / image.width))
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+            resized = image.resize((width, height), Image.Resampling.LANCZOS)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        resized.save(tmp_path, "WEBP", quality=RENDITION_QUALITY, method=4)
+        os.replace(tmp_path, path)
+        return key, path
+
+    def prefetch(self, file_path: Path, start: int, count: int, width: Optional[int]) -> List[int]:
+        """
+        预取后续页面：预热页面列表，并在后台生成缩放版本
+
+        Returns:
+            实际存在的页面索引
+        """
+        _, pages = self.get_pages(file_path)
+        indexes = list(range(max(0, start), min(len(pages), start + min(count, MAX_PREFETCH_PAGES))))
+        if width is None or not indexes:
+            return indexes
+
+        if self._prefetch_executor is None:
+            self._prefetch_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="comic-prefetch")
+        for index in indexes:
+            job = (str(file_path), index, width)
+            with self._lock:
+                if job in self._prefetching:
+                    continue
+                self._prefetching.add(job)
+            self._prefetch_executor.submit(self._prefetch_one, file_path, index, width, job)
+        return indexes
+
+    def _prefetch_one(self, file_path: Path, index: int, width: int, job: tuple) -> None:
+        try:
+            self.get_rendition(file_path, index, width)
+        except Exception as e:
+            log.debug(f"预取漫画页面失败: {file_path} #{index}, 错误: {e}")
+        finally:
+            with self._lock:
+                self._prefetching.discard(job)
+
+    def shutdown(self) -> None:
+        """关闭预取线程池和所有打开的压缩包"""
+        if self._prefetch_executor is not None:
+            self._prefetch_executor.shutdown(wait=False, cancel_futures=True)
+            self._prefetch_executor = None
+        with self._lock:
+            handles = list(self._handles.values())
+            self._handles.clear()
+            self._pages.clear()
+            for handle in handles:
+                handle.evicted = True
+            idle = [handle.zf for handle in handles if handle.users == 0]
+        for zf in idle:
+            zf.close()
+
+
+# 全局页面服务实例
+comic_page_server = ComicPageServer()
@@ -0,0 +1,357 @@
+"""
+封面多尺寸渲染服务
+为封面生成多个宽度的 AVIF/WebP/JPEG 版本，供列表、详情和 OPDS 按需选用
+
+- 在进程池中解码和缩放，不占用事件循环和主进程 GIL
+- JPEG 原图使用 draft 模式按 1/2、1/4、1/8 解码，只解码到够用的分辨率
+- 一次解码生成全部宽度和格式，同一封面的并发请求合并为一个任务
+- 扫描结束或管理员批量操作时可预生成
+
+输出文件位于 <封面目录>/renditions/<封面版本号>-w<宽度>.<扩展名>，
+封面版本号由封面路径、mtime 和大小计算（见 cover_manager.cover_version），封面改写即换新文件。
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from PIL import Image, features
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models import Book
+from app.utils.cover_manager import cover_version
+from app.utils.logger import log
+
+
+RENDITION_DIR = Path(settings.directories.covers) / "renditions"
+
+# 格式 -> (扩展名, MIME, PIL 格式名)
+FORMATS: Dict[str, Tuple[str, str, str]] = {
+    "avif": ("avif", "image/avif", "AVIF"),
+    "webp": ("webp", "image/webp", "WEBP"),
+    "jpeg": ("jpg", "image/jpeg", "JPEG"),
+}
+
+# 按压缩率从高到低排列，协商时取客户端支持的第一个
+_PREFERRED = ("avif", "webp", "jpeg")
+
+# 预生成时同时排队的封面数
+PREGENERATE_BATCH = 32
+
+
+def supported_formats() -> List[str]:
+    """当前 Pillow 能编码的格式"""
+    result = []
+    for name in _PREFERRED:
+        if name == "avif" and not features.check("avif"):
+            continue
+        if name == "webp" and not features.check("webp"):
+            continue
+        result.append(name)
+    return result
+
+
+SUPPORTED_FORMATS = supported_formats()
+
+
+def _accept_qualities(accept: Optional[str]) -> Dict[str, float]:
+    """解析 Accept 头，返回 媒体类型 -> q 值（同一类型出现多次时取第一次）"""
+    qualities: Dict[str, float] = {}
+    for media_range in (accept or "").lower().split(","):
+        media_type, *params = (part.strip() for part in media_range.split(";"))
+        if not media_type:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities.setdefault(media_type, quality)
+    return qualities
+
+
+def negotiate_format(accept: Optional[str]) -> str:
+    """
+    按 Accept 头选择输出格式
+
+    只有明确列出且 q > 0 的 AVIF/WebP 才会被选中（image/* 不算）；
+    取 q 值最高的格式，q 相同时按压缩率优先，都不可用时返回 JPEG。
+
+    Args:
+        accept: 请求的 Accept 头
+
+    Returns:
+        'avif' / 'webp' / 'jpeg'
+    """
+    qualities = _accept_qualities(accept)
+    best, best_quality = "jpeg", 0.0
+    for name in SUPPORTED_FORMATS:
+        quality = qualities.get(FORMATS[name][1], 0.0)
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def snap_width(width: int) -> int:
+    """把请求宽度对齐到配置的尺寸（取不小于请求的最小尺寸，超出时取最大尺寸）"""
+    widths = sorted(settings.cover.rendition_widths) or [settings.cover.thumbnail_width]
+    for candidate in widths:
+        if candidate >= width:
+            return candidate
+    return widths[-1]
+
+
+def rendition_path(version: str, width: int, fmt: str, max_height: Optional[int] = None) -> Path:
+    """封面某个尺寸和格式的输出路径（限制高度的缩略图单独命名）"""
+    size = f"w{width}" if max_height is None else f"w{width}h{max_height}"
+    return RENDITION_DIR / f"{version}-{size}.{FORMATS[fmt][0]}"
+
+
+# ===== 渲染进程 =====
+
+def render_cover(
+    cover_path: str,
+    version: str,
+    widths: Sequence[int],
+    formats: Sequence[str],
+    quality: int,
+    max_height: Optional[int] = None
+) -> Dict[str, str]:
+    """
+    解码一次封面并生成所有尺寸和格式（在子进程中执行）
+
+    Args:
+        cover_path: 原始封面路径
+        version: 封面版本号（决定输出文件名）
+        widths: 目标宽度（原图更窄时不放大）
+        formats: 输出格式
+        quality: 压缩质量
+        max_height: 高度上限（缩略图按宽高框缩放）
+
+    Returns:
+        {"<宽度>:<格式>": 输出路径}
+    """
+    RENDITION_DIR.mkdir(parents=True, exist_ok=True)
+    outputs: Dict[str, str] = {}
+    with Image.open(cover_path) as image:
+        largest = max(widths)
+        if image.format == "JPEG":
+            # draft 模式：解码时直接按 2 的幂缩小，只要仍不小于最大目标尺寸。
+            # Pillow 取 min(宽 // 目标宽, 高 // 目标高) 作为缩小倍数，目标须保持原图宽高比
+            image.draft("RGB", (largest, max(1, round(image.height * largest / image.width))))
+        image.load()
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        base = image.convert("RGBA" if has_alpha else "RGB")
+
+    for width in sorted(set(widths), reverse=True):
+        target_width = min(width, base.width)
+        target_height = max(1, round(base.height * target_width / base.width))
+        if max_height and target_height > max_height:
+            target_height = max_height
+            target_width = max(1, round(base.width * max_height / base.height))
+        if (target_width, target_height) == base.size:
+            resized = base
+        else:
+            resized = base.resize((target_width, target_height), Image.Resampling.LANCZOS)
+
+        for fmt in formats:
+            path = rendition_path(version, width, fmt, max_height)
+            frame = resized
+            if fmt == "jpeg" and frame.mode != "RGB":
+                frame = frame.convert("RGB")
+            tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            frame.save(tmp_path, FORMATS[fmt][2], quality=quality)
+            os.replace(tmp_path, path)
+            outputs[f"{width}:{fmt}"] = str(path)
+    return outputs
+
+
+class CoverRenditionService:
+    """封面多尺寸渲染服务（进程池 + 请求合并）"""
+
+    def __init__(self, workers: int):
+        self.workers = max(1, workers)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # (封面路径, 版本号, 宽度, 高度上限, 格式) -> 正在进行的渲染任务
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+        self._background: Set[asyncio.Task] = set()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def _render(
+        self,
+        cover_path: str,
+        version: str,
+        widths: Tuple[int, ...],
+        max_height: Optional[int] = None,
+        formats: Optional[Tuple[str, ...]] = None
+    ) -> None:
+        """渲染封面，同一封面同一组尺寸的并发调用共享同一任务"""
+        formats = formats or tuple(SUPPORTED_FORMATS)
+        key = (cover_path, version, widths, max_height, formats)
+        future = self._inflight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                self._get_executor(),
+                render_cover,
+                cover_path,
+                version,
+                widths,
+                formats,
+                settings.cover.quality,
+                max_height,
+            )
+            self._inflight[key] = future
+            future.add_done_callback(lambda _f: self._inflight.pop(key, None))
+        # shield：单个请求被取消时不影响其他等待者和渲染本身
+        try:
+            await asyncio.shield(future)
+        except BrokenProcessPool:
+            # 子进程异常退出后进程池不可再用，下次调用时重建
+            self._executor = None
+            raise
+
+    async def get(self, cover_path: str, version: str, width: int, fmt: str) -> Optional[Path]:
+        """
+        获取封面某个尺寸和格式的文件，不存在时生成
+
+        Args:
+            cover_path: 原始封面路径
+            version: 封面版本号（cover_manager.cover_version）
+            width: 已经过 snap_width 的宽度
+            fmt: 输出格式
+
+        Returns:
+            文件路径，生成失败返回 None
+        """
+        path = rendition_path(version, width, fmt)
+        if path.exists():
+            return path
+        try:
+            await self._render(cover_path, version, tuple(sorted(settings.cover.rendition_widths)))
+        except Exception as e:
+            log.error(f"生成多尺寸封面失败: {cover_path}, 错误: {e}")
+            return None
+        return path if path.exists() else None
+
+    async def get_thumbnail(self, cover_path: str, version: str) -> Optional[Path]:
+        """
+        获取缩略图（JPEG，按配置的缩略图宽高框缩放）
+
+        Returns:
+            文件路径，生成失败返回 None
+        """
+        width = settings.cover.thumbnail_width
+        height = settings.cover.thumbnail_height
+        path = rendition_path(version, width, "jpeg", height)
+        if path.exists():
+            return path
+        try:
+            await self._render(cover_path, version, (width,), height, ("jpeg",))
+        except Exception as e:
+            log.error(f"生成缩略图失败: {cover_path}, 错误: {e}")
+            return None
+        return path if path.exists() else None
+
+    @staticmethod
+    def _missing(version: str) -> bool:
+        return any(
+            not rendition_path(version, width, fmt).exists()
+            for width in settings.cover.rendition_widths
+            for fmt in SUPPORTED_FORMATS
+        )
+
+    def _pending(self, cover_paths: Iterable[str]) -> List[Tuple[str, str]]:
+        """尚未生成全部尺寸的封面 (路径, 版本号)（逐个 stat 文件，在线程中调用）"""
+        pending = []
+        for path in dict.fromkeys(cover_paths):
+            version = cover_version(path)
+            if version and self._missing(version):
+                pending.append((path, version))
+        return pending
+
+    async def pregenerate(self, cover_paths: Iterable[str]) -> int:
+        """
+        批量预生成多尺寸封面（跳过已生成的）
+
+        Args:
+            cover_paths: 原始封面路径
+
+        Returns:
+            新生成的封面数
+        """
+        widths = tuple(sorted(settings.cover.rendition_widths))
+        pending = await asyncio.to_thread(self._pending, cover_paths)
+        generated = 0
+        for start in range(0, len(pending), PREGENERATE_BATCH):
+            batch = pending[start:start + PREGENERATE_BATCH]
+            results = await asyncio.gather(
+                *(self._render(path, version, widths) for path, version in batch),
+                return_exceptions=True
+            )
+            for (path, _version), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    log.warning(f"预生成多尺寸封面失败: {path}, 错误: {result}")
+                else:
+                    generated += 1
+        if generated:
+            log.info(f"预生成多尺寸封面: {generated} 个")
+        return generated
+
+    def schedule_pregenerate(self, cover_paths: Iterable[str]) -> None:
+        """在后台预生成多尺寸封面，不等待完成"""
+        cover_paths = list(cover_paths)
+        if not cover_paths:
+            return
+        task = asyncio.create_task(self.pregenerate(cover_paths))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def shutdown(self) -> None:
+        """关闭进程池和后台任务"""
+        for task in list(self._background):
+            task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# 全局渲染服务实例
+cover_renditions = CoverRenditionService(settings.cover.rendition_workers)
+
+
+async def schedule_scan_pregenerate(db: AsyncSession, library_id: int, since: datetime) -> None:
+    """
+    扫描结束后为本次新增的书籍预生成多尺寸封面（后台执行）
+
+    Args:
+        db: 数据库会话
+        library_id: 书库ID
+        since: 扫描开始时间
+    """
+    if not settings.cover.pregenerate_on_scan:
+        return
+    result = await db.execute(
+        select(Book.cover_path).where(
+            Book.library_id == library_id,
+            Book.added_at >= since,
+            Book.cover_path.isnot(None)
+        )
+    )
+    cover_renditions.schedule_pregenerate(result.scalars().all())
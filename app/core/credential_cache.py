@@ -0,0 +1,92 @@
+"""
+已验证凭据缓存
+OPDS 客户端每个请求都带 HTTP Basic 凭据，逐次 bcrypt 校验（约 250ms CPU）开销过大。
+
+- 只缓存校验成功的凭据，带过期时间和条目上限（LRU）
+- 缓存键为 HMAC(进程随机密钥, 用户名 + 密码 + 当前密码哈希)，内存中不保留明文密码；
+  密码修改后哈希变化，旧条目自然失效，修改密码/删除用户时也会主动清除
+- 需要校验时在线程中执行 bcrypt，同一凭据的并发校验合并为一次
+"""
+import asyncio
+import hashlib
+import hmac
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+from app.config import settings
+from app.security import verify_password
+
+
+class CredentialCache:
+    """带过期时间和条目上限的已验证凭据缓存"""
+
+    def __init__(self, ttl: int, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._secret = os.urandom(32)
+        # 缓存键 -> (用户ID, 过期时间)
+        self._entries: "OrderedDict[bytes, Tuple[int, float]]" = OrderedDict()
+        self._inflight: Dict[bytes, asyncio.Future] = {}
+
+    def _key(self, username: str, password: str, password_hash: str) -> bytes:
+        mac = hmac.new(self._secret, digestmod=hashlib.sha256)
+        for part in (username, password, password_hash):
+            data = part.encode("utf-8")
+            mac.update(len(data).to_bytes(4, "big"))
+            mac.update(data)
+        return mac.digest()
+
+    async def verify(self, user_id: int, username: str, password: str, password_hash: str) -> bool:
+        """
+        校验密码，命中缓存时不执行 bcrypt
+
+        Args:
+            user_id: 用户ID
+            username: 用户名
+            password: 明文密码
+            password_hash: 数据库中当前的密码哈希
+
+        Returns:
+            是否匹配
+        """
+        if self.ttl <= 0:
+            return await asyncio.to_thread(verify_password, password, password_hash)
+
+        key = self._key(username, password, password_hash)
+        entry = self._entries.get(key)
+        if entry is not None:
+            cached_user_id, expires_at = entry
+            if cached_user_id == user_id and expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                return True
+            self._entries.pop(key, None)
+
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(asyncio.to_thread(verify_password, password, password_hash))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _f: self._inflight.pop(key, None))
+        # shield：单个请求被取消时不影响其他等待者
+        valid = await asyncio.shield(future)
+
+        if valid:
+            self._entries[key] = (user_id, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return valid
+
+    def invalidate_user(self, user_id: int) -> None:
+        """清除某个用户的全部缓存（修改密码、删除用户时调用）"""
+        for key in [k for k, (uid, _) in self._entries.items() if uid == user_id]:
+            del self._entries[key]
+
+    def clear(self) -> None:
+        """清空缓存"""
+        self._entries.clear()
+
+
+# 全局 OPDS 凭据缓存实例
+opds_credential_cache = CredentialCache(settings.opds.auth_cache_ttl, settings.opds.auth_cache_size)
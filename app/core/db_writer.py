@@ -0,0 +1,168 @@
+"""
+数据库写入队列
+高频小写入（阅读进度、心跳）提交到单个写入任务，合并为一个事务提交（group commit）
+
+- 写入任务取出第一个任务后，在合并窗口内继续收集，最多 write_batch_size 个
+- 一批任务在同一会话中依次执行，只提交一次
+- 合并提交失败时回滚，逐个单独重试，出错的任务只影响自己的调用方
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, List, Optional, Tuple, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.utils.logger import log
+
+
+T = TypeVar("T")
+WriteJob = Callable[[AsyncSession], Awaitable[T]]
+
+
+class DatabaseWriter:
+    """单写入任务 + 合并提交"""
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        batch_size: int,
+        batch_window: float
+    ):
+        self.session_factory = session_factory
+        self.batch_size = max(1, batch_size)
+        self.batch_window = max(0.0, batch_window)
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # 统计
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.batches = 0
+        self.max_batch = 0
+        self.max_depth = 0
+        self.split_batches = 0
+        self.commit_seconds = 0.0
+
+    def _ensure_started(self) -> asyncio.Queue:
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+        return self._queue
+
+    async def submit(self, job: WriteJob) -> T:
+        """
+        提交写入任务并等待其所在批次提交
+
+        Args:
+            job: async def job(session) -> 结果，在写入会话中执行，不要自行提交
+
+        Returns:
+            job 的返回值
+        """
+        queue = self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        queue.put_nowait((job, future))
+        self.submitted += 1
+        self.max_depth = max(self.max_depth, queue.qsize())
+        return await future
+
+    async def _run(self) -> None:
+        queue = self._queue
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = loop.time() + self.batch_window
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            await self._commit_batch(batch)
+            if stop:
+                return
+
+    async def _commit_batch(self, batch: List[Tuple[WriteJob, asyncio.Future]]) -> None:
+        batch = [(job, future) for job, future in batch if not future.done()]
+        if not batch:
+            return
+
+        start = time.monotonic()
+        results = []
+        try:
+            async with self.session_factory() as session:
+                for job, _ in batch:
+                    results.append(await job(session))
+                await session.commit()
+        except Exception as e:
+            if len(batch) > 1:
+                # 合并提交失败：逐个单独提交，隔离出错的任务
+                self.split_batches += 1
+                for item in batch:
+                    await self._commit_batch([item])
+                return
+            self.failed += 1
+            future = batch[0][1]
+            if not future.done():
+                future.set_exception(e)
+            return
+        finally:
+            self.commit_seconds += time.monotonic() - start
+
+        self.batches += 1
+        self.max_batch = max(self.max_batch, len(batch))
+        self.completed += len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def get_status(self) -> dict:
+        """写入队列统计"""
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "max_queue_depth": self.max_depth,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "batches": self.batches,
+            "avg_batch_size": round(self.completed / self.batches, 2) if self.batches else 0,
+            "max_batch_size": self.max_batch,
+            "split_batches": self.split_batches,
+            "commit_ms_total": round(self.commit_seconds * 1000, 1),
+        }
+
+    async def close(self) -> None:
+        """处理完队列中剩余的任务后停止"""
+        if self._task is None or self._task.done():
+            return
+        self._queue.put_nowait(None)
+        try:
+            await self._task
+        except Exception as e:
+            log.error(f"数据库写入队列停止失败: {e}")
+        self._task = None
+
+
+# 全局写入队列实例
+db_writer = DatabaseWriter(
+    AsyncSessionLocal,
+    settings.database.write_batch_size,
+    settings.database.write_batch_window_ms / 1000,
+)
@@ -2,21 +2,67 @@
 去重检测模块
 检测文件是否已经存在于数据库中，支持书籍组合并（类似Emby）
 """
+import asyncio
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Collection, Dict, List, Optional, Sequence, Tuple
 from collections import defaultdict
 import re
 
-from sqlalchemy import select, func
+from sqlalchemy import select, func, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import aliased, joinedload
 
 from app.config import settings
+from app.core.library_stats import mark_books_changed
 from app.models import Author, Book, BookGroup, BookVersion
-from app.utils.file_hash import calculate_file_hash
+from app.utils.file_hash import calculate_file_hash, quick_hash
 from app.utils.logger import log
 
 
+@dataclass(slots=True)
+class FileFingerprint:
+    """文件指纹：大小 + 采样Hash，完整Hash按需计算"""
+    file_size: int
+    sample_hash: str
+    file_hash: Optional[str] = None
+
+    def version_fields(self) -> dict:
+        """可直接传给 BookVersion(...) 的字段"""
+        return {
+            "file_size": self.file_size,
+            "sample_hash": self.sample_hash,
+            "file_hash": self.file_hash,
+        }
+
+
+def fingerprint_file(file_path: Path, algorithm: str, full: bool = False) -> FileFingerprint:
+    """
+    计算文件指纹（同步，可在子进程/线程中调用）
+
+    Args:
+        file_path: 文件路径
+        algorithm: 完整Hash算法
+        full: 是否同时计算完整Hash
+
+    Returns:
+        FileFingerprint
+    """
+    return FileFingerprint(
+        file_size=file_path.stat().st_size,
+        sample_hash=quick_hash(file_path),
+        file_hash=calculate_file_hash(file_path, algorithm) if full else None,
+    )
+
+
+@dataclass(slots=True)
+class _HashCandidate:
+    """内容比对候选（库内版本或同批次中较早的文件）"""
+    file_path: Path
+    fingerprint: FileFingerprint
+    version_id: Optional[int] = None
+
+
 class Deduplicator:
     """去重检测器（支持版本管理和书籍组）"""
     
@@ -24,13 +70,25 @@ class Deduplicator:
         self.db = db
         self.enabled = settings.deduplicator.enable
         self.algorithm = settings.deduplicator.hash_algorithm
+        self.hash_mode = settings.deduplicator.hash_mode
         self.similarity_threshold = settings.deduplicator.similarity_threshold
     
+    def fingerprint(self, file_path: Path, full: bool = False) -> FileFingerprint:
+        """
+        计算文件指纹（采样模式下不计算完整Hash）
+
+        Args:
+            file_path: 文件路径
+            full: 强制计算完整Hash（如压缩包内的临时文件，之后无法再读取）
+        """
+        return fingerprint_file(file_path, self.algorithm, full or self.hash_mode == "full")
+
     async def check_duplicate(
         self,
         file_path: Path,
         title: str,
-        author: Optional[str] = None
+        author: Optional[str] = None,
+        fingerprint: Optional[FileFingerprint] = None
     ) -> Tuple[str, Optional[int], Optional[str]]:
         """
         检查文件是否重复，并决定处理方式
@@ -39,6 +97,8 @@ class Deduplicator:
             file_path: 文件路径
             title: 书名
             author: 作者名（可选）
+            fingerprint: 文件指纹；传入时比对过程中算出的完整Hash会写回其中，
+                保存版本时直接复用，避免再次读取文件
             
         Returns:
             (action, book_id, reason)
@@ -46,26 +106,26 @@ class Deduplicator:
             - book_id: 如果是add_version，返回对应的book_id
             - reason: 处理原因说明
         """
-        if not self.enabled:
-            return 'new_book', None, None
-        
-        # 1. 计算文件Hash
-        file_hash = calculate_file_hash(file_path, self.algorithm)
-        
-        # 2. 检查Hash是否存在（完全相同的文件）
-        hash_result = await self._check_hash_duplicate(file_hash)
-        if hash_result:
+        # 1. 检查内容是否与已有版本完全相同（大小 -> 采样Hash -> 完整Hash）
+        #    file_hash 有唯一约束，关闭去重时也必须跳过完全相同的文件（与扫描写入流程一致）
+        if fingerprint is None:
+            fingerprint = self.fingerprint(file_path)
+        duplicates = await self.find_content_duplicates([(file_path, fingerprint)])
+        if duplicates[0]:
             log.info(f"发现Hash重复: {file_path.name}")
             return 'skip', None, "文件内容完全相同"
         
-        # 3. 检查是否为同一本书的不同版本
+        if not self.enabled:
+            return 'new_book', None, None
+        
+        # 2. 检查是否为同一本书的不同版本
         if author:
             existing_book = await self._find_same_book(title, author)
             if existing_book:
                 log.info(f"发现同名书籍，作为新版本: {file_path.name} ({title} by {author})")
                 return 'add_version', existing_book.id, f"同一本书的新版本"
         
-        # 4. 新书籍
+        # 3. 新书籍
         return 'new_book', None, None
     
     # 为了向后兼容，保留旧的API
@@ -84,25 +144,96 @@ class Deduplicator:
         action, _, reason = await self.check_duplicate(file_path, title, author)
         return action == 'skip', reason
     
-    async def _check_hash_duplicate(self, file_hash: str) -> bool:
+    async def find_content_duplicates(
+        self,
+        files: Sequence[Tuple[Path, FileFingerprint]],
+        exclude_version_ids: Collection[int] = ()
+    ) -> List[bool]:
         """
-        检查Hash是否已存在于任何版本中
-        
+        批量检查文件内容是否与库内版本（或同批次中较早的文件）完全相同
+
+        只有大小相同且采样Hash相同（或旧记录没有采样Hash）时才计算完整Hash；
+        算出的完整Hash写回各自的指纹，库内缺少完整Hash的版本顺带补录。
+
         Args:
-            file_hash: 文件Hash值
-            
+            files: [(文件路径, 指纹)]
+            exclude_version_ids: 不参与比对的版本ID（如文件自身的旧版本记录）
+
         Returns:
-            是否存在
+            与 files 一一对应的是否重复
         """
-        result = await self.db.execute(
-            select(BookVersion).where(BookVersion.file_hash == file_hash)
-        )
-        return result.scalar_one_or_none() is not None
+        sizes = {fingerprint.file_size for _, fingerprint in files}
+        candidates: Dict[int, List[_HashCandidate]] = defaultdict(list)
+        if sizes:
+            result = await self.db.execute(
+                select(
+                    BookVersion.id,
+                    BookVersion.file_path,
+                    BookVersion.file_size,
+                    BookVersion.sample_hash,
+                    BookVersion.file_hash,
+                )
+                .where(BookVersion.file_size.in_(sizes))
+            )
+            for version_id, path, size, sample, full in result.all():
+                if version_id in exclude_version_ids:
+                    continue
+                candidates[size].append(
+                    _HashCandidate(Path(path), FileFingerprint(size, sample, full), version_id)
+                )
+
+        duplicates = []
+        for file_path, fingerprint in files:
+            matches = [
+                c for c in candidates[fingerprint.file_size]
+                if c.fingerprint.sample_hash is None or c.fingerprint.sample_hash == fingerprint.sample_hash
+            ]
+            duplicate = False
+            if matches:
+                if fingerprint.file_hash is None:
+                    fingerprint.file_hash = await asyncio.to_thread(calculate_file_hash, file_path, self.algorithm)
+                for candidate in matches:
+                    if await self._ensure_full_hash(candidate) == fingerprint.file_hash:
+                        duplicate = True
+                        break
+            duplicates.append(duplicate)
+            if not duplicate:
+                candidates[fingerprint.file_size].append(_HashCandidate(file_path, fingerprint))
+        return duplicates
+
+    async def _ensure_full_hash(self, candidate: _HashCandidate) -> Optional[str]:
+        """获取候选的完整Hash，库内版本缺失时从磁盘计算并补录"""
+        fingerprint = candidate.fingerprint
+        if fingerprint.file_hash is not None:
+            return fingerprint.file_hash
+        try:
+            fingerprint.file_hash = await asyncio.to_thread(
+                calculate_file_hash, candidate.file_path, self.algorithm
+            )
+        except OSError:
+            # 文件已不在磁盘上，无法确认内容
+            return None
+        if candidate.version_id is not None:
+            # file_hash 唯一：关闭去重时可能已存在内容相同的版本，此时不补录
+            other = aliased(BookVersion)
+            taken = select(other.id).where(other.file_hash == fingerprint.file_hash).exists()
+            await self.db.execute(
+                update(BookVersion)
+                .where(BookVersion.id == candidate.version_id)
+                .where(~taken)
+                .values(file_hash=fingerprint.file_hash)
+            )
+            await mark_books_changed(
+                self.db, select(BookVersion.book_id).where(BookVersion.id == candidate.version_id)
+            )
+        return fingerprint.file_hash
     
     async def _find_same_book(self, title: str, author: str) -> Optional[Book]:
         """
         查找书名和作者都相同的书籍
         
+        书名和作者没有唯一约束（关闭去重时可能存在多本），取最早添加的一本。
+        
         Args:
             title: 书名
             author: 作者
@@ -120,9 +251,11 @@ class Deduplicator:
             .where(Author.name == author)
             .where(Book.title == title)
             .options(joinedload(Book.author))
+            .order_by(Book.id)
+            .limit(1)
         )
         
-        return result.scalar_one_or_none()
+        return result.scalars().first()
     
     def calculate_similarity(self, str1: str, str2: str) -> float:
         """
@@ -0,0 +1,250 @@
+"""
+TXT 编码检测模块
+扫描器、阅读器和 Telegram Bot 共用的编码识别
+
+- BOM、以及不含 NUL 的严格 UTF-8 样本直接返回，不再尝试其他编码
+- 其余候选编码各解码一次，用正则替换和 bytes.count 统计替换字符、控制字符、
+  汉字/常用字/ASCII 字母比例，不逐字符做 Python 循环
+- 检测结果（编码 + 置信度）由扫描器写入 BookVersion，之后的读取直接复用
+"""
+import codecs
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+
+from app.utils.logger import log
+
+
+# 编码检测读取的样本大小
+SAMPLE_SIZE = 200_000
+# 二进制判断读取的样本大小
+BINARY_SAMPLE_SIZE = 8192
+
+# UTF-8 / BOM 之外的候选编码（gbk、gb2312 是 gb18030 的子集，得分不会更高）
+CANDIDATE_ENCODINGS = ('gb18030', 'big5', 'utf-16-le', 'utf-16-be')
+
+_COMMON_CJK = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处队南给色光门即保治北造百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清己美再采转更单风切打白教速花带安场身车例真至达走积示议声报斗完类八离华名确才科张信马节话米整空元况今集温传土许步群广石记需段研界拉林律叫且究观越织装影算低持音众书布复容儿须际商非验连断深难近矿千周委素技备半办青省列习便响约支般史感劳团往酸历市克何除消构爱配胜降"
+
+# 质量差的字符：替换字符和除 \t \n \r 外的控制字符
+_BAD_CHAR_RE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffd]')
+_CJK_RE = re.compile('[\u4e00-\u9fff]')
+_ASCII_LETTER_RE = re.compile(r'[A-Za-z]')
+_COMMON_CJK_RE = re.compile('[' + ''.join(sorted(set(_COMMON_CJK))) + ']')
+# 控制字节（\t \n \r 除外），用于 bytes.translate 删除后计数
+_CONTROL_BYTES = bytes(b for b in range(32) if b not in (9, 10, 13))
+
+
+@dataclass(slots=True)
+class EncodingResult:
+    """编码检测结果"""
+    encoding: str
+    confidence: float
+
+    def version_fields(self) -> dict:
+        """可直接传给 BookVersion(...) 的字段"""
+        return {
+            "encoding": self.encoding,
+            "encoding_confidence": self.confidence,
+        }
+
+    @classmethod
+    def from_version(cls, version) -> Optional["EncodingResult"]:
+        """读取 BookVersion 上保存的编码，未检测过时返回 None"""
+        if not getattr(version, "encoding", None):
+            return None
+        return cls(version.encoding, version.encoding_confidence or 0.0)
+
+
+def _count(pattern: re.Pattern, text: str) -> int:
+    return len(text) - len(pattern.sub('', text))
+
+
+def decode_quality(text: str) -> float:
+    """替换字符 + 控制字符所占比例（越小越好）"""
+    if not text:
+        return 1.0
+    return _count(_BAD_CHAR_RE, text) / len(text)
+
+
+def text_metrics(text: str) -> Tuple[float, float, float, float]:
+    """
+    文本质量指标
+
+    Returns:
+        (坏字符比例, 汉字比例, ASCII 字母比例, 常用汉字比例)
+    """
+    if not text:
+        return 1.0, 0.0, 0.0, 0.0
+    total = len(text)
+    return (
+        _count(_BAD_CHAR_RE, text) / total,
+        _count(_CJK_RE, text) / total,
+        _count(_ASCII_LETTER_RE, text) / total,
+        _count(_COMMON_CJK_RE, text) / total,
+    )
+
+
+def sample_metrics(raw_data: bytes, encoding: str) -> Tuple[float, float, float, float]:
+    """按指定编码解码样本后计算 text_metrics（非法序列计为替换字符）"""
+    return text_metrics(raw_data.decode(encoding, errors='replace'))
+
+
+def is_sample_readable(raw_data: bytes, encoding: str) -> bool:
+    """样本按该编码解码后是否像正常文本"""
+    try:
+        quality, cjk, ascii_letters, common = sample_metrics(raw_data, encoding)
+    except LookupError:
+        return False
+    readable = cjk + ascii_letters
+    return (
+        (quality <= 0.25 and readable >= 0.03 and common >= 0.01)
+        or readable >= 0.2
+        or ascii_letters >= 0.2
+    )
+
+
+def read_sample(file_path: Path, size: int = SAMPLE_SIZE) -> Optional[bytes]:
+    """读取文件头部样本，失败返回 None"""
+    try:
+        with open(file_path, 'rb') as f:
+            return f.read(size)
+    except Exception as e:
+        log.error(f"读取编码检测样本失败: {file_path}, 错误: {e}")
+        return None
+
+
+def is_text_sample_valid(file_path: Path, encoding: str) -> bool:
+    """文件头部按该编码解码后是否像正常文本"""
+    raw_data = read_sample(file_path)
+    if raw_data is None:
+        return False
+    return is_sample_readable(raw_data, encoding)
+
+
+def _null_parity(raw_data: bytes) -> Tuple[int, int]:
+    """(偶数位 NUL 数, 奇数位 NUL 数)"""
+    return raw_data[0::2].count(0), raw_data[1::2].count(0)
+
+
+def is_probably_binary(sample: bytes) -> bool:
+    """根据文件头部字节判断是否为二进制文件"""
+    if not sample:
+        return False
+    if sample.startswith(codecs.BOM_UTF16_LE) or sample.startswith(codecs.BOM_UTF16_BE):
+        return False
+    if b'\x00' in sample:
+        # 无 BOM 的 UTF-16：NUL 集中在奇数位或偶数位
+        even_nulls, odd_nulls = _null_parity(sample)
+        if max(even_nulls, odd_nulls) / max(1, len(sample) // 2) > 0.6:
+            return False
+        return True
+    control_bytes = len(sample) - len(sample.translate(None, _CONTROL_BYTES))
+    return control_bytes / len(sample) > 0.1
+
+
+def is_probably_binary_file(file_path: Path, sample_size: int = BINARY_SAMPLE_SIZE) -> bool:
+    """读取文件头部判断是否为二进制文件（读取失败按文本处理）"""
+    try:
+        with open(file_path, 'rb') as f:
+            sample = f.read(sample_size)
+    except Exception as e:
+        log.warning(f"读取文件样本失败: {file_path}, 错误: {e}")
+        return False
+    return is_probably_binary(sample)
+
+
+def _confidence(quality: float, readable: float) -> float:
+    return round(max(0.0, 1.0 - quality) * min(1.0, readable / 0.5), 3)
+
+
+def _detect_with_chardet(raw_data: bytes) -> Optional[str]:
+    import chardet
+
+    detected = chardet.detect(raw_data).get('encoding')
+    if not detected:
+        return None
+    detected_lower = detected.lower().replace('_', '-')
+    if detected_lower == 'utf-16':
+        even_nulls, odd_nulls = _null_parity(raw_data)
+        if odd_nulls > even_nulls:
+            return 'utf-16-le'
+        if even_nulls > odd_nulls:
+            return 'utf-16-be'
+        return None
+    if detected_lower == 'utf-16le':
+        return 'utf-16-le'
+    if detected_lower == 'utf-16be':
+        return 'utf-16-be'
+    return detected
+
+
+def detect_encoding(raw_data: bytes) -> Optional[EncodingResult]:
+    """
+    检测字节样本的编码
+
+    Args:
+        raw_data: 文件头部样本（通常 SAMPLE_SIZE 字节）
+
+    Returns:
+        EncodingResult；样本为空或无法识别时返回 None
+    """
+    if not raw_data:
+        return None
+
+    if raw_data.startswith(codecs.BOM_UTF8):
+        return EncodingResult('utf-8-sig', 1.0)
+    if raw_data.startswith(codecs.BOM_UTF16_LE):
+        return EncodingResult('utf-16-le', 1.0)
+    if raw_data.startswith(codecs.BOM_UTF16_BE):
+        return EncodingResult('utf-16-be', 1.0)
+
+    # 严格 UTF-8：样本末尾被截断的多字节序列不算错误；含 NUL 的可能是无 BOM 的 UTF-16
+    if b'\x00' not in raw_data:
+        try:
+            codecs.utf_8_decode(raw_data, 'strict', False)
+        except UnicodeDecodeError:
+            pass
+        else:
+            # 纯 ASCII 样本无法区分 UTF-8 与 GB18030 等兼容编码，置信度减半
+            return EncodingResult('utf-8', 0.5 if raw_data.isascii() else 0.99)
+
+    metrics = []
+    for encoding in CANDIDATE_ENCODINGS:
+        quality, cjk, ascii_letters, common = sample_metrics(raw_data, encoding)
+        metrics.append((encoding, quality, cjk + ascii_letters, common, ascii_letters))
+
+    preferred = [m for m in metrics if m[3] >= 0.01 or m[4] >= 0.12 or m[2] >= 0.05]
+    pool = preferred or metrics
+    pool.sort(key=lambda m: (-m[3], -m[2], m[1]))
+    encoding, quality, readable, _common, _ascii = pool[0]
+    if quality <= 0.25:
+        return EncodingResult(encoding, _confidence(quality, readable))
+
+    # 候选编码都解码得很差：交给 chardet，其结果更好时采用
+    try:
+        detected = _detect_with_chardet(raw_data)
+    except Exception as e:
+        log.debug(f"chardet 检测失败: {e}")
+        detected = None
+    if detected:
+        try:
+            detected_quality, cjk, ascii_letters, _common = sample_metrics(raw_data, detected)
+        except LookupError:
+            detected_quality = 1.0
+        if detected_quality < quality:
+            return EncodingResult(detected, _confidence(detected_quality, cjk + ascii_letters))
+    return EncodingResult(encoding, _confidence(quality, readable))
+
+
+def detect_file_encoding(file_path: Path, sample_size: int = SAMPLE_SIZE) -> Optional[EncodingResult]:
+    """
+    检测文件编码（读取头部样本）
+
+    Returns:
+        EncodingResult；读取失败、空文件或无法识别时返回 None
+    """
+    raw_data = read_sample(file_path, sample_size)
+    if raw_data is None:
+        return None
+    return detect_encoding(raw_data)
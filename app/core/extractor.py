@@ -1,27 +1,172 @@
 """
 压缩包解压模块
 支持 zip、rar、7z、iso、tar.gz 等格式
+
+扫描时使用 iter_ebook_members 逐个流式读取包内电子书：
+只处理电子书（及嵌套压缩包）成员，每次只有一个成员写入临时文件，
+读取时顺带计算完整 Hash，调用方处理完后即删除。
+超过大小上限或读取失败而未产出的成员记入 skipped 列表，调用方据此判断是否完整读取。
 """
+import hashlib
+import queue
 import shutil
 import tarfile
+import threading
+import uuid
 import zipfile
-from pathlib import Path
-from typing import List
+from dataclasses import dataclass
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, Callable, Iterator, List, Optional
 
 import py7zr
 import pycdlib
 import rarfile
+from py7zr.io import NullIO, Py7zIO, WriterFactory
 
 from app.config import settings
 from app.utils.logger import log
 
 
+EBOOK_EXTENSIONS = ('.txt', '.epub', '.mobi', '.azw3')
+ARCHIVE_EXTENSIONS = ('.zip', '.rar', '.7z', '.iso', '.tar.gz', '.tar.bz2')
+
+# 流式复制的块大小
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class MemberTooLarge(Exception):
+    """成员实际大小超过 extractor.max_file_size"""
+
+
+@dataclass(slots=True)
+class ArchiveMember:
+    """压缩包内的电子书成员（内容在临时文件中，迭代到下一个成员时删除）"""
+    name: str        # 包内路径，嵌套压缩包以 "!/" 连接
+    path: Path       # 临时文件路径（保留包内目录结构和文件名）
+    file_size: int
+    file_hash: str   # 写入临时文件时计算的完整 Hash
+
+
+class _SpillFile:
+    """写入临时文件，同时计算 Hash 并检查大小上限"""
+
+    def __init__(self, path: Path, algorithm: str, max_size: int):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.size = 0
+        self._max_size = max_size
+        self._hasher = hashlib.new(algorithm)
+        self._fp = open(path, 'wb')
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        if self.size > self._max_size:
+            raise MemberTooLarge(f"超过大小上限 {self._max_size} 字节")
+        self._hasher.update(data)
+        return self._fp.write(data)
+
+    def copy_from(self, stream: BinaryIO) -> None:
+        while chunk := stream.read(COPY_CHUNK_SIZE):
+            self.write(chunk)
+
+    def close(self) -> None:
+        if not self._fp.closed:
+            self._fp.close()
+
+    @property
+    def hexdigest(self) -> str:
+        return self._hasher.hexdigest()
+
+
+class _ExtractAborted(Exception):
+    """消费者提前结束迭代，通知解压线程退出"""
+
+
+class _SevenZipSpill(Py7zIO):
+    """py7zr 的输出对象：解压数据直接写入临时文件"""
+
+    def __init__(self, spill: _SpillFile):
+        self.spill = spill
+        self.overflow = False
+
+    def write(self, s) -> int:
+        if not self.overflow:
+            try:
+                self.spill.write(bytes(s))
+            except MemberTooLarge:
+                # 超过上限：丢弃剩余数据，解压继续进行
+                self.overflow = True
+                self.spill.close()
+                self.spill.path.unlink(missing_ok=True)
+        return len(s)
+
+    def read(self, size: Optional[int] = None) -> bytes:
+        return b''
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return offset
+
+    def flush(self) -> None:
+        pass
+
+    def size(self) -> int:
+        return self.spill.size
+
+
+class _SevenZipHandoff(WriterFactory):
+    """
+    把 py7zr 的回调式解压转换为逐个成员交付
+
+    解压在后台线程中进行；每个成员写完后交给消费者，
+    等消费者处理完（临时文件已删除）再继续解压下一个成员。
+    create/finish 不加锁，只能用于单线程顺序解压（见 _iter_7z）。
+    """
+
+    def __init__(self, targets: set, new_spill: Callable[[str], _SpillFile], skipped: List[str]):
+        self._targets = targets
+        self._new_spill = new_spill
+        self._skipped = skipped
+        self._current: Optional[_SevenZipSpill] = None
+        self._current_name = ""
+        self.items: queue.Queue = queue.Queue(maxsize=1)
+        self.consumed = threading.Event()
+        self.aborted = False
+
+    def create(self, filename: str) -> Py7zIO:
+        self.finish()
+        if filename not in self._targets:
+            return NullIO()
+        self._current = _SevenZipSpill(self._new_spill(filename))
+        self._current_name = filename
+        return self._current
+
+    def finish(self) -> None:
+        """交付当前成员并等待消费者处理完"""
+        current, name = self._current, self._current_name
+        self._current = None
+        if current is None:
+            return
+        if current.overflow:
+            log.warning(f"压缩包成员超过大小上限，跳过: {name}")
+            self._skipped.append(name)
+            return
+        current.spill.close()
+        self.consumed.clear()
+        self.items.put((name, current.spill))
+        self.consumed.wait()
+        if self.aborted:
+            raise _ExtractAborted()
+
+
 class Extractor:
     """压缩包解压器"""
     
     def __init__(self):
         self.temp_dir = Path(settings.directories.temp)
         self.temp_dir.mkdir(parents=True, exist_ok=True)
+        self.max_file_size = settings.extractor.max_file_size
+        self.nested_depth = settings.extractor.nested_depth
+        self.hash_algorithm = settings.deduplicator.hash_algorithm
     
     def extract(self, archive_path: Path, dest_dir: Path) -> List[Path]:
         """
@@ -120,6 +265,250 @@ class Extractor:
         log.debug(f"在 {directory} 中找到 {len(ebook_files)} 个电子书文件")
         return ebook_files
     
+    # ===== 流式读取 =====
+
+    @staticmethod
+    def is_archive(name: str) -> bool:
+        """按文件名判断是否为支持的压缩包"""
+        return name.lower().endswith(ARCHIVE_EXTENSIONS)
+
+    def iter_ebook_members(
+        self,
+        archive_path: Path,
+        spill_dir: Path,
+        depth: int = 0,
+        skipped: Optional[List[str]] = None
+    ) -> Iterator[ArchiveMember]:
+        """
+        逐个产出压缩包内的电子书成员（不整体解压）
+
+        只读取电子书扩展名且不超过 extractor.max_file_size 的成员；
+        嵌套压缩包在 extractor.nested_depth 层以内递归处理。
+        产出的临时文件在迭代到下一个成员时删除，调用方需在此之前处理完。
+
+        Args:
+            archive_path: 压缩包路径
+            spill_dir: 临时目录（调用方负责最终清理）
+            depth: 当前嵌套层数
+            skipped: 传入列表时，记录超过大小上限或读取失败而未产出的成员名
+                （迭代正常结束后列表为空，说明包内电子书已全部产出）
+
+        Yields:
+            ArchiveMember
+        """
+        if skipped is None:
+            skipped = []
+        name = archive_path.name.lower()
+        nested = depth < self.nested_depth
+        if name.endswith('.zip'):
+            members = self._iter_zip(archive_path, spill_dir, nested, skipped)
+        elif name.endswith('.rar'):
+            members = self._iter_rar(archive_path, spill_dir, nested, skipped)
+        elif name.endswith('.7z'):
+            members = self._iter_7z(archive_path, spill_dir, nested, skipped)
+        elif name.endswith('.iso'):
+            members = self._iter_iso(archive_path, spill_dir, nested, skipped)
+        elif name.endswith(('.tar.gz', '.tar.bz2', '.gz', '.bz2')):
+            members = self._iter_tar(archive_path, spill_dir, nested, skipped)
+        else:
+            raise ValueError(f"不支持的压缩格式: {archive_path.suffix.lower()}")
+
+        try:
+            yield from self._expand_members(members, archive_path, spill_dir, depth, skipped)
+        finally:
+            members.close()
+
+    def _expand_members(
+        self,
+        members,
+        archive_path: Path,
+        spill_dir: Path,
+        depth: int,
+        skipped: List[str]
+    ) -> Iterator[ArchiveMember]:
+        """产出电子书成员，嵌套压缩包递归展开；成员处理完后删除其临时文件"""
+        for member_name, spill in members:
+            try:
+                if not self.is_archive(member_name):
+                    yield ArchiveMember(member_name, spill.path, spill.size, spill.hexdigest)
+                    continue
+                # 嵌套压缩包：递归读取后删除
+                nested_dir = spill_dir / f"nested-{uuid.uuid4().hex[:8]}"
+                nested_skipped: List[str] = []
+                try:
+                    for member in self.iter_ebook_members(spill.path, nested_dir, depth + 1, nested_skipped):
+                        member.name = f"{member_name}!/{member.name}"
+                        yield member
+                except Exception as e:
+                    log.error(f"读取嵌套压缩包失败: {archive_path}!/{member_name}, 错误: {e}")
+                    skipped.append(member_name)
+                finally:
+                    skipped.extend(f"{member_name}!/{name}" for name in nested_skipped)
+                    self.cleanup(nested_dir)
+            finally:
+                spill.path.unlink(missing_ok=True)
+
+    def _wanted(self, member_name: str, size: int, nested: bool, skipped: List[str]) -> bool:
+        """是否需要读取该成员（电子书或可递归的嵌套压缩包，且未超过大小上限）"""
+        lower = member_name.lower()
+        if not lower.endswith(EBOOK_EXTENSIONS) and not (nested and self.is_archive(lower)):
+            return False
+        if size > self.max_file_size:
+            log.warning(f"压缩包成员超过大小上限，跳过: {member_name} ({size} 字节)")
+            skipped.append(member_name)
+            return False
+        return True
+
+    def _new_spill(self, spill_dir: Path, member_name: str) -> _SpillFile:
+        """在临时目录下按包内相对路径创建临时文件（去除 .. 和根路径）"""
+        parts = [p for p in PurePosixPath(member_name.replace('\\', '/')).parts if p not in ('/', '..', '.')]
+        path = spill_dir.joinpath(*parts) if parts else spill_dir / uuid.uuid4().hex
+        return _SpillFile(path, self.hash_algorithm, self.max_file_size)
+
+    def _spill_stream(
+        self,
+        spill_dir: Path,
+        member_name: str,
+        stream: BinaryIO,
+        skipped: List[str]
+    ) -> Optional[_SpillFile]:
+        """把成员数据流写入临时文件；超过大小上限时记入 skipped 并返回 None"""
+        spill = self._new_spill(spill_dir, member_name)
+        try:
+            spill.copy_from(stream)
+        except MemberTooLarge:
+            spill.close()
+            spill.path.unlink(missing_ok=True)
+            log.warning(f"压缩包成员超过大小上限，跳过: {member_name}")
+            skipped.append(member_name)
+            return None
+        except Exception:
+            spill.close()
+            spill.path.unlink(missing_ok=True)
+            raise
+        spill.close()
+        return spill
+
+    def _iter_zip(self, archive_path: Path, spill_dir: Path, nested: bool, skipped: List[str]):
+        with zipfile.ZipFile(archive_path, 'r') as zip_ref:
+            for info in zip_ref.infolist():
+                if info.is_dir() or not self._wanted(info.filename, info.file_size, nested, skipped):
+                    continue
+                with zip_ref.open(info) as stream:
+                    spill = self._spill_stream(spill_dir, info.filename, stream, skipped)
+                if spill is not None:
+                    yield info.filename, spill
+
+    def _iter_rar(self, archive_path: Path, spill_dir: Path, nested: bool, skipped: List[str]):
+        with rarfile.RarFile(archive_path, 'r') as rar_ref:
+            for info in rar_ref.infolist():
+                if info.is_dir() or not self._wanted(info.filename, info.file_size, nested, skipped):
+                    continue
+                with rar_ref.open(info) as stream:
+                    spill = self._spill_stream(spill_dir, info.filename, stream, skipped)
+                if spill is not None:
+                    yield info.filename, spill
+
+    def _iter_tar(self, archive_path: Path, spill_dir: Path, nested: bool, skipped: List[str]):
+        # 流模式：按顺序读取，不需要随机访问（适合 .tar.gz/.tar.bz2）
+        with tarfile.open(archive_path, 'r|*') as tar_ref:
+            for info in tar_ref:
+                if not info.isfile() or not self._wanted(info.name, info.size, nested, skipped):
+                    continue
+                stream = tar_ref.extractfile(info)
+                if stream is None:
+                    continue
+                with stream:
+                    spill = self._spill_stream(spill_dir, info.name, stream, skipped)
+                if spill is not None:
+                    yield info.name, spill
+
+    def _iter_iso(self, archive_path: Path, spill_dir: Path, nested: bool, skipped: List[str]):
+        iso = pycdlib.PyCdlib()
+        iso.open(str(archive_path))
+        try:
+            # 优先使用 Rock Ridge / Joliet 长文件名，否则使用 ISO9660 名称（去掉 ";1" 版本号）
+            if iso.has_rock_ridge():
+                path_key = 'rr_path'
+            elif iso.has_joliet():
+                path_key = 'joliet_path'
+            else:
+                path_key = 'iso_path'
+
+            for dirname, _dirlist, filelist in iso.walk(**{path_key: '/'}):
+                for filename in filelist:
+                    iso_file_path = dirname.rstrip('/') + '/' + filename
+                    member_name = iso_file_path.lstrip('/').split(';')[0]
+                    size = iso.get_record(**{path_key: iso_file_path}).get_data_length()
+                    if not self._wanted(member_name, size, nested, skipped):
+                        continue
+                    spill = self._new_spill(spill_dir, member_name)
+                    try:
+                        iso.get_file_from_iso_fp(spill, **{path_key: iso_file_path})
+                    except MemberTooLarge:
+                        spill.close()
+                        spill.path.unlink(missing_ok=True)
+                        log.warning(f"压缩包成员超过大小上限，跳过: {member_name}")
+                        skipped.append(member_name)
+                        continue
+                    except Exception:
+                        spill.close()
+                        spill.path.unlink(missing_ok=True)
+                        raise
+                    spill.close()
+                    yield member_name, spill
+        finally:
+            iso.close()
+
+    def _iter_7z(self, archive_path: Path, spill_dir: Path, nested: bool, skipped: List[str]):
+        # 传入文件对象而不是路径：py7zr 对非固实多 folder 的压缩包只有传入路径时才按 folder 多线程解压，
+        # _SevenZipHandoff 只维护一个当前成员，必须在单个线程中按顺序回调
+        with open(archive_path, 'rb') as fp, py7zr.SevenZipFile(fp, 'r') as z_ref:
+            targets = {
+                info.filename for info in z_ref.list()
+                if not info.is_directory and self._wanted(info.filename, info.uncompressed, nested, skipped)
+            }
+            if not targets:
+                return
+
+            # 7z 多为固实压缩，按成员单独解压会重复解压前面的数据；
+            # 因此在后台线程中一次解压全部目标，逐个成员交付
+            handoff = _SevenZipHandoff(targets, lambda name: self._new_spill(spill_dir, name), skipped)
+            errors: List[BaseException] = []
+
+            def run():
+                try:
+                    z_ref.extract(targets=targets, factory=handoff)
+                    handoff.finish()
+                except _ExtractAborted:
+                    pass
+                except BaseException as e:
+                    errors.append(e)
+                finally:
+                    handoff.items.put(None)
+
+            worker = threading.Thread(target=run, name="extract-7z", daemon=True)
+            worker.start()
+            try:
+                while (item := handoff.items.get()) is not None:
+                    try:
+                        yield item
+                    finally:
+                        handoff.consumed.set()
+            finally:
+                # 提前结束时通知解压线程退出
+                handoff.aborted = True
+                handoff.consumed.set()
+                while worker.is_alive():
+                    try:
+                        handoff.items.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+                    handoff.consumed.set()
+                worker.join()
+            if errors:
+                raise errors[0]
+
     def cleanup(self, directory: Path):
         """
         清理临时目录
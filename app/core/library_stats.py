@@ -0,0 +1,256 @@
+"""
+书库统计物化
+维护 library_stats 表（书籍数、作者数、分组数、主版本总大小、7 天新增、最新书籍），
+首页不再按书库逐个执行聚合查询
+
+- ORM 刷新时书籍/版本发生变化的书库递增 change_seq（一条 UPDATE）
+- 读取时 change_seq 与 refreshed_seq 不一致、或超过 STATS_MAX_AGE 的记录重新计算，
+  多个书库合并为几条分组查询
+- 扫描结束时主动刷新，扫描后首次打开首页无需等待计算
+绕过 ORM 的批量语句（如 Core delete/update）之后需调用 mark_libraries_changed 或 mark_books_changed。
+"""
+import json
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Set, Union
+
+from sqlalchemy import Select, case, event, func, inspect, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models import Book, BookVersion, LibraryStats
+from app.utils.logger import log
+
+
+# 统计过期时间（7 天新增数随时间变化，需定期重算）
+STATS_MAX_AGE = timedelta(minutes=30)
+# 每个书库保留的最新书籍 ID 数
+LATEST_BOOKS_KEPT = 30
+NEW_BOOK_DAYS = 7
+
+
+def latest_book_ids(stats: LibraryStats) -> List[int]:
+    """解析统计中的最新书籍 ID 列表"""
+    if not stats.latest_book_ids:
+        return []
+    try:
+        return json.loads(stats.latest_book_ids)
+    except (json.JSONDecodeError, TypeError):
+        return []
+
+
+def _is_stale(stats: LibraryStats, now: datetime) -> bool:
+    return (
+        stats.refreshed_at is None
+        or stats.change_seq != stats.refreshed_seq
+        or now - stats.refreshed_at > STATS_MAX_AGE
+    )
+
+
+async def refresh_library_stats(db: AsyncSession, library_ids: Iterable[int]) -> Dict[int, LibraryStats]:
+    """
+    重新计算书库统计（只 flush，由调用方提交）
+
+    Args:
+        db: 数据库会话
+        library_ids: 书库 ID
+
+    Returns:
+        {书库ID: LibraryStats}
+    """
+    library_ids = list(set(library_ids))
+    if not library_ids:
+        return {}
+
+    result = await db.execute(select(LibraryStats).where(LibraryStats.library_id.in_(library_ids)))
+    existing = {stats.library_id: stats for stats in result.scalars()}
+    # 计算前记录变更序号：计算期间发生的变更会使本次结果保持过期
+    seen_seq = {library_id: stats.change_seq for library_id, stats in existing.items()}
+
+    now = datetime.utcnow()
+    threshold = now - timedelta(days=NEW_BOOK_DAYS)
+    counts = {
+        row.library_id: row
+        for row in await db.execute(
+            select(
+                Book.library_id,
+                func.count(Book.id).label("book_count"),
+                func.count(func.distinct(Book.author_id)).label("author_count"),
+                func.count(func.distinct(Book.group_id)).label("group_count"),
+                func.coalesce(func.sum(case((Book.added_at >= threshold, 1), else_=0)), 0).label("new_books"),
+            )
+            .where(Book.library_id.in_(library_ids))
+            .group_by(Book.library_id)
+        )
+    }
+    sizes = dict((await db.execute(
+        select(Book.library_id, func.coalesce(func.sum(BookVersion.file_size), 0))
+        .join(Book, BookVersion.book_id == Book.id)
+        .where(Book.library_id.in_(library_ids), BookVersion.is_primary == True)
+        .group_by(Book.library_id)
+    )).all())
+
+    ranked = (
+        select(
+            Book.library_id,
+            Book.id,
+            func.row_number().over(
+                partition_by=Book.library_id,
+                order_by=(Book.added_at.desc(), Book.id.desc())
+            ).label("rank"),
+        )
+        .where(Book.library_id.in_(library_ids))
+        .subquery()
+    )
+    latest: Dict[int, List[int]] = {library_id: [] for library_id in library_ids}
+    for library_id, book_id in await db.execute(
+        select(ranked.c.library_id, ranked.c.id)
+        .where(ranked.c.rank <= LATEST_BOOKS_KEPT)
+        .order_by(ranked.c.library_id, ranked.c.rank)
+    ):
+        latest[library_id].append(book_id)
+
+    refreshed = {}
+    for library_id in library_ids:
+        stats = existing.get(library_id)
+        if stats is None:
+            stats = LibraryStats(library_id=library_id, change_seq=0)
+            db.add(stats)
+        row = counts.get(library_id)
+        stats.book_count = row.book_count if row else 0
+        stats.author_count = row.author_count if row else 0
+        stats.group_count = row.group_count if row else 0
+        stats.new_books_7d = int(row.new_books) if row else 0
+        stats.total_size = int(sizes.get(library_id) or 0)
+        stats.latest_book_ids = json.dumps(latest[library_id])
+        stats.refreshed_seq = seen_seq.get(library_id, 0)
+        stats.refreshed_at = now
+        refreshed[library_id] = stats
+    await db.flush()
+    return refreshed
+
+
+async def get_library_stats(db: AsyncSession, library_ids: Iterable[int]) -> Dict[int, LibraryStats]:
+    """
+    获取书库统计，缺失或过期的记录即时重新计算并提交
+
+    Args:
+        db: 数据库会话
+        library_ids: 书库 ID
+
+    Returns:
+        {书库ID: LibraryStats}
+    """
+    library_ids = list(library_ids)
+    if not library_ids:
+        return {}
+
+    result = await db.execute(select(LibraryStats).where(LibraryStats.library_id.in_(library_ids)))
+    stats = {row.library_id: row for row in result.scalars()}
+
+    now = datetime.utcnow()
+    stale = [library_id for library_id in library_ids if library_id not in stats or _is_stale(stats[library_id], now)]
+    if stale:
+        try:
+            stats.update(await refresh_library_stats(db, stale))
+            await db.commit()
+        except Exception as e:
+            # 并发刷新时可能插入冲突，回滚后使用已有记录
+            log.warning(f"保存书库统计失败: {e}")
+            await db.rollback()
+            result = await db.execute(select(LibraryStats).where(LibraryStats.library_id.in_(library_ids)))
+            stats = {row.library_id: row for row in result.scalars()}
+    return stats
+
+
+def mark_libraries_changed_sync(connection: Connection, library_ids: Iterable[int]) -> None:
+    """递增书库的 change_seq（同步连接）"""
+    library_ids = [library_id for library_id in set(library_ids) if library_id is not None]
+    if not library_ids:
+        return
+    connection.execute(
+        update(LibraryStats)
+        .where(LibraryStats.library_id.in_(library_ids))
+        .values(change_seq=LibraryStats.change_seq + 1)
+    )
+
+
+async def mark_libraries_changed(db: AsyncSession, library_ids: Iterable[int]) -> None:
+    """
+    手动标记书库统计过期
+    用于绕过 ORM 的批量语句之后
+
+    Args:
+        db: 数据库会话
+        library_ids: 书库 ID
+    """
+    library_ids = list(library_ids)
+    await db.run_sync(lambda session: mark_libraries_changed_sync(session.connection(), library_ids))
+
+
+async def mark_books_changed(db: AsyncSession, book_ids: Union[Iterable[int], Select]) -> None:
+    """
+    按书籍标记其所在书库的统计过期（一条 UPDATE）
+    用于绕过 ORM 的批量语句之后，须在书籍被删除之前调用
+
+    Args:
+        db: 数据库会话
+        book_ids: 书籍 ID，或返回书籍 ID 的子查询
+    """
+    if not isinstance(book_ids, Select):
+        book_ids = [book_id for book_id in set(book_ids) if book_id is not None]
+        if not book_ids:
+            return
+    await db.execute(
+        update(LibraryStats)
+        .where(LibraryStats.library_id.in_(select(Book.library_id).where(Book.id.in_(book_ids))))
+        .values(change_seq=LibraryStats.change_seq + 1)
+    )
+
+
+def _attr_changed(obj, *names: str) -> bool:
+    state = inspect(obj)
+    return any(state.attrs[name].history.has_changes() for name in names)
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_stats_changed(session: Session, flush_context) -> None:
+    """ORM 刷新后标记受影响书库的统计过期"""
+    library_ids: Set[int] = set()
+    book_ids: Set[int] = set()
+
+    for obj in session.new:
+        if isinstance(obj, Book):
+            library_ids.add(obj.library_id)
+        elif isinstance(obj, BookVersion):
+            book_ids.add(obj.book_id)
+
+    for obj in session.dirty:
+        if isinstance(obj, Book) and _attr_changed(obj, "library_id", "author_id", "group_id", "added_at"):
+            library_ids.add(obj.library_id)
+            history = inspect(obj).attrs.library_id.history
+            library_ids.update(history.deleted or ())
+        elif isinstance(obj, BookVersion) and _attr_changed(obj, "file_size", "is_primary", "book_id"):
+            book_ids.add(obj.book_id)
+            history = inspect(obj).attrs.book_id.history
+            book_ids.update(history.deleted or ())
+
+    for obj in session.deleted:
+        if isinstance(obj, Book):
+            library_ids.add(obj.library_id)
+        elif isinstance(obj, BookVersion):
+            book_ids.add(obj.book_id)
+
+    if not (library_ids or book_ids):
+        return
+
+    connection = session.connection()
+    book_ids.discard(None)
+    if book_ids:
+        library_ids.update(connection.execute(
+            select(Book.library_id).where(Book.id.in_(book_ids)).distinct()
+        ).scalars())
+    try:
+        mark_libraries_changed_sync(connection, library_ids)
+    except Exception as e:
+        log.warning(f"标记书库统计失败: {e}")
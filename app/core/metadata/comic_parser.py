@@ -33,32 +33,46 @@ class ComicParser:
         if not file_path.exists():
             return []
             
-        images = []
         try:
             if zipfile.is_zipfile(file_path):
                 with zipfile.ZipFile(file_path, 'r') as zf:
-                    for info in zf.infolist():
-                        # 忽略目录和隐藏文件
-                        if info.is_dir() or info.filename.startswith('.') or '__MACOSX' in info.filename:
-                            continue
-                            
-                        # 检查扩展名
-                        ext = Path(info.filename).suffix.lower()
-                        if ext in cls.IMAGE_EXTENSIONS:
-                            images.append({
-                                "filename": info.filename,
-                                "size": info.file_size
-                            })
-                            
-            # 自然排序
-            images.sort(key=lambda x: cls._natural_sort_key(x['filename']))
-            return images
+                    return cls.list_images(zf)
+            return []
             
         except Exception as e:
             # 记录错误但不抛出，返回空列表
             print(f"解析漫画文件失败: {e}")
             return []
 
+    @classmethod
+    def list_images(cls, zf: zipfile.ZipFile) -> List[Dict[str, str]]:
+        """
+        从已打开的压缩包中列出图片（自然排序）
+        
+        Args:
+            zf: 已打开的 ZipFile
+            
+        Returns:
+            List[Dict]: 图片信息列表，包含 filename 和 size
+        """
+        images = []
+        for info in zf.infolist():
+            # 忽略目录和隐藏文件
+            if info.is_dir() or info.filename.startswith('.') or '__MACOSX' in info.filename:
+                continue
+                
+            # 检查扩展名
+            ext = Path(info.filename).suffix.lower()
+            if ext in cls.IMAGE_EXTENSIONS:
+                images.append({
+                    "filename": info.filename,
+                    "size": info.file_size
+                })
+                
+        # 自然排序
+        images.sort(key=lambda x: cls._natural_sort_key(x['filename']))
+        return images
+
     @classmethod
     def get_image_stream(cls, file_path: Path, filename: str) -> Optional[IO[bytes]]:
         """
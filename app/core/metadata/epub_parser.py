@@ -181,9 +181,9 @@ class EpubParser:
             cover_dir = Path(settings.directories.covers)
             cover_dir.mkdir(parents=True, exist_ok=True)
             
-            # 使用文件hash作为封面文件名
-            from app.utils.file_hash import calculate_file_hash
-            file_hash = calculate_file_hash(file_path)
+            # 使用文件采样hash作为封面文件名（无需读取整个文件）
+            from app.utils.file_hash import quick_hash
+            file_hash = quick_hash(file_path)
             cover_save_path = cover_dir / f"{file_hash}.jpg"
             
             # 保存并转换为jpg
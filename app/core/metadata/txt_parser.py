@@ -4,7 +4,6 @@ TXT文件名解析器
 支持动态规则加载和统计
 同时提供简介智能提取功能
 """
-import json
 import re
 import hashlib
 from pathlib import Path
@@ -14,11 +13,13 @@ from functools import lru_cache
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.chapter_detector import ChapterRules, detect_chapters, get_chapter_rules
+from app.core.encoding_detector import detect_file_encoding, is_probably_binary_file, text_metrics
 from app.models import FilenamePattern
 from app.utils.logger import log
 
 # 简单的内存缓存
-# Key: (file_path_str, file_mtime, file_size)
+# Key: (file_path_str, file_mtime, file_size, rules_fingerprint)
 # Value: chapters_list
 _toc_cache = {}
 
@@ -41,24 +42,6 @@ class TxtParser:
         (r'^【(.+?)】(.+?)\.txt$', 1, 2, '【作者】书名格式'),
     ]
 
-    DEFAULT_CHAPTER_SETTINGS = {
-        "chapter_max_title_length": 50,
-        "chapter_min_gap": 40,
-        "chapter_patterns_strong": [
-            r'^第[零一二三四五六七八九十百千万亿\d]+[章节卷集部篇回].*$',
-            r'^(正文\s*)?第[零一二三四五六七八九十百千万亿\d]+[章节卷集部篇回].*$',
-            r'^Chapter\s+\d+.*$',
-            r'^卷[零一二三四五六七八九十百千万亿\d]+.*$',
-            r'^(序章|楔子|引子|前言|后记|尾声|番外|终章|大结局).*$',
-            r'^[【\[\(].+[】\]\)]$',
-        ],
-        "chapter_patterns_weak": [
-            r'^\d{1,4}[\.、]\s*.*$',
-            r'^\d{1,4}\s+.*$',
-        ],
-        "chapter_inline_pattern": r'(正文\s*)?第[零一二三四五六七八九十百千万亿\d]+[章节卷集部篇回][^\n]{0,40}',
-    }
-    
     def __init__(self, db: Optional[AsyncSession] = None):
         """
         初始化解析器
@@ -70,52 +53,6 @@ class TxtParser:
         self.custom_patterns: List[Tuple] = []
         self.pattern_stats: Dict[int, Dict] = {}  # pattern_id -> {matches, successes}
 
-    def _load_chapter_settings(self) -> Dict:
-        settings = dict(self.DEFAULT_CHAPTER_SETTINGS)
-        settings_file = Path("config/system_settings.json")
-
-        if settings_file.exists():
-            try:
-                data = json.loads(settings_file.read_text(encoding="utf-8"))
-            except Exception as e:
-                log.warning(f"加载章节规则设置失败，使用默认值: {e}")
-                data = {}
-
-            strong = data.get("chapter_patterns_strong")
-            if isinstance(strong, list):
-                strong = [item.strip() for item in strong if isinstance(item, str) and item.strip()]
-                if strong:
-                    settings["chapter_patterns_strong"] = strong
-
-            weak = data.get("chapter_patterns_weak")
-            if isinstance(weak, list):
-                weak = [item.strip() for item in weak if isinstance(item, str) and item.strip()]
-                if weak:
-                    settings["chapter_patterns_weak"] = weak
-
-            inline_pattern = data.get("chapter_inline_pattern")
-            if isinstance(inline_pattern, str) and inline_pattern.strip():
-                settings["chapter_inline_pattern"] = inline_pattern.strip()
-
-            max_title_len = data.get("chapter_max_title_length")
-            if isinstance(max_title_len, int) and max_title_len > 0:
-                settings["chapter_max_title_length"] = max_title_len
-
-            min_gap = data.get("chapter_min_gap")
-            if isinstance(min_gap, int) and min_gap >= 0:
-                settings["chapter_min_gap"] = min_gap
-
-        return settings
-
-    def _compile_patterns(self, patterns: List[str], label: str) -> List[re.Pattern]:
-        regexes = []
-        for pattern in patterns:
-            try:
-                regexes.append(re.compile(pattern, re.IGNORECASE))
-            except re.error as e:
-                log.warning(f"章节规则无效，已跳过: {label} -> {pattern} ({e})")
-        return regexes
-        
     def parse_toc(self, file_path: Path) -> List[Dict]:
         """
         解析章节目录（带缓存）
@@ -128,9 +65,8 @@ class TxtParser:
         """
         try:
             stat = file_path.stat()
-            settings_file = Path("config/system_settings.json")
-            settings_mtime = settings_file.stat().st_mtime if settings_file.exists() else None
-            cache_key = (str(file_path), stat.st_mtime, stat.st_size, settings_mtime)
+            rules = get_chapter_rules()
+            cache_key = (str(file_path), stat.st_mtime, stat.st_size, rules.fingerprint)
             
             if cache_key in _toc_cache:
                 return _toc_cache[cache_key]
@@ -140,7 +76,7 @@ class TxtParser:
             if not content:
                 return []
                 
-            chapters = self._parse_chapters(content)
+            chapters = self._parse_chapters(content, rules)
             
             # 存入缓存 (简单的LRU机制：如果太大就清空)
             if len(_toc_cache) > 100:
@@ -152,108 +88,34 @@ class TxtParser:
             log.error(f"解析目录失败: {file_path}, 错误: {e}")
             return []
 
-    def read_preview(self, file_path: Path, max_chars: int = 5000) -> Optional[str]:
-        """读取文件前N字符用于简介/标签提取"""
-        return self._read_file_content(file_path, max_chars=max_chars, allow_binary=True)
+    def read_preview(
+        self,
+        file_path: Path,
+        max_chars: int = 5000,
+        encoding: Optional[str] = None
+    ) -> Optional[str]:
+        """读取文件前N字符用于简介/标签提取（已知编码时跳过检测）"""
+        return self._read_file_content(file_path, max_chars=max_chars, allow_binary=True, encoding=encoding)
 
     def _read_file_content(
         self,
         file_path: Path,
         max_chars: Optional[int] = None,
-        allow_binary: bool = False
+        allow_binary: bool = False,
+        encoding: Optional[str] = None
     ) -> Optional[str]:
-        """读取文件内容（尝试多种编码）"""
-        import chardet
-
-        is_binary = self._is_probably_binary_file(file_path)
+        """读取文件内容（未指定编码时自动检测，宽松模式下依次尝试常见编码）"""
+        is_binary = is_probably_binary_file(file_path)
         if is_binary and not allow_binary:
             log.warning(f"疑似二进制文件，跳过读取: {file_path.name}")
             return None
         if is_binary and allow_binary:
             log.warning(f"疑似二进制文件，尝试宽松读取: {file_path.name}")
-        
-        def decode_quality(text: str) -> float:
-            if not text:
-                return 1.0
-            total = len(text)
-            replacement = text.count('\ufffd')
-            control = sum(1 for ch in text if ord(ch) < 32 and ch not in '\t\n\r')
-            return (replacement + control) / total
-
-        def cjk_ratio(text: str) -> float:
-            if not text:
-                return 0.0
-            total = len(text)
-            cjk = sum(1 for ch in text if '\u4e00' <= ch <= '\u9fff')
-            return cjk / total
-
-        def ascii_letter_ratio(text: str) -> float:
-            if not text:
-                return 0.0
-            total = len(text)
-            ascii_letters = sum(1 for ch in text if ch.isascii() and ch.isalpha())
-            return ascii_letters / total
-
-        def choose_encoding() -> Optional[str]:
-            candidates = [
-                'utf-8', 'utf-8-sig',
-                'gb18030', 'gbk', 'gb2312',
-                'big5',
-                'utf-16-le', 'utf-16-be',
-            ]
-            try:
-                with open(file_path, 'rb') as f:
-                    raw_data = f.read(200000)
-            except Exception as e:
-                log.error(f"读取编码检测样本失败: {e}")
-                return None
-
-            bom_encoding = None
-            if raw_data.startswith(b'\xff\xfe'):
-                bom_encoding = 'utf-16-le'
-            elif raw_data.startswith(b'\xfe\xff'):
-                bom_encoding = 'utf-16-be'
-            if bom_encoding:
-                return bom_encoding
-
-            best_encoding = None
-            best_score = None
-            for encoding in candidates:
-                try:
-                    decoded = raw_data.decode(encoding)
-                except UnicodeDecodeError:
-                    continue
-                score = (decode_quality(decoded), -cjk_ratio(decoded))
-                if best_score is None or score < best_score:
-                    best_score = score
-                    best_encoding = encoding
-
-            if best_encoding:
-                return best_encoding
-
-            result = chardet.detect(raw_data)
-            detected = result.get('encoding')
-            if not detected:
-                return None
-
-            detected_lower = detected.lower()
-            if detected_lower in ('utf-16', 'utf_16'):
-                even_nulls = sum(1 for i in range(0, len(raw_data), 2) if raw_data[i] == 0)
-                odd_nulls = sum(1 for i in range(1, len(raw_data), 2) if raw_data[i] == 0)
-                if odd_nulls > even_nulls:
-                    return 'utf-16-le'
-                if even_nulls > odd_nulls:
-                    return 'utf-16-be'
-                return None
 
-            if detected_lower in ('utf-16le', 'utf_16le'):
-                return 'utf-16-le'
-            if detected_lower in ('utf-16be', 'utf_16be'):
-                return 'utf-16-be'
+        if not encoding:
+            detected = detect_file_encoding(file_path)
+            encoding = detected.encoding if detected else None
 
-            return detected
-
-        encoding = choose_encoding()
         candidates = []
         if encoding:
             candidates.append(encoding)
@@ -270,13 +132,11 @@ class TxtParser:
                     content = f.read() if max_chars is None else f.read(max_chars)
                 if not content:
                     continue
-                quality = decode_quality(content[:10000])
+                quality, cjk, ascii_letters, _common = text_metrics(content[:10000])
                 if allow_binary and quality > 0.25:
                     continue
-                if allow_binary:
-                    readable_score = cjk_ratio(content[:10000]) + ascii_letter_ratio(content[:10000])
-                    if readable_score < 0.2:
-                        continue
+                if allow_binary and cjk + ascii_letters < 0.2:
+                    continue
                 if quality > 0.2:
                     log.warning(f"编码 {enc} 读取质量较差: {file_path.name}")
                 return self._clean_content(content)
@@ -296,153 +156,15 @@ class TxtParser:
         content = re.sub(r'\r\n', '\n', content)
         return content
 
-    def _is_probably_binary_file(self, file_path: Path, sample_size: int = 8192) -> bool:
-        """根据文件头部字节判断是否为二进制文件"""
-        try:
-            with open(file_path, 'rb') as f:
-                sample = f.read(sample_size)
-        except Exception as e:
-            log.warning(f"读取文件样本失败: {file_path}, 错误: {e}")
-            return False
-
-        if not sample:
-            return False
-
-        if sample.startswith(b'\xff\xfe') or sample.startswith(b'\xfe\xff'):
-            return False
-
-        if b'\x00' in sample:
-            even_nulls = sum(1 for i in range(0, len(sample), 2) if sample[i] == 0)
-            odd_nulls = sum(1 for i in range(1, len(sample), 2) if sample[i] == 0)
-            if max(even_nulls, odd_nulls) / max(1, len(sample) // 2) > 0.6:
-                return False
-            return True
-
-        control_bytes = 0
-        for b in sample:
-            if b < 32 and b not in (9, 10, 13):
-                control_bytes += 1
-
-        return (control_bytes / len(sample)) > 0.1
-
-    def _parse_chapters(self, content: str) -> List[Dict]:
-        """解析章节列表"""
-        chapter_settings = self._load_chapter_settings()
-        max_title_len = chapter_settings.get("chapter_max_title_length", 50)
-        min_gap = chapter_settings.get("chapter_min_gap", 40)
-        strong_patterns = chapter_settings.get("chapter_patterns_strong", [])
-        weak_patterns = chapter_settings.get("chapter_patterns_weak", [])
-        inline_pattern = chapter_settings.get("chapter_inline_pattern", "")
-        if not isinstance(max_title_len, int) or max_title_len <= 0:
-            max_title_len = 50
-        if not isinstance(min_gap, int) or min_gap < 0:
-            min_gap = 40
-
-        lines = content.split('\n')
-        offsets = []
-        pos = 0
-        for line in lines:
-            offsets.append(pos)
-            pos += len(line) + 1
-
-        candidates = []
-        strong_regexes = self._compile_patterns(strong_patterns, "strong")
-        weak_regexes = self._compile_patterns(weak_patterns, "weak")
-        inline_strong = None
-        if isinstance(inline_pattern, str) and inline_pattern.strip():
-            try:
-                inline_strong = re.compile(inline_pattern.strip(), re.IGNORECASE)
-            except re.error as e:
-                log.warning(f"章节内联规则无效，使用默认值: {e}")
-                inline_strong = re.compile(
-                    self.DEFAULT_CHAPTER_SETTINGS["chapter_inline_pattern"],
-                    re.IGNORECASE
-                )
-
-        for i, raw_line in enumerate(lines):
-            line = raw_line.strip()
-            if not line:
-                continue
-
-            prev_blank = i == 0 or not lines[i - 1].strip()
-            next_blank = i == len(lines) - 1 or not lines[i + 1].strip()
-            has_blank_neighbor = prev_blank or next_blank
-
-            found = False
-            is_body_only = line in ('正文', '正文：', '正文:')
-
-            if len(line) <= max_title_len:
-                for pattern in strong_regexes:
-                    if pattern.match(line):
-                        candidates.append({
-                            "title": line,
-                            "startOffset": offsets[i],
-                            "strength": 3,
-                            "is_body_only": is_body_only
-                        })
-                        found = True
-                        break
-
-            if not found and len(line) <= max_title_len and has_blank_neighbor:
-                for pattern in weak_regexes:
-                    if pattern.match(line):
-                        candidates.append({
-                            "title": line,
-                            "startOffset": offsets[i],
-                            "strength": 1,
-                            "is_body_only": is_body_only
-                        })
-                        found = True
-                        break
-
-            if not found and inline_strong:
-                match = inline_strong.search(line)
-                if match:
-                    title = match.group().strip()
-                    if len(title) <= max_title_len:
-                        candidates.append({
-                            "title": title,
-                            "startOffset": offsets[i] + match.start(),
-                            "strength": 2,
-                            "is_body_only": False
-                        })
-
-        candidates.sort(key=lambda x: x["startOffset"])
-        filtered = []
-        for cand in candidates:
-            if filtered and cand["startOffset"] - filtered[-1]["startOffset"] <= min_gap:
-                if cand["strength"] > filtered[-1]["strength"]:
-                    filtered[-1] = cand
-                continue
-            filtered.append(cand)
-
-        if any(not c.get("is_body_only") for c in filtered):
-            filtered = [c for c in filtered if not c.get("is_body_only")]
-
-        chapters = []
-        total_len = len(content)
-        if not filtered:
+    def _parse_chapters(self, content: str, rules: Optional[ChapterRules] = None) -> List[Dict]:
+        """解析章节列表（未识别到章节时整本作为一章）"""
+        chapters = detect_chapters(content, rules)
+        if not chapters:
             return [{
                 "title": "全文",
                 "startOffset": 0,
-                "endOffset": total_len
+                "endOffset": len(content)
             }]
-
-        for i, match in enumerate(filtered):
-            end_offset = filtered[i + 1]["startOffset"] if i < len(filtered) - 1 else total_len
-            chapters.append({
-                "title": match["title"],
-                "startOffset": match["startOffset"],
-                "endOffset": end_offset
-            })
-
-        if filtered and filtered[0]["startOffset"] > 100:
-            chapters.insert(0, {
-                "title": "序",
-                "startOffset": 0,
-                "endOffset": filtered[0]["startOffset"]
-            })
-
         return chapters
 
     async def load_custom_patterns(self):
@@ -0,0 +1,351 @@
+"""
+阅读进度写回缓冲
+阅读进度和会话心跳先在内存中按 (用户, 书籍) / 会话合并，定时批量写入数据库
+
+- 同一本书的多次进度更新只保留合并后的最终值；会话只保留最新时长
+- 每 progress_flush_seconds 秒、会话结束或应用关闭时经写入队列批量 upsert，一次提交；
+  间隔为 0 时每次更新后立即写入
+- 写入失败的条目放回缓冲，与期间的新更新合并后下次重试
+- 读取进度时用 peek() 叠加尚未写入的值
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import bindparam, func, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.core.db_writer import DatabaseWriter, db_writer
+from app.models import ReadingProgress, ReadingSession
+from app.utils.logger import log
+
+
+# 会话归属缓存条目上限（心跳时免查会话表）
+SESSION_OWNER_CACHE_SIZE = 4096
+
+
+@dataclass(slots=True)
+class PendingProgress:
+    """
+    待写入的阅读进度
+
+    progress_is_floor 为 True 时（来自心跳）写入时与库中进度取较大值；
+    finished 为 None 时不修改库中的值。
+    """
+    progress: float
+    progress_is_floor: bool
+    position: Optional[str]
+    finished: Optional[bool]
+    last_read_at: datetime
+    buffered_at: float
+
+    def merge(self, newer: "PendingProgress") -> None:
+        """合并之后的一次更新（按到达顺序）"""
+        if newer.progress_is_floor:
+            self.progress = max(self.progress, newer.progress)
+            if newer.position is not None:
+                self.position = newer.position
+        else:
+            self.progress = newer.progress
+            self.progress_is_floor = False
+            self.position = newer.position
+        if newer.finished is not None:
+            self.finished = newer.finished
+        self.last_read_at = newer.last_read_at
+
+
+@dataclass(slots=True)
+class PendingSession:
+    """待写入的会话时长/进度"""
+    duration_seconds: int
+    progress: Optional[float]
+    end_time: Optional[datetime]
+    buffered_at: float
+
+    def merge(self, newer: "PendingSession") -> None:
+        self.duration_seconds = newer.duration_seconds
+        if newer.progress is not None:
+            self.progress = newer.progress
+        if newer.end_time is not None:
+            self.end_time = newer.end_time
+
+
+class ProgressBuffer:
+    """阅读进度和会话心跳的写回缓冲"""
+
+    def __init__(self, writer: DatabaseWriter, flush_interval: float):
+        self.writer = writer
+        self.flush_interval = max(0.0, flush_interval)
+        self._progress: Dict[Tuple[int, int], PendingProgress] = {}
+        self._sessions: Dict[int, PendingSession] = {}
+        self._session_owners: "OrderedDict[int, Tuple[int, int]]" = OrderedDict()
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        # 统计
+        self.recorded = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.failed_flushes = 0
+        self.last_flush_at: Optional[float] = None
+        self.last_flush_lag = 0.0
+        self.max_flush_lag = 0.0
+        self.max_pending = 0
+        self.flush_seconds = 0.0
+
+    def _ensure_started(self) -> None:
+        if self.flush_interval <= 0:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                log.error(f"阅读进度批量写入失败: {e}")
+
+    def _after_record(self) -> None:
+        self.recorded += 1
+        self.max_pending = max(self.max_pending, len(self._progress) + len(self._sessions))
+        self._ensure_started()
+
+    def record_progress(
+        self,
+        user_id: int,
+        book_id: int,
+        progress: Optional[float],
+        position: Optional[str],
+        last_read_at: datetime,
+        finished: Optional[bool] = None,
+        is_floor: bool = False
+    ) -> PendingProgress:
+        """
+        记录一次进度更新
+
+        Args:
+            is_floor: 为 True 时（心跳/会话结束）与已有进度取较大值，position 为 None 时保留原值；
+                为 False 时（显式更新进度）整体覆盖
+
+        Returns:
+            合并后的待写入进度（用于立即广播）
+        """
+        entry = PendingProgress(
+            progress=progress or 0.0,
+            progress_is_floor=is_floor,
+            position=position,
+            finished=finished,
+            last_read_at=last_read_at,
+            buffered_at=time.monotonic(),
+        )
+        key = (user_id, book_id)
+        pending = self._progress.get(key)
+        if pending is None:
+            self._progress[key] = entry
+        else:
+            pending.merge(entry)
+            entry = pending
+        self._after_record()
+        return entry
+
+    def record_session(
+        self,
+        session_id: int,
+        duration_seconds: int,
+        progress: Optional[float] = None,
+        end_time: Optional[datetime] = None
+    ) -> None:
+        """记录一次会话心跳/结束"""
+        entry = PendingSession(duration_seconds, progress, end_time, time.monotonic())
+        pending = self._sessions.get(session_id)
+        if pending is None:
+            self._sessions[session_id] = entry
+        else:
+            pending.merge(entry)
+        self._after_record()
+
+    async def flush_if_unbuffered(self) -> None:
+        """未启用缓冲（间隔为 0）时立即写入"""
+        if self.flush_interval <= 0:
+            await self.flush()
+
+    def peek(self, user_id: int, book_id: int) -> Optional[PendingProgress]:
+        """尚未写入的进度（没有时返回 None）"""
+        return self._progress.get((user_id, book_id))
+
+    def remember_session(self, session_id: int, user_id: int, book_id: int) -> None:
+        """缓存会话归属"""
+        self._session_owners[session_id] = (user_id, book_id)
+        self._session_owners.move_to_end(session_id)
+        while len(self._session_owners) > SESSION_OWNER_CACHE_SIZE:
+            self._session_owners.popitem(last=False)
+
+    def session_owner(self, session_id: int) -> Optional[Tuple[int, int]]:
+        """缓存中的会话归属 (用户, 书籍)"""
+        owner = self._session_owners.get(session_id)
+        if owner is not None:
+            self._session_owners.move_to_end(session_id)
+        return owner
+
+    def forget_session(self, session_id: int) -> None:
+        self._session_owners.pop(session_id, None)
+
+    async def flush(self) -> None:
+        """把缓冲中的全部更新经写入队列批量写入（一次提交）"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._progress and not self._sessions:
+                return
+            progress, self._progress = self._progress, {}
+            sessions, self._sessions = self._sessions, {}
+            now = time.monotonic()
+            oldest = min(
+                [entry.buffered_at for entry in progress.values()]
+                + [entry.buffered_at for entry in sessions.values()]
+            )
+
+            start = time.monotonic()
+            try:
+                await self.writer.submit(lambda session: _write_pending(session, progress, sessions))
+            except Exception:
+                self.failed_flushes += 1
+                self._restore(progress, sessions)
+                raise
+            finally:
+                self.flush_seconds += time.monotonic() - start
+
+            self.flushes += 1
+            self.flushed_rows += len(progress) + len(sessions)
+            self.last_flush_at = time.time()
+            self.last_flush_lag = now - oldest
+            self.max_flush_lag = max(self.max_flush_lag, self.last_flush_lag)
+
+    def _restore(
+        self,
+        progress: Dict[Tuple[int, int], PendingProgress],
+        sessions: Dict[int, PendingSession]
+    ) -> None:
+        """写入失败：放回缓冲，期间到达的更新合并在后"""
+        for key, entry in progress.items():
+            newer = self._progress.get(key)
+            if newer is not None:
+                entry.merge(newer)
+            self._progress[key] = entry
+        for session_id, entry in sessions.items():
+            newer = self._sessions.get(session_id)
+            if newer is not None:
+                entry.merge(newer)
+            self._sessions[session_id] = entry
+
+    async def close(self) -> None:
+        """停止定时写入，并写入剩余的更新（应用关闭时调用，需在写入队列关闭前）"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            log.error(f"关闭时写入阅读进度失败: {e}")
+
+    def get_status(self) -> dict:
+        """缓冲统计"""
+        now = time.monotonic()
+        pending = [entry.buffered_at for entry in self._progress.values()]
+        pending += [entry.buffered_at for entry in self._sessions.values()]
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "flush_interval_seconds": self.flush_interval,
+            "pending_progress": len(self._progress),
+            "pending_sessions": len(self._sessions),
+            "max_pending": self.max_pending,
+            "oldest_pending_seconds": round(now - min(pending), 3) if pending else 0,
+            "recorded": self.recorded,
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "coalesced": max(0, self.recorded - self.flushed_rows - len(pending)),
+            "failed_flushes": self.failed_flushes,
+            "last_flush_at": self.last_flush_at,
+            "last_flush_lag_seconds": round(self.last_flush_lag, 3),
+            "max_flush_lag_seconds": round(self.max_flush_lag, 3),
+            "flush_ms_total": round(self.flush_seconds * 1000, 1),
+        }
+
+
+async def _write_pending(
+    session: AsyncSession,
+    progress: Dict[Tuple[int, int], PendingProgress],
+    sessions: Dict[int, PendingSession]
+) -> None:
+    """在写入会话中批量 upsert 进度、更新会话（由写入队列提交）"""
+    table = ReadingProgress.__table__
+    for is_floor in (False, True):
+        rows = [
+            {
+                "user_id": user_id,
+                "book_id": book_id,
+                "progress": entry.progress,
+                "position": entry.position,
+                "finished": bool(entry.finished),
+                "last_read_at": entry.last_read_at,
+            }
+            for (user_id, book_id), entry in progress.items()
+            if entry.progress_is_floor == is_floor
+        ]
+        if not rows:
+            continue
+        stmt = sqlite_insert(table)
+        if is_floor:
+            values = {
+                "progress": func.max(func.coalesce(table.c.progress, 0.0), stmt.excluded.progress),
+                "position": func.coalesce(stmt.excluded.position, table.c.position),
+                "last_read_at": stmt.excluded.last_read_at,
+            }
+        else:
+            values = {
+                "progress": stmt.excluded.progress,
+                "position": stmt.excluded.position,
+                "finished": stmt.excluded.finished,
+                "last_read_at": stmt.excluded.last_read_at,
+            }
+        await session.execute(
+            stmt.on_conflict_do_update(index_elements=["user_id", "book_id"], set_=values),
+            rows
+        )
+
+    if sessions:
+        table = ReadingSession.__table__
+        await session.execute(
+            update(table)
+            .where(table.c.id == bindparam("session_id"))
+            .values(
+                duration_seconds=bindparam("duration"),
+                progress=func.coalesce(bindparam("new_progress", type_=table.c.progress.type), table.c.progress),
+                end_time=func.coalesce(bindparam("new_end_time", type_=table.c.end_time.type), table.c.end_time),
+                # 时长变化，待汇总到阅读统计
+                rollup_pending=True,
+            ),
+            [
+                {
+                    "session_id": session_id,
+                    "duration": entry.duration_seconds,
+                    "new_progress": entry.progress,
+                    "new_end_time": entry.end_time,
+                }
+                for session_id, entry in sessions.items()
+            ]
+        )
+
+
+# 全局进度缓冲实例
+progress_buffer = ProgressBuffer(db_writer, settings.database.progress_flush_seconds)
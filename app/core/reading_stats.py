@@ -0,0 +1,181 @@
+"""
+阅读统计汇总
+维护 reading_stats_daily 表（按 用户/日期/小时/书籍 汇总的阅读时长和会话数），
+阅读统计接口和 Bot /stats 不再逐次聚合原始阅读会话
+
+- 会话新建、心跳或结束写入时标记 rollup_pending；汇总时把时长增量
+  (duration_seconds - rolled_seconds) 累加到会话开始时间所在的日期和小时，首次汇总时会话数 +1
+- 会话结束时立即汇总该会话；查询统计前汇总该用户的待汇总会话；定时任务汇总其余会话（含升级后的历史数据）
+- 已汇总且超过保留天数的原始会话由定时任务删除，汇总数据不受影响
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import bindparam, delete, func, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.core.db_writer import db_writer
+from app.models import ReadingSession, ReadingStatsDaily
+from app.utils.logger import log
+
+
+# 单个写入事务汇总的会话数
+ROLLUP_BATCH_SIZE = 2000
+# 单个写入事务删除的会话数
+RETENTION_BATCH_SIZE = 5000
+
+
+async def rollup_batch(
+    db: AsyncSession,
+    user_id: Optional[int] = None,
+    session_ids: Optional[Iterable[int]] = None,
+    limit: int = ROLLUP_BATCH_SIZE
+) -> int:
+    """
+    汇总一批待汇总会话（只执行语句，由调用方提交；通常经写入队列调用）
+
+    Args:
+        db: 数据库会话
+        user_id: 只汇总该用户的会话
+        session_ids: 只汇总这些会话
+        limit: 本批最多汇总的会话数
+
+    Returns:
+        本批汇总的会话数
+    """
+    query = (
+        select(
+            ReadingSession.id,
+            ReadingSession.user_id,
+            ReadingSession.book_id,
+            ReadingSession.start_time,
+            ReadingSession.duration_seconds,
+            ReadingSession.rolled_seconds,
+        )
+        .where(ReadingSession.rollup_pending == True)
+        .limit(limit)
+    )
+    if user_id is not None:
+        query = query.where(ReadingSession.user_id == user_id)
+    if session_ids is not None:
+        query = query.where(ReadingSession.id.in_(list(session_ids)))
+    rows = (await db.execute(query)).all()
+    if not rows:
+        return 0
+
+    buckets: Dict[Tuple[int, object, int, int], dict] = {}
+    for row in rows:
+        start = row.start_time
+        key = (row.user_id, start.date(), start.hour, row.book_id)
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = {
+                "user_id": row.user_id,
+                "date": start.date(),
+                "hour": start.hour,
+                "book_id": row.book_id,
+                "seconds": 0,
+                "sessions": 0,
+                "last_read_at": start,
+            }
+        bucket["seconds"] += (row.duration_seconds or 0) - (row.rolled_seconds or 0)
+        if row.rolled_seconds is None:
+            bucket["sessions"] += 1
+        bucket["last_read_at"] = max(bucket["last_read_at"], start)
+
+    table = ReadingStatsDaily.__table__
+    stmt = sqlite_insert(table)
+    await db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["user_id", "date", "hour", "book_id"],
+            set_={
+                "seconds": table.c.seconds + stmt.excluded.seconds,
+                "sessions": table.c.sessions + stmt.excluded.sessions,
+                "last_read_at": func.max(
+                    func.coalesce(table.c.last_read_at, stmt.excluded.last_read_at),
+                    stmt.excluded.last_read_at
+                ),
+            },
+        ),
+        list(buckets.values())
+    )
+
+    sessions = ReadingSession.__table__
+    await db.execute(
+        update(sessions)
+        .where(sessions.c.id == bindparam("session_id"))
+        .values(rolled_seconds=bindparam("rolled"), rollup_pending=False),
+        [{"session_id": row.id, "rolled": row.duration_seconds or 0} for row in rows]
+    )
+    return len(rows)
+
+
+async def rollup_pending(user_id: Optional[int] = None, session_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    经写入队列分批汇总全部待汇总会话
+
+    Returns:
+        汇总的会话数
+    """
+    session_ids = list(session_ids) if session_ids is not None else None
+    total = 0
+    while True:
+        count = await db_writer.submit(
+            lambda db: rollup_batch(db, user_id=user_id, session_ids=session_ids)
+        )
+        total += count
+        if count < ROLLUP_BATCH_SIZE:
+            return total
+
+
+async def ensure_user_rollup(db: AsyncSession, user_id: int) -> None:
+    """查询统计前调用：该用户有待汇总会话时先汇总（db 可为只读会话）"""
+    pending = await db.execute(
+        select(ReadingSession.id)
+        .where(ReadingSession.user_id == user_id)
+        .where(ReadingSession.rollup_pending == True)
+        .limit(1)
+    )
+    if pending.first() is not None:
+        await rollup_pending(user_id=user_id)
+        # 结束当前读事务：WAL 下之后的查询才能读到刚汇总的数据
+        await db.commit()
+
+
+async def purge_old_sessions(retention_days: int) -> int:
+    """
+    删除已汇总且开始时间早于保留期的原始会话
+
+    Returns:
+        删除的会话数
+    """
+    if retention_days <= 0:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+
+    async def purge(db: AsyncSession) -> int:
+        sessions = ReadingSession.__table__
+        ids = select(sessions.c.id).where(
+            sessions.c.start_time < cutoff,
+            sessions.c.rollup_pending == False,
+        ).limit(RETENTION_BATCH_SIZE)
+        result = await db.execute(delete(sessions).where(sessions.c.id.in_(ids)))
+        return result.rowcount or 0
+
+    total = 0
+    while True:
+        count = await db_writer.submit(purge)
+        total += count
+        if count < RETENTION_BATCH_SIZE:
+            return total
+
+
+async def run_maintenance() -> Dict[str, int]:
+    """定时任务：汇总全部待汇总会话（含历史数据回填），并按保留期清理原始会话"""
+    rolled = await rollup_pending()
+    purged = await purge_old_sessions(settings.database.reading_session_retention_days)
+    if rolled or purged:
+        log.info(f"阅读统计汇总完成: 汇总会话 {rolled}，清理原始会话 {purged}")
+    return {"rolled": rolled, "purged": purged}
@@ -0,0 +1,413 @@
+"""
+扫描清单模块
+基于 BookVersion 记录的 (路径, 大小, mtime_ns, inode, hash) 实现增量扫描
+
+重新扫描时只需 stat() 文件并与清单比对：
+- 未变化的文件直接跳过，不再解析元数据和计算 Hash
+- 内容变化的文件原地更新版本记录
+- 被移动/重命名的文件（inode、大小、mtime 均相同）只更新路径
+- 清单中存在但磁盘上已消失的文件汇报给调用方，可选清理
+
+压缩包内的书籍以 source="archive:<压缩包路径>" 记录来源，
+并保存压缩包自身的 mtime/inode，压缩包未变化时整体跳过；
+变化的压缩包重新读取时按成员完整 Hash 与已有版本对应，已从包内移除的成员删除其版本记录。
+"""
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.deduplicator import Deduplicator, FileFingerprint
+from app.core.library_stats import mark_books_changed
+from app.models import Author, Book, BookVersion
+from app.utils.logger import log
+
+
+ARCHIVE_SOURCE_PREFIX = "archive:"
+
+# classify() 的返回值
+UNCHANGED = "unchanged"  # 与清单一致
+BACKFILL = "backfill"    # 旧记录缺少 mtime/inode，大小一致，仅需补录
+CHANGED = "changed"      # 路径相同但大小/mtime/inode 变化
+MOVED = "moved"          # 新路径，但与某条已消失的记录是同一个文件
+NEW = "new"              # 清单中不存在
+DUPLICATE = "duplicate"  # 内容变化后与其他版本重复，已移除
+
+
+@dataclass(slots=True)
+class ManifestEntry:
+    """清单中的一条版本记录"""
+    version_id: int
+    book_id: int
+    file_path: str
+    file_size: int
+    file_mtime_ns: Optional[int]
+    file_inode: Optional[int]
+    file_hash: Optional[str]
+    source: Optional[str]
+    seen: bool = False
+
+    @property
+    def display_path(self) -> str:
+        """用于汇报的路径（压缩包内的书籍显示压缩包路径）"""
+        if self.source and self.source.startswith(ARCHIVE_SOURCE_PREFIX):
+            return self.source[len(ARCHIVE_SOURCE_PREFIX):]
+        return self.file_path
+
+
+def manifest_path(file_path: Path) -> str:
+    """清单中使用的路径格式（与 BookVersion.file_path 保存格式一致）"""
+    return str(file_path.absolute().as_posix())
+
+
+def archive_source(archive_path: Path) -> str:
+    """压缩包内书籍版本的 source 字段"""
+    return f"{ARCHIVE_SOURCE_PREFIX}{manifest_path(archive_path)}"
+
+
+class ScanManifest:
+    """单个书库的扫描清单"""
+
+    def __init__(self, entries: Iterable[ManifestEntry], roots: Iterable[Path]):
+        self.roots = [manifest_path(Path(r)).rstrip("/") + "/" for r in roots]
+        self._by_path: Dict[str, ManifestEntry] = {}
+        self._by_identity: Dict[Tuple[int, int, int], ManifestEntry] = {}
+        self._by_archive: Dict[str, List[ManifestEntry]] = {}
+        # 各扫描根目录下实际发现的文件数，用于防止挂载点丢失时误删
+        self.discovered: Dict[str, int] = {root: 0 for root in self.roots}
+
+        for entry in entries:
+            if entry.source and entry.source.startswith(ARCHIVE_SOURCE_PREFIX):
+                archive = entry.source[len(ARCHIVE_SOURCE_PREFIX):]
+                self._by_archive.setdefault(archive, []).append(entry)
+                continue
+            self._by_path[entry.file_path] = entry
+            if entry.file_inode and entry.file_mtime_ns:
+                self._by_identity[(entry.file_inode, entry.file_size, entry.file_mtime_ns)] = entry
+
+    @classmethod
+    async def load(cls, db: AsyncSession, library_id: int, roots: Iterable[Path]) -> "ScanManifest":
+        """
+        从数据库加载书库的清单
+
+        Args:
+            db: 数据库会话
+            library_id: 书库ID
+            roots: 本次扫描的根目录
+
+        Returns:
+            ScanManifest 实例
+        """
+        result = await db.execute(
+            select(
+                BookVersion.id,
+                BookVersion.book_id,
+                BookVersion.file_path,
+                BookVersion.file_size,
+                BookVersion.file_mtime_ns,
+                BookVersion.file_inode,
+                BookVersion.file_hash,
+                BookVersion.source,
+            )
+            .join(Book, BookVersion.book_id == Book.id)
+            .where(Book.library_id == library_id)
+        )
+        entries = [ManifestEntry(*row) for row in result.all()]
+        log.info(f"加载扫描清单: 书库 {library_id}, {len(entries)} 个版本")
+        return cls(entries, roots)
+
+    def __len__(self) -> int:
+        return len(self._by_path) + sum(len(v) for v in self._by_archive.values())
+
+    def _count_discovered(self, path: str) -> None:
+        for root in self.roots:
+            if path.startswith(root):
+                self.discovered[root] += 1
+                return
+
+    def classify(self, file_path: Path, stat: os.stat_result) -> Tuple[str, Optional[ManifestEntry]]:
+        """
+        将磁盘上的文件与清单比对
+
+        Args:
+            file_path: 文件路径
+            stat: 文件的 stat 结果
+
+        Returns:
+            (状态, 对应的清单记录)，状态为 UNCHANGED/BACKFILL/CHANGED/MOVED/NEW
+        """
+        path = manifest_path(file_path)
+        self._count_discovered(path)
+
+        entry = self._by_path.get(path)
+        if entry is not None:
+            entry.seen = True
+            if entry.file_size != stat.st_size:
+                return CHANGED, entry
+            if entry.file_mtime_ns is None:
+                return BACKFILL, entry
+            if entry.file_mtime_ns != stat.st_mtime_ns:
+                return CHANGED, entry
+            if entry.file_inode and entry.file_inode != stat.st_ino:
+                # 文件被替换（例如原子写入），内容可能已变
+                return CHANGED, entry
+            return UNCHANGED, entry
+
+        moved = self._by_identity.get((stat.st_ino, stat.st_size, stat.st_mtime_ns))
+        if moved is not None and not moved.seen and not os.path.exists(moved.file_path):
+            moved.seen = True
+            self._by_path.pop(moved.file_path, None)
+            moved.file_path = path
+            self._by_path[path] = moved
+            return MOVED, moved
+
+        return NEW, None
+
+    def classify_archive(self, archive_path: Path, stat: os.stat_result) -> str:
+        """
+        判断压缩包自上次扫描后是否变化
+
+        Returns:
+            UNCHANGED（所有成员记录的 mtime/inode 与压缩包一致）、CHANGED 或 NEW
+        """
+        path = manifest_path(archive_path)
+        self._count_discovered(path)
+
+        entries = self._by_archive.get(path)
+        if not entries:
+            return NEW
+        for entry in entries:
+            entry.seen = True
+        if all(
+            e.file_mtime_ns == stat.st_mtime_ns and (not e.file_inode or e.file_inode == stat.st_ino)
+            for e in entries
+        ):
+            return UNCHANGED
+        return CHANGED
+
+    def archive_entries(self, archive_path: Path) -> List[ManifestEntry]:
+        """压缩包内书籍的清单记录"""
+        return self._by_archive.get(manifest_path(archive_path), [])
+
+    def missing(self) -> List[ManifestEntry]:
+        """
+        本次扫描未见到、且磁盘上确实不存在的记录
+
+        只统计位于扫描根目录下、且该根目录本次发现过文件的记录，
+        避免路径被禁用或挂载点暂时丢失时把整个书库判定为消失。
+        """
+        active_roots = [root for root, count in self.discovered.items() if count > 0]
+
+        def under_active_root(path: str) -> bool:
+            return any(path.startswith(root) for root in active_roots)
+
+        result = []
+        for entry in self._by_path.values():
+            if not entry.seen and under_active_root(entry.file_path) and not os.path.exists(entry.file_path):
+                result.append(entry)
+        for archive, entries in self._by_archive.items():
+            if under_active_root(archive) and not os.path.exists(archive):
+                result.extend(e for e in entries if not e.seen)
+        return result
+
+
+def version_manifest_fields(file_path: Path, archive_path: Optional[Path] = None) -> dict:
+    """
+    新建 BookVersion 时需要写入的清单字段
+
+    Args:
+        file_path: 书籍文件路径
+        archive_path: 书籍来自压缩包时为压缩包路径
+
+    Returns:
+        可直接传给 BookVersion(...) 的字段
+    """
+    if archive_path is not None:
+        stat = archive_path.stat()
+        return {
+            "file_mtime_ns": stat.st_mtime_ns,
+            "file_inode": stat.st_ino,
+            "source": archive_source(archive_path),
+        }
+    stat = file_path.stat()
+    return {
+        "file_mtime_ns": stat.st_mtime_ns,
+        "file_inode": stat.st_ino,
+    }
+
+
+async def sync_known_file(
+    db: AsyncSession,
+    manifest: ScanManifest,
+    file_path: Path,
+    deduplicator: Deduplicator,
+    determine_quality: Callable[[Path], str]
+) -> Optional[str]:
+    """
+    处理清单中已有的文件（未变化/补录/移动/内容变化）
+
+    Args:
+        db: 数据库会话
+        manifest: 扫描清单
+        file_path: 文件路径
+        deduplicator: 去重器（计算指纹、比对内容）
+        determine_quality: 质量判断函数
+
+    Returns:
+        已处理时返回状态（UNCHANGED/BACKFILL/MOVED/CHANGED/DUPLICATE），
+        新文件返回 None，由调用方走完整的解析入库流程
+    """
+    stat = file_path.stat()
+    state, entry = manifest.classify(file_path, stat)
+    if state == NEW:
+        return None
+    if state == UNCHANGED:
+        return UNCHANGED
+    if state in (BACKFILL, MOVED):
+        await record_stat(db, entry, file_path, stat)
+        if state == MOVED:
+            log.info(f"文件已移动，更新路径: {file_path}")
+        return state
+
+    fingerprint = deduplicator.fingerprint(file_path)
+    updated = await update_changed(
+        db, deduplicator, entry, file_path, stat, fingerprint, determine_quality(file_path)
+    )
+    if updated:
+        log.info(f"文件内容已变化，更新版本: {file_path}")
+        return CHANGED
+    return DUPLICATE
+
+
+async def touch_archive_versions(db: AsyncSession, archive_path: Path) -> None:
+    """压缩包处理完成后，把其全部书籍版本的 mtime/inode 更新为压缩包当前值"""
+    stat = archive_path.stat()
+    await db.execute(
+        update(BookVersion)
+        .where(BookVersion.source == archive_source(archive_path))
+        .values(file_mtime_ns=stat.st_mtime_ns, file_inode=stat.st_ino)
+    )
+
+
+async def record_stat(
+    db: AsyncSession,
+    entry: ManifestEntry,
+    file_path: Path,
+    stat: os.stat_result
+) -> None:
+    """补录未变化文件的 mtime/inode，或更新被移动文件的路径"""
+    await db.execute(
+        update(BookVersion)
+        .where(BookVersion.id == entry.version_id)
+        .values(
+            file_path=manifest_path(file_path),
+            file_name=file_path.name,
+            file_mtime_ns=stat.st_mtime_ns,
+            file_inode=stat.st_ino,
+        )
+    )
+    entry.file_mtime_ns = stat.st_mtime_ns
+    entry.file_inode = stat.st_ino
+
+
+async def update_changed(
+    db: AsyncSession,
+    deduplicator: Deduplicator,
+    entry: ManifestEntry,
+    file_path: Path,
+    stat: os.stat_result,
+    fingerprint: FileFingerprint,
+    quality: str
+) -> bool:
+    """
+    原地更新内容发生变化的版本
+
+    Returns:
+        True 表示已更新；False 表示新内容与其他版本完全相同，
+        该版本已作为重复文件移除
+    """
+    duplicates = await deduplicator.find_content_duplicates(
+        [(file_path, fingerprint)],
+        exclude_version_ids={entry.version_id}
+    )
+    if duplicates[0]:
+        log.info(f"文件变化后与已有版本内容相同，移除该版本: {file_path}")
+        await remove_versions(db, [entry])
+        return False
+
+    await db.execute(
+        update(BookVersion)
+        .where(BookVersion.id == entry.version_id)
+        .values(
+            file_mtime_ns=stat.st_mtime_ns,
+            file_inode=stat.st_ino,
+            quality=quality,
+            # 内容已变化，编码在下次读取时重新检测
+            encoding=None,
+            encoding_confidence=None,
+            **fingerprint.version_fields(),
+        )
+    )
+    # 文件大小可能变化，主版本总大小需重算
+    await mark_books_changed(db, [entry.book_id])
+    entry.file_size = fingerprint.file_size
+    entry.file_mtime_ns = stat.st_mtime_ns
+    entry.file_inode = stat.st_ino
+    entry.file_hash = fingerprint.file_hash
+    return True
+
+
+async def remove_versions(db: AsyncSession, entries: List[ManifestEntry]) -> int:
+    """
+    删除版本记录；书籍没有剩余版本时一并删除书籍，
+    主版本被删除时把最早的剩余版本设为主版本
+
+    Returns:
+        被删除的书籍数
+    """
+    if not entries:
+        return 0
+
+    version_ids = [e.version_id for e in entries]
+    book_ids = {e.book_id for e in entries}
+    # 版本删除和主版本变更绕过 ORM，在书籍删除之前标记书库统计过期
+    await mark_books_changed(db, book_ids)
+    await db.execute(delete(BookVersion).where(BookVersion.id.in_(version_ids)))
+
+    result = await db.execute(
+        select(
+            BookVersion.book_id,
+            func.min(BookVersion.id),
+            func.max(case((BookVersion.is_primary == True, 1), else_=0)),
+        )
+        .where(BookVersion.book_id.in_(book_ids))
+        .group_by(BookVersion.book_id)
+    )
+    remaining = {}
+    for book_id, first_version_id, has_primary in result.all():
+        remaining[book_id] = True
+        if not has_primary:
+            await db.execute(
+                update(BookVersion)
+                .where(BookVersion.id == first_version_id)
+                .values(is_primary=True)
+            )
+
+    orphan_ids = [book_id for book_id in book_ids if book_id not in remaining]
+    if orphan_ids:
+        # 通过 ORM 删除以级联清理进度、标签、收藏等关联数据
+        result = await db.execute(select(Book).where(Book.id.in_(orphan_ids)))
+        for book in result.scalars().all():
+            if book.author_id:
+                await db.execute(
+                    update(Author)
+                    .where(Author.id == book.author_id)
+                    .where(Author.book_count > 0)
+                    .values(book_count=Author.book_count - 1)
+                )
+            await db.delete(book)
+    await db.flush()
+    return len(orphan_ids)
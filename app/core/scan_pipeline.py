@@ -0,0 +1,567 @@
+"""
+并行扫描流水线
+目录遍历 -> 多进程解析 -> 单一数据库写入者
+
+- 遍历：在线程中遍历目录，通过有界队列交给事件循环，队列满时遍历线程阻塞（背压）
+- 解析：进程池中完成元数据解析、文件指纹、TXT 预览、简介和标签提取，只返回普通数据
+- 写入：主进程按批次合并去重，批量写入作者、书籍、版本和标签，每批一次 flush、一次提交
+
+作者和标签名称 -> ID 映射在扫描开始时一次性加载（ScanSession），缺失的名称
+用 INSERT ... ON CONFLICT DO NOTHING RETURNING 批量插入；作者书籍数在扫描结束时
+用一条 UPDATE 重新统计。
+书籍和版本仍走 ORM（add_all + flush），书库统计、封面等 after_flush 监听器照常生效；
+标签关联不需要回读 ID，flush 后用一条 executemany 插入，全文索引在其后按批次统一刷新。
+"""
+import asyncio
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.core import search_index
+from app.core.deduplicator import Deduplicator, fingerprint_file
+from app.core.encoding_detector import detect_file_encoding
+from app.models import Author, Book, BookTag, BookVersion, Tag
+from app.utils.logger import log
+
+
+# 写入结果动作
+SKIP = "skip"
+ADD_VERSION = "add_version"
+NEW_BOOK = "new_book"
+
+# 电子书格式（其余支持格式为压缩包，后台扫描不展开）
+EBOOK_FORMATS = (".txt", ".epub", ".mobi", ".azw3")
+
+# 单条 INSERT 的最大行数（SQLite 变量数上限）
+INSERT_CHUNK = 500
+
+_WALK_DONE = object()
+
+
+def resolve_worker_count(configured: int) -> int:
+    """
+    计算解析进程数
+
+    Args:
+        configured: 配置值，0 表示按 CPU 核数自动选择
+
+    Returns:
+        进程数（至少为 1）
+    """
+    if configured and configured > 0:
+        return configured
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+def determine_quality(file_format: str, file_size: int) -> str:
+    """
+    根据格式和大小判断文件质量
+
+    Args:
+        file_format: 小写扩展名（含点）
+        file_size: 文件大小（字节）
+
+    Returns:
+        'low' / 'medium' / 'high'
+    """
+    format_quality = {
+        '.epub': 'high',
+        '.mobi': 'medium',
+        '.azw3': 'high',
+        '.txt': 'low',
+    }
+
+    if file_format in ['.epub', '.mobi', '.azw3']:
+        if file_size > 2 * 1024 * 1024:
+            return 'high'
+        elif file_size > 500 * 1024:
+            return 'medium'
+        else:
+            return 'low'
+
+    return format_quality.get(file_format, 'medium')
+
+
+# ===== 遍历 =====
+
+def _iter_book_files(directory: Path, formats: Sequence[str]):
+    """单次遍历目录树，按扩展名（支持 .tar.gz 这类多段扩展名）筛选文件"""
+    suffixes = tuple(ext.lower() for ext in formats)
+
+    def on_error(error: OSError):
+        log.error(f"扫描目录失败: {error.filename}, 错误: {error}")
+
+    for dirpath, _dirnames, filenames in os.walk(directory, onerror=on_error):
+        for filename in filenames:
+            if filename.lower().endswith(suffixes):
+                yield Path(dirpath) / filename
+
+
+async def walk_files(
+    roots: Iterable[Path],
+    formats: Sequence[str],
+    queue_size: int
+) -> AsyncIterator[Path]:
+    """
+    在后台线程中遍历目录，按发现顺序产出文件路径
+
+    Args:
+        roots: 扫描根目录
+        formats: 支持的扩展名
+        queue_size: 队列上限，消费跟不上时遍历线程阻塞等待
+
+    Yields:
+        文件路径
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_size))
+    stopped = threading.Event()
+
+    def put(item) -> None:
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def produce() -> None:
+        try:
+            for root in roots:
+                if not root.exists():
+                    log.warning(f"路径不存在，跳过: {root}")
+                    continue
+                log.info(f"开始扫描路径: {root}")
+                for file_path in _iter_book_files(root, formats):
+                    if stopped.is_set():
+                        return
+                    put(file_path)
+        finally:
+            if not stopped.is_set():
+                put(_WALK_DONE)
+
+    producer = loop.run_in_executor(None, produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is _WALK_DONE:
+                break
+            yield item
+    finally:
+        # 提前退出时让遍历线程结束：置位后清空队列，解除其阻塞
+        stopped.set()
+        while not producer.done():
+            while not queue.empty():
+                queue.get_nowait()
+            await asyncio.sleep(0.01)
+        await producer
+
+
+# ===== 解析进程 =====
+
+_worker_parsers: Dict[str, object] = {}
+
+
+def _init_worker(custom_patterns: List[dict], log_level: str) -> None:
+    """子进程初始化：创建解析器；日志只输出到控制台，避免多进程同时轮转日志文件"""
+    from app.core.metadata.epub_parser import EpubParser
+    from app.core.metadata.mobi_parser import MobiParser
+    from app.core.metadata.txt_parser import TxtParser
+
+    log.remove()
+    log.add(sys.stderr, level=log_level, format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | scan-worker | {message}")
+
+    txt_parser = TxtParser()
+    txt_parser.custom_patterns = custom_patterns
+    _worker_parsers.update(
+        txt=txt_parser,
+        epub=EpubParser(),
+        mobi=MobiParser(),
+    )
+
+
+def _extract_metadata(file_path: Path) -> Optional[dict]:
+    suffix = file_path.suffix.lower()
+    try:
+        if suffix == '.txt':
+            return _worker_parsers["txt"].parse(file_path)
+        elif suffix == '.epub':
+            return _worker_parsers["epub"].parse(file_path)
+        elif suffix in ['.mobi', '.azw3']:
+            return _worker_parsers["mobi"].parse(file_path)
+        return None
+    except Exception as e:
+        log.error(f"元数据提取失败: {file_path}, 错误: {e}")
+        return None
+
+
+def process_file(path: str, algorithm: str, full_hash: bool) -> dict:
+    """
+    解析单个文件（在子进程中执行）
+
+    Args:
+        path: 文件路径
+        algorithm: Hash 算法
+        full_hash: 是否计算完整Hash（否则只计算采样Hash，由写入者在碰撞时补算）
+
+    Returns:
+        dict：path、metadata（无法解析时为 None）、文件信息及指纹、
+        pattern_stats（本次命中的自定义规则统计）；出错时带 error/error_type
+    """
+    from app.core.tag_keywords import get_tags_from_content, get_tags_from_filename
+
+    file_path = Path(path)
+    result = {"path": path, "metadata": None, "pattern_stats": {}}
+    txt_parser = _worker_parsers["txt"]
+    txt_parser.pattern_stats = {}
+
+    try:
+        stat = file_path.stat()
+        file_format = file_path.suffix.lower()
+
+        metadata = _extract_metadata(file_path)
+        result["pattern_stats"] = txt_parser.pattern_stats
+        if not metadata:
+            return result
+
+        # TXT：检测一次编码（随版本保存），读取一次前部内容，用于简介和标签提取
+        txt_content = None
+        if file_format == '.txt':
+            try:
+                encoding = detect_file_encoding(file_path)
+                result["encoding"] = encoding
+                txt_content = txt_parser.read_preview(
+                    file_path, max_chars=5000, encoding=encoding.encoding if encoding else None
+                )
+            except Exception as e:
+                log.error(f"读取TXT内容失败: {file_path}, 错误: {e}")
+
+        if txt_content and not metadata.get('description'):
+            try:
+                description = txt_parser.extract_description(txt_content)
+                if description:
+                    metadata['description'] = description
+            except Exception as e:
+                log.error(f"提取简介失败: {file_path}, 错误: {e}")
+
+        auto_tags = list(metadata.get('auto_tags') or [])
+        try:
+            auto_tags.extend(get_tags_from_filename(file_path.name))
+            if txt_content:
+                auto_tags.extend(get_tags_from_content(txt_content[:1000]))
+        except Exception as e:
+            log.error(f"提取标签失败: {file_path}, 错误: {e}")
+        metadata['auto_tags'] = sorted(set(auto_tags))
+
+        result.update(
+            metadata=metadata,
+            file_format=file_format,
+            file_mtime_ns=stat.st_mtime_ns,
+            file_inode=stat.st_ino,
+            fingerprint=fingerprint_file(file_path, algorithm, full_hash),
+            quality=determine_quality(file_format, stat.st_size),
+        )
+    except Exception as e:
+        result.update(error=str(e)[:200], error_type=type(e).__name__)
+    return result
+
+
+class ScanWorkerPool:
+    """解析进程池（子进程崩溃时自动重建）"""
+
+    def __init__(self, workers: int, custom_patterns: List[dict]):
+        self.workers = max(1, workers)
+        self._custom_patterns = custom_patterns
+        self._algorithm = settings.deduplicator.hash_algorithm
+        self._full_hash = settings.deduplicator.hash_mode == "full"
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._generation = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn：不继承父进程的事件循环、数据库连接和线程状态
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self._custom_patterns, settings.logging.level),
+            )
+        return self._executor
+
+    async def process(self, file_path: Path) -> dict:
+        """
+        在子进程中解析文件，不抛出异常
+
+        Returns:
+            process_file 的结果
+        """
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        generation = self._generation
+        try:
+            return await loop.run_in_executor(executor, process_file, str(file_path), self._algorithm, self._full_hash)
+        except BrokenProcessPool as e:
+            # 某个文件导致子进程崩溃：同一代的任务全部失败，只重建一次
+            if generation == self._generation:
+                log.error(f"解析进程异常退出，重建进程池: {file_path}")
+                self._generation += 1
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            return {
+                "path": str(file_path),
+                "metadata": None,
+                "pattern_stats": {},
+                "error": str(e)[:200] or "解析进程异常退出",
+                "error_type": type(e).__name__,
+            }
+
+    def shutdown(self) -> None:
+        """关闭进程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+# ===== 批量写入 =====
+
+class ScanSession:
+    """
+    单次扫描内的作者/标签名称 -> ID 映射
+
+    扫描开始时一次性加载，之后只为缺失的名称执行批量插入。
+    提交和回滚需通过本对象进行：回滚时丢弃本事务内新插入的名称。
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.author_ids: Dict[str, int] = {}
+        self.tag_ids: Dict[str, int] = {}
+        # 本事务内新插入的 (映射, 名称)，回滚时移除
+        self._uncommitted: List[Tuple[Dict[str, int], str]] = []
+
+    async def load(self) -> None:
+        """预加载全部作者和标签"""
+        self.author_ids = dict((await self.db.execute(select(Author.name, Author.id))).all())
+        self.tag_ids = dict((await self.db.execute(select(Tag.name, Tag.id))).all())
+
+    async def resolve_authors(self, names: Iterable[str]) -> Dict[str, int]:
+        """获取作者ID，不存在的作者批量创建"""
+        return await self._resolve(Author, self.author_ids, names, {"book_count": 0})
+
+    async def resolve_tags(self, names: Iterable[str]) -> Dict[str, int]:
+        """获取标签ID，不存在的标签批量创建（类型为 auto）"""
+        return await self._resolve(Tag, self.tag_ids, names, {"type": "auto"})
+
+    async def _resolve(self, model, cache: Dict[str, int], names: Iterable[str], defaults: dict) -> Dict[str, int]:
+        names = list(dict.fromkeys(names))
+        missing = [name for name in names if name not in cache]
+        for start in range(0, len(missing), INSERT_CHUNK):
+            chunk = missing[start:start + INSERT_CHUNK]
+            result = await self.db.execute(
+                sqlite_insert(model)
+                .values([{"name": name, **defaults} for name in chunk])
+                .on_conflict_do_nothing(index_elements=["name"])
+                .returning(model.name, model.id)
+            )
+            for name, row_id in result.all():
+                cache[name] = row_id
+                self._uncommitted.append((cache, name))
+            # 其他会话并发插入的名称不会返回，补查一次
+            remaining = [name for name in chunk if name not in cache]
+            if remaining:
+                result = await self.db.execute(select(model.name, model.id).where(model.name.in_(remaining)))
+                cache.update(result.all())
+        return {name: cache[name] for name in names}
+
+    async def commit(self) -> None:
+        await self.db.commit()
+        self._uncommitted.clear()
+
+    async def rollback(self) -> None:
+        await self.db.rollback()
+        for cache, name in self._uncommitted:
+            cache.pop(name, None)
+        self._uncommitted.clear()
+
+
+async def recompute_author_book_counts(db: AsyncSession) -> None:
+    """用一条 UPDATE 重新统计所有作者的书籍数（只更新有变化的行）"""
+    count = select(func.count(Book.id)).where(Book.author_id == Author.id).scalar_subquery()
+    await db.execute(
+        update(Author)
+        .where(Author.book_count.is_distinct_from(count))
+        .values(book_count=count)
+        .execution_options(synchronize_session=False)
+    )
+
+
+class ScanBatchWriter:
+    """把解析结果按批写入数据库（单一写入者）"""
+
+    def __init__(
+        self,
+        db: AsyncSession,
+        library_id: int,
+        library_tag_ids: Sequence[int],
+        deduplicator: Deduplicator,
+        session: Optional[ScanSession] = None
+    ):
+        self.db = db
+        self.library_id = library_id
+        self.library_tag_ids = list(library_tag_ids)
+        self.deduplicator = deduplicator
+        self.session = session or ScanSession(db)
+        self.merge_versions = settings.deduplicator.enable
+
+    async def commit(self) -> None:
+        """提交当前批次"""
+        await self.session.commit()
+
+    async def rollback(self) -> None:
+        """回滚当前批次（同时丢弃本批次新建的作者/标签映射）"""
+        await self.session.rollback()
+
+    async def write(self, items: List[dict]) -> List[Tuple[dict, str, Optional[str]]]:
+        """
+        写入一批解析结果（只 flush，由调用方通过 commit / rollback 结束）
+
+        Args:
+            items: process_file 返回的成功结果（压缩包成员可带 source 字段）
+
+        Returns:
+            [(结果, 动作, 原因)]，动作为 SKIP / ADD_VERSION / NEW_BOOK
+        """
+        db = self.db
+        outcomes: List[Tuple[dict, str, Optional[str]]] = []
+
+        # 1. 内容去重（库内已有 + 批次内重复）：大小 -> 采样Hash -> 碰撞时才计算完整Hash
+        #    file_hash 有唯一约束，关闭去重时也必须跳过完全相同的文件
+        duplicates = await self.deduplicator.find_content_duplicates(
+            [(Path(item["path"]), item["fingerprint"]) for item in items]
+        )
+        accepted = []
+        for item, duplicate in zip(items, duplicates):
+            if duplicate:
+                outcomes.append((item, SKIP, "文件内容完全相同"))
+            else:
+                accepted.append(item)
+        if not accepted:
+            return outcomes
+
+        # 2. 书名+作者相同的已有书籍（作为新版本）
+        existing_books: Dict[Tuple[str, str], int] = {}
+        keys = {self._book_key(item) for item in accepted} - {None}
+        if keys:
+            rows = await db.execute(
+                select(Book.id, Book.title, Author.name)
+                .join(Author, Book.author_id == Author.id)
+                .where(Book.title.in_({title for title, _ in keys}))
+                .where(Author.name.in_({author for _, author in keys}))
+                .order_by(Book.id)
+            )
+            for book_id, title, author in rows:
+                if (title, author) in keys:
+                    existing_books.setdefault((title, author), book_id)
+
+        # 3. 规划：已有书籍的新版本 / 批次内新书 / 批次内同书的其他版本
+        new_books: Dict[object, dict] = {}
+        plan = []
+        for item in accepted:
+            key = self._book_key(item)
+            if key is not None and key in existing_books:
+                plan.append((item, existing_books[key], None))
+                outcomes.append((item, ADD_VERSION, "同一本书的新版本"))
+            elif key is not None and key in new_books:
+                plan.append((item, None, key))
+                outcomes.append((item, ADD_VERSION, "同一本书的新版本"))
+            else:
+                key = key if key is not None else object()
+                new_books[key] = item
+                plan.append((item, None, key))
+                outcomes.append((item, NEW_BOOK, None))
+
+        # 4. 作者、标签（名称 -> ID，缺失的批量插入）
+        author_ids = await self.session.resolve_authors(
+            item["metadata"]["author"] for item in new_books.values() if item["metadata"].get("author")
+        )
+        tag_ids = await self.session.resolve_tags(
+            name for item in new_books.values() for name in item["metadata"]["auto_tags"]
+        )
+
+        # 5. 书籍
+        books: Dict[object, Book] = {}
+        for key, item in new_books.items():
+            metadata = item["metadata"]
+            book = Book(
+                library_id=self.library_id,
+                title=metadata["title"],
+                author_id=author_ids.get(metadata.get("author")) if metadata.get("author") else None,
+                cover_path=metadata.get("cover"),
+                description=metadata.get("description"),
+                publisher=metadata.get("publisher"),
+            )
+            books[key] = book
+            db.add(book)
+
+        # 6. 版本：每本书第一个版本为主版本（已有主版本的书籍除外）
+        existing_ids = {book_id for _, book_id, _ in plan if book_id is not None}
+        has_primary = set()
+        if existing_ids:
+            has_primary = set((await db.execute(
+                select(BookVersion.book_id)
+                .where(BookVersion.book_id.in_(existing_ids))
+                .where(BookVersion.is_primary == True)
+            )).scalars())
+
+        for item, book_id, key in plan:
+            owner = book_id if book_id is not None else key
+            file_path = Path(item["path"])
+            version = BookVersion(
+                file_path=str(file_path.absolute().as_posix()),
+                file_name=file_path.name,
+                file_format=item["file_format"],
+                file_mtime_ns=item["file_mtime_ns"],
+                file_inode=item["file_inode"],
+                quality=item["quality"],
+                is_primary=owner not in has_primary,
+                source=item.get("source"),
+                **item["fingerprint"].version_fields(),
+                **(item["encoding"].version_fields() if item.get("encoding") else {}),
+            )
+            has_primary.add(owner)
+            if book_id is not None:
+                version.book_id = book_id
+            else:
+                version.book = books[key]
+            db.add(version)
+
+        # 本次 flush 不逐本同步全文索引，标签关联写入后统一刷新
+        db.info[search_index.DEFER_SYNC_KEY] = True
+        try:
+            await db.flush()
+        finally:
+            db.info.pop(search_index.DEFER_SYNC_KEY, None)
+
+        # 7. 标签关联（executemany）
+        book_tag_rows = []
+        for key, book in books.items():
+            book_tag_ids = set(self.library_tag_ids)
+            book_tag_ids.update(tag_ids[name] for name in new_books[key]["metadata"]["auto_tags"])
+            book_tag_rows.extend({"book_id": book.id, "tag_id": tag_id} for tag_id in book_tag_ids)
+        if book_tag_rows:
+            await db.execute(insert(BookTag.__table__), book_tag_rows)
+
+        await search_index.reindex_books(db, [book.id for book in books.values()])
+        return outcomes
+
+    def _book_key(self, item: dict) -> Optional[Tuple[str, str]]:
+        """书名+作者（未开启去重或无作者时不合并版本）"""
+        metadata = item["metadata"]
+        if not self.merge_versions or not metadata.get("author"):
+            return None
+        return metadata["title"], metadata["author"]
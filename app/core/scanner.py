@@ -4,7 +4,8 @@
 """
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional
+import asyncio
 import uuid
 import gc
 import traceback
@@ -13,14 +14,27 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
-from app.core.deduplicator import Deduplicator
-from app.core.extractor import Extractor
+from app.core.deduplicator import Deduplicator, FileFingerprint
+from app.core.encoding_detector import detect_file_encoding
+from app.core.extractor import ArchiveMember, Extractor
+from app.core.cover_renditions import schedule_scan_pregenerate
+from app.core.library_stats import refresh_library_stats
+from app.core import scan_manifest
+from app.core.scan_manifest import ManifestEntry, ScanManifest
+from app.core.scan_pipeline import (
+    ADD_VERSION,
+    SKIP,
+    ScanBatchWriter,
+    ScanSession,
+    recompute_author_book_counts,
+)
 from app.core.metadata.epub_parser import EpubParser
 from app.core.metadata.mobi_parser import MobiParser
 from app.core.metadata.txt_parser import TxtParser
 from app.core.tag_keywords import get_tags_from_filename, get_tags_from_content
-from app.models import Author, Book, BookVersion, Library, LibraryTag, Tag
-from app.utils.file_hash import calculate_file_hash
+from app.database import yield_write_gate
+from app.models import Library, LibraryTag
+from app.utils.file_hash import quick_hash
 from app.utils.logger import log
 
 
@@ -39,6 +53,12 @@ class Scanner:
         
         self.supported_formats = settings.scanner.supported_formats
         self.recursive = settings.scanner.recursive
+        self.library_tag_ids: list = []
+        
+        # 批量写入：解析结果先暂存，每 batch_size 个文件写入并提交一次
+        self.batch_size = max(1, settings.scanner.batch_size)
+        self.writer: Optional[ScanBatchWriter] = None
+        self._pending: List[dict] = []
     
     async def scan_library(self, library_id: int) -> dict:
         """
@@ -50,6 +70,8 @@ class Scanner:
         Returns:
             扫描统计信息
         """
+        scan_started = datetime.utcnow()
+        
         # 获取书库信息
         result = await self.db.execute(
             select(Library).where(Library.id == library_id)
@@ -70,17 +92,32 @@ class Scanner:
         
         # 加载书库默认标签
         library_tag_ids = await self._get_library_tags(library_id)
+        self.library_tag_ids = library_tag_ids
         if library_tag_ids:
             log.info(f"书库默认标签: {len(library_tag_ids)} 个")
         
+        # 作者/标签名称 -> ID 映射，整个扫描期间复用
+        scan_session = ScanSession(self.db)
+        await scan_session.load()
+        self.writer = ScanBatchWriter(self.db, library_id, library_tag_ids, self.deduplicator, scan_session)
+        self._pending = []
+        
         stats = {
             "scanned": 0,
             "added": 0,
             "skipped": 0,
+            "unchanged": 0,  # 清单比对未变化，直接跳过
+            "updated": 0,  # 内容变化或移动，原地更新
+            "missing": 0,  # 已从磁盘消失
+            "removed": 0,  # 清理消失文件时删除的书籍数
             "errors": 0,
             "error_details": [],  # 存储详细错误信息
+            "missing_files": [],
         }
         
+        # 加载扫描清单（增量扫描：未变化的文件只需 stat）
+        manifest = await ScanManifest.load(self.db, library_id, [library_path])
+        
         # 扫描所有文件（生成器，避免一次性加载到内存）
         files = self._discover_files_generator(library_path)
         log.info("开始遍历书库文件（生成器模式）")
@@ -91,16 +128,31 @@ class Scanner:
         for file_path in files:
             try:
                 stats["scanned"] += 1
+                # 有 Web 写入排队时先提交，不长时间占用写闸门
+                await yield_write_gate(self.db)
                 
                 # 检查是否为压缩包
                 if self._is_archive(file_path):
-                    await self._process_archive(file_path, library_id, stats)
+                    await self._process_archive(file_path, library_id, stats, manifest)
                 else:
-                    await self._process_ebook(file_path, library_id, stats)
+                    state = await scan_manifest.sync_known_file(
+                        self.db,
+                        manifest,
+                        file_path,
+                        self.deduplicator,
+                        self._determine_quality
+                    )
+                    if state is None:
+                        await self._process_ebook(file_path, library_id, stats)
+                        if len(self._pending) >= self.batch_size:
+                            await self._flush_pending(stats)
+                    else:
+                        self._count_manifest_state(state, stats)
                 
                 processed_count += 1
                 # 每处理 50 个文件主动进行一次垃圾回收，防止内存持续增长
                 if processed_count % 50 == 0:
+                    await self.db.commit()
                     gc.collect()
                     
             except Exception as e:
@@ -114,19 +166,50 @@ class Scanner:
                     "traceback": traceback.format_exc()
                 })
         
+        # 写入剩余的解析结果
+        await self._flush_pending(stats)
+        
         # 扫描结束后进行一次彻底的垃圾回收
         gc.collect()
         
+        # 处理已从磁盘消失的文件
+        missing = manifest.missing()
+        if missing:
+            stats["missing"] = len(missing)
+            stats["missing_files"] = [entry.display_path for entry in missing[:100]]
+            log.warning(f"发现 {len(missing)} 个已消失的文件")
+            if settings.scanner.prune_missing:
+                stats["removed"] = await scan_manifest.remove_versions(self.db, missing)
+                log.info(f"已清理消失的文件记录: {len(missing)} 个版本, {stats['removed']} 本书")
+        
         # 更新文件名规则统计信息
         await self.txt_parser.update_pattern_stats()
         
+        # 重新统计作者书籍数（一条 UPDATE）
+        await recompute_author_book_counts(self.db)
+        
+        # 刷新书库统计（首页使用）
+        await refresh_library_stats(self.db, [library_id])
+        
         # 更新书库最后扫描时间
         library.last_scan = datetime.utcnow()
         await self.db.commit()
         
+        # 后台为新书预生成多尺寸封面
+        await schedule_scan_pregenerate(self.db, library_id, scan_started)
+        
         log.info(f"扫描完成: {stats}")
         return stats
     
+    def _count_manifest_state(self, state: str, stats: dict):
+        """按清单比对结果累计统计"""
+        if state in (scan_manifest.UNCHANGED, scan_manifest.BACKFILL):
+            stats["unchanged"] += 1
+        elif state == scan_manifest.DUPLICATE:
+            stats["skipped"] += 1
+        else:
+            stats["updated"] += 1
+    
     def _discover_files(self, directory: Path) -> List[Path]:
         """
         发现目录中的所有支持的文件
@@ -168,7 +251,13 @@ class Scanner:
         archive_formats = ['.zip', '.rar', '.7z', '.iso', '.tar.gz', '.tar.bz2']
         return any(str(file_path).lower().endswith(fmt) for fmt in archive_formats)
     
-    async def _process_archive(self, archive_path: Path, library_id: int, stats: dict):
+    async def _process_archive(
+        self,
+        archive_path: Path,
+        library_id: int,
+        stats: dict,
+        manifest: Optional[ScanManifest] = None
+    ):
         """
         处理压缩包文件
         
@@ -176,29 +265,77 @@ class Scanner:
             archive_path: 压缩包路径
             library_id: 书库ID
             stats: 统计信息字典
+            manifest: 扫描清单（压缩包未变化时整体跳过）
         """
+        if manifest is not None:
+            if manifest.classify_archive(archive_path, archive_path.stat()) == scan_manifest.UNCHANGED:
+                stats["unchanged"] += 1
+                return
+        
         log.info(f"处理压缩包: {archive_path}")
         
-        # 创建临时目录
-        temp_dir = Path(settings.directories.temp) / str(uuid.uuid4())
+        # 压缩包已变化：完整 Hash 与已有版本相同的成员内容未变，直接跳过
+        known: Dict[str, List[ManifestEntry]] = {}
+        if manifest is not None:
+            for entry in manifest.archive_entries(archive_path):
+                if entry.file_hash:
+                    known.setdefault(entry.file_hash, []).append(entry)
+        kept_version_ids = set()
+        
+        # 临时目录：逐个成员流式写入，同一时刻只保留一个成员
+        spill_dir = Path(settings.directories.temp) / str(uuid.uuid4())
+        # 超过大小上限、读取失败或处理失败的成员；非空时不能确定旧版本已从包内移除
+        skipped: List[str] = []
+        members = self.extractor.iter_ebook_members(archive_path, spill_dir, skipped=skipped)
         
         try:
-            # 解压
-            ebook_files = self.extractor.extract(archive_path, temp_dir)
-            
-            # 处理解压后的每个电子书
-            for ebook_file in ebook_files:
+            # 读取和写入临时文件在线程中进行，不阻塞事件循环
+            while (member := await asyncio.to_thread(next, members, None)) is not None:
+                if member.file_hash in known:
+                    kept_version_ids.update(entry.version_id for entry in known[member.file_hash])
+                    stats["unchanged"] += 1
+                    continue
                 try:
-                    await self._process_ebook(ebook_file, library_id, stats)
+                    await self._process_ebook(member.path, library_id, stats, archive_path, member)
                 except Exception as e:
-                    log.error(f"处理解压文件失败: {ebook_file}, 错误: {e}")
+                    log.error(f"处理压缩包内文件失败: {archive_path}!/{member.name}, 错误: {e}")
                     stats["errors"] += 1
+                    skipped.append(member.name)
+            
+            # 临时目录删除前写入本压缩包的解析结果
+            await self._flush_pending(stats)
+            
+            # 完整读完压缩包后，未对应到任何成员的旧版本已从包内移除（或内容已被替换）；
+            # 有成员被跳过或失败时无法区分，保留旧版本
+            removed = [
+                entry for entries in known.values() for entry in entries
+                if entry.version_id not in kept_version_ids
+            ]
+            if removed and skipped:
+                log.warning(
+                    f"压缩包未完整读取（{len(skipped)} 个成员跳过或失败），"
+                    f"暂不删除 {len(removed)} 个旧版本: {archive_path}"
+                )
+            elif removed:
+                stats["removed"] += await scan_manifest.remove_versions(self.db, removed)
+                log.info(f"压缩包内已移除的成员: {archive_path}, 删除 {len(removed)} 个版本")
+            
+            # 记录压缩包当前的 mtime/inode，下次扫描未变化时跳过
+            await scan_manifest.touch_archive_versions(self.db, archive_path)
         
         finally:
+            members.close()
             # 清理临时目录
-            self.extractor.cleanup(temp_dir)
+            self.extractor.cleanup(spill_dir)
     
-    async def _process_ebook(self, file_path: Path, library_id: int, stats: dict):
+    async def _process_ebook(
+        self,
+        file_path: Path,
+        library_id: int,
+        stats: dict,
+        archive_path: Optional[Path] = None,
+        member: Optional[ArchiveMember] = None
+    ):
         """
         处理电子书文件（支持版本管理）
         
@@ -206,6 +343,8 @@ class Scanner:
             file_path: 电子书路径
             library_id: 书库ID
             stats: 统计信息字典
+            archive_path: 来自压缩包时为压缩包路径
+            member: 来自压缩包时为包内成员（已在读取时计算完整Hash）
         """
         # 提取元数据
         metadata = self._extract_metadata(file_path)
@@ -217,6 +356,7 @@ class Scanner:
         
         # TXT 文件：一次性读取内容用于简介和标签提取（内存优化）
         txt_content = None
+        encoding = None
         if file_path.suffix.lower() == '.txt':
             try:
                 # 检查文件大小，如果过大（>50MB），记录警告但仍处理（只读前部）
@@ -224,7 +364,11 @@ class Scanner:
                 if file_size > 50 * 1024 * 1024:
                     log.warning(f"TXT文件较大 ({file_size / 1024 / 1024:.2f} MB): {file_path.name}")
 
-                txt_content = self.txt_parser.read_preview(file_path, max_chars=5000)
+                # 编码只检测一次，随版本保存供阅读器和 Bot 使用
+                encoding = detect_file_encoding(file_path)
+                txt_content = self.txt_parser.read_preview(
+                    file_path, max_chars=5000, encoding=encoding.encoding if encoding else None
+                )
             except Exception as e:
                 log.error(f"读取TXT内容失败: {file_path}, 错误: {e}")
         
@@ -252,35 +396,82 @@ class Scanner:
                 except Exception as e:
                     log.error(f"从内容提取标签失败: {e}")
             
-            auto_tags = list(set(auto_tags))  # 去重
             if auto_tags:
-                metadata['auto_tags'] = auto_tags
                 log.debug(f"自动提取标签: {auto_tags}")
         except Exception as e:
             log.error(f"提取标签失败: {file_path}, 错误: {e}")
+        metadata['auto_tags'] = sorted(set(auto_tags))  # 去重
         
         # 释放内容引用，帮助 GC
         txt_content = None
         
-        # 去重检测（支持版本管理）
-        action, book_id, reason = await self.deduplicator.check_duplicate(
-            file_path,
-            metadata["title"],
-            metadata.get("author")
-        )
+        # 指纹中算出的Hash直接用于保存，不再重复读取文件
+        # 压缩包成员的临时文件之后会被删除，使用读取时已计算的完整Hash
+        if member is not None:
+            fingerprint = FileFingerprint(member.file_size, quick_hash(file_path), member.file_hash)
+        else:
+            fingerprint = self.deduplicator.fingerprint(file_path)
+        
+        # 暂存，由 _flush_pending 批量去重并写入
+        manifest_fields = scan_manifest.version_manifest_fields(file_path, archive_path)
+        self._pending.append({
+            "path": str(file_path),
+            "metadata": metadata,
+            "file_format": file_path.suffix.lower(),
+            "file_mtime_ns": manifest_fields["file_mtime_ns"],
+            "file_inode": manifest_fields["file_inode"],
+            "source": manifest_fields.get("source"),
+            "fingerprint": fingerprint,
+            "encoding": encoding,
+            "quality": self._determine_quality(file_path),
+        })
+    
+    async def _flush_pending(self, stats: dict):
+        """
+        批量写入暂存的解析结果（一次 flush、一次提交）
+        整批失败时回滚并逐个重试，只跳过出错的文件
         
-        if action == 'skip':
-            log.info(f"跳过重复文件: {file_path} ({reason})")
-            stats["skipped"] += 1
+        Args:
+            stats: 统计信息字典
+        """
+        items, self._pending = self._pending, []
+        if not items:
             return
-        elif action == 'add_version':
-            log.info(f"添加新版本: {file_path} ({reason})")
-            await self._save_book_version(file_path, book_id, metadata)
-            stats["added"] += 1
-        else:  # new_book
-            log.info(f"添加新书籍: {metadata['title']} by {metadata.get('author', 'Unknown')}")
-            await self._save_book(file_path, library_id, metadata, library_tag_ids)
-            stats["added"] += 1
+        
+        try:
+            outcomes = await self.writer.write(items)
+            await self.writer.commit()
+        except Exception as e:
+            await self.writer.rollback()
+            log.warning(f"批量写入失败，逐个重试: {e}")
+            outcomes = []
+            for item in items:
+                try:
+                    outcomes.extend(await self.writer.write([item]))
+                    await self.writer.commit()
+                except Exception as item_error:
+                    await self.writer.rollback()
+                    error_msg = f"{type(item_error).__name__}: {str(item_error)}"
+                    log.error(f"处理文件失败: {item['path']}, 错误: {error_msg}")
+                    stats["errors"] += 1
+                    stats["error_details"].append({
+                        "file": Path(item["path"]).name,
+                        "path": item["path"],
+                        "error": error_msg,
+                        "traceback": traceback.format_exc()
+                    })
+        
+        for item, action, reason in outcomes:
+            if action == SKIP:
+                log.info(f"跳过重复文件: {item['path']} ({reason})")
+                stats["skipped"] += 1
+            elif action == ADD_VERSION:
+                log.info(f"添加新版本: {item['path']} ({reason})")
+                stats["added"] += 1
+            else:
+                metadata = item["metadata"]
+                log.info(f"添加新书籍: {metadata['title']} by {metadata.get('author', 'Unknown')}")
+                stats["added"] += 1
     
     def _extract_metadata(self, file_path: Path) -> Optional[dict]:
         """
@@ -323,106 +514,6 @@ class Scanner:
         )
         return [row[0] for row in result.fetchall()]
     
-    async def _save_book(self, file_path: Path, library_id: int, metadata: dict, library_tag_ids: list = None):
-        """
-        保存新书籍到数据库（包含主版本）
-        
-        Args:
-            file_path: 文件路径
-            library_id: 书库ID
-            metadata: 元数据
-        """
-        # 获取或创建作者
-        author_id = None
-        if metadata.get("author"):
-            author_id = await self._get_or_create_author(metadata["author"])
-        
-        # 创建书籍主记录
-        book = Book(
-            library_id=library_id,
-            title=metadata["title"],
-            author_id=author_id,
-            cover_path=metadata.get("cover"),
-            description=metadata.get("description"),
-            publisher=metadata.get("publisher"),
-        )
-        
-        self.db.add(book)
-        await self.db.flush()  # 获取book.id但不提交
-        
-        # 自动添加标签
-        if metadata.get('auto_tags'):
-            for tag_name in metadata['auto_tags']:
-                tag = await self._get_or_create_tag(tag_name)
-                if tag not in book.tags:
-                    book.tags.append(tag)
-            log.debug(f"为书籍添加标签: {metadata['auto_tags']}")
-        
-        # 添加书库默认标签
-        if library_tag_ids:
-            for tag_id in library_tag_ids:
-                tag_result = await self.db.execute(
-                    select(Tag).where(Tag.id == tag_id)
-                )
-                tag = tag_result.scalar_one_or_none()
-                if tag and tag not in book.tags:
-                    book.tags.append(tag)
-            log.debug(f"为书籍添加书库默认标签: {len(library_tag_ids)} 个")
-        
-        # 创建主版本 - 使用 as_posix() 确保路径格式一致
-        file_hash = calculate_file_hash(file_path, settings.deduplicator.hash_algorithm)
-        quality = self._determine_quality(file_path)
-        
-        version = BookVersion(
-            book_id=book.id,
-            file_path=str(file_path.absolute().as_posix()),
-            file_name=file_path.name,
-            file_format=file_path.suffix.lower(),
-            file_size=file_path.stat().st_size,
-            file_hash=file_hash,
-            quality=quality,
-            is_primary=True,  # 第一个版本默认为主版本
-        )
-        
-        self.db.add(version)
-        await self.db.commit()
-    
-    async def _save_book_version(self, file_path: Path, book_id: int, metadata: dict):
-        """
-        为现有书籍添加新版本
-        
-        Args:
-            file_path: 文件路径
-            book_id: 书籍ID
-            metadata: 元数据
-        """
-        # 计算文件Hash
-        file_hash = calculate_file_hash(file_path, settings.deduplicator.hash_algorithm)
-        quality = self._determine_quality(file_path)
-        
-        # 检查是否已有主版本，如果没有则设为主版本
-        result = await self.db.execute(
-            select(BookVersion)
-            .where(BookVersion.book_id == book_id)
-            .where(BookVersion.is_primary == True)
-        )
-        has_primary = result.scalar_one_or_none() is not None
-        
-        # 创建新版本 - 使用 as_posix() 确保路径格式一致
-        version = BookVersion(
-            book_id=book_id,
-            file_path=str(file_path.absolute().as_posix()),
-            file_name=file_path.name,
-            file_format=file_path.suffix.lower(),
-            file_size=file_path.stat().st_size,
-            file_hash=file_hash,
-            quality=quality,
-            is_primary=not has_primary,  # 如果没有主版本，设为主版本
-        )
-        
-        self.db.add(version)
-        await self.db.commit()
-    
     def _determine_quality(self, file_path: Path) -> str:
         """
         根据文件属性判断质量
@@ -457,59 +548,3 @@ class Scanner:
                 return 'low'
         
         return base_quality
-    
-    async def _get_or_create_author(self, author_name: str) -> int:
-        """
-        获取或创建作者
-        
-        Args:
-            author_name: 作者名
-            
-        Returns:
-            作者ID
-        """
-        # 查找作者
-        result = await self.db.execute(
-            select(Author).where(Author.name == author_name)
-        )
-        author = result.scalar_one_or_none()
-        
-        if author:
-            # 更新书籍数量
-            author.book_count += 1
-            await self.db.commit()
-            return author.id
-        
-        # 创建新作者
-        author = Author(name=author_name, book_count=1)
-        self.db.add(author)
-        await self.db.commit()
-        await self.db.refresh(author)
-        
-        return author.id
-    
-    async def _get_or_create_tag(self, tag_name: str) -> Tag:
-        """
-        获取或创建标签
-        
-        Args:
-            tag_name: 标签名
-            
-        Returns:
-            Tag对象
-        """
-        # 查找标签
-        result = await self.db.execute(
-            select(Tag).where(Tag.name == tag_name)
-        )
-        tag = result.scalar_one_or_none()
-        
-        if tag:
-            return tag
-        
-        # 创建新标签（自动扫描添加的标签类型为auto）
-        tag = Tag(name=tag_name, type="auto")
-        self.db.add(tag)
-        await self.db.flush()  # 获取ID但不提交
-        
-        return tag
@@ -1,8 +1,8 @@
 """
 定时任务调度器模块
-使用 APScheduler 实现自动备份等定时任务
+使用 APScheduler 实现自动备份、阅读统计汇总等定时任务
 """
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from typing import Optional, Dict, Any
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
@@ -10,6 +10,7 @@ from apscheduler.triggers.cron import CronTrigger
 
 from app.config import settings
 from app.core.backup import backup_manager
+from app.core import reading_stats
 from app.utils.logger import log
 
 
@@ -39,6 +40,8 @@ class BackupScheduler:
             )
         else:
             log.info("自动备份未启用")
+
+        self._add_reading_stats_job()
         
         self.scheduler.start()
         log.info("定时任务调度器已启动")
@@ -72,6 +75,28 @@ class BackupScheduler:
             log.error(f"添加备份任务失败: {e}")
             raise
     
+    def _add_reading_stats_job(self):
+        """添加阅读统计汇总任务（每天凌晨执行；启动一分钟后先执行一次，回填升级前的会话）"""
+        self.scheduler.add_job(
+            self._reading_stats_task,
+            trigger=CronTrigger(hour=4, minute=30, timezone="Asia/Shanghai"),
+            id="reading_stats_rollup",
+            name="阅读统计汇总任务",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+            misfire_grace_time=3600,
+            next_run_time=datetime.now(timezone.utc) + timedelta(minutes=1)
+        )
+
+    async def _reading_stats_task(self):
+        """汇总待汇总的阅读会话，并按保留期清理原始会话"""
+        try:
+            await reading_stats.run_maintenance()
+        except Exception as e:
+            # 不抛出异常，避免影响调度器继续运行
+            log.error(f"阅读统计汇总失败: {e}")
+    
     async def _auto_backup_task(self):
         """自动备份任务执行函数"""
         self.last_run = datetime.now()
@@ -0,0 +1,424 @@
+"""
+全文搜索索引模块
+基于 SQLite FTS5 为书名、作者、简介和标签建立全文索引
+
+中文没有空格分词，unicode61 分词器会把连续汉字当成一个词，
+因此写入索引前先在 Python 端切分：连续的 CJK 字符生成二元组（bigram），
+并在每段末尾补一个单字（unigram），这样任意长度的子串都能用短语查询命中，
+单字查询则用前缀匹配。查询串按同样规则切分，保证两边一致。
+
+索引通过 Session 的 after_flush 事件自动维护：ORM 层对书籍、作者、
+标签及书籍标签的增删改都会在同一事务内同步到索引表。
+"""
+import html
+import re
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import (
+    Integer,
+    Select,
+    column,
+    event,
+    false,
+    func,
+    inspect,
+    literal_column,
+    or_,
+    select,
+    table,
+    text,
+)
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app.database import engine
+from app.models import Author, Book, BookTag, Tag
+from app.utils.logger import log
+
+
+FTS_TABLE = "books_fts"
+
+# 索引列及 BM25 权重（顺序与建表语句一致）
+FTS_COLUMNS = ("title", "author", "description", "tags")
+BM25_WEIGHTS = (10.0, 5.0, 1.0, 3.0)
+
+# 单次批量重建的书籍数量
+REBUILD_BATCH_SIZE = 500
+
+# 会话 info 中带此键时 after_flush 不同步索引，由调用方随后调用 reindex_books
+DEFER_SYNC_KEY = "search_index_defer_sync"
+
+# 中日韩字符（汉字、假名、谚文）
+_CJK_RUN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]+")
+_WORD = re.compile(r"\w+")
+
+books_fts = table(
+    FTS_TABLE,
+    column("rowid", Integer),
+    *(column(name) for name in FTS_COLUMNS),
+)
+
+# 启动时检测 FTS5 是否可用（非 SQLite 或未编译 FTS5 时回退到 LIKE）
+_fts_available = False
+
+
+def is_available() -> bool:
+    """全文索引是否可用"""
+    return _fts_available
+
+
+# ===== 分词 =====
+
+def _split_segments(value: str) -> List[Tuple[bool, str]]:
+    """将文本切分为 (是否CJK, 片段) 列表"""
+    segments = []
+    pos = 0
+    for match in _CJK_RUN.finditer(value):
+        if match.start() > pos:
+            segments.append((False, value[pos:match.start()]))
+        segments.append((True, match.group()))
+        pos = match.end()
+    if pos < len(value):
+        segments.append((False, value[pos:]))
+    return segments
+
+
+def _cjk_tokens(run: str, trailing_unigram: bool) -> List[str]:
+    """CJK 连续片段 -> 二元组（可选末尾单字）"""
+    if len(run) == 1:
+        return [run]
+    tokens = [run[i:i + 2] for i in range(len(run) - 1)]
+    if trailing_unigram:
+        tokens.append(run[-1])
+    return tokens
+
+
+def tokenize_for_index(value: Optional[str]) -> str:
+    """
+    生成写入索引的文本
+
+    Args:
+        value: 原始文本
+
+    Returns:
+        以空格分隔的词元串
+    """
+    if not value:
+        return ""
+    tokens: List[str] = []
+    for is_cjk, segment in _split_segments(value.lower()):
+        if is_cjk:
+            tokens.extend(_cjk_tokens(segment, trailing_unigram=True))
+        else:
+            tokens.extend(_WORD.findall(segment))
+    return " ".join(tokens)
+
+
+def _term_tokens(term: str) -> List[str]:
+    """查询词 -> 词元序列（与索引切分规则对齐）"""
+    segments = _split_segments(term.lower())
+    tokens: List[str] = []
+    for index, (is_cjk, segment) in enumerate(segments):
+        if is_cjk:
+            # 词内后面还有片段时，索引中该段末尾的单字会夹在中间
+            has_following = index < len(segments) - 1
+            tokens.extend(_cjk_tokens(segment, trailing_unigram=has_following))
+        else:
+            tokens.extend(_WORD.findall(segment))
+    return tokens
+
+
+def build_match_expression(query: str, columns: Optional[Sequence[str]] = None) -> Optional[str]:
+    """
+    将用户输入转换为 FTS5 MATCH 表达式
+
+    每个空格分隔的词转换为一个前缀短语，多个词之间为 AND 关系。
+
+    Args:
+        query: 用户输入
+        columns: 限定搜索的列（默认全部列）
+
+    Returns:
+        MATCH 表达式；输入中没有可检索内容时返回 None
+    """
+    phrases = []
+    for term in query.split():
+        tokens = _term_tokens(term)
+        if tokens:
+            phrases.append(f'"{" ".join(tokens)}" *')
+    if not phrases:
+        return None
+    expression = " AND ".join(phrases)
+    if columns:
+        expression = "{" + " ".join(columns) + "} : (" + expression + ")"
+    return expression
+
+
+# ===== 查询 =====
+
+def match_subquery(query: str, columns: Optional[Sequence[str]] = None):
+    """
+    构建全文匹配子查询，返回 (book_id, rank) 列
+    rank 为 BM25 分数，越小越相关
+
+    Returns:
+        子查询；查询串无有效内容时返回 None
+    """
+    expression = build_match_expression(query, columns)
+    if expression is None:
+        return None
+    fts = literal_column(FTS_TABLE)
+    return (
+        select(
+            books_fts.c.rowid.label("book_id"),
+            func.bm25(fts, *BM25_WEIGHTS).label("rank"),
+        )
+        .where(fts.op("MATCH")(expression))
+        .subquery("search_hits")
+    )
+
+
+def apply_book_search(
+    query: Select,
+    keywords: str,
+    columns: Optional[Sequence[str]] = None,
+):
+    """
+    给 select(Book) 查询添加关键词条件
+
+    全文索引可用时关联匹配子查询并返回相关度列，调用方可据此排序；
+    不可用时回退为书名/作者 LIKE 查询，相关度列为 None。
+
+    Args:
+        query: 以 Book 为主体的查询
+        keywords: 搜索关键词
+        columns: 限定搜索的列（仅全文索引模式有效）
+
+    Returns:
+        (新查询, 相关度列或 None)
+    """
+    keywords = keywords.strip()
+    if not keywords:
+        return query, None
+
+    if not _fts_available:
+        search_term = f"%{keywords}%"
+        conditions = []
+        if not columns or "title" in columns:
+            conditions.append(Book.title.like(search_term))
+        if not columns or "author" in columns:
+            conditions.append(
+                Book.author_id.in_(select(Author.id).where(Author.name.like(search_term)))
+            )
+        return query.where(or_(*conditions)), None
+
+    hits = match_subquery(keywords, columns)
+    if hits is None:
+        return query.where(false()), None
+    return query.join(hits, hits.c.book_id == Book.id), hits.c.rank
+
+
+def highlight(value: Optional[str], keywords: str, max_length: Optional[int] = None) -> Optional[str]:
+    """
+    生成高亮片段（HTML 转义后用 <mark> 包裹命中词）
+
+    Args:
+        value: 原始文本
+        keywords: 搜索关键词
+        max_length: 片段最大长度，超出时以首个命中位置为中心截取
+
+    Returns:
+        高亮后的 HTML 片段
+    """
+    if not value:
+        return value
+    terms = [term for term in keywords.split() if term]
+    if not terms:
+        return html.escape(value[:max_length] if max_length else value)
+    pattern = re.compile("|".join(re.escape(term) for term in terms), re.IGNORECASE)
+
+    snippet = value
+    prefix = suffix = ""
+    if max_length and len(value) > max_length:
+        match = pattern.search(value)
+        center = match.start() if match else 0
+        start = max(0, min(center - max_length // 3, len(value) - max_length))
+        snippet = value[start:start + max_length]
+        prefix = "…" if start > 0 else ""
+        suffix = "…" if start + max_length < len(value) else ""
+
+    parts = []
+    pos = 0
+    for match in pattern.finditer(snippet):
+        parts.append(html.escape(snippet[pos:match.start()]))
+        parts.append(f"<mark>{html.escape(match.group())}</mark>")
+        pos = match.end()
+    parts.append(html.escape(snippet[pos:]))
+    return prefix + "".join(parts) + suffix
+
+
+# ===== 索引维护 =====
+
+def _reindex_books_sync(connection: Connection, book_ids: Iterable[int]) -> None:
+    """重建指定书籍的索引行（同步，运行在当前事务连接上）"""
+    book_ids = list(set(book_ids))
+    if not book_ids:
+        return
+
+    for start in range(0, len(book_ids), REBUILD_BATCH_SIZE):
+        batch = book_ids[start:start + REBUILD_BATCH_SIZE]
+        tag_names = (
+            select(func.group_concat(Tag.name, " "))
+            .join(BookTag, BookTag.tag_id == Tag.id)
+            .where(BookTag.book_id == Book.id)
+            .correlate(Book)
+            .scalar_subquery()
+        )
+        rows = connection.execute(
+            select(Book.id, Book.title, Author.name, Book.description, tag_names)
+            .outerjoin(Author, Book.author_id == Author.id)
+            .where(Book.id.in_(batch))
+        ).all()
+
+        connection.execute(
+            text(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({','.join(str(int(i)) for i in batch)})")
+        )
+        if rows:
+            connection.execute(
+                text(
+                    f"INSERT INTO {FTS_TABLE} (rowid, title, author, description, tags) "
+                    "VALUES (:id, :title, :author, :description, :tags)"
+                ),
+                [
+                    {
+                        "id": row[0],
+                        "title": tokenize_for_index(row[1]),
+                        "author": tokenize_for_index(row[2]),
+                        "description": tokenize_for_index(row[3]),
+                        "tags": tokenize_for_index(row[4]),
+                    }
+                    for row in rows
+                ],
+            )
+
+
+def _attr_changed(obj, *names: str) -> bool:
+    state = inspect(obj)
+    return any(state.attrs[name].history.has_changes() for name in names)
+
+
+@event.listens_for(Session, "after_flush")
+def _sync_search_index(session: Session, flush_context) -> None:
+    """ORM 刷新后同步受影响书籍的索引"""
+    if not _fts_available or session.info.get(DEFER_SYNC_KEY):
+        return
+
+    book_ids = set()
+    author_ids = set()
+    tag_ids = set()
+
+    for obj in session.new:
+        if isinstance(obj, Book):
+            book_ids.add(obj.id)
+        elif isinstance(obj, BookTag):
+            book_ids.add(obj.book_id)
+
+    for obj in session.dirty:
+        if isinstance(obj, Book) and _attr_changed(obj, "title", "author_id", "description"):
+            book_ids.add(obj.id)
+        elif isinstance(obj, Author) and _attr_changed(obj, "name"):
+            author_ids.add(obj.id)
+        elif isinstance(obj, Tag) and _attr_changed(obj, "name"):
+            tag_ids.add(obj.id)
+        elif isinstance(obj, BookTag) and _attr_changed(obj, "book_id", "tag_id"):
+            book_ids.add(obj.book_id)
+
+    for obj in session.deleted:
+        if isinstance(obj, (Book, BookTag)):
+            book_ids.add(obj.id if isinstance(obj, Book) else obj.book_id)
+
+    if not (book_ids or author_ids or tag_ids):
+        return
+
+    connection = session.connection()
+    if author_ids:
+        book_ids.update(connection.execute(
+            select(Book.id).where(Book.author_id.in_(author_ids))
+        ).scalars())
+    if tag_ids:
+        book_ids.update(connection.execute(
+            select(BookTag.book_id).where(BookTag.tag_id.in_(tag_ids))
+        ).scalars())
+
+    try:
+        _reindex_books_sync(connection, (book_id for book_id in book_ids if book_id is not None))
+    except Exception as e:
+        log.warning(f"更新搜索索引失败: {e}")
+
+
+async def reindex_books(db, book_ids: Iterable[int]) -> None:
+    """
+    手动刷新指定书籍的索引
+    用于绕过 ORM 的批量语句（如 Core delete）之后
+
+    Args:
+        db: 数据库会话
+        book_ids: 书籍 ID 列表
+    """
+    if not _fts_available:
+        return
+    book_ids = list(book_ids)
+    await db.run_sync(lambda session: _reindex_books_sync(session.connection(), book_ids))
+
+
+def _rebuild_sync(connection: Connection) -> int:
+    """全量重建索引"""
+    connection.execute(text(f"DELETE FROM {FTS_TABLE}"))
+    book_ids = list(connection.execute(select(Book.id)).scalars())
+    _reindex_books_sync(connection, book_ids)
+    return len(book_ids)
+
+
+async def rebuild_search_index() -> int:
+    """
+    全量重建全文索引
+
+    Returns:
+        已索引的书籍数量
+    """
+    if not _fts_available:
+        return 0
+    async with engine.begin() as conn:
+        count = await conn.run_sync(_rebuild_sync)
+    log.info(f"搜索索引重建完成: {count} 本书籍")
+    return count
+
+
+def _init_sync(connection: Connection) -> bool:
+    """创建 FTS5 表，首次创建或条目数与书籍数不一致时重建"""
+    if connection.dialect.name != "sqlite":
+        return False
+    try:
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            f"{', '.join(FTS_COLUMNS)}, tokenize='unicode61 remove_diacritics 2')"
+        ))
+    except Exception as e:
+        log.warning(f"SQLite 不支持 FTS5，搜索将回退为 LIKE 查询: {e}")
+        return False
+
+    indexed = connection.execute(text(f"SELECT COUNT(*) FROM {FTS_TABLE}")).scalar() or 0
+    total = connection.execute(select(func.count(Book.id))).scalar() or 0
+    if indexed != total:
+        log.info(f"搜索索引与书籍数量不一致（{indexed}/{total}），开始重建")
+        _rebuild_sync(connection)
+    return True
+
+
+async def init_search_index() -> None:
+    """初始化全文索引（应用启动时调用）"""
+    global _fts_available
+    async with engine.begin() as conn:
+        _fts_available = await conn.run_sync(_init_sync)
+    if _fts_available:
+        log.info("全文搜索索引已就绪")
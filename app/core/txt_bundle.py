@@ -0,0 +1,120 @@
+"""
+TXT 离线整书包
+把目录和全部（或指定范围的）章节按 NDJSON 或 zip 流式输出，供移动端一次性离线缓存
+
+- 内容逐章取自缓存文本的内存映射，边生成边发送，内存占用与全书大小无关
+- 清单（manifest）含全书内容哈希和每章正文的 CRC32，客户端据此断点续传和增量同步：
+  全书哈希不变时无需重新下载；变化时只拉取 CRC32 不同的章节
+- 章节正文与原始章节接口一致（去掉开头标题和首尾空白，见 txt_chapter_blobs.chapter_body_span）
+"""
+import json
+import zipfile
+import zlib
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+from app.core.txt_cache_index import TxtCacheIndex
+from app.core.txt_chapter_blobs import chapter_body_span
+
+
+BUNDLE_VERSION = 1
+
+
+def build_manifest(index: TxtCacheIndex, text_path: Path, start: int, end: int) -> Dict:
+    """
+    整书包清单（同步，需在线程中调用：会计算全书各章的 CRC32）
+
+    Args:
+        index: 缓存索引
+        text_path: 缓存文本路径
+        start: 输出的首章序号
+        end: 输出的末章序号（含）
+
+    Returns:
+        清单字典；hash 由缓存键和章节表摘要组成，内容或分章变化时随之改变
+    """
+    text = index.text_map(text_path)
+    chapters: List[Dict] = []
+    for i in range(len(index)):
+        if text is not None:
+            body_start, body_end = chapter_body_span(text, index, i)
+            crc = zlib.crc32(text[body_start:body_end])
+        else:
+            crc = 0
+        chapters.append({
+            "index": i,
+            "title": index.title(i),
+            "startOffset": index.start_offsets[i],
+            "endOffset": index.end_offsets[i],
+            "crc32": f"{crc:08x}",
+        })
+    return {
+        "type": "manifest",
+        "version": BUNDLE_VERSION,
+        "format": "txt",
+        "hash": f"{text_path.name.split('.', 1)[0]}-{index.digest:08x}",
+        "totalLength": index.total_length,
+        "totalChapters": len(index),
+        "range": {"start": start, "end": end},
+        "chapters": chapters,
+    }
+
+
+def _chapter_text(index: TxtCacheIndex, text_path: Path, chapter_index: int) -> bytes:
+    text = index.text_map(text_path)
+    if text is None:
+        return b""
+    body_start, body_end = chapter_body_span(text, index, chapter_index)
+    return text[body_start:body_end]
+
+
+def iter_ndjson(manifest: Dict, index: TxtCacheIndex, text_path: Path) -> Iterator[bytes]:
+    """
+    NDJSON：第一行为清单，之后每行一章 {"type": "chapter", "index", "title", "crc32", "content"}
+    """
+    yield json.dumps(manifest, ensure_ascii=False).encode("utf-8") + b"\n"
+    chapters = manifest["chapters"]
+    for i in range(manifest["range"]["start"], manifest["range"]["end"] + 1):
+        line = {
+            "type": "chapter",
+            "index": i,
+            "title": chapters[i]["title"],
+            "crc32": chapters[i]["crc32"],
+            "content": _chapter_text(index, text_path, i).decode("utf-8", errors="replace"),
+        }
+        yield json.dumps(line, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+class _ChunkSink:
+    """zipfile 的只写输出：写入的数据攒在内存中，由生成器逐章取走"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip(manifest: Dict, index: TxtCacheIndex, text_path: Path) -> Iterator[bytes]:
+    """
+    zip 流：manifest.json，以及 chapters/{序号:05d}.txt（UTF-8 正文）
+
+    输出不可回写，zipfile 使用数据描述符记录大小和 CRC，每写完一章即发送。
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False))
+        yield sink.drain()
+        for i in range(manifest["range"]["start"], manifest["range"]["end"] + 1):
+            archive.writestr(f"chapters/{i:05d}.txt", _chapter_text(index, text_path, i))
+            yield sink.drain()
+    yield sink.drain()
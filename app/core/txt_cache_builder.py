@@ -0,0 +1,139 @@
+"""
+TXT 阅读缓存构建服务
+在有并发上限的线程池中构建缓存，避免阻塞事件循环
+
+同一缓存键的并发请求合并为同一个构建任务（single-flight），
+构建过程中的进度可供前端和管理后台查询。
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from app.config import settings
+from app.utils.logger import log
+
+
+class TxtCacheBuilder:
+    """带并发上限和请求合并的缓存构建器"""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max(1, max_workers)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # 缓存键 -> 正在进行的构建任务
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # 缓存键 -> 进度信息
+        self._progress: Dict[str, Dict[str, Any]] = {}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="txt-cache"
+            )
+        return self._executor
+
+    async def build(
+        self,
+        key: str,
+        func: Callable[..., Any],
+        *args: Any,
+        label: str = ""
+    ) -> Any:
+        """
+        在线程池中执行构建函数，同一 key 的并发调用共享同一结果
+
+        构建函数需接受关键字参数 progress(done, total)，用于上报进度。
+
+        Args:
+            key: 缓存键
+            func: 同步构建函数
+            *args: 构建函数参数
+            label: 进度展示名称（通常为文件名）
+
+        Returns:
+            构建函数的返回值（异常会传递给所有等待者）
+        """
+        future = self._inflight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            self._progress[key] = {
+                "key": key,
+                "label": label,
+                "state": "queued",
+                "done": 0,
+                "total": 0,
+                "queued_at": time.time(),
+                "started_at": None,
+            }
+            future = loop.run_in_executor(
+                self._get_executor(),
+                self._run,
+                key,
+                func,
+                args
+            )
+            self._inflight[key] = future
+            future.add_done_callback(lambda _f: self._finish(key))
+        # shield：单个请求被取消时不影响其他等待者和构建本身
+        return await asyncio.shield(future)
+
+    def _run(self, key: str, func: Callable[..., Any], args: tuple) -> Any:
+        info = self._progress.get(key)
+        if info is not None:
+            info["state"] = "building"
+            info["started_at"] = time.time()
+
+        def progress(done: int, total: int) -> None:
+            if info is not None:
+                info["done"] = done
+                info["total"] = total
+
+        started = time.monotonic()
+        try:
+            return func(*args, progress=progress)
+        finally:
+            log.debug(f"TXT缓存构建结束: {info.get('label') if info else key}, 耗时 {time.monotonic() - started:.2f}s")
+
+    def _finish(self, key: str) -> None:
+        self._inflight.pop(key, None)
+        self._progress.pop(key, None)
+
+    def get_progress(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        获取某个缓存键的构建进度
+
+        Returns:
+            进度信息，未在构建中返回 None
+        """
+        info = self._progress.get(key)
+        return _format_progress(info) if info else None
+
+    def get_status(self) -> Dict[str, Any]:
+        """获取构建服务整体状态"""
+        jobs: List[Dict[str, Any]] = [_format_progress(info) for info in list(self._progress.values())]
+        return {
+            "max_workers": self.max_workers,
+            "building": sum(1 for job in jobs if job["state"] == "building"),
+            "queued": sum(1 for job in jobs if job["state"] == "queued"),
+            "jobs": jobs,
+        }
+
+    def shutdown(self) -> None:
+        """关闭线程池（不等待排队任务）"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def _format_progress(info: Dict[str, Any]) -> Dict[str, Any]:
+    total = info.get("total") or 0
+    done = info.get("done") or 0
+    return {
+        **info,
+        "percent": round(done * 100 / total, 1) if total else 0.0,
+    }
+
+
+# 全局构建服务实例
+txt_cache_builder = TxtCacheBuilder(settings.reader.cache_build_workers)
@@ -0,0 +1,395 @@
+"""
+TXT 阅读缓存索引
+章节目录与编码信息的二进制格式，按需内存映射读取
+
+文件布局（{cache_key}.index.bin，整数均为小端）：
+- 头部：magic、版本、章节数、标题表字节数、全文字符/字节数、
+  源文件大小和 mtime_ns（缓存戳）、编码置信度、编码名、章节规则指纹
+- 章节数组：startOffset / endOffset / startByte / endByte，各 N 个 uint64
+- 标题偏移：N + 1 个 uint64，第 i 个标题为标题表 [off[i], off[i+1])
+- 字节检查点：缓存文本第 k * CHECKPOINT_CHARS 个字符的字节偏移，各 uint64
+- 标题表：UTF-8 字节串
+
+读取时只映射文件，数组通过 memoryview 直接访问，单个章节只触及自己的几十个字节；
+字符偏移先取所在检查点，再解码不超过一个间隔的文本即得到精确字节偏移。
+已打开的索引按源文件 (路径, mtime_ns, 大小) 缓存在进程内 LRU 中。
+"""
+import codecs
+import mmap
+import os
+import struct
+import threading
+import zlib
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from app.utils.logger import log
+
+
+INDEX_MAGIC = b"TXCI"
+INDEX_VERSION = 2
+
+# 字节检查点间隔（字符数）
+CHECKPOINT_CHARS = 4096
+
+# 进程内保留的已打开索引数
+LOADED_INDEX_CACHE_SIZE = 64
+
+# magic, 版本, 保留, 章节数, 标题表字节数, 全文字符数, 全文字节数,
+# 源文件大小, 源文件 mtime_ns, 编码置信度, 编码名, 章节规则指纹, 检查点间隔, 检查点数
+_HEADER = struct.Struct("<4sHHIIQQQQd32s16sII")
+
+_lock = threading.Lock()
+_loaded_indexes: "OrderedDict[tuple, TxtCacheIndex]" = OrderedDict()
+
+
+def _pack_str(value: Optional[str], size: int) -> bytes:
+    data = (value or "").encode("ascii", errors="ignore")[:size]
+    return data.ljust(size, b"\0")
+
+
+def _unpack_str(value: bytes) -> Optional[str]:
+    return value.rstrip(b"\0").decode("ascii", errors="ignore") or None
+
+
+class CheckpointRecorder:
+    """构建缓存时按写入顺序记录字节检查点"""
+
+    def __init__(self, interval: int = CHECKPOINT_CHARS):
+        self.interval = interval
+        self.points = array("Q", [0])
+        self._chars = 0
+        self._bytes = 0
+
+    def feed(self, text: str, byte_length: int) -> None:
+        """
+        记录一段刚写入的文本
+
+        Args:
+            text: 文本
+            byte_length: 该文本的 UTF-8 字节数
+        """
+        end = self._chars + len(text)
+        mark = len(self.points) * self.interval
+        byte = self._bytes
+        pos = 0
+        while mark <= end:
+            rel = mark - self._chars
+            byte += len(text[pos:rel].encode("utf-8"))
+            pos = rel
+            self.points.append(byte)
+            mark += self.interval
+        self._chars = end
+        self._bytes += byte_length
+
+
+def scan_checkpoints(text_path: Path, interval: int = CHECKPOINT_CHARS) -> array:
+    """从已有的 UTF-8 缓存文本计算检查点（旧索引迁移时使用）"""
+    recorder = CheckpointRecorder(interval)
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    with open(text_path, "rb") as f:
+        while chunk := f.read(512 * 1024):
+            text = decoder.decode(chunk)
+            recorder.feed(text, len(text.encode("utf-8")))
+    return recorder.points
+
+
+def char_to_byte(f, checkpoints: Sequence[int], interval: int, char_offset: int) -> int:
+    """
+    字符偏移 -> 缓存文本中的精确字节偏移
+
+    Args:
+        f: 以二进制方式打开的缓存文本
+        checkpoints: 字节检查点
+        interval: 检查点间隔
+        char_offset: 字符偏移（不超过全文字符数）
+
+    Returns:
+        字节偏移
+    """
+    slot = min(char_offset // interval, len(checkpoints) - 1)
+    base = checkpoints[slot]
+    rest = char_offset - slot * interval
+    if rest <= 0:
+        return base
+    f.seek(base)
+    # 每个字符至多 4 字节；末尾截断的多字节序列不计入
+    text, _consumed = codecs.utf_8_decode(f.read(rest * 4), "replace", False)
+    return base + len(text[:rest].encode("utf-8"))
+
+
+class MappedViews:
+    """
+    从内存映射切出的 memoryview
+
+    映射上仍有 memoryview 时 mmap.close() 会抛出 BufferError；
+    解析失败时先 release() 全部视图，调用方才能关闭映射。
+    """
+
+    def __init__(self, buffer: mmap.mmap):
+        self._base = memoryview(buffer)
+        self._views: List[memoryview] = [self._base]
+
+    def take(self, start: int, length: int, fmt: Optional[str] = None) -> memoryview:
+        """[start, start + length) 的视图，fmt 不为空时按该格式转换"""
+        view = self._base[start:start + length]
+        self._views.append(view)
+        if fmt is not None:
+            view = view.cast(fmt)
+            self._views.append(view)
+        return view
+
+    def release(self) -> None:
+        for view in reversed(self._views):
+            view.release()
+
+
+class TxtCacheIndex:
+    """内存映射的 TXT 缓存索引（只读）"""
+
+    def __init__(self, path: Path, buffer: mmap.mmap):
+        (
+            magic, version, _reserved, chapter_count, title_bytes,
+            total_length, total_bytes, source_size, source_mtime_ns,
+            encoding_confidence, encoding, chapter_rules,
+            checkpoint_interval, checkpoint_count,
+        ) = _HEADER.unpack_from(buffer, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError("索引格式或版本不匹配")
+
+        self.path = path
+        self.chapter_count = chapter_count
+        self.total_length = total_length
+        self.total_bytes = total_bytes
+        self.source_size = source_size
+        self.source_mtime_ns = source_mtime_ns
+        self.encoding_confidence = encoding_confidence
+        self.encoding = _unpack_str(encoding)
+        self.chapter_rules = _unpack_str(chapter_rules)
+        self.checkpoint_interval = checkpoint_interval or CHECKPOINT_CHARS
+
+        views = MappedViews(buffer)
+        try:
+            width = 8 * chapter_count
+            pos = _HEADER.size
+            arrays = []
+            for _ in range(4):
+                arrays.append(views.take(pos, width, "Q"))
+                pos += width
+            self.start_offsets, self.end_offsets, self.start_bytes, self.end_bytes = arrays
+            self._title_offsets = views.take(pos, width + 8, "Q")
+            pos += width + 8
+            self.checkpoints = views.take(pos, 8 * checkpoint_count, "Q")
+            pos += 8 * checkpoint_count
+            if not len(self.checkpoints):
+                raise ValueError("索引缺少字节检查点")
+            self._titles = views.take(pos, title_bytes)
+            if len(self._titles) != title_bytes:
+                raise ValueError("索引文件不完整")
+        except BaseException:
+            views.release()
+            raise
+        # 映射保持打开，随对象回收关闭
+        self._buffer = buffer
+        self._text_map: Optional[mmap.mmap] = None
+        self._digest: Optional[int] = None
+
+    def __len__(self) -> int:
+        return self.chapter_count
+
+    def title(self, index: int) -> str:
+        start = self._title_offsets[index]
+        end = self._title_offsets[index + 1]
+        return bytes(self._titles[start:end]).decode("utf-8", errors="replace")
+
+    def chapter(self, index: int) -> Dict:
+        """第 index 个章节：title/startOffset/endOffset/startByte/endByte"""
+        return {
+            "title": self.title(index),
+            "startOffset": self.start_offsets[index],
+            "endOffset": self.end_offsets[index],
+            "startByte": self.start_bytes[index],
+            "endByte": self.end_bytes[index],
+        }
+
+    def chapters(self) -> List[Dict]:
+        """完整目录"""
+        return [self.chapter(i) for i in range(self.chapter_count)]
+
+    def byte_offset(self, f, char_offset: int) -> int:
+        """字符偏移 -> 精确字节偏移（f 为以二进制方式打开的缓存文本）"""
+        if char_offset <= 0:
+            return 0
+        if char_offset >= self.total_length:
+            return self.total_bytes
+        return char_to_byte(f, self.checkpoints, self.checkpoint_interval, char_offset)
+
+    @property
+    def digest(self) -> int:
+        """章节边界的 CRC32（章节预压缩文件据此判断是否与索引一致）"""
+        if self._digest is None:
+            crc = 0
+            for column in (self.start_offsets, self.end_offsets, self.start_bytes, self.end_bytes):
+                crc = zlib.crc32(column, crc)
+            self._digest = zlib.crc32(self._titles, crc)
+        return self._digest
+
+    def text_map(self, text_path: Path) -> Optional[mmap.mmap]:
+        """
+        只读映射缓存文本（首次调用时映射，随索引对象一起缓存）
+
+        缓存文本与索引同时构建，重建后会生成新的索引对象，因此映射不会过期。
+        空文本返回 None。
+        """
+        if self._text_map is None and self.total_bytes > 0:
+            with open(text_path, "rb") as f:
+                self._text_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._text_map
+
+    def matches_source(self, stat: os.stat_result) -> bool:
+        """缓存戳是否与源文件当前状态一致"""
+        return self.source_size == stat.st_size and self.source_mtime_ns == stat.st_mtime_ns
+
+
+def write_index(
+    index_path: Path,
+    chapters: Sequence[Dict],
+    total_length: int,
+    total_bytes: int,
+    source_size: int,
+    source_mtime_ns: int,
+    encoding: str,
+    checkpoints: Sequence[int],
+    encoding_confidence: Optional[float] = None,
+    chapter_rules: Optional[str] = None,
+    checkpoint_interval: int = CHECKPOINT_CHARS,
+) -> bool:
+    """
+    写入索引文件（先写临时文件再替换）
+
+    Args:
+        index_path: 索引文件路径
+        chapters: 章节列表（title/startOffset/endOffset/startByte/endByte）
+        total_length: 缓存文本字符数
+        total_bytes: 缓存文本字节数
+        source_size: 源文件大小（缓存戳）
+        source_mtime_ns: 源文件 mtime_ns（缓存戳）
+        encoding: 源文件编码
+        checkpoints: 字节检查点（CheckpointRecorder.points）
+        encoding_confidence: 编码置信度
+        chapter_rules: 章节规则指纹
+        checkpoint_interval: 检查点间隔
+
+    Returns:
+        是否写入成功
+    """
+    columns = [array("Q") for _ in range(4)]
+    title_offsets = array("Q", [0])
+    titles = bytearray()
+    for chapter in chapters:
+        for column, key in zip(columns, ("startOffset", "endOffset", "startByte", "endByte")):
+            column.append(max(0, int(chapter.get(key, 0))))
+        titles += chapter["title"].encode("utf-8")
+        title_offsets.append(len(titles))
+    if not isinstance(checkpoints, array):
+        checkpoints = array("Q", checkpoints)
+
+    header = _HEADER.pack(
+        INDEX_MAGIC,
+        INDEX_VERSION,
+        0,
+        len(chapters),
+        len(titles),
+        total_length,
+        total_bytes,
+        source_size,
+        source_mtime_ns,
+        encoding_confidence or 0.0,
+        _pack_str(encoding, 32),
+        _pack_str(chapter_rules, 16),
+        checkpoint_interval,
+        len(checkpoints),
+    )
+    tmp_path = index_path.with_suffix(".tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            for column in columns:
+                column.tofile(f)
+            title_offsets.tofile(f)
+            checkpoints.tofile(f)
+            f.write(titles)
+        tmp_path.replace(index_path)
+        return True
+    except Exception as e:
+        log.warning(f"写入TXT索引失败: {index_path.name}, 错误: {e}")
+        try:
+            tmp_path.unlink(missing_ok=True)
+        except Exception:
+            pass
+        return False
+
+
+def open_index(index_path: Path) -> Optional[TxtCacheIndex]:
+    """映射索引文件，不存在或格式不符时返回 None"""
+    try:
+        with open(index_path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        log.warning(f"读取TXT索引失败: {index_path.name}, 错误: {e}")
+        return None
+    try:
+        return TxtCacheIndex(index_path, buffer)
+    except (ValueError, TypeError, struct.error) as e:
+        log.warning(f"TXT索引无效: {index_path.name}, 错误: {e}")
+        buffer.close()
+        return None
+
+
+def _cache_key(source_path: Path, stat: os.stat_result) -> tuple:
+    return str(source_path), stat.st_mtime_ns, stat.st_size
+
+
+def get_index(index_path: Path, source_path: Path, stat: os.stat_result) -> Optional[TxtCacheIndex]:
+    """
+    获取源文件的缓存索引（进程内 LRU，未命中时映射索引文件）
+
+    Args:
+        index_path: 索引文件路径
+        source_path: 源 TXT 文件路径
+        stat: 源文件 stat
+
+    Returns:
+        索引；文件不存在或无效时返回 None
+    """
+    key = _cache_key(source_path, stat)
+    with _lock:
+        index = _loaded_indexes.get(key)
+        if index is not None and index.path == index_path:
+            _loaded_indexes.move_to_end(key)
+            return index
+
+    index = open_index(index_path)
+    if index is not None:
+        remember_index(source_path, stat, index)
+    return index
+
+
+def remember_index(source_path: Path, stat: os.stat_result, index: TxtCacheIndex) -> None:
+    """放入（或替换）LRU 中的索引"""
+    key = _cache_key(source_path, stat)
+    with _lock:
+        _loaded_indexes[key] = index
+        _loaded_indexes.move_to_end(key)
+        while len(_loaded_indexes) > LOADED_INDEX_CACHE_SIZE:
+            _loaded_indexes.popitem(last=False)
+
+
+def forget_index(source_path: Path, stat: os.stat_result) -> None:
+    """从 LRU 中移除（缓存被删除时调用）"""
+    with _lock:
+        _loaded_indexes.pop(_cache_key(source_path, stat), None)
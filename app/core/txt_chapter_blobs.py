@@ -0,0 +1,193 @@
+"""
+TXT 章节预压缩
+构建阅读缓存时把每章正文分别压缩，原始章节接口按 Accept-Encoding 原样返回
+
+文件布局（{cache_key}.chapters.gz / .chapters.br，整数均为小端）：
+- 头部：magic、版本、章节数、索引摘要（TxtCacheIndex.digest）
+- 偏移：N + 1 个 uint64，第 i 章为数据区 [off[i], off[i+1])
+- 数据区：各章独立的压缩流
+
+章节正文为缓存文本中去掉开头标题和首尾空白后的字节区间（见 chapter_body_span），
+未压缩响应与预压缩数据解压后的内容一致。brotli 为可选依赖，未安装时只生成 gzip。
+"""
+import gzip
+import mmap
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from app.utils.logger import log
+from app.core.txt_cache_index import MappedViews, TxtCacheIndex
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+BLOB_MAGIC = b"TXCZ"
+BLOB_VERSION = 1
+
+# 进程内保留的已打开预压缩文件数
+LOADED_BLOB_CACHE_SIZE = 64
+
+# magic, 版本, 保留, 章节数, 索引摘要
+_HEADER = struct.Struct("<4sHHII")
+
+_ASCII_SPACE = b" \t\r\n\x0b\x0c"
+
+_lock = threading.Lock()
+_loaded_blobs: "OrderedDict[tuple, ChapterBlobs]" = OrderedDict()
+
+
+def available_encodings() -> Dict[str, Callable[[bytes], bytes]]:
+    """可用的内容编码 -> 压缩函数（按偏好顺序）"""
+    encoders: Dict[str, Callable[[bytes], bytes]] = {}
+    if brotli is not None:
+        encoders["br"] = lambda data: brotli.compress(data, mode=brotli.MODE_TEXT, quality=5)
+    encoders["gzip"] = lambda data: gzip.compress(data, compresslevel=6, mtime=0)
+    return encoders
+
+
+def blob_path(text_path: Path, encoding: str) -> Path:
+    """缓存文本对应的预压缩文件路径"""
+    name = text_path.name.replace(".utf8.txt", "")
+    return text_path.with_name(f"{name}.chapters.{'gz' if encoding == 'gzip' else encoding}")
+
+
+def chapter_body_span(text: mmap.mmap, index: TxtCacheIndex, chapter_index: int) -> Tuple[int, int]:
+    """
+    章节正文的字节区间：去掉开头的章节标题和首尾 ASCII 空白
+
+    Args:
+        text: 缓存文本映射
+        index: 缓存索引
+        chapter_index: 章节序号
+
+    Returns:
+        (起始字节, 结束字节)
+    """
+    start = index.start_bytes[chapter_index]
+    end = index.end_bytes[chapter_index]
+    while start < end and text[start] in _ASCII_SPACE:
+        start += 1
+    title = index.title(chapter_index).encode("utf-8")
+    if title and text.find(title, start, min(end, start + len(title))) == start:
+        start += len(title)
+        while start < end and text[start] in _ASCII_SPACE:
+            start += 1
+    while end > start and text[end - 1] in _ASCII_SPACE:
+        end -= 1
+    return start, end
+
+
+class ChapterBlobs:
+    """内存映射的章节预压缩文件（只读）"""
+
+    def __init__(self, path: Path, buffer: mmap.mmap):
+        magic, version, _reserved, chapter_count, digest = _HEADER.unpack_from(buffer, 0)
+        if magic != BLOB_MAGIC or version != BLOB_VERSION:
+            raise ValueError("预压缩文件格式或版本不匹配")
+        self.path = path
+        self.chapter_count = chapter_count
+        self.digest = digest
+        width = 8 * (chapter_count + 1)
+        views = MappedViews(buffer)
+        try:
+            self._offsets = views.take(_HEADER.size, width, "Q")
+            self._data_start = _HEADER.size + width
+            if len(self._offsets) != chapter_count + 1 or len(buffer) < self._data_start + self._offsets[-1]:
+                raise ValueError("预压缩文件不完整")
+        except BaseException:
+            views.release()
+            raise
+        self._buffer = buffer
+
+    def get(self, chapter_index: int) -> bytes:
+        """第 chapter_index 章的压缩数据"""
+        start = self._data_start + self._offsets[chapter_index]
+        end = self._data_start + self._offsets[chapter_index + 1]
+        return self._buffer[start:end]
+
+
+def write_blobs(text_path: Path, index: TxtCacheIndex) -> None:
+    """
+    为缓存的每一章生成预压缩文件（在缓存构建线程中调用）
+
+    失败时只记录日志，原始章节接口会退回未压缩响应。
+    """
+    text = index.text_map(text_path)
+    if text is None or not len(index):
+        return
+    for encoding, compress in available_encodings().items():
+        path = blob_path(text_path, encoding)
+        tmp_path = path.with_suffix(".tmp")
+        offsets = array("Q", [0])
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(_HEADER.pack(BLOB_MAGIC, BLOB_VERSION, 0, len(index), index.digest))
+                # 偏移表占位，数据写完后回填
+                f.write(bytes(8 * (len(index) + 1)))
+                for i in range(len(index)):
+                    start, end = chapter_body_span(text, index, i)
+                    data = compress(text[start:end])
+                    f.write(data)
+                    offsets.append(offsets[-1] + len(data))
+                f.seek(_HEADER.size)
+                offsets.tofile(f)
+            tmp_path.replace(path)
+        except Exception as e:
+            log.warning(f"生成章节预压缩失败: {path.name}, 错误: {e}")
+            try:
+                tmp_path.unlink(missing_ok=True)
+            except Exception:
+                pass
+
+
+def get_blobs(text_path: Path, index: TxtCacheIndex, encoding: str) -> Optional[ChapterBlobs]:
+    """
+    获取与索引一致的预压缩文件（进程内 LRU）
+
+    Returns:
+        ChapterBlobs；文件不存在、无效或与索引不一致时返回 None
+    """
+    path = blob_path(text_path, encoding)
+    key = (str(path), index.digest)
+    with _lock:
+        blobs = _loaded_blobs.get(key)
+        if blobs is not None:
+            _loaded_blobs.move_to_end(key)
+            return blobs
+
+    try:
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    try:
+        blobs = ChapterBlobs(path, buffer)
+    except (ValueError, TypeError, struct.error) as e:
+        log.warning(f"章节预压缩文件无效: {path.name}, 错误: {e}")
+        buffer.close()
+        return None
+    if blobs.digest != index.digest or blobs.chapter_count != len(index):
+        return None
+
+    with _lock:
+        _loaded_blobs[key] = blobs
+        _loaded_blobs.move_to_end(key)
+        while len(_loaded_blobs) > LOADED_BLOB_CACHE_SIZE:
+            _loaded_blobs.popitem(last=False)
+    return blobs
+
+
+def remove_blobs(text_path: Path) -> None:
+    """删除缓存文本对应的全部预压缩文件"""
+    for encoding in ("br", "gzip"):
+        try:
+            blob_path(text_path, encoding).unlink(missing_ok=True)
+        except Exception:
+            pass
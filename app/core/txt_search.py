@@ -0,0 +1,488 @@
+"""
+TXT 书内全文索引
+基于 TXT 阅读缓存（规范化后的 UTF-8 文本）构建 n-gram 倒排索引
+
+缓存文本按行边界切成约 64KB 的块，记录每个单字（unigram）和
+二元组（bigram）出现在哪些块中。查询时取关键词全部 n-gram 的
+块集合交集，只需读取并扫描候选块，无需每次解码整本书。
+整块没有换行、只能在行中间切开的块，连同下一块开头
+MAX_KEYWORD_CHARS - 1 个字符一起建索引，跨块边界的匹配也能命中。
+
+索引文件与 TXT 缓存放在同一目录（{cache_key}.search.bin），
+首次搜索时懒构建；缓存文本被重建后根据大小和修改时间自动失效。
+"""
+import re
+import struct
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+from typing import Optional
+
+from app.utils.logger import log
+
+
+INDEX_MAGIC = b"TXSI"
+INDEX_VERSION = 2
+
+# 索引块大小（按行边界切分，实际块不超过该值）
+BLOCK_BYTES = 64 * 1024
+
+# 关键词最大长度（行中间切开的块与下一块重叠 MAX_KEYWORD_CHARS - 1 个字符建索引）
+MAX_KEYWORD_CHARS = 100
+
+# 已加载索引 / 关键词命中统计的缓存条数
+LOADED_INDEX_CACHE_SIZE = 8
+MATCH_COUNT_CACHE_SIZE = 128
+
+# magic, version, 倒排项字节宽度, 块数, n-gram 数, 倒排项数, 文本字节数, 文本字符数, 文本 mtime_ns
+_HEADER = struct.Struct("<4sHHIIIQQQ")
+
+_lock = threading.Lock()
+_loaded_indexes: "OrderedDict[str, TxtSearchIndex]" = OrderedDict()
+_match_counts: "OrderedDict[tuple, list]" = OrderedDict()
+
+
+class TxtSearchIndex:
+    """已加载到内存的书内索引（倒排表按需从磁盘读取）"""
+
+    def __init__(
+        self,
+        path: Path,
+        text_mtime_ns: int,
+        text_bytes: int,
+        block_bytes: array,
+        block_chars: array,
+        grams: array,
+        offsets: array,
+        posting_typecode: str,
+        postings_base: int,
+    ):
+        self.path = path
+        self.text_mtime_ns = text_mtime_ns
+        self.text_bytes = text_bytes
+        # 第 i 块为 [block_bytes[i], block_bytes[i+1])，末尾为哨兵
+        self.block_bytes = block_bytes
+        self.block_chars = block_chars
+        self.grams = grams
+        self.offsets = offsets
+        self.posting_typecode = posting_typecode
+        self.postings_base = postings_base
+
+    @property
+    def block_count(self) -> int:
+        return len(self.block_bytes) - 1
+
+    def candidate_blocks(self, keyword: str) -> list[int]:
+        """
+        返回可能包含关键词的块号（升序）
+
+        Args:
+            keyword: 搜索关键词
+
+        Returns:
+            候选块号列表
+        """
+        query_grams = _extract_grams(keyword)
+        if not query_grams:
+            return list(range(self.block_count))
+
+        ranges = []
+        for gram in query_grams:
+            pos = bisect_left(self.grams, gram)
+            if pos >= len(self.grams) or self.grams[pos] != gram:
+                return []
+            ranges.append((self.offsets[pos], self.offsets[pos + 1]))
+
+        # 从最短的倒排表开始求交集
+        ranges.sort(key=lambda r: r[1] - r[0])
+        width = array(self.posting_typecode).itemsize
+        result: Optional[set] = None
+        with open(self.path, "rb") as f:
+            for start, end in ranges:
+                f.seek(self.postings_base + start * width)
+                postings = array(self.posting_typecode)
+                postings.frombytes(f.read((end - start) * width))
+                result = set(postings) if result is None else result.intersection(postings)
+                if not result:
+                    return []
+        return sorted(result)
+
+
+def search_index_path(text_path: Path) -> Path:
+    """TXT 缓存文本对应的索引文件路径"""
+    name = text_path.name
+    if name.endswith(".utf8.txt"):
+        name = name[: -len(".utf8.txt")]
+    return text_path.with_name(f"{name}.search.bin")
+
+
+def _extract_grams(text: str) -> set[int]:
+    """
+    提取文本（小写化后）的全部单字与二元组编码
+
+    单字编码为码点，二元组编码为两个相邻码点拼成的 64 位整数，
+    借助 memoryview 在 C 层完成切分，避免逐字符循环。
+    """
+    data = text.lower().encode("utf-32-le")
+    view = memoryview(data)
+    count = len(data) // 4
+    grams = set(view.cast("I"))
+    if count >= 2:
+        grams.update(view[: (count // 2) * 8].cast("Q"))
+        grams.update(view[4: 4 + ((count - 1) // 2) * 8].cast("Q"))
+    return grams
+
+
+def _utf8_cut(chunk: bytes) -> int:
+    """返回不超过 chunk 末尾、且不截断 UTF-8 字符的切分位置"""
+    cut = len(chunk)
+    while cut > 0 and (chunk[cut - 1] & 0xC0) == 0x80:
+        cut -= 1
+    if cut == 0:
+        return len(chunk)
+    lead = chunk[cut - 1]
+    if lead >= 0xF0:
+        need = 4
+    elif lead >= 0xE0:
+        need = 3
+    elif lead >= 0xC0:
+        need = 2
+    else:
+        return len(chunk)
+    return len(chunk) if cut - 1 + need <= len(chunk) else cut - 1
+
+
+def _iter_text_blocks(text_path: Path):
+    """按行边界把缓存文本切成块，逐块产出 (字节长度, 文本)"""
+    carry = b""
+    with open(text_path, "rb") as f:
+        while True:
+            chunk = carry + f.read(BLOCK_BYTES - len(carry))
+            if not chunk:
+                break
+            if len(chunk) < BLOCK_BYTES:
+                cut = len(chunk)
+            else:
+                cut = chunk.rfind(b"\n") + 1 or _utf8_cut(chunk)
+            carry = chunk[cut:]
+            yield cut, chunk[:cut].decode("utf-8", errors="replace")
+
+
+def build_search_index(text_path: Path) -> Optional[TxtSearchIndex]:
+    """
+    为 TXT 缓存文本构建索引并写入磁盘（同步，耗时操作）
+
+    Args:
+        text_path: TXT 缓存文本路径
+
+    Returns:
+        构建好的索引，失败返回 None
+    """
+    index_path = search_index_path(text_path)
+    tmp_path = index_path.with_suffix(".tmp")
+    try:
+        text_stat = text_path.stat()
+        block_bytes = array("Q", [0])
+        block_chars = array("Q", [0])
+        postings_map: defaultdict[int, list] = defaultdict(list)
+
+        prev_text: Optional[str] = None
+        block_id = 0
+        for size, block_text in _iter_text_blocks(text_path):
+            block_bytes.append(block_bytes[-1] + size)
+            block_chars.append(block_chars[-1] + len(block_text))
+            if prev_text is not None:
+                # 带上下一块首字符，跨块边界的二元组也能命中；
+                # 在行中间切开的块带上关键词最大长度减一个字符，跨块的关键词也能命中
+                overlap = 1 if prev_text.endswith("\n") else MAX_KEYWORD_CHARS - 1
+                for gram in _extract_grams(prev_text + block_text[:overlap]):
+                    postings_map[gram].append(block_id)
+                block_id += 1
+            prev_text = block_text
+        if prev_text is not None:
+            for gram in _extract_grams(prev_text):
+                postings_map[gram].append(block_id)
+
+        block_count = len(block_bytes) - 1
+        posting_typecode = "H" if block_count <= 0xFFFF else "I"
+        grams = array("Q", sorted(postings_map))
+        offsets = array("I", [0])
+        postings = array(posting_typecode)
+        for gram in grams:
+            postings.extend(postings_map[gram])
+            offsets.append(len(postings))
+        del postings_map
+
+        header = _HEADER.pack(
+            INDEX_MAGIC,
+            INDEX_VERSION,
+            postings.itemsize,
+            block_count,
+            len(grams),
+            len(postings),
+            block_bytes[-1],
+            block_chars[-1],
+            text_stat.st_mtime_ns,
+        )
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            for part in (block_bytes, block_chars, grams, offsets, postings):
+                part.tofile(f)
+        tmp_path.replace(index_path)
+    except Exception as e:
+        log.warning(f"构建书内搜索索引失败: {text_path.name}, 错误: {e}")
+        try:
+            tmp_path.unlink(missing_ok=True)
+        except Exception:
+            pass
+        return None
+
+    log.info(
+        f"书内搜索索引构建完成: {text_path.name}, "
+        f"{block_count} 块, {len(grams)} 个 n-gram"
+    )
+    return _load_index_file(index_path, text_path)
+
+
+def _load_index_file(index_path: Path, text_path: Path) -> Optional[TxtSearchIndex]:
+    """读取索引文件（倒排项除外），与缓存文本不一致时返回 None"""
+    try:
+        text_stat = text_path.stat()
+        with open(index_path, "rb") as f:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return None
+            (
+                magic, version, posting_width, block_count, gram_count,
+                _posting_count, text_bytes, _text_length, text_mtime_ns,
+            ) = _HEADER.unpack(header)
+            if magic != INDEX_MAGIC or version != INDEX_VERSION:
+                return None
+            if text_bytes != text_stat.st_size or text_mtime_ns != text_stat.st_mtime_ns:
+                return None
+
+            def read_array(typecode: str, count: int) -> array:
+                values = array(typecode)
+                values.fromfile(f, count)
+                return values
+
+            block_bytes = read_array("Q", block_count + 1)
+            block_chars = read_array("Q", block_count + 1)
+            grams = read_array("Q", gram_count)
+            offsets = read_array("I", gram_count + 1)
+            postings_base = f.tell()
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        log.warning(f"读取书内搜索索引失败: {index_path.name}, 错误: {e}")
+        return None
+
+    return TxtSearchIndex(
+        path=index_path,
+        text_mtime_ns=text_mtime_ns,
+        text_bytes=text_bytes,
+        block_bytes=block_bytes,
+        block_chars=block_chars,
+        grams=grams,
+        offsets=offsets,
+        posting_typecode="H" if posting_width == 2 else "I",
+        postings_base=postings_base,
+    )
+
+
+def ensure_search_index(text_path: Path) -> Optional[TxtSearchIndex]:
+    """
+    获取 TXT 缓存文本的索引，不存在或已过期时构建（同步）
+
+    Args:
+        text_path: TXT 缓存文本路径
+
+    Returns:
+        索引对象，构建失败返回 None
+    """
+    key = str(text_path)
+    try:
+        mtime_ns = text_path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+    with _lock:
+        index = _loaded_indexes.get(key)
+        if index is not None and index.text_mtime_ns == mtime_ns:
+            _loaded_indexes.move_to_end(key)
+            return index
+
+    index = _load_index_file(search_index_path(text_path), text_path)
+    if index is None:
+        index = build_search_index(text_path)
+    if index is None:
+        return None
+
+    with _lock:
+        _loaded_indexes[key] = index
+        _loaded_indexes.move_to_end(key)
+        while len(_loaded_indexes) > LOADED_INDEX_CACHE_SIZE:
+            _loaded_indexes.popitem(last=False)
+    return index
+
+
+def remove_search_index(text_path: Path) -> None:
+    """删除 TXT 缓存文本对应的索引（缓存重建时调用）"""
+    with _lock:
+        _loaded_indexes.pop(str(text_path), None)
+    try:
+        search_index_path(text_path).unlink(missing_ok=True)
+    except Exception:
+        pass
+
+
+def _read_block(f, index: TxtSearchIndex, block: int, extra_bytes: int) -> str:
+    """读取一个块的文本，并额外带上后续若干字节（用于跨块匹配）"""
+    start = index.block_bytes[block]
+    end = min(index.text_bytes, index.block_bytes[block + 1] + extra_bytes)
+    f.seek(start)
+    # 末尾可能截断多字节字符，忽略不完整部分
+    return f.read(end - start).decode("utf-8", errors="ignore")
+
+
+def _scan_block_counts(
+    f,
+    index: TxtSearchIndex,
+    pattern: re.Pattern,
+    blocks: list[int],
+    extra_bytes: int,
+) -> list[tuple[int, int, int]]:
+    """
+    统计每个候选块内的匹配数
+
+    Returns:
+        [(块号, 匹配数, 块内起始扫描位置)]，起始扫描位置用于跳过
+        与上一块末尾匹配重叠的部分，保证结果与整本 finditer 一致
+    """
+    counts = []
+    resume_char = 0
+    for block in blocks:
+        block_start = index.block_chars[block]
+        block_len = index.block_chars[block + 1] - block_start
+        skip = max(0, resume_char - block_start)
+        if skip >= block_len:
+            continue
+        text = _read_block(f, index, block, extra_bytes)
+        count = 0
+        for match in pattern.finditer(text, skip):
+            if match.start() >= block_len:
+                break
+            count += 1
+            resume_char = block_start + match.end()
+        if count:
+            counts.append((block, count, skip))
+    return counts
+
+
+def search_text(
+    text_path: Path,
+    keyword: str,
+    offset: int,
+    limit: int,
+    context_chars: int = 50,
+) -> Optional[tuple[int, list[dict]]]:
+    """
+    在 TXT 缓存文本中搜索关键词（不区分大小写），只返回请求的一页结果
+
+    Args:
+        text_path: TXT 缓存文本路径
+        keyword: 搜索关键词
+        offset: 结果起始序号
+        limit: 返回结果数
+        context_chars: 上下文字符数
+
+    Returns:
+        (总匹配数, 匹配列表)，索引不可用时返回 None。
+        匹配项包含 position（字符偏移）、byte（字节偏移）、
+        context、highlightStart、highlightEnd
+    """
+    index = ensure_search_index(text_path)
+    if index is None:
+        return None
+
+    pattern = re.compile(re.escape(keyword), re.IGNORECASE)
+    # 匹配可能越过块尾，多读 len(keyword) 个字符的余量
+    extra_bytes = 4 * max(0, len(keyword) - 1)
+    cache_key = (str(text_path), index.text_mtime_ns, keyword.lower())
+
+    with open(text_path, "rb") as f:
+        with _lock:
+            counts = _match_counts.get(cache_key)
+            if counts is not None:
+                _match_counts.move_to_end(cache_key)
+        if counts is None:
+            if len(keyword) > MAX_KEYWORD_CHARS:
+                # 超出索引的块重叠长度，跨块匹配可能不在候选块中，扫描全部块
+                blocks = list(range(index.block_count))
+            else:
+                blocks = index.candidate_blocks(keyword)
+            counts = _scan_block_counts(f, index, pattern, blocks, extra_bytes)
+            with _lock:
+                _match_counts[cache_key] = counts
+                while len(_match_counts) > MATCH_COUNT_CACHE_SIZE:
+                    _match_counts.popitem(last=False)
+
+        total = sum(count for _block, count, _skip in counts)
+        matches: list[dict] = []
+        seen = 0
+        for block, count, skip in counts:
+            if len(matches) >= limit:
+                break
+            if seen + count <= offset:
+                seen += count
+                continue
+            text = _read_block(f, index, block, extra_bytes)
+            block_len = index.block_chars[block + 1] - index.block_chars[block]
+            for match in pattern.finditer(text, skip):
+                if match.start() >= block_len or len(matches) >= limit:
+                    break
+                if seen < offset:
+                    seen += 1
+                    continue
+                seen += 1
+                match_byte = index.block_bytes[block] + len(text[:match.start()].encode("utf-8"))
+                matches.append(
+                    _build_match(
+                        f,
+                        index,
+                        position=index.block_chars[block] + match.start(),
+                        match_byte=match_byte,
+                        matched=match.group(),
+                        context_chars=context_chars,
+                    )
+                )
+
+    return total, matches
+
+
+def _build_match(
+    f,
+    index: TxtSearchIndex,
+    position: int,
+    match_byte: int,
+    matched: str,
+    context_chars: int,
+) -> dict:
+    """读取匹配位置前后的上下文"""
+    matched_bytes = len(matched.encode("utf-8"))
+    window_start = max(0, match_byte - 4 * context_chars)
+    window_end = min(index.text_bytes, match_byte + matched_bytes + 4 * context_chars)
+    f.seek(window_start)
+    raw = f.read(window_end - window_start)
+    head = match_byte - window_start
+    before = raw[:head].decode("utf-8", errors="ignore")[-context_chars:] if context_chars else ""
+    after = raw[head + matched_bytes:].decode("utf-8", errors="ignore")[:context_chars]
+    return {
+        "position": position,
+        "byte": match_byte,
+        "context": before + matched + after,
+        "highlightStart": len(before),
+        "highlightEnd": len(before) + len(matched),
+    }
@@ -1,19 +1,80 @@
 """
 数据库连接和会话管理
+
+SQLite 下：
+- 每个连接设置 WAL、synchronous、busy_timeout、cache_size、mmap_size 等 PRAGMA
+- 写引擎（engine / AsyncSessionLocal）处理读写请求；只读引擎（read_engine / get_read_db）
+  为纯查询接口提供独立的连接池，连接设置 query_only，读请求不占用写连接
+- ORM 写事务在进程内串行：会话首次 flush 时获取写闸门，事务结束时释放，
+  并发写入在事件循环中排队，而不是在 SQLite 锁上等待直至 "database is locked"
+  （Core 批量语句不经过 flush，仍依赖 busy_timeout）
+- 扫描等长时间运行的写入者在等待解析结果前、或有其他写入排队时调用 yield_write_gate
+  提交当前事务，不在长时间等待期间占用写闸门和 SQLite 写锁
 """
+import asyncio
+import time
 from typing import AsyncGenerator
 
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
-from sqlalchemy.orm import declarative_base
+from sqlalchemy import event
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.orm import Session, declarative_base
+from sqlalchemy.util.concurrency import await_, in_greenlet
 
 from app.config import settings
 
+
+IS_SQLITE = make_url(settings.database.url).get_backend_name() == "sqlite"
+_IN_MEMORY = IS_SQLITE and make_url(settings.database.url).database in (None, "", ":memory:")
+
+_GATE_KEY = "write_gate_acquired"
+
+
+def _apply_sqlite_pragmas(dbapi_connection, read_only: bool) -> None:
+    """为新的 SQLite 连接设置 PRAGMA"""
+    config = settings.database
+    cursor = dbapi_connection.cursor()
+    try:
+        if not read_only and not _IN_MEMORY:
+            cursor.execute(f"PRAGMA journal_mode={config.journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={config.synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={int(config.busy_timeout)}")
+        cursor.execute(f"PRAGMA cache_size={-int(config.cache_size_mb) * 1024}")
+        cursor.execute(f"PRAGMA mmap_size={int(config.mmap_size_mb) * 1024 * 1024}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+    finally:
+        cursor.close()
+
+
+def _create_engine(read_only: bool = False, **kwargs) -> AsyncEngine:
+    """创建异步引擎（SQLite 时注册 PRAGMA）"""
+    new_engine = create_async_engine(
+        settings.database.url,
+        echo=False,
+        future=True,
+        **kwargs
+    )
+    if IS_SQLITE:
+        @event.listens_for(new_engine.sync_engine, "connect")
+        def _on_connect(dbapi_connection, connection_record):
+            _apply_sqlite_pragmas(dbapi_connection, read_only)
+    return new_engine
+
+
 # 创建异步引擎
-engine = create_async_engine(
-    settings.database.url,
-    echo=False,
-    future=True,
-)
+engine = _create_engine()
+
+# 只读引擎（非 SQLite 或内存数据库时与写引擎相同）
+if IS_SQLITE and not _IN_MEMORY:
+    read_engine = _create_engine(
+        read_only=True,
+        pool_size=settings.database.read_pool_size,
+        max_overflow=settings.database.read_pool_size,
+    )
+else:
+    read_engine = engine
 
 # 创建会话工厂
 AsyncSessionLocal = async_sessionmaker(
@@ -22,6 +83,12 @@ AsyncSessionLocal = async_sessionmaker(
     expire_on_commit=False,
 )
 
+ReadSessionLocal = async_sessionmaker(
+    read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+)
+
 # 声明基类
 Base = declarative_base()
 
@@ -38,11 +105,135 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
             await session.close()
 
 
+async def get_read_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    获取只读数据库会话（使用只读连接池）
+    用于只查询、不写入的接口
+    """
+    async with ReadSessionLocal() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
+
 async def init_db():
     """初始化数据库，创建所有表"""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
 
+async def dispose_engines():
+    """关闭所有连接池"""
+    await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
+
+
 # 别名，保持兼容性
 init_database = init_db
+
+
+# ===== 写事务闸门 =====
+
+class WriteGate:
+    """进程内写事务闸门：同一时间只有一个 ORM 写事务，其余在事件循环中排队"""
+
+    def __init__(self, timeout: float):
+        # 超过等待时间后不再等待闸门，交给 SQLite busy_timeout 处理
+        # （防止同一任务内嵌套会话写入时互相等待）
+        self.timeout = timeout
+        self._lock = asyncio.Lock()
+        self.acquired = 0
+        self.waiting = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+
+    async def acquire(self) -> bool:
+        """
+        获取闸门
+
+        Returns:
+            是否获取成功（超时返回 False）
+        """
+        if not self._lock.locked():
+            await self._lock.acquire()
+            self.acquired += 1
+            return True
+
+        self.waits += 1
+        self.waiting += 1
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(self._lock.acquire(), self.timeout)
+            self.acquired += 1
+            return True
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return False
+        finally:
+            self.waiting -= 1
+            elapsed = time.monotonic() - start
+            self.wait_seconds += elapsed
+            self.max_wait_seconds = max(self.max_wait_seconds, elapsed)
+
+    def release(self) -> None:
+        if self._lock.locked():
+            self._lock.release()
+
+    def get_status(self) -> dict:
+        """闸门统计"""
+        return {
+            "locked": self._lock.locked(),
+            "waiting": self.waiting,
+            "acquired": self.acquired,
+            "lock_waits": self.waits,
+            "lock_wait_ms_total": round(self.wait_seconds * 1000, 1),
+            "lock_wait_ms_avg": round(self.wait_seconds * 1000 / self.waits, 2) if self.waits else 0,
+            "lock_wait_ms_max": round(self.max_wait_seconds * 1000, 1),
+            "lock_timeouts": self.timeouts,
+        }
+
+
+# 全局写闸门实例
+write_gate = WriteGate(settings.database.busy_timeout / 1000)
+
+
+@event.listens_for(Session, "before_flush")
+def _acquire_write_gate(session: Session, flush_context, instances) -> None:
+    """会话首次写入时获取写闸门（只对写引擎上的异步会话生效）"""
+    if not IS_SQLITE or _GATE_KEY in session.info:
+        return
+    if session.bind is not engine.sync_engine or not in_greenlet():
+        return
+    session.info[_GATE_KEY] = await_(write_gate.acquire())
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _release_write_gate(session: Session, transaction) -> None:
+    """事务结束（提交、回滚或关闭）时释放写闸门"""
+    if transaction.parent is None and session.info.pop(_GATE_KEY, False):
+        write_gate.release()
+
+
+async def yield_write_gate(session: AsyncSession, force: bool = False) -> bool:
+    """
+    长时间运行的写入者让出写闸门：提交当前事务，排队中的写入随即获得闸门
+
+    Args:
+        session: 写入者的会话
+        force: 为 True 时（即将长时间等待）只要有未结束的事务就提交；
+            否则仅在持有闸门且有其他写入排队时提交
+
+    Returns:
+        是否提交了事务
+    """
+    if force:
+        if not session.in_transaction():
+            return False
+    elif not (session.info.get(_GATE_KEY) and write_gate.waiting):
+        return False
+    await session.commit()
+    return True
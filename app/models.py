@@ -4,7 +4,7 @@
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import Boolean, Column, DateTime, Float, ForeignKey, Integer, String, Text, UniqueConstraint
+from sqlalchemy import BigInteger, Boolean, Column, Date, DateTime, Float, ForeignKey, Index, Integer, String, Text, UniqueConstraint, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.associationproxy import association_proxy
 
@@ -65,6 +65,29 @@ class Library(Base):
     paths = relationship("LibraryPath", back_populates="library", cascade="all, delete-orphan")
     scan_tasks = relationship("ScanTask", back_populates="library", cascade="all, delete-orphan")
     library_tags = relationship("LibraryTag", back_populates="library", cascade="all, delete-orphan")
+    stats = relationship("LibraryStats", back_populates="library", uselist=False, cascade="all, delete-orphan")
+
+
+class LibraryStats(Base):
+    """书库统计（物化，供首页使用）
+
+    书籍及版本变化时递增 change_seq，读取时 refreshed_seq 不一致即重新计算。
+    """
+    __tablename__ = "library_stats"
+
+    library_id = Column(Integer, ForeignKey("libraries.id", ondelete="CASCADE"), primary_key=True)
+    book_count = Column(Integer, default=0, nullable=False)
+    author_count = Column(Integer, default=0, nullable=False)
+    group_count = Column(Integer, default=0, nullable=False)
+    total_size = Column(BigInteger, default=0, nullable=False)  # 主版本文件总大小
+    new_books_7d = Column(Integer, default=0, nullable=False)
+    latest_book_ids = Column(Text, nullable=True)  # JSON 数组，按添加时间倒序
+    change_seq = Column(Integer, default=0, nullable=False)
+    refreshed_seq = Column(Integer, default=0, nullable=False)
+    refreshed_at = Column(DateTime, nullable=True)
+
+    # 关系
+    library = relationship("Library", back_populates="stats")
 
 
 class LibraryPath(Base):
@@ -113,6 +136,9 @@ class ScanTask(Base):
     added_books = Column(Integer, default=0)
     skipped_books = Column(Integer, default=0)
     error_count = Column(Integer, default=0)
+    unchanged_files = Column(Integer, default=0)  # 增量扫描：未变化跳过的文件
+    updated_files = Column(Integer, default=0)  # 增量扫描：原地更新/移动的文件
+    missing_files = Column(Integer, default=0)  # 增量扫描：已从磁盘消失的文件
     error_message = Column(Text, nullable=True)
     started_at = Column(DateTime, nullable=True)
     completed_at = Column(DateTime, nullable=True)
@@ -189,20 +215,33 @@ class Book(Base):
     # 便捷属性：通过book_tags访问tags
     tags = association_proxy("book_tags", "tag")
 
+    __table_args__ = (
+        # 按书库统计、按书库取最新书籍
+        Index('ix_books_library_added', 'library_id', 'added_at'),
+    )
+
 
 class BookVersion(Base):
     """书籍版本表（具体文件）"""
     __tablename__ = "book_versions"
 
     id = Column(Integer, primary_key=True, index=True)
-    book_id = Column(Integer, ForeignKey("books.id"), nullable=False)
+    book_id = Column(Integer, ForeignKey("books.id"), nullable=False, index=True)
     
     # 文件信息
     file_path = Column(String(1000), unique=True, nullable=False)
     file_name = Column(String(255), nullable=False)
     file_format = Column(String(20), nullable=False, index=True)
     file_size = Column(Integer, nullable=False)
-    file_hash = Column(String(64), unique=True, nullable=False, index=True)
+    # 完整内容Hash：采样模式下只在大小和采样Hash都相同时才计算，其余为空
+    file_hash = Column(String(64), unique=True, nullable=True, index=True)
+    sample_hash = Column(String(32), nullable=True)  # 大小 + 头/中/尾采样Hash
+    # 扫描清单：用于增量扫描时判断文件是否变化
+    file_mtime_ns = Column(BigInteger, nullable=True)
+    file_inode = Column(BigInteger, nullable=True)
+    # TXT 编码检测结果：扫描时写入，文件内容变化时清空
+    encoding = Column(String(32), nullable=True)
+    encoding_confidence = Column(Float, nullable=True)
     
     # 版本属性
     quality = Column(String(20), default='medium')  # 'low', 'medium', 'high'
@@ -214,6 +253,10 @@ class BookVersion(Base):
     # 关系
     book = relationship("Book", back_populates="versions")
 
+    __table_args__ = (
+        Index('ix_book_versions_size_sample', 'file_size', 'sample_hash'),
+    )
+
 
 class Tag(Base):
     """内容标签（用于分级控制）"""
@@ -399,11 +442,35 @@ class ReadingSession(Base):
     device_info = Column(String(255), nullable=True)
     
     created_at = Column(DateTime, default=datetime.utcnow)
+
+    # 汇总到 reading_stats_daily 的状态：已计入的时长（NULL 表示会话尚未计入），时长变化后待汇总
+    rolled_seconds = Column(Integer, nullable=True)
+    rollup_pending = Column(Boolean, default=True, nullable=False)
     
     # 关系
     user = relationship("User", backref="reading_sessions")
     book = relationship("Book", backref="reading_sessions")
 
+    __table_args__ = (
+        Index('ix_reading_sessions_rollup_pending', 'user_id', sqlite_where=text('rollup_pending = 1')),
+    )
+
+
+class ReadingStatsDaily(Base):
+    """每日阅读统计（按 用户/日期/小时/书籍 汇总的阅读会话）
+
+    会话按开始时间计入对应的日期和小时；阅读统计接口只读此表。
+    """
+    __tablename__ = "reading_stats_daily"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    date = Column(Date, primary_key=True)
+    hour = Column(Integer, primary_key=True)
+    book_id = Column(Integer, ForeignKey("books.id", ondelete="CASCADE"), primary_key=True)
+    seconds = Column(Integer, default=0, nullable=False)
+    sessions = Column(Integer, default=0, nullable=False)
+    last_read_at = Column(DateTime, nullable=True)  # 最近一次会话的开始时间
+
 
 class FilenamePattern(Base):
     """文件名解析规则"""
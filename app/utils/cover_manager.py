@@ -1,21 +1,100 @@
 """
 封面管理器
 统一的封面提取、缓存和生成管理
+
+封面响应的 HTTP 缓存：
+- ETag 和版本号由文件的 (路径, mtime_ns, 大小) 计算，只需 stat，不读取文件内容
+- 书籍ID -> 封面文件的解析结果缓存在内存中，条件请求命中时无需查询数据库
+- 列表接口返回带版本号的地址（/books/{id}/cover?v=<版本>），
+  同一路径被重新写入（重新提取封面、恢复备份）后 mtime 变化，版本号随之改变，
+  因此版本化地址可长期缓存
+缩略图和多尺寸封面由 app.core.cover_renditions 在进程池中生成。
+Book.cover_path 变化或书籍删除时，在事务提交后清除对应的解析结果。
 """
 import hashlib
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Iterable, Optional, Tuple
 from io import BytesIO
 
 from PIL import Image, ImageDraw, ImageFont
-from sqlalchemy import select
+from sqlalchemy import event, inspect, select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 
 from app.config import settings
 from app.models import Book
 from app.utils.logger import log
 
 
+# 封面解析结果缓存条目上限
+RESOLVED_CACHE_SIZE = 8192
+
+_PENDING_KEY = "cover_cache_pending"
+
+
+def _stat_token(path: str, stat: os.stat_result) -> str:
+    """
+    由 (路径, mtime_ns, 大小) 计算的文件标识，文件被改写后随之改变（只需 stat，不读取文件）
+    
+    Args:
+        path: 文件路径
+        stat: 文件 stat
+        
+    Returns:
+        20 位十六进制标识
+    """
+    key = f"{path}\0{stat.st_mtime_ns}\0{stat.st_size}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+
+
+def cover_version(cover_path: Optional[str]) -> Optional[str]:
+    """
+    封面版本号（由封面路径、mtime_ns 和大小计算）
+    
+    Args:
+        cover_path: Book.cover_path
+        
+    Returns:
+        12 位十六进制版本号，无封面或封面文件不存在时返回 None
+    """
+    if not cover_path:
+        return None
+    try:
+        return _stat_token(cover_path, os.stat(cover_path))[:12]
+    except OSError:
+        return None
+
+
+def cover_url(book_id: int, cover_path: Optional[str], base_url: str = "") -> str:
+    """
+    书籍封面地址，有封面时带版本号（可被客户端长期缓存）
+    
+    Args:
+        book_id: 书籍ID
+        cover_path: Book.cover_path
+        base_url: 地址前缀
+        
+    Returns:
+        封面地址
+    """
+    version = cover_version(cover_path)
+    if version:
+        return f"{base_url}/books/{book_id}/cover?v={version}"
+    return f"{base_url}/books/{book_id}/cover"
+
+
+@dataclass(slots=True)
+class CoverFile:
+    """可直接响应的封面文件"""
+    path: str
+    version: str
+    etag: str
+    mtime: float
+
+
 class CoverManager:
     """封面管理器"""
     
@@ -44,6 +123,8 @@ class CoverManager:
         """初始化封面管理器"""
         self.cover_dir = Path(settings.directories.covers)
         self.cover_dir.mkdir(parents=True, exist_ok=True)
+        # (书籍ID, 尺寸) -> (响应文件路径, 原始封面路径, 版本号)；书籍无封面时为 None
+        self._resolved: "OrderedDict[Tuple[int, str], Optional[Tuple[str, str, str]]]" = OrderedDict()
     
     async def get_cover_path(
         self, 
@@ -62,58 +143,108 @@ class CoverManager:
         Returns:
             封面路径，如果不存在返回None
         """
+        cover = await self.resolve_cover(book_id, db, size)
+        return cover.path if cover else None
+    
+    async def resolve_cover(
+        self,
+        book_id: int,
+        db: AsyncSession,
+        size: str = "original"
+    ) -> Optional[CoverFile]:
+        """
+        解析书籍封面文件及其缓存校验信息
+        
+        解析结果缓存在内存中，命中时只 stat 文件，不查询数据库。
+        
+        Args:
+            book_id: 书籍ID
+            db: 数据库会话
+            size: 尺寸（original/thumbnail）
+            
+        Returns:
+            CoverFile，书籍不存在或没有封面时返回 None
+        """
+        key = (book_id, size)
         try:
-            # 查询书籍
+            if key in self._resolved:
+                self._resolved.move_to_end(key)
+                resolved = self._resolved[key]
+                if resolved is None:
+                    return None
+                cover = await self._cover_file(*resolved)
+                if cover is not None:
+                    return cover
+                # 文件已被删除或封面已改写（版本号变化），重新解析
+                self._resolved.pop(key, None)
+            
             result = await db.execute(
-                select(Book).where(Book.id == book_id)
+                select(Book.cover_path).where(Book.id == book_id)
             )
-            book = result.scalar_one_or_none()
-            
-            if not book or not book.cover_path:
+            row = result.first()
+            if row is None:
                 return None
             
-            cover_path = Path(book.cover_path)
-            if not cover_path.exists():
-                return None
+            cover_path = row[0]
+            resolved = None
+            version = cover_version(cover_path)
+            if version:
+                path = cover_path
+                # 如果需要缩略图，生成或返回缩略图路径
+                if size == "thumbnail":
+                    path = await self._get_thumbnail_path(Path(cover_path), version)
+                resolved = (path, cover_path, version)
             
-            # 如果需要缩略图，生成或返回缩略图路径
-            if size == "thumbnail":
-                return await self._get_thumbnail_path(cover_path)
+            self._resolved[key] = resolved
+            while len(self._resolved) > RESOLVED_CACHE_SIZE:
+                self._resolved.popitem(last=False)
             
-            return str(cover_path)
+            return await self._cover_file(*resolved) if resolved else None
             
         except Exception as e:
             log.error(f"获取封面路径失败: book_id={book_id}, 错误: {e}")
             return None
     
-    async def _get_thumbnail_path(self, original_path: Path) -> str:
+    async def _cover_file(self, path: str, cover_path: str, version: str) -> Optional[CoverFile]:
+        """
+        stat 响应文件并计算 ETag
+        
+        原始封面的版本号与解析时不一致（封面已改写）时返回 None。
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        token = _stat_token(path, stat)
+        if path == cover_path:
+            if token[:12] != version:
+                return None
+        elif cover_version(cover_path) != version:
+            return None
+        
+        return CoverFile(path=path, version=version, etag=f'"{token}"', mtime=stat.st_mtime)
+    
+    def invalidate_covers(self, book_ids: Iterable[int]) -> None:
+        """清除书籍的封面解析结果（封面变化或书籍删除后调用）"""
+        for book_id in set(book_ids):
+            for size in ("original", "thumbnail"):
+                self._resolved.pop((book_id, size), None)
+    
+    async def _get_thumbnail_path(self, original_path: Path, version: str) -> str:
         """
-        获取或生成缩略图
+        获取或生成缩略图（按配置的缩略图尺寸和质量，在封面渲染进程池中生成）
         
         Args:
             original_path: 原始封面路径
+            version: 原始封面版本号
             
         Returns:
-            缩略图路径
+            缩略图路径，生成失败时返回原图路径
         """
-        try:
-            # 缩略图保存路径
-            thumb_path = original_path.parent / f"thumb_{original_path.name}"
-            
-            # 如果缩略图已存在，直接返回
-            if thumb_path.exists():
-                return str(thumb_path)
-            
-            # 生成缩略图
-            img = Image.open(original_path)
-            img.thumbnail((300, 450), Image.Resampling.LANCZOS)
-            img.save(thumb_path, 'JPEG', quality=85)
-            
-            return str(thumb_path)
-            
-        except Exception as e:
-            log.error(f"生成缩略图失败: {original_path}, 错误: {e}")
-            return str(original_path)
+        from app.core.cover_renditions import cover_renditions
+        
+        thumb_path = await cover_renditions.get_thumbnail(str(original_path), version)
+        return str(thumb_path) if thumb_path else str(original_path)
     
     def generate_default_cover(
         self, 
@@ -470,11 +601,19 @@ class CoverManager:
                 if str(cover_file) not in valid_covers:
                     cover_file.unlink()
                     deleted_count += 1
-                    # 同时删除缩略图
+                    # 同时删除旧版缩略图
                     thumb_file = cover_file.parent / f"thumb_{cover_file.name}"
                     if thumb_file.exists():
                         thumb_file.unlink()
             
+            # 多尺寸封面文件名以封面版本号开头，版本号不在有效集合中的一并删除
+            valid_versions = {cover_version(path) for path in valid_covers}
+            rendition_dir = self.cover_dir / "renditions"
+            if rendition_dir.exists():
+                for rendition_file in rendition_dir.iterdir():
+                    if rendition_file.name.split("-", 1)[0] not in valid_versions:
+                        rendition_file.unlink()
+            
             log.info(f"清理了 {deleted_count} 个孤立封面文件")
             return deleted_count
             
@@ -492,6 +631,9 @@ class CoverManager:
         try:
             cover_files = list(self.cover_dir.glob("*.jpg"))
             thumb_files = list(self.cover_dir.glob("thumb_*.jpg"))
+            rendition_dir = self.cover_dir / "renditions"
+            if rendition_dir.exists():
+                thumb_files.extend(rendition_dir.iterdir())
             
             total_size = sum(f.stat().st_size for f in cover_files)
             thumb_size = sum(f.stat().st_size for f in thumb_files)
@@ -518,3 +660,31 @@ class CoverManager:
 
 # 全局实例
 cover_manager = CoverManager()
+
+
+# ===== ORM 事件：封面变化后清除解析结果 =====
+
+@event.listens_for(Session, "after_flush")
+def _collect_cover_changes(session: Session, flush_context) -> None:
+    """记录本次刷新中封面变化或被删除的书籍"""
+    book_ids = set()
+    for obj in session.dirty:
+        if isinstance(obj, Book) and inspect(obj).attrs.cover_path.history.has_changes():
+            book_ids.add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, Book):
+            book_ids.add(obj.id)
+    if book_ids:
+        session.info.setdefault(_PENDING_KEY, set()).update(book_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_cover_changes(session: Session) -> None:
+    book_ids = session.info.pop(_PENDING_KEY, None)
+    if book_ids:
+        cover_manager.invalidate_covers(book_ids)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_cover_changes(session: Session, previous_transaction) -> None:
+    session.info.pop(_PENDING_KEY, None)
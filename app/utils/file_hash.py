@@ -41,14 +41,15 @@ def calculate_file_hash(
         raise
 
 
-def quick_hash(file_path: Path, sample_size: int = 1024) -> str:
+def quick_hash(file_path: Path, sample_size: int = 65536) -> str:
     """
-    快速Hash计算（仅读取文件头部）
-    用于快速去重检测
+    快速Hash计算（文件大小 + 头部/中部/尾部采样）
+    用于快速去重检测：采样不同的文件内容必然不同，
+    采样相同时再用 calculate_file_hash 确认
     
     Args:
         file_path: 文件路径
-        sample_size: 采样大小（字节）
+        sample_size: 每段采样大小（字节）
         
     Returns:
         采样Hash字符串
@@ -60,10 +61,14 @@ def quick_hash(file_path: Path, sample_size: int = 1024) -> str:
         file_size = file_path.stat().st_size
         hasher.update(str(file_size).encode())
         
-        # 读取文件头部
         with open(file_path, "rb") as f:
-            sample = f.read(sample_size)
-            hasher.update(sample)
+            if file_size <= sample_size * 3:
+                # 小文件直接读取全部内容
+                hasher.update(f.read())
+            else:
+                for offset in (0, (file_size - sample_size) // 2, file_size - sample_size):
+                    f.seek(offset)
+                    hasher.update(f.read(sample_size))
         
         return hasher.hexdigest()
     except Exception as e:
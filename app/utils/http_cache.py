@@ -0,0 +1,166 @@
+"""
+HTTP 缓存工具
+ETag / If-None-Match / If-Modified-Since 条件请求和单段 Range 请求的响应构造
+"""
+import re
+from email.utils import parsedate_to_datetime
+from typing import Optional, Set
+
+from fastapi import Request
+from fastapi.responses import Response
+
+
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+_Q_PATTERN = re.compile(r"^q=([0-9.]+)$")
+
+
+def make_etag(*parts: object) -> str:
+    """
+    由若干部分生成强 ETag（带引号）
+
+    Args:
+        parts: 能唯一确定内容的值（如文件键摘要、页码、宽度）
+
+    Returns:
+        形如 "a-b-c" 的 ETag
+    """
+    return '"' + "-".join(str(part) for part in parts) + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """请求的 If-None-Match 是否命中当前 ETag"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag in candidates
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[float] = None) -> bool:
+    """
+    条件请求是否可以返回 304
+
+    有 If-None-Match 时只比较 ETag；否则比较 If-Modified-Since 与文件修改时间。
+
+    Args:
+        request: 当前请求
+        etag: 当前 ETag
+        last_modified: 内容修改时间（时间戳）
+
+    Returns:
+        是否未修改
+    """
+    if request.headers.get("if-none-match"):
+        return etag_matches(request, etag)
+    since = request.headers.get("if-modified-since")
+    if since and last_modified is not None:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def accepted_encodings(request: Request) -> Set[str]:
+    """Accept-Encoding 中可接受（q > 0）的内容编码"""
+    accepted = set()
+    for item in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        match = _Q_PATTERN.match(params.strip().replace(" ", ""))
+        try:
+            if match and float(match.group(1)) <= 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(name)
+    return accepted
+
+
+def not_modified(etag: str, cache_control: Optional[str] = None) -> Response:
+    """304 响应"""
+    headers = {"ETag": etag}
+    if cache_control:
+        headers["Cache-Control"] = cache_control
+    return Response(status_code=304, headers=headers)
+
+
+def _parse_range(header: str, size: int) -> Optional[tuple]:
+    """
+    解析单段 Range 头
+
+    Returns:
+        (start, end)（含 end）；不支持的格式返回 None（按完整响应处理）；
+        范围无法满足时返回 ()
+    """
+    match = _RANGE_PATTERN.match(header.strip())
+    if not match:
+        return None
+    start_text, end_text = match.groups()
+    if not start_text and not end_text:
+        return None
+    if not start_text:
+        # 后缀范围：最后 N 字节
+        length = int(end_text)
+        if length == 0:
+            return ()
+        return max(0, size - length), size - 1
+    start = int(start_text)
+    end = min(int(end_text), size - 1) if end_text else size - 1
+    if start >= size or start > end:
+        return ()
+    return start, end
+
+
+def bytes_response(
+    request: Request,
+    data: bytes,
+    media_type: str,
+    etag: str,
+    cache_control: Optional[str] = None,
+    headers: Optional[dict] = None
+) -> Response:
+    """
+    返回内存中的数据，支持 If-None-Match（304）和单段 Range（206）
+
+    Args:
+        request: 当前请求
+        data: 完整内容
+        media_type: MIME 类型
+        etag: 内容的 ETag
+        cache_control: Cache-Control 头
+        headers: 附加响应头（如 Vary）
+
+    Returns:
+        Response
+    """
+    if etag_matches(request, etag):
+        return not_modified(etag, cache_control)
+
+    headers = {**(headers or {}), "ETag": etag, "Accept-Ranges": "bytes"}
+    if cache_control:
+        headers["Cache-Control"] = cache_control
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range == etag):
+        size = len(data)
+        parsed = _parse_range(range_header, size)
+        if parsed == ():
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+        if parsed is not None:
+            start, end = parsed
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            return Response(
+                content=data[start:end + 1],
+                status_code=206,
+                media_type=media_type,
+                headers=headers
+            )
+
+    return Response(content=data, media_type=media_type, headers=headers)
@@ -8,6 +8,7 @@ from typing import List, Optional
 from urllib.parse import quote
 
 from app.models import Author, Book, BookVersion
+from app.utils.cover_manager import cover_url
 from app.utils.logger import log
 
 
@@ -150,7 +151,7 @@ def build_opds_entry(book: Book, base_url: str, author_name: Optional[str] = Non
     
     # 构建下载链接
     download_link = f"{base_url}/opds/download/{book.id}"
-    cover_link = f"{base_url}/api/books/{book.id}/cover"
+    cover_link = cover_url(book.id, book.cover_path, f"{base_url}/api")
     
     # 格式化文件大小
     if file_size:
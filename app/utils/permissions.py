@@ -3,12 +3,23 @@
 提供书库和书籍访问权限验证
 """
 import json
-from typing import Optional
+from typing import Iterable, Optional
 
-from sqlalchemy import select
+from sqlalchemy import and_, exists, false, or_, select, true
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.elements import ColumnElement
 
-from app.models import Book, Library, LibraryPermission, User
+from app.core.access_context import access_context_cache
+from app.models import Book, BookTag, Library, LibraryPermission, User
+from app.utils.logger import log
+
+
+# 年龄分级层级（数值越大内容越成人化）
+RATING_HIERARCHY = {
+    'general': 0,
+    'teen': 1,
+    'adult': 2
+}
 
 
 async def check_library_access(
@@ -31,6 +42,11 @@ async def check_library_access(
     if user.is_admin:
         return True
     
+    # 访问上下文缓存命中时无需查询
+    ctx = access_context_cache.peek(user)
+    if ctx is not None:
+        return library_id in ctx.library_ids
+    
     # 检查书库是否存在
     library = await db.get(Library, library_id)
     if not library:
@@ -69,17 +85,13 @@ async def check_book_access(
     Returns:
         bool: 是否有权限访问
     """
-    # 获取书籍所属书库
-    book = await db.get(Book, book_id)
-    if not book:
-        return False
-    
-    # 检查书库访问权限
-    if not await check_library_access(user, book.library_id, db):
-        return False
-    
-    # 检查内容分级限制
-    return await check_content_rating(user, book, db)
+    # 书库权限、内容分级和屏蔽标签合并为一条查询
+    result = await db.execute(
+        select(Book.id)
+        .where(Book.id == book_id)
+        .where(build_book_access_clause(user))
+    )
+    return result.scalar_one_or_none() is not None
 
 
 async def check_content_rating(
@@ -103,32 +115,135 @@ async def check_content_rating(
         return True
     
     # 检查年龄分级
-    rating_hierarchy = {
-        'general': 0,
-        'teen': 1,
-        'adult': 2
-    }
-    
-    user_limit = rating_hierarchy.get(user.age_rating_limit, 2)
-    book_rating = rating_hierarchy.get(book.age_rating, 0)
+    user_limit = get_rating_limit(user)
+    book_rating = RATING_HIERARCHY.get(book.age_rating, 0)
     
     if book_rating > user_limit:
         return False
     
     # 检查被屏蔽的标签
-    if user.blocked_tags:
-        try:
-            blocked_tag_ids = json.loads(user.blocked_tags)
-            if blocked_tag_ids and book.book_tags:
-                book_tag_ids = [bt.tag_id for bt in book.book_tags]
-                if any(tag_id in blocked_tag_ids for tag_id in book_tag_ids):
-                    return False
-        except (json.JSONDecodeError, TypeError):
-            pass
+    blocked_tag_ids = parse_blocked_tag_ids(user)
+    if blocked_tag_ids and book.book_tags:
+        if any(bt.tag_id in blocked_tag_ids for bt in book.book_tags):
+            return False
     
     return True
 
 
+def get_rating_limit(user: User) -> int:
+    """
+    获取用户的年龄分级上限（RATING_HIERARCHY 中的层级）
+    
+    Args:
+        user: 用户对象
+        
+    Returns:
+        int: 分级层级，未知分级视为最高
+    """
+    ctx = access_context_cache.peek(user)
+    if ctx is not None and ctx.fields.get("age_rating_limit") == user.age_rating_limit:
+        return ctx.rating_limit
+    return RATING_HIERARCHY.get(user.age_rating_limit, 2)
+
+
+def parse_blocked_tag_ids(user: User) -> set[int]:
+    """
+    解析用户屏蔽的标签 ID 集合
+    
+    Args:
+        user: 用户对象
+        
+    Returns:
+        set[int]: 屏蔽的标签 ID，解析失败时返回空集合（非整数的 ID 忽略并记录警告）
+    """
+    if not user.blocked_tags:
+        return set()
+    ctx = access_context_cache.peek(user)
+    if ctx is not None and ctx.blocked_tags == user.blocked_tags:
+        return set(ctx.blocked_tag_ids)
+    try:
+        blocked = json.loads(user.blocked_tags)
+    except (json.JSONDecodeError, TypeError):
+        log.warning(f"用户 {user.id} 的屏蔽标签不是有效的 JSON，已忽略: {user.blocked_tags[:200]!r}")
+        return set()
+    if not isinstance(blocked, list):
+        log.warning(f"用户 {user.id} 的屏蔽标签不是列表，已忽略: {user.blocked_tags[:200]!r}")
+        return set()
+    tag_ids = {tag_id for tag_id in blocked if type(tag_id) is int}
+    invalid = [tag_id for tag_id in blocked if type(tag_id) is not int]
+    if invalid:
+        log.warning(f"用户 {user.id} 的屏蔽标签包含非整数 ID，已忽略: {invalid[:20]!r}")
+    return tag_ids
+
+
+def build_book_access_clause(
+    user: User,
+    library_ids: Optional[Iterable[int]] = None
+) -> ColumnElement[bool]:
+    """
+    将用户权限编译为作用于 Book 的 SQL 条件
+    
+    条件包含三部分：可访问书库、年龄分级上限、不含被屏蔽标签（NOT EXISTS）。
+    语义与 check_library_access + check_content_rating 保持一致，
+    可直接用于 select(Book) 等查询的 where 子句，无需逐本检查。
+    
+    Args:
+        user: 用户对象
+        library_ids: 已知的可访问书库 ID（可选）；未提供时使用子查询计算
+        
+    Returns:
+        ColumnElement[bool]: SQL 条件表达式
+    """
+    # 管理员拥有所有权限且不受分级限制
+    if user.is_admin:
+        return true()
+    
+    conditions = []
+    
+    if library_ids is None:
+        ctx = access_context_cache.peek(user)
+        if ctx is not None:
+            library_ids = ctx.library_ids
+    
+    # 书库访问权限
+    if library_ids is not None:
+        library_ids = list(library_ids)
+        if not library_ids:
+            return false()
+        conditions.append(Book.library_id.in_(library_ids))
+    else:
+        conditions.append(or_(
+            Book.library_id.in_(
+                select(Library.id).where(Library.is_public == True)
+            ),
+            Book.library_id.in_(
+                select(LibraryPermission.library_id)
+                .where(LibraryPermission.user_id == user.id)
+            ),
+        ))
+    
+    # 年龄分级上限（未知分级视为 general，与 check_content_rating 一致）
+    user_limit = get_rating_limit(user)
+    denied_ratings = [
+        rating for rating, level in RATING_HIERARCHY.items() if level > user_limit
+    ]
+    if denied_ratings:
+        conditions.append(or_(
+            Book.age_rating.is_(None),
+            Book.age_rating.notin_(denied_ratings),
+        ))
+    
+    # 屏蔽标签
+    blocked_tag_ids = parse_blocked_tag_ids(user)
+    if blocked_tag_ids:
+        conditions.append(~exists().where(
+            BookTag.book_id == Book.id,
+            BookTag.tag_id.in_(blocked_tag_ids),
+        ))
+    
+    return and_(*conditions)
+
+
 async def get_accessible_library_ids(
     user: User,
     db: AsyncSession
@@ -143,6 +258,11 @@ async def get_accessible_library_ids(
     Returns:
         list[int]: 可访问的书库 ID 列表
     """
+    # 访问上下文缓存命中时无需查询
+    ctx = access_context_cache.peek(user)
+    if ctx is not None:
+        return list(ctx.library_ids)
+    
     # 管理员可访问所有书库
     if user.is_admin:
         result = await db.execute(select(Library.id))
@@ -183,10 +303,15 @@ async def filter_books_by_access(
     Returns:
         list[int]: 用户有权访问的书籍 ID 列表
     """
-    accessible_ids = []
+    if not book_ids:
+        return []
     
-    for book_id in book_ids:
-        if await check_book_access(user, book_id, db):
-            accessible_ids.append(book_id)
+    result = await db.execute(
+        select(Book.id)
+        .where(Book.id.in_(book_ids))
+        .where(build_book_access_clause(user))
+    )
+    accessible = {row[0] for row in result.all()}
     
-    return accessible_ids
+    # 保持输入顺序
+    return [book_id for book_id in book_ids if book_id in accessible]
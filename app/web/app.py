@@ -10,8 +10,14 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
 from app.config import settings
-from app.database import init_database
+from app.database import dispose_engines, init_database
+from app.core.search_index import init_search_index
 from app.core.scheduler import backup_scheduler
+from app.core.txt_cache_builder import txt_cache_builder
+from app.core.comic_pages import comic_page_server
+from app.core.cover_renditions import cover_renditions
+from app.core.db_writer import db_writer
+from app.core.progress_buffer import progress_buffer
 from app.bot.bot import telegram_bot
 from app.utils.logger import log
 
@@ -29,6 +35,9 @@ async def lifespan(app: FastAPI):
     await init_database()
     log.info("数据库初始化完成")
     
+    # 初始化全文搜索索引
+    await init_search_index()
+    
     # 启动定时备份调度器
     await backup_scheduler.start()
     log.info("定时备份调度器已启动")
@@ -53,6 +62,18 @@ async def lifespan(app: FastAPI):
     await backup_scheduler.shutdown()
     log.info("定时备份调度器已关闭")
     
+    # 关闭 TXT 缓存构建线程池
+    txt_cache_builder.shutdown()
+    
+    # 关闭漫画预取线程池、打开的压缩包和封面渲染进程池
+    comic_page_server.shutdown()
+    cover_renditions.shutdown()
+    
+    # 写入缓冲中的阅读进度，提交写入队列中剩余的任务并关闭连接池
+    await progress_buffer.close()
+    await db_writer.close()
+    await dispose_engines()
+    
     log.info("应用已关闭")
 
 
@@ -25,6 +25,7 @@ from app.security import hash_password, decode_access_token
 from app.utils.filename_analyzer import FilenameAnalyzer
 from app.utils.logger import log
 from app.core.backup import backup_manager
+from app.core.library_stats import mark_libraries_changed
 
 router = APIRouter()
 
@@ -352,9 +353,12 @@ async def delete_user(
     if user.id == current_user.id:
         raise HTTPException(status_code=400, detail="不能删除自己的账户")
     
+    from app.core.credential_cache import opds_credential_cache
+
     username = user.username
     await db.delete(user)
     await db.commit()
+    opds_credential_cache.invalidate_user(user_id)
     
     log.info(f"管理员 {current_user.username} 删除了用户: {username}")
     
@@ -379,8 +383,11 @@ async def reset_user_password(
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
     
+    from app.core.credential_cache import opds_credential_cache
+
     user.password_hash = hash_password(password_data.new_password)
     await db.commit()
+    opds_credential_cache.invalidate_user(user_id)
     
     log.info(f"管理员 {current_user.username} 重置了用户 {user.username} 的密码")
     
@@ -856,6 +863,7 @@ async def apply_library_content_rating_to_books(
     )
     
     updated_count = result.rowcount
+    await mark_libraries_changed(db, [library_id])
     await db.commit()
     
     log.info(
@@ -1295,7 +1303,17 @@ async def batch_extract_covers(
     """
     批量提取缺失的封面（管理员）
     可选择指定书库，否则处理所有书籍
+    已有封面的书籍在后台预生成多尺寸封面（跳过已生成的）
     """
+    from app.core.cover_renditions import cover_renditions
+    
+    # 已有封面的书籍：后台预生成多尺寸封面
+    cover_query = select(Book.cover_path).where(Book.cover_path.isnot(None))
+    if library_id:
+        cover_query = cover_query.where(Book.library_id == library_id)
+    cover_paths = (await db.execute(cover_query)).scalars().all()
+    cover_renditions.schedule_pregenerate(cover_paths)
+    
     # 查询没有封面的书籍
     query = select(Book).where(Book.cover_path.is_(None))
     
@@ -1306,7 +1324,11 @@ async def batch_extract_covers(
     books = result.scalars().all()
     
     if not books:
-        return {"message": "没有需要提取封面的书籍", "count": 0}
+        return {
+            "message": "没有需要提取封面的书籍",
+            "count": 0,
+            "rendition_queued": len(cover_paths)
+        }
     
     # 这里应该使用后台任务处理，暂时返回统计
     count = len(books)
@@ -1316,6 +1338,7 @@ async def batch_extract_covers(
     return {
         "message": f"已加入队列，将处理 {count} 本书",
         "count": count,
+        "rendition_queued": len(cover_paths),
         "note": "批量提取功能需要后台任务支持，当前仅返回统计"
     }
 
@@ -1379,6 +1402,139 @@ async def cleanup_orphaned_covers(
     }
 
 
+# ==================== 搜索索引 API ====================
+
+@router.post("/admin/search/rebuild")
+async def rebuild_search_index_endpoint(
+    current_user: User = Depends(admin_required)
+):
+    """
+    全量重建全文搜索索引（管理员）
+    """
+    from app.core.search_index import is_available, rebuild_search_index
+
+    if not is_available():
+        raise HTTPException(status_code=400, detail="当前数据库不支持全文索引")
+
+    count = await rebuild_search_index()
+    log.info(f"管理员 {current_user.username} 重建了搜索索引，共 {count} 本书")
+    return {"message": f"已重建 {count} 本书籍的索引", "count": count}
+
+
+# ==================== 阅读缓存 API ====================
+
+class ReaderCachePrewarmRequest(BaseModel):
+    """预热阅读缓存请求"""
+    library_id: Optional[int] = None
+    book_ids: Optional[List[int]] = None
+
+
+# 预热任务状态（同一时间只允许一个预热任务）
+_reader_cache_prewarm: dict = {"running": False, "total": 0, "done": 0, "ready": 0, "failed": 0}
+
+
+async def _run_reader_cache_prewarm(file_paths: List[str]):
+    """逐批预热 TXT 阅读缓存，批大小与构建线程池并发数一致"""
+    import asyncio
+    from app.core.txt_cache_builder import txt_cache_builder
+    from app.web.routes.reader import prewarm_txt_cache
+
+    state = _reader_cache_prewarm
+    batch_size = txt_cache_builder.max_workers
+    try:
+        for i in range(0, len(file_paths), batch_size):
+            batch = [Path(p) for p in file_paths[i:i + batch_size] if Path(p).exists()]
+            results = await asyncio.gather(*(prewarm_txt_cache(p) for p in batch))
+            state["ready"] += sum(1 for ok in results if ok)
+            state["failed"] += sum(1 for ok in results if not ok)
+            state["done"] = min(state["total"], i + batch_size)
+    finally:
+        state["running"] = False
+        log.info(
+            f"TXT阅读缓存预热完成: 共 {state['total']} 个文件, "
+            f"成功 {state['ready']}, 失败 {state['failed']}"
+        )
+
+
+@router.get("/admin/reader-cache/status")
+async def get_reader_cache_status(
+    current_user: User = Depends(admin_required)
+):
+    """
+    查询 TXT 阅读缓存构建状态（管理员）
+    """
+    from app.core.txt_cache_builder import txt_cache_builder
+
+    return {
+        "builder": txt_cache_builder.get_status(),
+        "prewarm": dict(_reader_cache_prewarm),
+    }
+
+
+@router.get("/admin/database/status")
+async def get_database_status(
+    current_user: User = Depends(admin_required),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    查询数据库并发状态（管理员）
+    包括 SQLite 日志模式、写入队列深度、写锁等待和阅读进度缓冲统计
+    """
+    from sqlalchemy import text
+    from app.core.db_writer import db_writer
+    from app.core.progress_buffer import progress_buffer
+    from app.database import IS_SQLITE, write_gate
+
+    journal_mode = None
+    if IS_SQLITE:
+        journal_mode = (await db.execute(text("PRAGMA journal_mode"))).scalar()
+
+    return {
+        "journal_mode": journal_mode,
+        "writer": db_writer.get_status(),
+        "progress_buffer": progress_buffer.get_status(),
+        "write_gate": write_gate.get_status(),
+    }
+
+
+@router.post("/admin/reader-cache/prewarm")
+async def prewarm_reader_cache(
+    request: ReaderCachePrewarmRequest,
+    current_user: User = Depends(admin_required),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    预热 TXT 阅读缓存（管理员）
+    可按书库或书籍ID筛选，不指定则预热全部 TXT 书籍
+    """
+    import asyncio
+
+    if _reader_cache_prewarm["running"]:
+        raise HTTPException(status_code=409, detail="已有正在进行的预热任务")
+
+    query = (
+        select(BookVersion.file_path)
+        .join(Book, BookVersion.book_id == Book.id)
+        .where(func.lower(BookVersion.file_format).in_(["txt", ".txt"]))
+        .distinct()
+    )
+    if request.library_id is not None:
+        query = query.where(Book.library_id == request.library_id)
+    if request.book_ids:
+        query = query.where(Book.id.in_(request.book_ids))
+
+    result = await db.execute(query)
+    file_paths = [row[0] for row in result.all()]
+    if not file_paths:
+        return {"message": "没有需要预热的TXT书籍", "total": 0}
+
+    _reader_cache_prewarm.update(running=True, total=len(file_paths), done=0, ready=0, failed=0)
+    asyncio.create_task(_run_reader_cache_prewarm(file_paths))
+
+    log.info(f"管理员 {current_user.username} 启动了TXT阅读缓存预热，共 {len(file_paths)} 个文件")
+    return {"message": f"已开始预热 {len(file_paths)} 个TXT文件的阅读缓存", "total": len(file_paths)}
+
+
 # ==================== 备份管理 API ====================
 
 class BackupCreateRequest(BaseModel):
@@ -54,6 +54,9 @@ class ScanTaskResponse(BaseModel):
     processed_files: int
     added_books: int
     skipped_books: int
+    unchanged_files: int = 0
+    updated_files: int = 0
+    missing_files: int = 0
     error_count: int
     error_message: Optional[str]
     error_details: Optional[List[dict]] = None
@@ -432,6 +435,9 @@ async def get_library_scan_tasks(
             "processed_files": task.processed_files,
             "added_books": task.added_books,
             "skipped_books": task.skipped_books,
+            "unchanged_files": task.unchanged_files or 0,
+            "updated_files": task.updated_files or 0,
+            "missing_files": task.missing_files or 0,
             "error_count": task.error_count,
             "error_message": task.error_message,
             "error_details": error_details if isinstance(error_details, list) else None,
@@ -519,6 +525,9 @@ async def list_all_scan_tasks(
             "processed_files": task.processed_files,
             "added_books": task.added_books,
             "skipped_books": task.skipped_books,
+            "unchanged_files": task.unchanged_files or 0,
+            "updated_files": task.updated_files or 0,
+            "missing_files": task.missing_files or 0,
             "error_count": task.error_count,
             "error_message": task.error_message,
             "started_at": task.started_at.isoformat() if task.started_at else None,
@@ -11,6 +11,7 @@ from sqlalchemy import select, or_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload
 
+from app.core import search_index
 from app.database import get_db
 from app.models import (
     Book,
@@ -22,7 +23,7 @@ from app.models import (
     Author,
     BookVersion,
 )
-from app.utils.permissions import check_book_access, get_accessible_library_ids
+from app.utils.permissions import build_book_access_clause, get_accessible_library_ids
 from app.web.routes.auth import get_current_user
 from app.core.ai.config import ai_config
 from app.core.ai.service import get_ai_service
@@ -132,23 +133,9 @@ def _score_book_by_preferences(
     return tag_score * 2.0 + author_score
 
 
-async def _filter_accessible_books(
-    current_user: User,
-    books: Iterable[Book],
-    db: AsyncSession,
-) -> List[Book]:
-    accessible: List[Book] = []
-    for book in books:
-        if await check_book_access(current_user, book.id, db):
-            accessible.append(book)
-    return accessible
-
-
-async def _build_list_from_books(
+def _build_list_from_books(
     title: str,
     books: Iterable[Book],
-    current_user: User,
-    db: AsyncSession,
     limit: int,
     description: Optional[str] = None,
     score_fn: Optional[Any] = None,
@@ -158,8 +145,6 @@ async def _build_list_from_books(
     for book in books:
         if len(items) >= limit:
             break
-        if not await check_book_access(current_user, book.id, db):
-            continue
         score = score_fn(book) if score_fn else 0.0
         items.append(_book_to_item(book, score))
 
@@ -308,7 +293,7 @@ async def get_recommendations(
     if not seed_book_ids:
         query = (
             select(Book)
-            .where(Book.library_id.in_(accessible_library_ids))
+            .where(build_book_access_clause(current_user, accessible_library_ids))
             .options(joinedload(Book.author), joinedload(Book.versions))
             .order_by(Book.added_at.desc())
             .limit(limit)
@@ -317,8 +302,6 @@ async def get_recommendations(
         books = result.unique().scalars().all()
         response_items = []
         for book in books:
-            if not await check_book_access(current_user, book.id, db):
-                continue
             primary = _get_primary_version(book)
             response_items.append(
                 RecommendationItem(
@@ -345,7 +328,7 @@ async def get_recommendations(
 
     query = (
         select(Book)
-        .where(Book.library_id.in_(accessible_library_ids))
+        .where(build_book_access_clause(current_user, accessible_library_ids))
         .options(
             joinedload(Book.author),
             joinedload(Book.book_tags).joinedload(BookTag.tag),
@@ -372,8 +355,6 @@ async def get_recommendations(
 
     recommendations: List[RecommendationItem] = []
     for book in candidate_books:
-        if not await check_book_access(current_user, book.id, db):
-            continue
         primary = _get_primary_version(book)
         book_tag_ids = {bt.tag_id for bt in book.book_tags}
         tag_score = len(book_tag_ids & tag_ids)
@@ -465,17 +446,11 @@ async def chat_search(
         joinedload(Book.book_tags).joinedload(BookTag.tag),
         joinedload(Book.versions),
     )
-    query = query.where(Book.library_id.in_(accessible_library_ids))
+    query = query.where(build_book_access_clause(current_user, accessible_library_ids))
 
+    rank = None
     if keywords:
-        search_term = f"%{keywords}%"
-        query = query.outerjoin(Author, Book.author_id == Author.id)
-        query = query.where(
-            or_(
-                Book.title.like(search_term),
-                Author.name.like(search_term),
-            )
-        )
+        query, rank = search_index.apply_book_search(query, keywords)
 
     if author_name:
         author_result = await db.execute(
@@ -498,14 +473,13 @@ async def chat_search(
     if tags:
         query = query.outerjoin(BookTag).outerjoin(Tag).where(Tag.name.in_(tags))
 
-    query = query.order_by(Book.added_at.desc()).limit(request.limit * 3)
+    if rank is not None:
+        query = query.order_by(rank, Book.added_at.desc())
+    else:
+        query = query.order_by(Book.added_at.desc())
+    query = query.limit(request.limit * 3)
     result = await db.execute(query)
-    all_books = result.unique().scalars().all()
-
-    filtered_books = []
-    for book in all_books:
-        if await check_book_access(current_user, book.id, db):
-            filtered_books.append(book)
+    filtered_books = result.unique().scalars().all()
 
     response_books = []
     for book in filtered_books[: request.limit]:
@@ -584,7 +558,7 @@ async def generate_reading_lists(
 
     query = (
         select(Book)
-        .where(Book.library_id.in_(accessible_library_ids))
+        .where(build_book_access_clause(current_user, accessible_library_ids))
         .options(
             joinedload(Book.author),
             joinedload(Book.book_tags).joinedload(BookTag.tag),
@@ -627,24 +601,20 @@ async def generate_reading_lists(
 
     if theme_keyword and themed_candidates:
         lists.append(
-            await _build_list_from_books(
+            _build_list_from_books(
                 title=f"主题精选：{request.theme}",
                 description="根据你的主题关键词筛选",
                 books=themed_candidates,
-                current_user=current_user,
-                db=db,
                 limit=limit,
             )
         )
 
     if preferred_tag_names or preferred_author_ids:
         lists.append(
-            await _build_list_from_books(
+            _build_list_from_books(
                 title="你的偏好推荐",
                 description="根据收藏与阅读偏好生成",
                 books=candidates,
-                current_user=current_user,
-                db=db,
                 limit=limit,
                 score_fn=lambda book: _score_book_by_preferences(
                     book, preferred_tag_names, preferred_author_ids
@@ -653,12 +623,10 @@ async def generate_reading_lists(
         )
 
     lists.append(
-        await _build_list_from_books(
+        _build_list_from_books(
             title="最新入库",
             description="最近新增的书籍",
             books=candidates,
-            current_user=current_user,
-            db=db,
             limit=limit,
         )
     )
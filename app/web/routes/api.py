@@ -3,16 +3,19 @@ API路由
 提供REST API接口
 """
 import asyncio
+import base64
+import json
 from datetime import datetime, timezone, timedelta, date
 from pathlib import Path
 from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from pydantic import BaseModel
-from sqlalchemy import func, select, and_, cast, Date
+from sqlalchemy import case, func, select, and_, or_, cast, Date
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import aliased, joinedload
 
+from app.core import reading_stats, search_index
 from app.core.scanner import Scanner
 from app.core.conversion.ebook_convert import (
     get_cached_conversion_path,
@@ -23,12 +26,16 @@ from app.core.conversion.ebook_convert import (
 from app.core.kindle_mailer import send_to_kindle
 from app.core.kindle_settings import load_kindle_settings
 from app.core.websocket import manager
-from app.database import get_db
-from app.models import Author, Book, Library, ReadingProgress, ReadingSession, User
+from app.core.progress_buffer import progress_buffer
+from app.database import get_db, get_read_db
+from app.models import (
+    Author, Book, BookTag, BookVersion, Library, ReadingProgress, ReadingSession, ReadingStatsDaily, User
+)
 from app.web.routes.auth import get_current_admin, get_current_user
 from app.web.routes.dependencies import get_accessible_book, get_accessible_library
+from app.utils.cover_manager import cover_url
 from app.utils.logger import log
-from app.utils.permissions import check_book_access, get_accessible_library_ids
+from app.utils.permissions import build_book_access_clause, check_book_access, get_accessible_library_ids
 
 router = APIRouter()
 
@@ -146,6 +153,52 @@ class SearchSuggestion(BaseModel):
     id: int
 
 
+# ===== 分页辅助 =====
+
+# 支持游标分页的排序方式（排序键 + Book.id 唯一确定位置）
+_KEYSET_SORTS = {"added_at_desc", "added_at_asc", "title_asc", "title_desc"}
+
+
+def _primary_version_id_subquery():
+    """
+    书籍主版本 ID 的关联子查询
+    与 Python 端逻辑一致：优先 is_primary，否则取最早的版本
+    """
+    return (
+        select(BookVersion.id)
+        .where(BookVersion.book_id == Book.id)
+        .order_by(BookVersion.is_primary.desc(), BookVersion.id.asc())
+        .limit(1)
+        .correlate(Book)
+        .scalar_subquery()
+    )
+
+
+def _encode_book_cursor(book: Book, sort: str) -> str:
+    """将最后一条记录的排序键编码为游标"""
+    if sort.startswith("added_at"):
+        value = book.added_at.isoformat() if book.added_at else None
+    else:
+        value = book.title
+    raw = json.dumps([value, book.id], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _decode_book_cursor(cursor: str, sort: str):
+    """解析游标，返回 (排序键, book_id)，无效时返回 None"""
+    try:
+        value, book_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if not isinstance(book_id, int) or value is None:
+            return None
+        if sort.startswith("added_at"):
+            value = datetime.fromisoformat(value)
+        elif not isinstance(value, str):
+            return None
+        return value, book_id
+    except (ValueError, TypeError):
+        return None
+
+
 # ===== 书库管理 =====
 
 @router.get("/libraries", response_model=List[LibraryResponse])
@@ -352,6 +405,7 @@ async def delete_library(
 async def list_books(
     page: int = Query(1, ge=1),
     limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="游标分页（上一页返回的 next_cursor），仅支持按添加时间/书名排序，其他排序返回 400"),
     author_id: Optional[int] = None,
     author_ids: Optional[str] = Query(None, description="按作者筛选（逗号分隔的作者ID）"),
     library_id: Optional[int] = None,
@@ -383,236 +437,192 @@ async def list_books(
     - size_desc/asc: 按文件大小排序
     - format_asc/desc: 按格式排序
     - rating_asc/desc: 按分级排序
+    分页：
+    - page/limit: 偏移分页
+    - cursor: 游标分页（仅 added_at_*/title_* 排序可用，其他排序传入时返回 400），深翻页开销与首页一致
+    所有筛选、排序与分页均在 SQL 中完成，单次请求内存占用与书库规模无关
     """
+    empty_response = {
+        "books": [],
+        "total": 0,
+        "page": page,
+        "limit": limit,
+        "total_pages": 0,
+        "next_cursor": None,
+    }
+
     # 获取用户可访问的书库ID列表
     accessible_library_ids = await get_accessible_library_ids(current_user, db)
     
     if not accessible_library_ids:
-        return {
-            "books": [],
-            "total": 0,
-            "page": page,
-            "limit": limit,
-            "total_pages": 0
-        }
-    
-    # 构建查询，只包含可访问书库的书籍，并加载主版本
-    query = select(Book).options(
-        joinedload(Book.author),
-        joinedload(Book.book_tags),
-        joinedload(Book.versions)
-    )
-    query = query.where(Book.library_id.in_(accessible_library_ids))
+        return empty_response
+
+    # 主版本（is_primary 优先，其次最早的版本）
+    primary_version = aliased(BookVersion)
+    primary_join = primary_version.id == _primary_version_id_subquery()
+
+    conditions = [build_book_access_clause(current_user, accessible_library_ids)]
     
     if author_id:
-        query = query.where(Book.author_id == author_id)
+        conditions.append(Book.author_id == author_id)
 
     if author_ids:
         try:
             author_id_list = [int(a.strip()) for a in author_ids.split(',') if a.strip()]
             if author_id_list:
-                query = query.where(Book.author_id.in_(author_id_list))
+                conditions.append(Book.author_id.in_(author_id_list))
         except ValueError as e:
             log.error(f"作者筛选解析错误: {e}")
 
     if library_id:
         # 确保请求的书库在可访问列表中
         if library_id not in accessible_library_ids:
-            return {
-                "books": [],
-                "total": 0,
-                "page": page,
-                "limit": limit,
-                "total_pages": 0
-            }
-        query = query.where(Book.library_id == library_id)
+            return empty_response
+        conditions.append(Book.library_id == library_id)
 
     if age_ratings:
         rating_list = [r.strip().lower() for r in age_ratings.split(',') if r.strip()]
         if rating_list:
-            query = query.where(func.lower(Book.age_rating).in_(rating_list))
+            conditions.append(func.lower(Book.age_rating).in_(rating_list))
 
     if added_from:
-        query = query.where(cast(Book.added_at, Date) >= added_from)
+        conditions.append(cast(Book.added_at, Date) >= added_from)
 
     if added_to:
-        query = query.where(cast(Book.added_at, Date) <= added_to)
+        conditions.append(cast(Book.added_at, Date) <= added_to)
     
     # 按格式筛选
     if formats:
-        from app.models import BookVersion
-        from sqlalchemy import or_, func
         format_list = [f.strip().lower() for f in formats.split(',') if f.strip()]
         if format_list:
             # 处理带点和不带点的格式（如 txt 和 .txt）
             # 数据库可能存储为 .txt 或 txt，需要兼容
-            format_conditions = []
+            format_values = set()
             for fmt in format_list:
-                # 不带点的格式
-                format_conditions.append(func.lower(BookVersion.file_format) == fmt.lower())
-                # 带点的格式
-                format_conditions.append(func.lower(BookVersion.file_format) == f".{fmt}".lower())
+                format_values.add(fmt)
+                format_values.add(f".{fmt}")
             
             # 子查询：找到有匹配格式版本的书籍ID
             subquery = select(BookVersion.book_id).where(
-                or_(*format_conditions)
-            ).distinct()
-            query = query.where(Book.id.in_(subquery))
+                func.lower(BookVersion.file_format).in_(format_values)
+            )
+            conditions.append(Book.id.in_(subquery))
     
     # 按标签筛选（AND逻辑：必须同时包含所有选中标签）
     if tag_ids:
-        from app.models import BookTag
         try:
             tag_id_list = [int(t.strip()) for t in tag_ids.split(',') if t.strip()]
             if tag_id_list:
-                # 先查询符合条件的书籍ID列表
                 if len(tag_id_list) == 1:
                     # 单个标签：简单的IN查询
                     tag_subquery = select(BookTag.book_id).where(
                         BookTag.tag_id == tag_id_list[0]
-                    ).distinct()
-                    
-                    # 执行子查询
-                    tag_book_result = await db.execute(tag_subquery)
-                    tag_book_ids = [row[0] for row in tag_book_result.fetchall()]
+                    )
                 else:
                     # 多个标签：使用 group by + having count 确保必须包含所有标签
-                    # 使用 DISTINCT COUNT 确保正确计数
                     tag_subquery = select(BookTag.book_id).where(
                         BookTag.tag_id.in_(tag_id_list)
                     ).group_by(BookTag.book_id).having(
                         func.count(func.distinct(BookTag.tag_id)) >= len(tag_id_list)
                     )
-                    
-                    # 执行子查询
-                    tag_book_result = await db.execute(tag_subquery)
-                    tag_book_ids = [row[0] for row in tag_book_result.fetchall()]
-                
-                if tag_book_ids:
-                    query = query.where(Book.id.in_(tag_book_ids))
-                else:
-                    # 没有匹配的书籍，直接返回空结果
-                    return {
-                        "books": [],
-                        "total": 0,
-                        "page": page,
-                        "limit": limit,
-                        "total_pages": 0
-                    }
+                conditions.append(Book.id.in_(tag_subquery))
         except ValueError as e:
             log.error(f"标签筛选解析错误: {e}")
-        except Exception as e:
-            log.error(f"标签筛选查询错误: {e}")
-    
-    # 应用排序
-    # 对于需要 BookVersion 的排序（size, format），在内存中处理
-    db_sort_applied = False
-    if sort:
-        sort_lower = sort.lower()
-        if sort_lower == "added_at_desc":
-            query = query.order_by(Book.added_at.desc())
-            db_sort_applied = True
-        elif sort_lower == "added_at_asc":
-            query = query.order_by(Book.added_at.asc())
-            db_sort_applied = True
-        elif sort_lower == "title_asc":
-            query = query.order_by(Book.title.asc())
-            db_sort_applied = True
-        elif sort_lower == "title_desc":
-            query = query.order_by(Book.title.desc())
-            db_sort_applied = True
-        elif sort_lower == "rating_asc":
-            query = query.order_by(Book.age_rating.asc())
-            db_sort_applied = True
-        elif sort_lower == "rating_desc":
-            query = query.order_by(Book.age_rating.desc())
-            db_sort_applied = True
-        # size_asc/desc 和 format_asc/desc 需要在获取数据后排序
-    
-    if not db_sort_applied:
-        query = query.order_by(Book.added_at.desc())
-    
-    # 获取所有符合条件的书籍（使用unique()去重，因为有joinedload关联）
-    result = await db.execute(query)
-    all_books = result.unique().scalars().all()
-    
-    # 应用内容分级过滤
-    filtered_books = []
-    for book in all_books:
-        if await check_book_access(current_user, book.id, db):
-            filtered_books.append(book)
-    
-    # 内存中排序（对于需要 BookVersion 的排序）
-    if sort:
-        sort_lower = sort.lower()
-        
-        def get_primary_version(book):
-            """获取书籍的主版本"""
-            if book.versions:
-                primary = next((v for v in book.versions if v.is_primary), None)
-                if not primary:
-                    primary = book.versions[0] if book.versions else None
-                return primary
-            return None
-        
-        if sort_lower == "size_desc":
-            filtered_books.sort(key=lambda b: (get_primary_version(b).file_size if get_primary_version(b) else 0), reverse=True)
-        elif sort_lower == "size_asc":
-            filtered_books.sort(key=lambda b: (get_primary_version(b).file_size if get_primary_version(b) else 0))
-        elif sort_lower == "format_asc":
-            filtered_books.sort(key=lambda b: (get_primary_version(b).file_format if get_primary_version(b) else ""))
-        elif sort_lower == "format_desc":
-            filtered_books.sort(key=lambda b: (get_primary_version(b).file_format if get_primary_version(b) else ""), reverse=True)
-    
+
     # 按文件大小过滤（主版本）
-    if min_size is not None or max_size is not None:
-        def in_size_range(book):
-            primary_version = None
-            if book.versions:
-                primary_version = next((v for v in book.versions if v.is_primary), None)
-                if not primary_version:
-                    primary_version = book.versions[0] if book.versions else None
-            size = primary_version.file_size if primary_version else 0
-            if min_size is not None and size < min_size:
-                return False
-            if max_size is not None and size > max_size:
-                return False
-            return True
-
-        filtered_books = [book for book in filtered_books if in_size_range(book)]
-
-    # 计算总数和分页
-    total_count = len(filtered_books)
+    primary_size = func.coalesce(primary_version.file_size, 0)
+    needs_primary_join = min_size is not None or max_size is not None
+    if min_size is not None:
+        conditions.append(primary_size >= min_size)
+    if max_size is not None:
+        conditions.append(primary_size <= max_size)
+
+    # 应用排序（Book.id 作为次级排序键，保证分页稳定）
+    sort_lower = (sort or "added_at_desc").lower()
+    primary_format = func.coalesce(primary_version.file_format, "")
+    sort_columns = {
+        "added_at_desc": (Book.added_at, True),
+        "added_at_asc": (Book.added_at, False),
+        "title_asc": (Book.title, False),
+        "title_desc": (Book.title, True),
+        "rating_asc": (Book.age_rating, False),
+        "rating_desc": (Book.age_rating, True),
+        "size_desc": (primary_size, True),
+        "size_asc": (primary_size, False),
+        "format_asc": (primary_format, False),
+        "format_desc": (primary_format, True),
+    }
+    if sort_lower not in sort_columns:
+        sort_lower = "added_at_desc"
+    sort_column, descending = sort_columns[sort_lower]
+    keyset_supported = sort_lower in _KEYSET_SORTS
+    if cursor and not keyset_supported:
+        raise HTTPException(status_code=400, detail="该排序方式不支持游标分页，请使用 page 分页")
+
+    # 总数（仅在需要主版本时才关联版本表）
+    count_query = select(func.count(Book.id))
+    if needs_primary_join:
+        count_query = count_query.outerjoin(primary_version, primary_join)
+    total_count = (await db.execute(count_query.where(*conditions))).scalar() or 0
     total_pages = (total_count + limit - 1) // limit if total_count > 0 else 0
-    start_idx = (page - 1) * limit
-    end_idx = start_idx + limit
-    paginated_books = filtered_books[start_idx:end_idx]
+
+    query = (
+        select(Book, primary_version)
+        .outerjoin(primary_version, primary_join)
+        .options(joinedload(Book.author))
+        .where(*conditions)
+    )
+
+    if descending:
+        query = query.order_by(sort_column.desc(), Book.id.desc())
+    else:
+        query = query.order_by(sort_column.asc(), Book.id.asc())
+
+    if cursor:
+        cursor_values = _decode_book_cursor(cursor, sort_lower)
+        if cursor_values is None:
+            raise HTTPException(status_code=400, detail="无效的分页游标")
+        last_value, last_id = cursor_values
+        if descending:
+            query = query.where(or_(
+                sort_column < last_value,
+                and_(sort_column == last_value, Book.id < last_id),
+            ))
+        else:
+            query = query.where(or_(
+                sort_column > last_value,
+                and_(sort_column == last_value, Book.id > last_id),
+            ))
+    else:
+        query = query.offset((page - 1) * limit)
+
+    result = await db.execute(query.limit(limit))
+    rows = result.all()
     
     # 手动构建响应
     books_data = []
-    for book in paginated_books:
-        # 获取主版本或第一个版本
-        primary_version = None
-        if book.versions:
-            primary_version = next((v for v in book.versions if v.is_primary), None)
-            if not primary_version:
-                primary_version = book.versions[0] if book.versions else None
-        
+    for book, version in rows:
         books_data.append({
             "id": book.id,
             "title": book.title,
             "author_name": book.author.name if book.author else None,
-            "file_format": primary_version.file_format if primary_version else "unknown",
-            "file_size": primary_version.file_size if primary_version else 0,
+            "file_format": version.file_format if version else "unknown",
+            "file_size": version.file_size if version else 0,
             "added_at": book.added_at.isoformat(),
+            "cover_url": cover_url(book.id, book.cover_path),
         })
+
+    next_cursor = None
+    if keyset_supported and len(rows) == limit:
+        next_cursor = _encode_book_cursor(rows[-1][0], sort_lower)
     
     return {
         "books": books_data,
         "total": total_count,
         "page": page,
         "limit": limit,
-        "total_pages": total_pages
+        "total_pages": total_pages,
+        "next_cursor": next_cursor,
     }
 
 
@@ -1008,6 +1018,9 @@ async def update_book_tags(
             book_tag = BookTag(book_id=book_id, tag_id=tag_id)
             db.add(book_tag)
     
+    # 批量删除绕过了 ORM，需要手动刷新搜索索引
+    await db.flush()
+    await search_index.reindex_books(db, [book_id])
     await db.commit()
     
     # 返回更新后的标签列表
@@ -1026,7 +1039,7 @@ async def update_book_tags(
 @router.get("/authors", response_model=List[AuthorResponse])
 async def list_authors(
     min_books: int = Query(1, ge=0, description="最少书籍数量过滤"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -1069,17 +1082,41 @@ async def list_authors(
 @router.get("/progress/{book_id}")
 async def get_progress(
     book_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取阅读进度"""
+    return await _current_progress(db, current_user.id, book_id)
+
+
+async def _current_progress(db: AsyncSession, user_id: int, book_id: int) -> dict:
+    """库中的阅读进度叠加进度缓冲中尚未写入的值"""
     result = await db.execute(
         select(ReadingProgress)
-        .where(ReadingProgress.user_id == current_user.id)
+        .where(ReadingProgress.user_id == user_id)
         .where(ReadingProgress.book_id == book_id)
     )
     progress = result.scalar_one_or_none()
-    
+    # 叠加尚未写入数据库的进度
+    pending = progress_buffer.peek(user_id, book_id)
+    
+    if pending is not None:
+        value = pending.progress
+        if pending.progress_is_floor and progress is not None:
+            value = max(progress.progress or 0.0, value)
+        position = pending.position
+        if position is None and pending.progress_is_floor and progress is not None:
+            position = progress.position
+        finished = pending.finished
+        if finished is None:
+            finished = progress.finished if progress is not None else False
+        return {
+            "progress": value,
+            "position": position,
+            "finished": finished,
+            "last_read_at": pending.last_read_at.isoformat(),
+        }
+
     if not progress:
         return {"progress": 0.0, "position": None, "finished": False}
     
@@ -1096,41 +1133,23 @@ async def update_progress(
     book_id: int,
     progress_data: ProgressUpdate,
     book: Book = Depends(get_accessible_book),
-    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """更新阅读进度（需要有书籍访问权限）"""
     from datetime import datetime, timezone
     
-    # 查找现有进度
-    result = await db.execute(
-        select(ReadingProgress)
-        .where(ReadingProgress.user_id == current_user.id)
-        .where(ReadingProgress.book_id == book_id)
-    )
-    progress = result.scalar_one_or_none()
-    
     now = datetime.now(timezone.utc)  # 使用带时区的UTC时间
     
-    if progress:
-        # 更新现有进度
-        progress.progress = progress_data.progress
-        progress.position = progress_data.position
-        progress.finished = progress_data.finished
-        progress.last_read_at = now
-    else:
-        # 创建新进度
-        progress = ReadingProgress(
-            user_id=current_user.id,
-            book_id=book_id,
-            progress=progress_data.progress,
-            position=progress_data.position,
-            finished=progress_data.finished,
-            last_read_at=now,
-        )
-        db.add(progress)
-    
-    await db.commit()
+    # 先在内存中合并，由进度缓冲定时批量写入
+    progress_buffer.record_progress(
+        current_user.id,
+        book_id,
+        progress_data.progress,
+        progress_data.position,
+        now,
+        finished=progress_data.finished,
+    )
+    await progress_buffer.flush_if_unbuffered()
 
     # 广播进度更新
     await manager.broadcast_to_user(current_user.id, {
@@ -1150,12 +1169,12 @@ async def update_progress(
 async def search_suggestions(
     q: str = Query(..., min_length=1, description="搜索关键词"),
     limit: int = Query(10, ge=1, le=20),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     获取搜索建议
-    返回匹配的书名和作者名
+    返回匹配的书名和作者名（全文索引前缀匹配）
     """
     if not q.strip():
         return []
@@ -1166,17 +1185,14 @@ async def search_suggestions(
     if not accessible_library_ids:
         return []
     
-    search_term = f"%{q}%"
+    access_clause = build_book_access_clause(current_user, accessible_library_ids)
     suggestions = []
     
-    # 1. 搜索匹配的书籍
-    # 只查询可访问书库中的书籍
-    book_stmt = select(Book.id, Book.title).where(
-        and_(
-            Book.library_id.in_(accessible_library_ids),
-            Book.title.like(search_term)
-        )
-    ).limit(limit)
+    # 1. 搜索匹配的书籍（按相关度排序）
+    book_stmt, rank = search_index.apply_book_search(
+        select(Book.id, Book.title).where(access_clause), q, columns=["title"]
+    )
+    book_stmt = book_stmt.order_by(rank if rank is not None else Book.title).limit(limit)
     
     book_result = await db.execute(book_stmt)
     for row in book_result:
@@ -1190,15 +1206,16 @@ async def search_suggestions(
     if len(suggestions) < limit:
         remaining = limit - len(suggestions)
         
-        # 搜索作者（需要确保作者至少有一本书在用户可访问的书库中）
-        # 这里为了性能简化查询，只查作者名匹配，不严格检查每本书的权限
-        # 但通常作者存在就意味着有书。为了更严谨，可以关联 Book 表检查 library_id
-        author_stmt = select(Author.id, Author.name).join(Book).where(
-            and_(
-                Book.library_id.in_(accessible_library_ids),
-                Author.name.like(search_term)
-            )
-        ).distinct().limit(remaining)
+        # 只返回在用户可访问范围内有书的作者
+        author_book_stmt, _ = search_index.apply_book_search(
+            select(Book.author_id).where(access_clause), q, columns=["author"]
+        )
+        author_stmt = (
+            select(Author.id, Author.name)
+            .where(Author.id.in_(author_book_stmt))
+            .order_by(Author.name)
+            .limit(remaining)
+        )
         
         author_result = await db.execute(author_stmt)
         for row in author_result:
@@ -1225,125 +1242,103 @@ async def search_books(
     """
     搜索书籍
     支持关键词搜索和高级筛选
-    - q: 搜索关键词（书名或作者名）
+    - q: 搜索关键词（书名、作者、简介、标签，按相关度排序）
     - author_id: 按作者ID筛选
     - formats: 按格式筛选，多个格式用逗号分隔（如'txt,epub,mobi'）
-    - library_id: 按书库ID筛选
+    - library_id: 按书库筛选
     """
+    filters = {
+        "author_id": author_id,
+        "formats": formats,
+        "library_id": library_id
+    }
+    empty_response = {
+        "books": [],
+        "total": 0,
+        "page": page,
+        "limit": limit,
+        "total_pages": 0,
+        "query": q,
+        "filters": filters
+    }
+
     # 如果既没有搜索词也没有筛选条件，返回空结果
     if not q.strip() and not author_id and not formats and not library_id:
-        return {
-            "books": [],
-            "total": 0,
-            "page": page,
-            "limit": limit,
-            "total_pages": 0,
-            "query": q,
-            "filters": {}
-        }
+        return {**empty_response, "filters": {}}
     
     # 获取用户可访问的书库
     accessible_library_ids = await get_accessible_library_ids(current_user, db)
     
     if not accessible_library_ids:
-        return {
-            "books": [],
-            "total": 0,
-            "page": page,
-            "limit": limit,
-            "total_pages": 0
-        }
+        return empty_response
     
-    # 构建搜索查询
-    from sqlalchemy import or_
-    query = select(Book).options(
-        joinedload(Book.author),
-        joinedload(Book.book_tags),
-        joinedload(Book.versions)
-    )
-    query = query.where(Book.library_id.in_(accessible_library_ids))
-    
-    # 关键词搜索（书名或作者名）
-    if q.strip():
-        search_term = f"%{q}%"
-        query = query.outerjoin(Author, Book.author_id == Author.id)
-        query = query.where(
-            or_(
-                Book.title.like(search_term),
-                Author.name.like(search_term)
-            )
-        )
-    else:
-        # 即使没有搜索词，也需要 join Author 表以便后续使用
-        query = query.outerjoin(Author, Book.author_id == Author.id)
+    conditions = [build_book_access_clause(current_user, accessible_library_ids)]
     
     # 按作者筛选
     if author_id:
-        query = query.where(Book.author_id == author_id)
+        conditions.append(Book.author_id == author_id)
     
-    # 按格式筛选
+    # 按格式筛选（兼容带点和不带点的存储格式）
     if formats:
-        format_list = [f.strip().lower() for f in formats.split(',') if f.strip()]
-        if format_list:
-            query = query.where(Book.file_format.in_(format_list))
+        format_values = set()
+        for fmt in formats.split(','):
+            fmt = fmt.strip().lower().lstrip('.')
+            if fmt:
+                format_values.add(fmt)
+                format_values.add(f".{fmt}")
+        if format_values:
+            conditions.append(Book.id.in_(
+                select(BookVersion.book_id).where(func.lower(BookVersion.file_format).in_(format_values))
+            ))
     
     # 按书库筛选
     if library_id:
         # 确保请求的书库在用户可访问列表中
-        if library_id in accessible_library_ids:
-            query = query.where(Book.library_id == library_id)
-        else:
-            # 用户无权访问该书库，返回空结果
-            return {
-                "books": [],
-                "total": 0,
-                "page": page,
-                "limit": limit,
-                "total_pages": 0,
-                "query": q,
-                "filters": {
-                    "author_id": author_id,
-                    "formats": formats,
-                    "library_id": library_id
-                }
-            }
-    
-    query = query.order_by(Book.title)
+        if library_id not in accessible_library_ids:
+            return empty_response
+        conditions.append(Book.library_id == library_id)
     
-    result = await db.execute(query)
-    all_books = result.unique().scalars().all()
+    # 关键词搜索（全文索引）
+    count_query, _ = search_index.apply_book_search(
+        select(func.count(Book.id)).where(*conditions), q
+    )
+    total_books = (await db.execute(count_query)).scalar() or 0
+    total_pages = (total_books + limit - 1) // limit if total_books > 0 else 0
     
-    # 应用内容分级过滤
-    filtered_books = []
-    for book in all_books:
-        if await check_book_access(current_user, book.id, db):
-            filtered_books.append(book)
+    primary_version = aliased(BookVersion)
+    query, rank = search_index.apply_book_search(
+        select(Book, primary_version)
+        .outerjoin(primary_version, primary_version.id == _primary_version_id_subquery())
+        .options(joinedload(Book.author))
+        .where(*conditions),
+        q
+    )
+    if rank is not None:
+        query = query.order_by(rank, Book.id)
+    else:
+        query = query.order_by(Book.title, Book.id)
+    query = query.offset((page - 1) * limit).limit(limit)
     
-    # 计算分页
-    total_books = len(filtered_books)
-    total_pages = (total_books + limit - 1) // limit if total_books > 0 else 0
-    start_idx = (page - 1) * limit
-    end_idx = start_idx + limit
-    paginated_books = filtered_books[start_idx:end_idx]
+    result = await db.execute(query)
     
     # 构建响应
     response_books = []
-    for book in paginated_books:
-        # 获取主版本或第一个版本
-        primary_version = None
-        if book.versions:
-            primary_version = next((v for v in book.versions if v.is_primary), None)
-            if not primary_version:
-                primary_version = book.versions[0] if book.versions else None
-        
-        response_books.append({
+    for book, version in result.all():
+        item = {
             "id": book.id,
             "title": book.title,
             "author_name": book.author.name if book.author else None,
-            "file_format": primary_version.file_format if primary_version else "unknown",
-            "file_size": primary_version.file_size if primary_version else 0,
+            "file_format": version.file_format if version else "unknown",
+            "file_size": version.file_size if version else 0,
             "added_at": book.added_at.isoformat(),
-        })
+        }
+        if q.strip():
+            item["highlight"] = {
+                "title": search_index.highlight(book.title, q),
+                "author_name": search_index.highlight(item["author_name"], q),
+                "description": search_index.highlight(book.description, q, max_length=120),
+            }
+        response_books.append(item)
     
     return {
         "books": response_books,
@@ -1352,11 +1347,7 @@ async def search_books(
         "limit": limit,
         "total_pages": total_pages,
         "query": q,
-        "filters": {
-            "author_id": author_id,
-            "formats": formats,
-            "library_id": library_id
-        }
+        "filters": filters
     }
 
 
@@ -1364,7 +1355,7 @@ async def search_books(
 
 @router.get("/stats", response_model=StatsResponse)
 async def get_stats(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取用户可访问范围内的统计信息"""
@@ -1437,6 +1428,7 @@ async def start_reading_session(
     db.add(session)
     await db.commit()
     await db.refresh(session)
+    progress_buffer.remember_session(session.id, current_user.id, data.book_id)
     
     return {"session_id": session.id, "status": "started"}
 
@@ -1444,67 +1436,46 @@ async def start_reading_session(
 @router.post("/stats/session/heartbeat", response_model=dict)
 async def heartbeat_reading_session(
     data: ReadingHeartbeat,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
-    """阅读心跳更新"""
-    from app.models import ReadingSession, ReadingProgress
-    
-    # 获取会话
-    result = await db.execute(
-        select(ReadingSession).where(ReadingSession.id == data.session_id)
-    )
-    session = result.scalar_one_or_none()
+    """阅读心跳更新（写入由进度缓冲合并后批量提交）"""
+    from app.models import ReadingSession
     
-    if not session:
-        raise HTTPException(status_code=404, detail="会话不存在")
+    # 获取会话归属（优先使用缓存）
+    owner = progress_buffer.session_owner(data.session_id)
+    if owner is None:
+        result = await db.execute(
+            select(ReadingSession.user_id, ReadingSession.book_id).where(ReadingSession.id == data.session_id)
+        )
+        row = result.first()
+        
+        if not row:
+            raise HTTPException(status_code=404, detail="会话不存在")
+        owner = (row.user_id, row.book_id)
+        progress_buffer.remember_session(data.session_id, *owner)
         
-    if session.user_id != current_user.id:
+    user_id, book_id = owner
+    if user_id != current_user.id:
         raise HTTPException(status_code=403, detail="无权访问此会话")
     
-    # 更新会话信息
-    session.duration_seconds = data.duration_seconds
-    if data.progress is not None:
-        session.progress = data.progress
+    now = datetime.now(timezone.utc)
+    progress_buffer.record_session(data.session_id, data.duration_seconds, data.progress)
     
-    # 同时更新总体阅读进度
+    # 同时更新总体阅读进度（与已有进度取较大值），并立即广播合并后的进度
     if data.progress is not None or data.position is not None:
-        progress_result = await db.execute(
-            select(ReadingProgress)
-            .where(ReadingProgress.user_id == current_user.id)
-            .where(ReadingProgress.book_id == session.book_id)
+        progress_buffer.record_progress(
+            user_id, book_id, data.progress, data.position, now, is_floor=True
         )
-        reading_progress = progress_result.scalar_one_or_none()
-        
-        now = datetime.now(timezone.utc)
-        
-        if reading_progress:
-            if data.progress is not None:
-                reading_progress.progress = max(reading_progress.progress, data.progress)
-            if data.position is not None:
-                reading_progress.position = data.position
-            reading_progress.last_read_at = now
-        else:
-            reading_progress = ReadingProgress(
-                user_id=current_user.id,
-                book_id=session.book_id,
-                progress=data.progress or 0.0,
-                position=data.position,
-                last_read_at=now
-            )
-            db.add(reading_progress)
-            
-    await db.commit()
-
-    # 广播进度更新
-    if data.progress is not None or data.position is not None:
+        current = await _current_progress(db, user_id, book_id)
         await manager.broadcast_to_user(current_user.id, {
             "type": "progress_update",
-            "book_id": session.book_id,
-            "progress": reading_progress.progress,
-            "position": reading_progress.position,
+            "book_id": book_id,
+            "progress": current["progress"],
+            "position": current["position"],
             "timestamp": now.isoformat()
         })
+    await progress_buffer.flush_if_unbuffered()
     
     return {"status": "updated"}
 
@@ -1515,63 +1486,48 @@ async def end_reading_session(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """结束阅读会话"""
-    from app.models import ReadingSession, ReadingProgress
-    
-    # 获取会话
-    result = await db.execute(
-        select(ReadingSession).where(ReadingSession.id == data.session_id)
-    )
-    session = result.scalar_one_or_none()
+    """结束阅读会话（连同缓冲中的进度和心跳立即写入）"""
+    from app.models import ReadingSession
     
-    if not session:
-        raise HTTPException(status_code=404, detail="会话不存在")
+    # 获取会话归属（优先使用缓存）
+    owner = progress_buffer.session_owner(data.session_id)
+    if owner is None:
+        result = await db.execute(
+            select(ReadingSession.user_id, ReadingSession.book_id).where(ReadingSession.id == data.session_id)
+        )
+        row = result.first()
         
-    if session.user_id != current_user.id:
+        if not row:
+            raise HTTPException(status_code=404, detail="会话不存在")
+        owner = (row.user_id, row.book_id)
+        
+    user_id, book_id = owner
+    if user_id != current_user.id:
         raise HTTPException(status_code=403, detail="无权访问此会话")
     
-    # 更新会话信息
-    session.end_time = datetime.now(timezone.utc)
-    session.duration_seconds = data.duration_seconds
-    if data.progress is not None:
-        session.progress = data.progress
+    now = datetime.now(timezone.utc)
+    progress_buffer.record_session(data.session_id, data.duration_seconds, data.progress, end_time=now)
         
-    # 同时更新总体阅读进度
+    # 同时更新总体阅读进度（与已有进度取较大值），在写入前取得合并后的进度用于广播
+    current = None
     if data.progress is not None or data.position is not None:
-        progress_result = await db.execute(
-            select(ReadingProgress)
-            .where(ReadingProgress.user_id == current_user.id)
-            .where(ReadingProgress.book_id == session.book_id)
+        progress_buffer.record_progress(
+            user_id, book_id, data.progress, data.position, now, is_floor=True
         )
-        reading_progress = progress_result.scalar_one_or_none()
-        
-        now = datetime.now(timezone.utc)
-        
-        if reading_progress:
-            if data.progress is not None:
-                reading_progress.progress = max(reading_progress.progress, data.progress)
-            if data.position is not None:
-                reading_progress.position = data.position
-            reading_progress.last_read_at = now
-        else:
-            reading_progress = ReadingProgress(
-                user_id=current_user.id,
-                book_id=session.book_id,
-                progress=data.progress or 0.0,
-                position=data.position,
-                last_read_at=now
-            )
-            db.add(reading_progress)
+        current = await _current_progress(db, user_id, book_id)
     
-    await db.commit()
+    await progress_buffer.flush()
+    progress_buffer.forget_session(data.session_id)
+    # 会话结束：立即汇总到阅读统计
+    await reading_stats.rollup_pending(session_ids=[data.session_id])
 
     # 广播进度更新
-    if data.progress is not None or data.position is not None:
+    if current is not None:
         await manager.broadcast_to_user(current_user.id, {
             "type": "progress_update",
-            "book_id": session.book_id,
-            "progress": reading_progress.progress,
-            "position": reading_progress.position,
+            "book_id": book_id,
+            "progress": current["progress"],
+            "position": current["position"],
             "timestamp": now.isoformat()
         })
     
@@ -1580,91 +1536,60 @@ async def end_reading_session(
 
 @router.get("/stats/reading/overview")
 async def get_reading_stats_overview(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
-    """获取阅读统计概览"""
-    # 总阅读时长（秒）
-    total_duration_result = await db.execute(
-        select(func.sum(ReadingSession.duration_seconds))
-        .where(ReadingSession.user_id == current_user.id)
-    )
-    total_duration_seconds = total_duration_result.scalar() or 0
-    
-    # 总阅读会话数
-    session_count_result = await db.execute(
-        select(func.count(ReadingSession.id))
-        .where(ReadingSession.user_id == current_user.id)
-    )
-    total_sessions = session_count_result.scalar() or 0
-    
-    # 阅读过的书籍数量（有阅读会话记录）
-    books_read_result = await db.execute(
-        select(func.count(func.distinct(ReadingSession.book_id)))
-        .where(ReadingSession.user_id == current_user.id)
-    )
-    books_read = books_read_result.scalar() or 0
+    """获取阅读统计概览（读取 reading_stats_daily 汇总表）"""
+    user_id = current_user.id
+    await reading_stats.ensure_user_rollup(db, user_id)
+
+    today = datetime.now(timezone.utc).date()
+    week_start = today - timedelta(days=today.weekday())  # 本周从周一开始
+    month_start = today.replace(day=1)
+    thirty_days_start = today - timedelta(days=29)  # 过去30天（含今天）
+
+    def seconds_since(start_date: date):
+        return func.coalesce(
+            func.sum(case((ReadingStatsDaily.date >= start_date, ReadingStatsDaily.seconds), else_=0)), 0
+        )
+
+    # 总时长、会话数、书籍数和各时间段时长合并为一条查询
+    totals = (await db.execute(
+        select(
+            func.coalesce(func.sum(ReadingStatsDaily.seconds), 0).label("total"),
+            func.coalesce(func.sum(ReadingStatsDaily.sessions), 0).label("sessions"),
+            func.count(func.distinct(ReadingStatsDaily.book_id)).label("books"),
+            seconds_since(today).label("today"),
+            seconds_since(week_start).label("week"),
+            seconds_since(month_start).label("month"),
+            seconds_since(thirty_days_start).label("last_30_days"),
+        )
+        .where(ReadingStatsDaily.user_id == user_id)
+    )).one()
     
     # 已完成阅读的书籍数量
     finished_books_result = await db.execute(
         select(func.count(ReadingProgress.id))
-        .where(ReadingProgress.user_id == current_user.id)
+        .where(ReadingProgress.user_id == user_id)
         .where(ReadingProgress.finished == True)
     )
     finished_books = finished_books_result.scalar() or 0
     
-    # 今日阅读时长
-    today_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-    today_duration_result = await db.execute(
-        select(func.sum(ReadingSession.duration_seconds))
-        .where(ReadingSession.user_id == current_user.id)
-        .where(ReadingSession.start_time >= today_start)
-    )
-    today_duration = today_duration_result.scalar() or 0
-    
-    # 本周阅读时长（从周一开始）
-    today = datetime.now(timezone.utc).date()
-    week_start = today - timedelta(days=today.weekday())
-    week_start_dt = datetime.combine(week_start, datetime.min.time()).replace(tzinfo=timezone.utc)
-    week_duration_result = await db.execute(
-        select(func.sum(ReadingSession.duration_seconds))
-        .where(ReadingSession.user_id == current_user.id)
-        .where(ReadingSession.start_time >= week_start_dt)
-    )
-    week_duration = week_duration_result.scalar() or 0
-    
-    # 本月阅读时长
-    month_start = today.replace(day=1)
-    month_start_dt = datetime.combine(month_start, datetime.min.time()).replace(tzinfo=timezone.utc)
-    month_duration_result = await db.execute(
-        select(func.sum(ReadingSession.duration_seconds))
-        .where(ReadingSession.user_id == current_user.id)
-        .where(ReadingSession.start_time >= month_start_dt)
-    )
-    month_duration = month_duration_result.scalar() or 0
-    
-    # 平均每日阅读时长（过去30天）
-    thirty_days_ago = datetime.now(timezone.utc) - timedelta(days=30)
-    avg_daily_result = await db.execute(
-        select(func.sum(ReadingSession.duration_seconds))
-        .where(ReadingSession.user_id == current_user.id)
-        .where(ReadingSession.start_time >= thirty_days_ago)
-    )
-    last_30_days_total = avg_daily_result.scalar() or 0
-    avg_daily_seconds = last_30_days_total / 30
+    total_duration_seconds = totals.total
+    avg_daily_seconds = totals.last_30_days / 30
     
     return {
         "total_duration_seconds": total_duration_seconds,
         "total_duration_formatted": _format_duration(total_duration_seconds),
-        "total_sessions": total_sessions,
-        "books_read": books_read,
+        "total_sessions": totals.sessions,
+        "books_read": totals.books,
         "finished_books": finished_books,
-        "today_duration_seconds": today_duration,
-        "today_duration_formatted": _format_duration(today_duration),
-        "week_duration_seconds": week_duration,
-        "week_duration_formatted": _format_duration(week_duration),
-        "month_duration_seconds": month_duration,
-        "month_duration_formatted": _format_duration(month_duration),
+        "today_duration_seconds": totals.today,
+        "today_duration_formatted": _format_duration(totals.today),
+        "week_duration_seconds": totals.week,
+        "week_duration_formatted": _format_duration(totals.week),
+        "month_duration_seconds": totals.month,
+        "month_duration_formatted": _format_duration(totals.month),
         "avg_daily_seconds": int(avg_daily_seconds),
         "avg_daily_formatted": _format_duration(int(avg_daily_seconds)),
     }
@@ -1673,62 +1598,45 @@ async def get_reading_stats_overview(
 @router.get("/stats/reading/daily")
 async def get_daily_reading_stats(
     days: int = Query(30, ge=1, le=365, description="统计天数"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取每日阅读时长统计"""
-    start_date = datetime.now(timezone.utc) - timedelta(days=days)
+    await reading_stats.ensure_user_rollup(db, current_user.id)
+    start_date = (datetime.now(timezone.utc) - timedelta(days=days)).date()
+    end_date = datetime.now(timezone.utc).date()
     
-    # 按日期分组统计阅读时长
-    # 使用 SQLite 的 date() 函数提取日期
+    # 按日期分组统计阅读时长（汇总表主键前缀即 (user_id, date)）
     result = await db.execute(
         select(
-            func.date(ReadingSession.start_time).label('date'),
-            func.sum(ReadingSession.duration_seconds).label('duration'),
-            func.count(ReadingSession.id).label('sessions')
+            ReadingStatsDaily.date,
+            func.sum(ReadingStatsDaily.seconds).label('duration'),
+            func.sum(ReadingStatsDaily.sessions).label('sessions')
         )
-        .where(ReadingSession.user_id == current_user.id)
-        .where(ReadingSession.start_time >= start_date)
-        .group_by(func.date(ReadingSession.start_time))
-        .order_by(func.date(ReadingSession.start_time))
+        .where(ReadingStatsDaily.user_id == current_user.id)
+        .where(ReadingStatsDaily.date >= start_date)
+        .group_by(ReadingStatsDaily.date)
     )
-    
-    daily_stats = []
-    for row in result:
-        daily_stats.append({
-            "date": row.date,
-            "duration_seconds": row.duration or 0,
-            "duration_formatted": _format_duration(row.duration or 0),
-            "sessions": row.sessions or 0
-        })
+    by_date = {row.date: row for row in result}
     
     # 补充没有阅读记录的日期
     full_daily_stats = []
-    current_date = start_date.date()
-    end_date = datetime.now(timezone.utc).date()
-    existing_dates = {row["date"] for row in daily_stats}
-    
+    current_date = start_date
     while current_date <= end_date:
-        date_str = current_date.isoformat()
-        if date_str in existing_dates:
-            # 找到对应的记录
-            for row in daily_stats:
-                if row["date"] == date_str:
-                    full_daily_stats.append(row)
-                    break
-        else:
-            full_daily_stats.append({
-                "date": date_str,
-                "duration_seconds": 0,
-                "duration_formatted": "0分钟",
-                "sessions": 0
-            })
+        row = by_date.get(current_date)
+        duration = (row.duration or 0) if row else 0
+        full_daily_stats.append({
+            "date": current_date.isoformat(),
+            "duration_seconds": duration,
+            "duration_formatted": _format_duration(duration) if row else "0分钟",
+            "sessions": (row.sessions or 0) if row else 0
+        })
         current_date += timedelta(days=1)
     
     return {
         "days": days,
-        "start_date": start_date.date().isoformat(),
-        "end_date": datetime.now(timezone.utc).date().isoformat(),
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat(),
         "daily_stats": full_daily_stats
     }
 
@@ -1736,32 +1644,30 @@ async def get_daily_reading_stats(
 @router.get("/stats/reading/hourly")
 async def get_hourly_reading_distribution(
     days: int = Query(30, ge=1, le=365, description="统计天数"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取每小时阅读分布（阅读习惯分析）"""
-    start_date = datetime.now(timezone.utc) - timedelta(days=days)
+    await reading_stats.ensure_user_rollup(db, current_user.id)
+    start_date = (datetime.now(timezone.utc) - timedelta(days=days)).date()
     
     # 按小时分组统计
-    # 使用 strftime 提取小时
     result = await db.execute(
         select(
-            func.strftime('%H', ReadingSession.start_time).label('hour'),
-            func.sum(ReadingSession.duration_seconds).label('duration'),
-            func.count(ReadingSession.id).label('sessions')
+            ReadingStatsDaily.hour,
+            func.sum(ReadingStatsDaily.seconds).label('duration'),
+            func.sum(ReadingStatsDaily.sessions).label('sessions')
         )
-        .where(ReadingSession.user_id == current_user.id)
-        .where(ReadingSession.start_time >= start_date)
-        .group_by(func.strftime('%H', ReadingSession.start_time))
-        .order_by(func.strftime('%H', ReadingSession.start_time))
+        .where(ReadingStatsDaily.user_id == current_user.id)
+        .where(ReadingStatsDaily.date >= start_date)
+        .group_by(ReadingStatsDaily.hour)
     )
     
-    hourly_data = {str(i).zfill(2): {"duration_seconds": 0, "sessions": 0} for i in range(24)}
+    hourly_data = {hour: {"duration_seconds": 0, "sessions": 0} for hour in range(24)}
     
     for row in result:
-        hour = row.hour
-        if hour:
-            hourly_data[hour] = {
+        if row.hour in hourly_data:
+            hourly_data[row.hour] = {
                 "duration_seconds": row.duration or 0,
                 "sessions": row.sessions or 0
             }
@@ -1769,8 +1675,7 @@ async def get_hourly_reading_distribution(
     # 转换为列表格式
     hourly_stats = []
     for hour in range(24):
-        hour_str = str(hour).zfill(2)
-        data = hourly_data[hour_str]
+        data = hourly_data[hour]
         hourly_stats.append({
             "hour": hour,
             "hour_label": f"{hour}:00-{hour+1}:00" if hour < 23 else "23:00-00:00",
@@ -1788,41 +1693,48 @@ async def get_hourly_reading_distribution(
 @router.get("/stats/reading/books")
 async def get_book_reading_stats(
     limit: int = Query(20, ge=1, le=100, description="返回数量"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取各书籍阅读时长统计"""
+    await reading_stats.ensure_user_rollup(db, current_user.id)
+
     # 按书籍分组统计阅读时长
     result = await db.execute(
         select(
-            ReadingSession.book_id,
-            func.sum(ReadingSession.duration_seconds).label('total_duration'),
-            func.count(ReadingSession.id).label('session_count'),
-            func.max(ReadingSession.start_time).label('last_read')
+            ReadingStatsDaily.book_id,
+            func.sum(ReadingStatsDaily.seconds).label('total_duration'),
+            func.sum(ReadingStatsDaily.sessions).label('session_count'),
+            func.max(ReadingStatsDaily.last_read_at).label('last_read')
         )
-        .where(ReadingSession.user_id == current_user.id)
-        .group_by(ReadingSession.book_id)
-        .order_by(func.sum(ReadingSession.duration_seconds).desc())
+        .where(ReadingStatsDaily.user_id == current_user.id)
+        .group_by(ReadingStatsDaily.book_id)
+        .order_by(func.sum(ReadingStatsDaily.seconds).desc())
         .limit(limit)
     )
+    rows = result.all()
+    book_ids = [row.book_id for row in rows]
     
-    book_stats = []
-    for row in result:
-        # 获取书籍信息
+    # 批量获取书籍信息和阅读进度
+    books = {}
+    progress_map = {}
+    if book_ids:
         book_result = await db.execute(
-            select(Book).options(joinedload(Book.author)).where(Book.id == row.book_id)
+            select(Book).options(joinedload(Book.author)).where(Book.id.in_(book_ids))
         )
-        book = book_result.scalar_one_or_none()
-        
+        books = {book.id: book for book in book_result.unique().scalars()}
+        progress_result = await db.execute(
+            select(ReadingProgress)
+            .where(ReadingProgress.user_id == current_user.id)
+            .where(ReadingProgress.book_id.in_(book_ids))
+        )
+        progress_map = {progress.book_id: progress for progress in progress_result.scalars()}
+    
+    book_stats = []
+    for row in rows:
+        book = books.get(row.book_id)
         if book:
-            # 获取阅读进度
-            progress_result = await db.execute(
-                select(ReadingProgress)
-                .where(ReadingProgress.user_id == current_user.id)
-                .where(ReadingProgress.book_id == row.book_id)
-            )
-            progress = progress_result.scalar_one_or_none()
-            
+            progress = progress_map.get(row.book_id)
             book_stats.append({
                 "book_id": row.book_id,
                 "title": book.title,
@@ -1844,7 +1756,7 @@ async def get_book_reading_stats(
 @router.get("/stats/reading/recent-sessions")
 async def get_recent_reading_sessions(
     limit: int = Query(20, ge=1, le=100, description="返回数量"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取最近的阅读会话记录"""
@@ -13,6 +13,7 @@ from pydantic import BaseModel
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.access_context import access_context_cache
 from app.database import get_db
 from app.models import User
 from app.security import create_access_token, decode_access_token, verify_password, hash_password
@@ -90,11 +91,8 @@ async def get_current_user(
     if username is None:
         raise credentials_exception
     
-    # 从数据库获取用户
-    result = await db.execute(
-        select(User).where(User.username == username)
-    )
-    user = result.scalar_one_or_none()
+    # 获取用户（命中访问上下文缓存时不查询数据库）
+    user = await access_context_cache.get_user(db, username)
     
     if user is None:
         raise credentials_exception
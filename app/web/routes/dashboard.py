@@ -2,7 +2,7 @@
 Dashboard API - Emby 风格首页数据接口
 """
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
@@ -10,11 +10,14 @@ from sqlalchemy import func, select, desc
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
+from app.core.library_stats import get_library_stats, latest_book_ids
 from app.database import get_db
+from app.utils.cover_manager import cover_url
 from app.models import (
-    User, Book, BookVersion, BookGroup, Library, LibraryPermission, 
+    User, Book, BookGroup, Library, LibraryStats,
     ReadingProgress, Author, Favorite
 )
+from app.utils.permissions import get_accessible_library_ids
 from app.web.routes.dependencies import get_current_user
 
 router = APIRouter(prefix="/api", tags=["dashboard"])
@@ -88,37 +91,70 @@ class DashboardResponse(BaseModel):
 
 async def get_user_accessible_libraries(db: AsyncSession, user: User) -> List[Library]:
     """获取用户可访问的书库列表"""
-    if user.is_admin:
-        result = await db.execute(select(Library))
-        return list(result.scalars().all())
+    library_ids = await get_accessible_library_ids(user, db)
+    if not library_ids:
+        return []
     
-    # 公共书库
     result = await db.execute(
-        select(Library).where(Library.is_public == True)
+        select(Library).where(Library.id.in_(library_ids)).order_by(Library.id)
     )
-    public_libraries = list(result.scalars().all())
+    return list(result.scalars().all())
+
+
+def build_library_summaries(
+    libraries: List[Library],
+    stats: Dict[int, LibraryStats]
+) -> List[LibrarySummary]:
+    """根据书库统计构建书库摘要（最新一本书作为封面）"""
+    summaries = []
+    for library in libraries:
+        library_stats = stats.get(library.id)
+        latest_ids = latest_book_ids(library_stats) if library_stats else []
+        summaries.append(LibrarySummary(
+            id=library.id,
+            name=library.name,
+            book_count=library_stats.book_count if library_stats else 0,
+            cover_url=f"/books/{latest_ids[0]}/cover" if latest_ids else None
+        ))
+    return summaries
+
+
+async def get_latest_books_by_library(
+    db: AsyncSession,
+    library_ids: List[int],
+    per_library: int
+) -> Dict[int, List[Book]]:
+    """
+    一次查询获取每个书库最新添加的书籍（窗口函数按书库分区取前 N 本）
     
-    # 用户有权限的书库
-    result = await db.execute(
-        select(LibraryPermission.library_id).where(
-            LibraryPermission.user_id == user.id
+    Returns:
+        {书库ID: 按添加时间倒序的书籍列表}
+    """
+    ranked = (
+        select(
+            Book.id,
+            func.row_number().over(
+                partition_by=Book.library_id,
+                order_by=(desc(Book.added_at), desc(Book.id))
+            ).label("rank"),
         )
+        .where(Book.library_id.in_(library_ids))
+        .subquery()
     )
-    permitted_library_ids = [row[0] for row in result.all()]
-    
-    permitted_libraries = []
-    if permitted_library_ids:
-        result = await db.execute(
-            select(Library).where(Library.id.in_(permitted_library_ids))
+    result = await db.execute(
+        select(Book).options(
+            selectinload(Book.author),
+            selectinload(Book.versions),
+            selectinload(Book.group)  # 加载组信息
         )
-        permitted_libraries = list(result.scalars().all())
-    
-    # 合并并去重
-    all_libraries = {lib.id: lib for lib in public_libraries}
-    for lib in permitted_libraries:
-        all_libraries[lib.id] = lib
-    
-    return list(all_libraries.values())
+        .join(ranked, ranked.c.id == Book.id)
+        .where(ranked.c.rank <= per_library)
+        .order_by(Book.library_id, ranked.c.rank)
+    )
+    books_by_library: Dict[int, List[Book]] = {}
+    for book in result.scalars().all():
+        books_by_library.setdefault(book.library_id, []).append(book)
+    return books_by_library
 
 
 def filter_books_by_group(books: List[Book]) -> List[Book]:
@@ -179,7 +215,7 @@ def book_to_summary(book: Book, base_url: str = "") -> BookSummary:
         id=book.id,
         title=book.title,
         author_name=book.author.name if book.author else None,
-        cover_url=f"{base_url}/books/{book.id}/cover",
+        cover_url=cover_url(book.id, book.cover_path, base_url),
         is_new=is_new,
         added_at=book.added_at,
         file_format=file_format
@@ -226,30 +262,9 @@ async def get_dashboard(
             )
         )
     
-    # 2. 构建书库摘要列表（包含书籍数量）
-    libraries_summary = []
-    for library in accessible_libraries:
-        # 获取书籍数量
-        result = await db.execute(
-            select(func.count(Book.id)).where(Book.library_id == library.id)
-        )
-        book_count = result.scalar() or 0
-        
-        # 获取最新一本书作为封面
-        result = await db.execute(
-            select(Book).where(Book.library_id == library.id)
-            .order_by(desc(Book.added_at)).limit(1)
-        )
-        latest_book = result.scalar_one_or_none()
-        
-        cover_url = f"/books/{latest_book.id}/cover" if latest_book else None
-        
-        libraries_summary.append(LibrarySummary(
-            id=library.id,
-            name=library.name,
-            book_count=book_count,
-            cover_url=cover_url
-        ))
+    # 2. 构建书库摘要列表（来自物化的书库统计）
+    library_stats = await get_library_stats(db, library_ids)
+    libraries_summary = build_library_summaries(accessible_libraries, library_stats)
     
     # 3. 获取继续阅读列表（有进度但未完成的书籍）
     continue_reading = []
@@ -272,7 +287,7 @@ async def get_dashboard(
                 id=book.id,
                 title=book.title,
                 author_name=book.author.name if book.author else None,
-                cover_url=f"/books/{book.id}/cover",
+                cover_url=cover_url(book.id, book.cover_path),
                 progress=progress.progress,
                 last_read_at=progress.last_read_at,
                 library_id=book.library_id,
@@ -280,21 +295,12 @@ async def get_dashboard(
             ))
     
     # 4. 获取每个书库的最新书籍（去除同组重复）
+    # 多查询一些书籍以便过滤后仍有足够数量
+    books_by_library = await get_latest_books_by_library(db, library_ids, 30)
     latest_by_library = []
     for library in accessible_libraries:
-        # 多查询一些书籍以便过滤后仍有足够数量
-        result = await db.execute(
-            select(Book).options(
-                selectinload(Book.author),
-                selectinload(Book.versions),
-                selectinload(Book.group)  # 加载组信息
-            ).where(Book.library_id == library.id)
-            .order_by(desc(Book.added_at)).limit(30)
-        )
-        all_books = list(result.scalars().all())
-        
         # 过滤同组重复书籍
-        filtered_books = filter_books_by_group(all_books)[:10]
+        filtered_books = filter_books_by_group(books_by_library.get(library.id, []))[:10]
         
         if filtered_books:
             latest_by_library.append(LibraryLatest(
@@ -309,37 +315,24 @@ async def get_dashboard(
     )
     favorites_count = result.scalar() or 0
 
-    # 6. 统计信息（仅统计可访问书库）
-    total_books_result = await db.execute(
-        select(func.count(Book.id)).where(Book.library_id.in_(library_ids))
-    )
-    total_books = total_books_result.scalar() or 0
-
-    total_authors_result = await db.execute(
-        select(func.count(func.distinct(Book.author_id)))
-        .where(Book.library_id.in_(library_ids), Book.author_id.isnot(None))
-    )
-    total_authors = total_authors_result.scalar() or 0
-
-    total_groups_result = await db.execute(
-        select(func.count(func.distinct(Book.group_id)))
-        .where(Book.library_id.in_(library_ids), Book.group_id.isnot(None))
-    )
-    total_groups = total_groups_result.scalar() or 0
-
-    recent_threshold = datetime.utcnow() - timedelta(days=7)
-    new_books_result = await db.execute(
-        select(func.count(Book.id))
-        .where(Book.library_id.in_(library_ids), Book.added_at >= recent_threshold)
-    )
-    new_books_7d = new_books_result.scalar() or 0
-
-    total_size_result = await db.execute(
-        select(func.coalesce(func.sum(BookVersion.file_size), 0))
-        .join(Book, BookVersion.book_id == Book.id)
-        .where(Book.library_id.in_(library_ids), BookVersion.is_primary == True)
-    )
-    total_size = total_size_result.scalar() or 0
+    # 6. 统计信息（仅统计可访问书库，来自书库统计）
+    all_stats = [library_stats[library_id] for library_id in library_ids if library_id in library_stats]
+    total_books = sum(stats.book_count for stats in all_stats)
+    new_books_7d = sum(stats.new_books_7d for stats in all_stats)
+    total_size = sum(stats.total_size for stats in all_stats)
+
+    if len(library_ids) == 1:
+        total_authors = all_stats[0].author_count if all_stats else 0
+        total_groups = all_stats[0].group_count if all_stats else 0
+    else:
+        # 同一作者/分组可能跨书库，多书库时按去重计数
+        distinct_result = await db.execute(
+            select(
+                func.count(func.distinct(Book.author_id)),
+                func.count(func.distinct(Book.group_id)),
+            ).where(Book.library_id.in_(library_ids))
+        )
+        total_authors, total_groups = distinct_result.one()
 
     continue_reading_count_result = await db.execute(
         select(func.count(ReadingProgress.id))
@@ -402,7 +395,7 @@ async def get_continue_reading(
                 id=book.id,
                 title=book.title,
                 author_name=book.author.name if book.author else None,
-                cover_url=f"/books/{book.id}/cover",
+                cover_url=cover_url(book.id, book.cover_path),
                 progress=progress.progress,
                 last_read_at=progress.last_read_at,
                 library_id=book.library_id,
@@ -420,32 +413,9 @@ async def get_libraries(
     """获取用户可访问的书库列表"""
     
     accessible_libraries = await get_user_accessible_libraries(db, current_user)
+    library_stats = await get_library_stats(db, [lib.id for lib in accessible_libraries])
     
-    result = []
-    for library in accessible_libraries:
-        # 获取书籍数量
-        count_result = await db.execute(
-            select(func.count(Book.id)).where(Book.library_id == library.id)
-        )
-        book_count = count_result.scalar() or 0
-        
-        # 获取最新一本书作为封面
-        book_result = await db.execute(
-            select(Book).where(Book.library_id == library.id)
-            .order_by(desc(Book.added_at)).limit(1)
-        )
-        latest_book = book_result.scalar_one_or_none()
-        
-        cover_url = f"/books/{latest_book.id}/cover" if latest_book else None
-        
-        result.append(LibrarySummary(
-            id=library.id,
-            name=library.name,
-            book_count=book_count,
-            cover_url=cover_url
-        ))
-    
-    return result
+    return build_library_summaries(accessible_libraries, library_stats)
 
 
 @router.get("/libraries/{library_id}/latest", response_model=LibraryLatest)
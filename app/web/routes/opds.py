@@ -10,13 +10,14 @@ import base64
 from fastapi import APIRouter, Depends, Query, Request, Response, HTTPException, Header
 from fastapi.responses import FileResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from sqlalchemy import func, or_, select
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload
 
+from app.core import search_index
 from app.database import get_db
 from app.models import Author, Book, Library, User
-from app.security import verify_password
+from app.core.credential_cache import opds_credential_cache
 from app.utils.logger import log
 from app.utils.opds_builder import (
     build_opds_acquisition_feed,
@@ -24,7 +25,7 @@ from app.utils.opds_builder import (
     build_opds_root,
     build_opds_search_descriptor,
 )
-from app.utils.permissions import check_book_access, get_accessible_library_ids
+from app.utils.permissions import build_book_access_clause, check_book_access, get_accessible_library_ids
 
 router = APIRouter()
 security = HTTPBasic(auto_error=False)
@@ -47,7 +48,7 @@ async def get_opds_user_optional(
         result = await db.execute(select(User).where(User.username == username))
         user = result.scalar_one_or_none()
         
-        if user and verify_password(password, user.password_hash):
+        if user and await opds_credential_cache.verify(user.id, username, password, user.password_hash):
             return user
     
     return None
@@ -72,7 +73,7 @@ async def get_opds_user(
         result = await db.execute(select(User).where(User.username == username))
         user = result.scalar_one_or_none()
         
-        if user and verify_password(password, user.password_hash):
+        if user and await opds_credential_cache.verify(user.id, username, password, user.password_hash):
             return user
     
     # 没有认证或认证失败，返回 401 要求认证
@@ -162,18 +163,13 @@ async def opds_recent_books(
         joinedload(Book.book_tags),
         joinedload(Book.versions),
     )
-    query = query.where(Book.library_id.in_(accessible_library_ids))
+    query = query.where(build_book_access_clause(current_user, accessible_library_ids))
     query = query.order_by(Book.added_at.desc())
     
     # 获取所有符合条件的书籍
+    # 书库权限与内容分级已在查询条件中过滤
     result = await db.execute(query)
-    all_books = result.unique().scalars().all()
-    
-    # 应用内容分级过滤
-    filtered_books = []
-    for book in all_books:
-        if await check_book_access(current_user, book.id, db):
-            filtered_books.append(book)
+    filtered_books = result.unique().scalars().all()
     
     # 计算分页
     total_books = len(filtered_books)
@@ -312,17 +308,12 @@ async def opds_author_books(
         joinedload(Book.versions),
     )
     query = query.where(Book.author_id == author_id)
-    query = query.where(Book.library_id.in_(accessible_library_ids))
+    query = query.where(build_book_access_clause(current_user, accessible_library_ids))
     query = query.order_by(Book.title)
     
+    # 书库权限与内容分级已在查询条件中过滤
     result = await db.execute(query)
-    all_books = result.unique().scalars().all()
-    
-    # 应用内容分级过滤
-    filtered_books = []
-    for book in all_books:
-        if await check_book_access(current_user, book.id, db):
-            filtered_books.append(book)
+    filtered_books = result.unique().scalars().all()
     
     # 计算分页
     total_books = len(filtered_books)
@@ -393,32 +384,20 @@ async def opds_search(
         return Response(content=xml, media_type="application/atom+xml;profile=opds-catalog;kind=acquisition")
     
     # 构建搜索查询
-    search_term = f"%{q}%"
     query = select(Book).options(
         joinedload(Book.author),
         joinedload(Book.book_tags),
         joinedload(Book.versions),
     )
-    query = query.where(Book.library_id.in_(accessible_library_ids))
-    
-    # 搜索书名或作者名
-    query = query.outerjoin(Author, Book.author_id == Author.id)
-    query = query.where(
-        or_(
-            Book.title.like(search_term),
-            Author.name.like(search_term)
-        )
-    )
-    query = query.order_by(Book.title)
+    query = query.where(build_book_access_clause(current_user, accessible_library_ids))
     
-    result = await db.execute(query)
-    all_books = result.unique().scalars().all()
+    # 全文索引搜索（书名、作者、简介、标签），按相关度排序
+    query, rank = search_index.apply_book_search(query, q)
+    query = query.order_by(rank if rank is not None else Book.title)
     
-    # 应用内容分级过滤
-    filtered_books = []
-    for book in all_books:
-        if await check_book_access(current_user, book.id, db):
-            filtered_books.append(book)
+    # 书库权限与内容分级已在查询条件中过滤
+    result = await db.execute(query)
+    filtered_books = result.unique().scalars().all()
     
     # 计算分页
     total_books = len(filtered_books)
@@ -529,15 +508,12 @@ async def opds_library_books(
         joinedload(Book.book_tags),
         joinedload(Book.versions),
     )
-    query = query.where(Book.library_id == library_id).order_by(Book.added_at.desc())
+    query = query.where(Book.library_id == library_id)
+    query = query.where(build_book_access_clause(current_user, accessible_library_ids))
+    query = query.order_by(Book.added_at.desc())
 
     result = await db.execute(query)
-    all_books = result.unique().scalars().all()
-
-    filtered_books = []
-    for book in all_books:
-        if await check_book_access(current_user, book.id, db):
-            filtered_books.append(book)
+    filtered_books = result.unique().scalars().all()
 
     total_books = len(filtered_books)
     total_pages = math.ceil(total_books / limit) if total_books > 0 else 1
@@ -3,18 +3,20 @@
 提供在线阅读功能
 """
 import os
+import asyncio
+import bisect
 import json
 import codecs
 import re
 import math
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Optional, Tuple
 import multiprocessing
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Header, Request
 from fastapi.responses import FileResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import get_db
@@ -25,7 +27,18 @@ from app.security import decode_access_token
 from app.utils.permissions import check_book_access
 from app.utils.logger import log
 from app.config import settings
-from app.core.metadata.comic_parser import ComicParser
+from app.core import txt_bundle, txt_cache_index, txt_chapter_blobs, txt_search
+from app.core.access_context import access_context_cache
+from app.core.chapter_detector import ChapterScanner, build_chapters, get_chapter_rules
+from app.core.db_writer import db_writer
+from app.core.encoding_detector import (
+    EncodingResult,
+    decode_quality,
+    detect_file_encoding,
+    is_probably_binary_file,
+    is_text_sample_valid,
+)
+from app.core.txt_cache_builder import txt_cache_builder
 from app.core.metadata.txt_parser import TxtParser
 from app.core.metadata.mobi_parser import MobiParser, extract_text_in_subprocess
 from app.core.conversion.ebook_convert import (
@@ -64,6 +77,8 @@ MOBI_TEXT_LENGTH_LIMIT = 5_000_000
 
 # TXT 缓存目录
 TXT_CACHE_DIR = Path(settings.directories.data) / "cache" / "txt"
+# 原始章节：内容随章节规则变化，按 ETag 重新验证
+TXT_CHAPTER_CACHE_CONTROL = "private, no-cache"
 
 
 class ConvertRequest(BaseModel):
@@ -90,15 +105,24 @@ async def get_book_toc(
     file_path = Path(version.file_path)
     file_format = version.file_format.lower()
     
+    if file_format in COMIC_FORMATS:
+        from app.core.comic_pages import comic_page_server
+
+        _, images = await asyncio.to_thread(comic_page_server.get_pages, file_path)
+        return {
+            "format": "comic",
+            "images": images,
+        }
+
     if file_format not in ['txt', '.txt']:
         raise HTTPException(status_code=400, detail="仅支持TXT在线阅读，请下载原文件")
 
-    cache = await _ensure_txt_cache(file_path)
+    cache = await _ensure_txt_cache(file_path, version)
     if not cache:
         raise HTTPException(status_code=500, detail="无法读取文件内容")
     index = cache["index"]
-    total_length = index.get("total_length", 0)
-    chapters = index.get("chapters", [])
+    total_length = index.total_length
+    chapters = index.chapters()
 
     return {
         "format": "txt",
@@ -139,18 +163,26 @@ async def get_chapter_content(
     file_path = Path(version.file_path)
     file_format = version.file_format.lower()
     
+    if file_format in COMIC_FORMATS:
+        from app.core.comic_pages import comic_page_server
+
+        _, images = await asyncio.to_thread(comic_page_server.get_pages, file_path)
+        return {
+            "format": "comic",
+            "images": images,
+        }
+
     if file_format not in ['txt', '.txt']:
         raise HTTPException(status_code=400, detail="仅支持TXT在线阅读，请下载原文件")
 
-    cache = await _ensure_txt_cache(file_path)
+    cache = await _ensure_txt_cache(file_path, version)
     if not cache:
         log.error(f"无法读取文件内容: {file_path}")
         raise HTTPException(status_code=500, detail="无法读取文件内容")
     index = cache["index"]
-    all_chapters = index.get("chapters", [])
-    total_length = index.get("total_length", 0)
+    total_length = index.total_length
 
-    total_chapters = len(all_chapters)
+    total_chapters = len(index)
     
     log.info(f"解析到 {total_chapters} 个章节，请求索引: {chapter_index}")
 
@@ -165,7 +197,7 @@ async def get_chapter_content(
     # 提取章节内容
     result_chapters = []
     for i in range(start_index, end_index):
-        ch = all_chapters[i]
+        ch = index.chapter(i)
         chapter_content = _read_txt_range(
             cache["text_path"],
             ch.get("startByte", 0),
@@ -198,6 +230,139 @@ async def get_chapter_content(
     }
 
 
+@router.get("/books/{book_id}/chapter/{chapter_index}/raw")
+async def get_chapter_raw(
+    chapter_index: int,
+    request: Request,
+    book: Book = Depends(get_accessible_book),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    获取单个章节正文（text/plain; charset=utf-8，不含章节标题）
+
+    正文直接取自缓存文本的内存映射，不解码、不做 JSON 编码。
+    Accept-Encoding 允许且存在预压缩数据时原样返回 br/gzip；
+    Range 请求始终按未压缩内容处理。支持 ETag（304）。
+    """
+    from app.utils.http_cache import accepted_encodings, bytes_response, etag_matches, make_etag, not_modified
+
+    await db.refresh(book, ['versions'])
+
+    version = await _get_valid_version(book)
+    file_path = Path(version.file_path)
+    if version.file_format.lower() not in ['txt', '.txt']:
+        raise HTTPException(status_code=400, detail="仅支持TXT在线阅读，请下载原文件")
+
+    cache = await _ensure_txt_cache(file_path, version)
+    if not cache:
+        raise HTTPException(status_code=500, detail="无法读取文件内容")
+    index = cache["index"]
+    if chapter_index < 0 or chapter_index >= len(index):
+        raise HTTPException(status_code=400, detail=f"章节索引超出范围，有效范围: 0-{len(index) - 1}")
+
+    text_path = cache["text_path"]
+    etag_parts = (text_path.name.split(".", 1)[0], f"{index.digest:08x}", chapter_index)
+    headers = {"Vary": "Accept-Encoding"}
+
+    if not request.headers.get("range"):
+        accepted = accepted_encodings(request)
+        for encoding in txt_chapter_blobs.available_encodings():
+            if encoding not in accepted:
+                continue
+            blobs = txt_chapter_blobs.get_blobs(text_path, index, encoding)
+            if blobs is None:
+                continue
+            etag = make_etag(*etag_parts, encoding)
+            if etag_matches(request, etag):
+                return not_modified(etag, TXT_CHAPTER_CACHE_CONTROL)
+            return Response(
+                content=blobs.get(chapter_index),
+                media_type="text/plain; charset=utf-8",
+                headers={
+                    **headers,
+                    "Content-Encoding": encoding,
+                    "ETag": etag,
+                    "Cache-Control": TXT_CHAPTER_CACHE_CONTROL,
+                }
+            )
+
+    # 映射页通常已在页缓存中，切片只有一次内存复制
+    text = index.text_map(text_path)
+    if text is None:
+        data = b""
+    else:
+        start, end = txt_chapter_blobs.chapter_body_span(text, index, chapter_index)
+        data = text[start:end]
+    return bytes_response(
+        request,
+        data,
+        "text/plain; charset=utf-8",
+        make_etag(*etag_parts),
+        TXT_CHAPTER_CACHE_CONTROL,
+        headers
+    )
+
+
+@router.get("/books/{book_id}/bundle")
+async def get_book_bundle(
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|zip)$", description="输出格式：ndjson 或 zip"),
+    start: int = Query(0, ge=0, description="首章序号（断点续传时从此处继续）"),
+    end: Optional[int] = Query(None, ge=0, description="末章序号（含），默认到最后一章"),
+    book: Book = Depends(get_accessible_book),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    离线整书包：一次请求流式返回目录和全部（或指定范围的）章节
+
+    - ndjson：第一行为清单，之后每行一章
+    - zip：manifest.json + chapters/{序号}.txt
+
+    清单含全书哈希（同时作为 ETag）和每章 CRC32；If-None-Match 命中时返回 304，
+    客户端可据此判断是否需要同步，并只请求变化的章节范围。
+    """
+    from app.utils.http_cache import etag_matches, make_etag, not_modified
+
+    await db.refresh(book, ['versions'])
+
+    version = await _get_valid_version(book)
+    file_path = Path(version.file_path)
+    if version.file_format.lower() not in ['txt', '.txt']:
+        raise HTTPException(status_code=400, detail="仅支持TXT离线下载，请下载原文件")
+
+    cache = await _ensure_txt_cache(file_path, version)
+    if not cache:
+        raise HTTPException(status_code=500, detail="无法读取文件内容")
+    index = cache["index"]
+    text_path = cache["text_path"]
+    total_chapters = len(index)
+    end = total_chapters - 1 if end is None else min(end, total_chapters - 1)
+    if start > end:
+        raise HTTPException(status_code=400, detail=f"章节范围无效，有效范围: 0-{total_chapters - 1}")
+
+    etag = make_etag(text_path.name.split(".", 1)[0], f"{index.digest:08x}", start, end, format)
+    if etag_matches(request, etag):
+        return not_modified(etag, TXT_CHAPTER_CACHE_CONTROL)
+
+    manifest = await asyncio.to_thread(txt_bundle.build_manifest, index, text_path, start, end)
+    headers = {"ETag": etag, "Cache-Control": TXT_CHAPTER_CACHE_CONTROL}
+    if format == "zip":
+        headers["Content-Disposition"] = f'attachment; filename="book_{book.id}.zip"'
+        # 同步生成器由 Starlette 在线程池中迭代，不阻塞事件循环
+        return StreamingResponse(
+            txt_bundle.iter_zip(manifest, index, text_path),
+            media_type="application/zip",
+            headers=headers
+        )
+    return StreamingResponse(
+        txt_bundle.iter_ndjson(manifest, index, text_path),
+        media_type="application/x-ndjson",
+        headers=headers
+    )
+
+
 async def _get_mobi_text(file_path: Path) -> Optional[str]:
     """获取MOBI/AZW3文件的文本内容（带缓存）"""
     try:
@@ -233,7 +398,7 @@ async def _get_mobi_text(file_path: Path) -> Optional[str]:
         # 检查缓存
         if cache_path.exists():
             log.debug(f"使用MOBI文本缓存: {file_path.name}")
-            cached_content = await _read_txt_file(cache_path)
+            cached_content = await _read_txt_file(cache_path, EncodingResult('utf-8', 1.0))
             if cached_content and cached_content.strip():
                 return cached_content
             else:
@@ -353,114 +518,18 @@ def _extract_mobi_with_limits(file_path: Path) -> Optional[str]:
     return None
 
 
-def _detect_txt_encoding(file_path: Path) -> Optional[str]:
-    """检测 TXT 编码，仅返回编码名"""
-    import chardet
-
-    try:
-        with open(file_path, 'rb') as f:
-            raw_data = f.read(200000)
-    except Exception as e:
-        log.error(f"读取编码检测样本失败: {e}")
-        return None
-
-    if not raw_data:
-        return None
-
-    if raw_data.startswith(codecs.BOM_UTF8):
-        return "utf-8-sig"
-    if raw_data.startswith(b'\xff\xfe'):
-        return "utf-16-le"
-    if raw_data.startswith(b'\xfe\xff'):
-        return "utf-16-be"
-
-    candidates = [
-        'utf-8', 'utf-8-sig',
-        'gb18030', 'gbk', 'gb2312',
-        'big5',
-        'utf-16-le', 'utf-16-be',
-    ]
-    metrics: list[tuple[str, float, float, float, float]] = []
-    for encoding in candidates:
-        try:
-            quality, cjk_ratio, ascii_ratio, common_ratio = _sample_text_metrics(raw_data, encoding)
-        except Exception:
-            continue
-        readable_ratio = cjk_ratio + ascii_ratio
-        metrics.append((encoding, quality, readable_ratio, common_ratio, ascii_ratio))
-
-    if metrics:
-        preferred = [
-            m for m in metrics
-            if (m[3] >= 0.01 or m[4] >= 0.12 or m[2] >= 0.05)
-        ]
-        pool = preferred or metrics
-        pool.sort(key=lambda m: (-m[3], -m[2], m[1]))
-        return pool[0][0]
-
-    detected = chardet.detect(raw_data).get('encoding')
-    if not detected:
-        return None
-
-    detected_lower = detected.lower()
-    if detected_lower in ('utf-16', 'utf_16'):
-        even_nulls = sum(1 for i in range(0, len(raw_data), 2) if raw_data[i] == 0)
-        odd_nulls = sum(1 for i in range(1, len(raw_data), 2) if raw_data[i] == 0)
-        if odd_nulls > even_nulls:
-            return "utf-16-le"
-        if even_nulls > odd_nulls:
-            return "utf-16-be"
-        return None
-    if detected_lower in ('utf-16le', 'utf_16le'):
-        return "utf-16-le"
-    if detected_lower in ('utf-16be', 'utf_16be'):
-        return "utf-16-be"
-
-    if _is_text_sample_valid(file_path, detected):
-        return detected
-    return None
-
-
-_COMMON_CJK_SET = set("的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处队南给色光门即保治北造百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清己美再采转更单风切打白教速花带安场身车例真至达走积示议声报斗完类八离华名确才科张信马节话米整空元况今集温传土许步群广石记需段研界拉林律叫且究观越织装影算低持音众书布复容儿须际商非验连断深难近矿千周委素技备半办青省列习便响约支般史感劳便团往酸历市克何除消构支般爱配胜降阶术")
-
-def _sample_text_metrics(raw_data: bytes, encoding: str) -> tuple[float, float, float, float]:
-    decoded = raw_data.decode(encoding, errors='replace')
-    if not decoded:
-        return 1.0, 0.0, 0.0, 0.0
-    total = len(decoded)
-    replacement = decoded.count('\ufffd')
-    control = sum(1 for ch in decoded if ord(ch) < 32 and ch not in '\t\n\r')
-    quality = (replacement + control) / total
-    cjk = sum(1 for ch in decoded if '\u4e00' <= ch <= '\u9fff') / total
-    ascii_letters = sum(1 for ch in decoded if ch.isascii() and ch.isalpha()) / total
-    common_cjk = sum(1 for ch in decoded if ch in _COMMON_CJK_SET) / total
-    return quality, cjk, ascii_letters, common_cjk
-
-
-def _is_text_sample_valid(file_path: Path, encoding: str) -> bool:
-    try:
-        with open(file_path, 'rb') as f:
-            raw_data = f.read(200000)
-    except Exception:
-        return False
-    quality, cjk_ratio, ascii_ratio, common_ratio = _sample_text_metrics(raw_data, encoding)
-    readable_ratio = cjk_ratio + ascii_ratio
-    return (
-        (quality <= 0.25 and readable_ratio >= 0.03 and common_ratio >= 0.01)
-        or readable_ratio >= 0.2
-        or ascii_ratio >= 0.2
-    )
-
-
-async def _read_txt_file_with_encoding(file_path: Path) -> tuple[Optional[str], Optional[str]]:
-    """读取TXT文件内容（支持多种编码和自动检测），返回(内容, 编码)"""
+async def _read_txt_file_with_encoding(
+    file_path: Path,
+    known: Optional[EncodingResult] = None
+) -> tuple[Optional[str], Optional[EncodingResult]]:
+    """读取TXT文件内容（已知编码时跳过检测），返回(内容, 编码)"""
     log.debug(f"开始读取TXT文件: {file_path}")
 
     if not file_path.exists():
         log.error(f"文件不存在: {file_path}")
         return None, None
 
-    if _is_probably_binary_file(file_path):
+    if known is None and is_probably_binary_file(file_path):
         file_size = file_path.stat().st_size
         if file_size > TXT_BINARY_STRICT_MAX_BYTES and file_path.suffix.lower() == ".txt":
             log.warning(f"疑似二进制特征但文件较大，继续尝试按TXT读取: {file_path.name}")
@@ -468,70 +537,97 @@ async def _read_txt_file_with_encoding(file_path: Path) -> tuple[Optional[str],
             log.error(f"疑似二进制文件，拒绝按TXT读取: {file_path}")
             raise HTTPException(status_code=415, detail="疑似非文本文件，可能扩展名错误或文件损坏")
 
-    encoding = _detect_txt_encoding(file_path)
+    encoding = known or detect_file_encoding(file_path)
     if not encoding:
         log.error(f"无法识别编码: {file_path}")
         return None, None
 
-    def decode_quality(text: str) -> float:
-        if not text:
-            return 1.0
-        total = len(text)
-        replacement = text.count('\ufffd')
-        control = sum(1 for ch in text if ord(ch) < 32 and ch not in '\t\n\r')
-        return (replacement + control) / total
-
     try:
-        with open(file_path, 'r', encoding=encoding, errors='replace') as f:
+        with open(file_path, 'r', encoding=encoding.encoding, errors='replace') as f:
             content = f.read()
         if decode_quality(content[:10000]) > 0.2:
-            log.warning(f"编码 {encoding} 读取质量较差: {file_path.name}")
-        log.debug(f"使用编码 {encoding} 读取文件: {file_path.name}")
+            log.warning(f"编码 {encoding.encoding} 读取质量较差: {file_path.name}")
+        log.debug(f"使用编码 {encoding.encoding} 读取文件: {file_path.name}")
         return _clean_txt_content(content), encoding
     except Exception as e:
-        log.error(f"使用编码 {encoding} 读取失败: {e}")
+        log.error(f"使用编码 {encoding.encoding} 读取失败: {e}")
         return None, None
 
 
-async def _read_txt_file(file_path: Path) -> Optional[str]:
+async def _read_txt_file(file_path: Path, known: Optional[EncodingResult] = None) -> Optional[str]:
     """读取TXT文件内容（支持多种编码和自动检测）"""
-    content, _encoding = await _read_txt_file_with_encoding(file_path)
+    content, _encoding = await _read_txt_file_with_encoding(file_path, known)
     return content
 
 
+async def _remember_txt_encoding(
+    version: BookVersion,
+    encoding: Optional[str],
+    confidence: Optional[float]
+) -> None:
+    """把实际使用的编码写回 BookVersion，之后的读取不再检测"""
+    if not encoding or encoding == version.encoding:
+        return
+    version_id = version.id
+
+    async def save(session: AsyncSession) -> None:
+        await session.execute(
+            update(BookVersion)
+            .where(BookVersion.id == version_id)
+            .values(encoding=encoding, encoding_confidence=confidence)
+        )
+
+    try:
+        await db_writer.submit(save)
+    except Exception as e:
+        log.warning(f"保存TXT编码失败: {version.file_path}, 错误: {e}")
+
+
 def _get_txt_cache_paths(file_path: Path) -> tuple[Path, Path, Path, str]:
     TXT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
     stat = file_path.stat()
     key = f"{file_path.name}_{stat.st_size}_{stat.st_mtime}"
     cache_key = hashlib.md5(key.encode()).hexdigest()
     text_path = TXT_CACHE_DIR / f"{cache_key}.utf8.txt"
-    index_path = TXT_CACHE_DIR / f"{cache_key}.index.json"
+    index_path = TXT_CACHE_DIR / f"{cache_key}.index.bin"
     fail_marker = TXT_CACHE_DIR / f"{cache_key}.fail"
     return text_path, index_path, fail_marker, cache_key
 
 
-def _load_txt_index(index_path: Path) -> Optional[dict]:
-    try:
-        with open(index_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        log.warning(f"读取TXT索引失败: {index_path.name}, 错误: {e}")
+def _migrate_json_index(file_path: Path, index_path: Path) -> Optional[txt_cache_index.TxtCacheIndex]:
+    """把旧版 JSON 索引转换为二进制索引（编码需通过抽样校验），没有旧索引时返回 None"""
+    legacy_path = index_path.with_name(index_path.name.replace(".index.bin", ".index.json"))
+    if not legacy_path.exists():
         return None
-
-
-def _write_txt_index(index_path: Path, data: dict) -> None:
-    tmp_path = index_path.with_suffix('.tmp')
     try:
-        with open(tmp_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=True)
-        tmp_path.replace(index_path)
+        with open(legacy_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
     except Exception as e:
-        log.warning(f"写入TXT索引失败: {index_path.name}, 错误: {e}")
-        try:
-            if tmp_path.exists():
-                tmp_path.unlink()
-        except Exception:
-            pass
+        log.warning(f"读取TXT索引失败: {legacy_path.name}, 错误: {e}")
+        data = {}
+    try:
+        legacy_path.unlink(missing_ok=True)
+    except Exception:
+        pass
+
+    encoding = data.get("encoding")
+    if not encoding or not is_text_sample_valid(file_path, encoding):
+        return None
+    text_path = index_path.with_name(index_path.name.replace(".index.bin", ".utf8.txt"))
+    stat = file_path.stat()
+    written = txt_cache_index.write_index(
+        index_path,
+        data.get("chapters", []),
+        data.get("total_length", 0),
+        data.get("total_bytes", 0),
+        stat.st_size,
+        stat.st_mtime_ns,
+        encoding,
+        txt_cache_index.scan_checkpoints(text_path),
+        data.get("encoding_confidence"),
+        data.get("chapter_rules"),
+    )
+    return txt_cache_index.open_index(index_path) if written else None
 
 
 def _read_txt_range(text_path: Path, start_byte: int, end_byte: int) -> str:
@@ -541,97 +637,46 @@ def _read_txt_range(text_path: Path, start_byte: int, end_byte: int) -> str:
     return chunk.decode('utf-8', errors='replace')
 
 
-def _clean_txt_line(line: str) -> str:
-    """按行清理 TXT 内容，减少零宽字符干扰"""
-    line = re.sub(r'[\u200b\u200c\u200d\ufeff]', '', line)
-    return line.rstrip()
+def _read_txt_chars(
+    text_path: Path,
+    index: txt_cache_index.TxtCacheIndex,
+    start: int,
+    end: int
+) -> Tuple[str, int, int]:
+    """按字符区间读取缓存文本，返回 (内容, startByte, endByte)，字节边界由检查点精确换算"""
+    with open(text_path, 'rb') as f:
+        start_byte = index.byte_offset(f, start)
+        end_byte = index.byte_offset(f, end)
+        f.seek(start_byte)
+        chunk = f.read(max(0, end_byte - start_byte))
+    return chunk.decode('utf-8', errors='replace'), start_byte, end_byte
 
 
-def _detect_chapter_candidates(
-    raw_line: str,
-    start_offset: int,
-    start_byte: int,
-    prev_blank: bool,
-    next_blank: bool,
-) -> list:
-    """基于单行判断是否为章节标题"""
-    import re
+_ZERO_WIDTH_RE = re.compile(r'[\u200b\u200c\u200d\ufeff]')
+_TRAILING_SPACE_RE = re.compile(r'[^\S\n]+$', re.MULTILINE)
 
-    max_title_len = 50
-    strong_patterns = [
-        r'^第[零一二三四五六七八九十百千万亿\d]+[章节卷集部篇回].*$',
-        r'^(正文\s*)?第[零一二三四五六七八九十百千万亿\d]+[章节卷集部篇回].*$',
-        r'^Chapter\s+\d+.*$',
-        r'^卷[零一二三四五六七八九十百千万亿\d]+.*$',
-        r'^(序章|楔子|引子|前言|后记|尾声|番外|终章|大结局).*$',
-        r'^[【\[\(].+[】\]\)]$',
-    ]
-    weak_patterns = [
-        r'^\d{1,4}[\.、]\s*.*$',
-        r'^\d{1,4}\s+.*$',
-    ]
-    inline_strong = re.compile(
-        r'(正文\s*)?第[零一二三四五六七八九十百千万亿\d]+[章节卷集部篇回][^\n]{0,40}',
-        re.IGNORECASE
-    )
 
-    line = raw_line.strip()
-    if not line:
-        return []
-
-    has_blank_neighbor = prev_blank or next_blank
-    is_body_only = line in ('正文', '正文：', '正文:')
-    candidates = []
-    strong_regexes = [re.compile(p, re.IGNORECASE) for p in strong_patterns]
-    weak_regexes = [re.compile(p, re.IGNORECASE) for p in weak_patterns]
-
-    if len(line) <= max_title_len:
-        for pattern in strong_regexes:
-            if pattern.match(line):
-                candidates.append({
-                    "title": line,
-                    "startOffset": start_offset,
-                    "startByte": start_byte,
-                    "strength": 3,
-                    "is_body_only": is_body_only
-                })
-                return candidates
-
-    if len(line) <= max_title_len and has_blank_neighbor:
-        for pattern in weak_regexes:
-            if pattern.match(line):
-                candidates.append({
-                    "title": line,
-                    "startOffset": start_offset,
-                    "startByte": start_byte,
-                    "strength": 1,
-                    "is_body_only": is_body_only
-                })
-                return candidates
-
-    match = inline_strong.search(raw_line)
-    if match:
-        title = match.group().strip()
-        if len(title) <= max_title_len:
-            byte_offset = start_byte + len(raw_line[:match.start()].encode('utf-8'))
-            candidates.append({
-                "title": title,
-                "startOffset": start_offset + match.start(),
-                "startByte": byte_offset,
-                "strength": 2,
-                "is_body_only": False
-            })
+def _clean_txt_line(line: str) -> str:
+    """按行清理 TXT 内容，减少零宽字符干扰"""
+    return _ZERO_WIDTH_RE.sub('', line).rstrip()
 
-    return candidates
+
+def _clean_txt_lines(text: str) -> str:
+    """按块清理多行 TXT 内容（与逐行 _clean_txt_line 结果相同，保留换行）"""
+    return _TRAILING_SPACE_RE.sub('', _ZERO_WIDTH_RE.sub('', text))
 
 
 def _finalize_chapters(
     candidates: list,
     total_length: int,
-    total_bytes: int
+    total_bytes: int,
+    byte_at: Callable[[int], int]
 ) -> list:
-    """整理候选章节并补齐 endOffset/endByte"""
-    min_gap = 40
+    """
+    整理候选章节并补齐 endOffset/endByte，过大的章节拆分
+
+    拆分点取在字符边界上，对应字节偏移由 byte_at（字符偏移 -> 精确字节偏移）给出。
+    """
     if not candidates:
         chapters = []
         if total_bytes <= 0:
@@ -642,80 +687,46 @@ def _finalize_chapters(
                 "startByte": 0,
                 "endByte": total_bytes
             }]
-        avg_bytes = total_bytes / max(1, total_length)
         chunk_count = math.ceil(total_bytes / TXT_FALLBACK_CHUNK_BYTES)
+        bounds = [total_length * idx // chunk_count for idx in range(chunk_count + 1)]
+        byte_bounds = [byte_at(offset) for offset in bounds]
         for idx in range(chunk_count):
-            start_byte = idx * TXT_FALLBACK_CHUNK_BYTES
-            end_byte = min(total_bytes, start_byte + TXT_FALLBACK_CHUNK_BYTES)
-            start_offset = int(start_byte / avg_bytes)
-            end_offset = int(end_byte / avg_bytes)
             chapters.append({
                 "title": f"正文 {idx + 1}/{chunk_count}",
-                "startOffset": start_offset,
-                "endOffset": end_offset,
-                "startByte": start_byte,
-                "endByte": end_byte
+                "startOffset": bounds[idx],
+                "endOffset": bounds[idx + 1],
+                "startByte": byte_bounds[idx],
+                "endByte": byte_bounds[idx + 1]
             })
         return chapters
 
-    candidates.sort(key=lambda x: x["startOffset"])
-    filtered = []
-    for cand in candidates:
-        if filtered and cand["startOffset"] - filtered[-1]["startOffset"] <= min_gap:
-            if cand["strength"] > filtered[-1]["strength"]:
-                filtered[-1] = cand
-            continue
-        filtered.append(cand)
-
-    if any(not c.get("is_body_only") for c in filtered):
-        filtered = [c for c in filtered if not c.get("is_body_only")]
-
-    chapters = []
-    for i, match in enumerate(filtered):
-        next_match = filtered[i + 1] if i < len(filtered) - 1 else None
-        end_offset = next_match["startOffset"] if next_match else total_length
-        end_byte = next_match["startByte"] if next_match else total_bytes
-        chapters.append({
-            "title": match["title"],
-            "startOffset": match["startOffset"],
-            "endOffset": end_offset,
-            "startByte": match["startByte"],
-            "endByte": end_byte
-        })
-
-    if filtered and filtered[0]["startOffset"] > 100:
-        chapters.insert(0, {
-            "title": "序",
-            "startOffset": 0,
-            "endOffset": filtered[0]["startOffset"],
-            "startByte": 0,
-            "endByte": filtered[0]["startByte"]
-        })
+    chapters = build_chapters(candidates, total_length, total_bytes)
 
     if not chapters:
         return chapters
 
-    avg_bytes = total_bytes / max(1, total_length)
     expanded = []
     for chapter in chapters:
-        start_byte = chapter["startByte"]
-        end_byte = chapter["endByte"]
-        size = end_byte - start_byte
+        size = chapter["endByte"] - chapter["startByte"]
         if size <= TXT_MAX_CHAPTER_BYTES:
             expanded.append(chapter)
             continue
         parts = max(1, math.ceil(size / TXT_MAX_CHAPTER_BYTES))
+        start_offset = chapter["startOffset"]
+        span = chapter["endOffset"] - start_offset
+        bounds = [start_offset + span * idx // parts for idx in range(parts + 1)]
+        byte_bounds = (
+            [chapter["startByte"]]
+            + [byte_at(offset) for offset in bounds[1:-1]]
+            + [chapter["endByte"]]
+        )
         for idx in range(parts):
-            part_start = start_byte + idx * TXT_MAX_CHAPTER_BYTES
-            part_end = min(end_byte, part_start + TXT_MAX_CHAPTER_BYTES)
-            part_start_offset = int(part_start / avg_bytes)
-            part_end_offset = int(part_end / avg_bytes)
             expanded.append({
                 "title": f"{chapter['title']} ({idx + 1}/{parts})",
-                "startOffset": part_start_offset,
-                "endOffset": part_end_offset,
-                "startByte": part_start,
-                "endByte": part_end
+                "startOffset": bounds[idx],
+                "endOffset": bounds[idx + 1],
+                "startByte": byte_bounds[idx],
+                "endByte": byte_bounds[idx + 1]
             })
 
     return expanded
@@ -725,45 +736,43 @@ def _build_txt_cache_streaming(
     file_path: Path,
     text_path: Path,
     index_path: Path,
-    encoding: str,
+    encoding: EncodingResult,
+    progress: Optional[Callable[[int, int], None]] = None,
 ) -> Optional[dict]:
-    """流式构建 TXT UTF-8 缓存与章节索引"""
+    """流式构建 TXT UTF-8 缓存与章节索引（按块清理、写入和识别章节）"""
     tmp_text_path = text_path.with_suffix('.tmp')
-    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    source_stat = file_path.stat()
+    source_bytes = source_stat.st_size
+    bytes_read = 0
+    decoder = codecs.getincrementaldecoder(encoding.encoding)(errors='replace')
     buffer = ""
     pending_cr = False
     total_length = 0
     total_bytes = 0
-    candidates = []
-    prev_line = None
-    prev_start_offset = 0
-    prev_start_byte = 0
-    prev_blank = True
+    rules = get_chapter_rules()
+    scanner = ChapterScanner(rules, track_bytes=True)
+    checkpoints = txt_cache_index.CheckpointRecorder()
 
     try:
         with open(file_path, 'rb') as src, open(tmp_text_path, 'wb') as dst:
-            def flush_long_segment(segment: str) -> None:
-                nonlocal total_length, total_bytes, prev_line, prev_blank, prev_start_offset, prev_start_byte
-                if not segment:
-                    return
-                line = _clean_txt_line(segment)
-                if not line:
+            def write_text(text: str) -> None:
+                nonlocal total_length, total_bytes
+                if not text:
                     return
-                line_start_offset = total_length
-                line_start_byte = total_bytes
-                line_bytes = line.encode('utf-8')
-                dst.write(line_bytes)
-                total_length += len(line)
-                total_bytes += len(line_bytes)
-                prev_line = None
-                prev_blank = False
-                prev_start_offset = line_start_offset
-                prev_start_byte = line_start_byte
+                data = text.encode('utf-8')
+                dst.write(data)
+                total_length += len(text)
+                total_bytes += len(data)
+                scanner.feed(text)
+                checkpoints.feed(text, len(data))
 
             while True:
                 chunk = src.read(TXT_STREAM_CHUNK_SIZE)
                 if not chunk:
                     break
+                bytes_read += len(chunk)
+                if progress:
+                    progress(bytes_read, source_bytes)
                 decoded = decoder.decode(chunk)
                 if not decoded:
                     continue
@@ -782,34 +791,12 @@ def _build_txt_cache_streaming(
                 while '\n' not in buffer and len(buffer) > TXT_MAX_LINE_BUFFER_CHARS:
                     flush_part = buffer[:TXT_LONG_LINE_FLUSH_CHARS]
                     buffer = buffer[TXT_LONG_LINE_FLUSH_CHARS:]
-                    flush_long_segment(flush_part)
-
-                while '\n' in buffer:
-                    line, buffer = buffer.split('\n', 1)
-                    line = _clean_txt_line(line)
-                    line_blank = not line.strip()
-                    if prev_line is not None:
-                        candidates.extend(
-                            _detect_chapter_candidates(
-                                prev_line,
-                                prev_start_offset,
-                                prev_start_byte,
-                                prev_blank,
-                                line_blank
-                            )
-                        )
-                        prev_blank = not prev_line.strip()
-
-                    line_start_offset = total_length
-                    line_start_byte = total_bytes
-                    line_bytes = (line + '\n').encode('utf-8')
-                    dst.write(line_bytes)
-                    total_length += len(line) + 1
-                    total_bytes += len(line_bytes)
-
-                    prev_line = line
-                    prev_start_offset = line_start_offset
-                    prev_start_byte = line_start_byte
+                    write_text(_clean_txt_line(flush_part))
+
+                last_newline = buffer.rfind('\n')
+                if last_newline >= 0:
+                    write_text(_clean_txt_lines(buffer[:last_newline + 1]))
+                    buffer = buffer[last_newline + 1:]
 
             decoded = decoder.decode(b'', final=True)
             if pending_cr:
@@ -823,36 +810,11 @@ def _build_txt_cache_streaming(
             decoded = decoded.replace('\r', '\n')
             buffer += decoded
 
-            final_line = _clean_txt_line(buffer)
-            final_blank = not final_line.strip()
-            if prev_line is not None:
-                candidates.extend(
-                    _detect_chapter_candidates(
-                        prev_line,
-                        prev_start_offset,
-                        prev_start_byte,
-                        prev_blank,
-                        final_blank
-                    )
-                )
-                prev_blank = not prev_line.strip()
-
-            if final_line:
-                final_start_offset = total_length
-                final_start_byte = total_bytes
-                final_bytes = final_line.encode('utf-8')
-                dst.write(final_bytes)
-                total_length += len(final_line)
-                total_bytes += len(final_bytes)
-                candidates.extend(
-                    _detect_chapter_candidates(
-                        final_line,
-                        final_start_offset,
-                        final_start_byte,
-                        prev_blank,
-                        True
-                    )
-                )
+            last_newline = buffer.rfind('\n')
+            if last_newline >= 0:
+                write_text(_clean_txt_lines(buffer[:last_newline + 1]))
+                buffer = buffer[last_newline + 1:]
+            write_text(_clean_txt_line(buffer))
 
         tmp_text_path.replace(text_path)
     except Exception as e:
@@ -864,42 +826,154 @@ def _build_txt_cache_streaming(
             pass
         return None
 
-    chapters = _finalize_chapters(candidates, total_length, total_bytes)
-    index_data = {
-        "encoding": encoding,
-        "total_length": total_length,
-        "total_bytes": total_bytes,
-        "chapters": chapters,
-    }
-    _write_txt_index(index_path, index_data)
+    with open(text_path, 'rb') as f:
+        chapters = _finalize_chapters(
+            scanner.close(),
+            total_length,
+            total_bytes,
+            lambda offset: txt_cache_index.char_to_byte(
+                f, checkpoints.points, checkpoints.interval, offset
+            ),
+        )
+    written = txt_cache_index.write_index(
+        index_path,
+        chapters,
+        total_length,
+        total_bytes,
+        source_stat.st_size,
+        source_stat.st_mtime_ns,
+        encoding.encoding,
+        checkpoints.points,
+        encoding.confidence,
+        rules.fingerprint,
+    )
+    index = txt_cache_index.open_index(index_path) if written else None
+    if index is None:
+        return None
+    txt_cache_index.remember_index(file_path, source_stat, index)
+    if settings.reader.precompress_chapters:
+        txt_chapter_blobs.write_blobs(text_path, index)
     return {
         "text_path": text_path,
-        "index": index_data
+        "index": index
     }
 
 
-async def _ensure_txt_cache(file_path: Path) -> Optional[dict]:
+def _refresh_txt_chapters(
+    file_path: Path,
+    stat: os.stat_result,
+    text_path: Path,
+    index_path: Path,
+    index: txt_cache_index.TxtCacheIndex
+) -> txt_cache_index.TxtCacheIndex:
+    """章节规则变化后，从已缓存的 UTF-8 文本重新识别章节（不重新解码原文件）"""
+    rules = get_chapter_rules()
+    scanner = ChapterScanner(rules, track_bytes=True)
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    with open(text_path, 'rb') as f:
+        while chunk := f.read(TXT_STREAM_CHUNK_SIZE):
+            scanner.feed(decoder.decode(chunk))
+        scanner.feed(decoder.decode(b'', final=True))
+        chapters = _finalize_chapters(
+            scanner.close(),
+            index.total_length,
+            index.total_bytes,
+            lambda offset: index.byte_offset(f, offset),
+        )
+    # 缓存文本未变，沿用原检查点
+    written = txt_cache_index.write_index(
+        index_path,
+        chapters,
+        index.total_length,
+        index.total_bytes,
+        index.source_size,
+        index.source_mtime_ns,
+        index.encoding,
+        index.checkpoints,
+        index.encoding_confidence,
+        rules.fingerprint,
+        index.checkpoint_interval,
+    )
+    refreshed = txt_cache_index.open_index(index_path) if written else None
+    if refreshed is None:
+        return index
+    txt_cache_index.remember_index(file_path, stat, refreshed)
+    if settings.reader.precompress_chapters:
+        txt_chapter_blobs.write_blobs(text_path, refreshed)
+    return refreshed
+
+
+def _load_ready_txt_cache(
+    file_path: Path,
+    text_path: Path,
+    index_path: Path,
+    known_encoding: Optional[str] = None
+) -> Optional[dict]:
+    """
+    读取已构建的 TXT 缓存（同步），编码疑似错误时清理缓存并返回 None
+
+    索引按源文件状态缓存在进程内；缓存戳与源文件一致、或编码与版本上保存的一致时不再抽样校验。
+    """
+    if not text_path.exists():
+        return None
+
+    stat = file_path.stat()
+    index = txt_cache_index.get_index(index_path, file_path, stat)
+    if index is None:
+        index = _migrate_json_index(file_path, index_path)
+        if index is not None:
+            txt_cache_index.remember_index(file_path, stat, index)
+    if index is not None:
+        encoding = index.encoding
+        if encoding and (
+            index.matches_source(stat)
+            or encoding == known_encoding
+            or is_text_sample_valid(file_path, encoding)
+        ):
+            if index.chapter_rules != get_chapter_rules().fingerprint:
+                try:
+                    index = _refresh_txt_chapters(file_path, stat, text_path, index_path, index)
+                except Exception as e:
+                    log.warning(f"重新识别TXT章节失败: {file_path.name}, 错误: {e}")
+            return {
+                "text_path": text_path,
+                "index": index
+            }
+        log.warning(f"TXT缓存编码疑似错误，触发重建: {file_path.name} ({encoding})")
+    txt_cache_index.forget_index(file_path, stat)
+    try:
+        text_path.unlink(missing_ok=True)
+        index_path.unlink(missing_ok=True)
+    except Exception:
+        pass
+    txt_chapter_blobs.remove_blobs(text_path)
+    txt_search.remove_search_index(text_path)
+    return None
+
+
+def _prepare_txt_cache(
+    file_path: Path,
+    known: Optional[EncodingResult] = None,
+    progress: Optional[Callable[[int, int], None]] = None
+) -> Optional[dict]:
+    """
+    检测编码并构建 TXT 缓存（同步，在缓存构建线程池中执行）
+
+    Args:
+        file_path: TXT 文件路径
+        known: 版本上保存的编码（有则跳过检测）
+        progress: 进度回调 (已读取字节数, 文件总字节数)
+    """
     text_path, index_path, fail_marker, _cache_key = _get_txt_cache_paths(file_path)
 
-    if text_path.exists() and index_path.exists():
-        index = _load_txt_index(index_path)
-        if index:
-            encoding = index.get("encoding")
-            if encoding and _is_text_sample_valid(file_path, encoding):
-                return {
-                    "text_path": text_path,
-                    "index": index
-                }
-            log.warning(f"TXT缓存编码疑似错误，触发重建: {file_path.name} ({encoding})")
-            try:
-                text_path.unlink(missing_ok=True)
-                index_path.unlink(missing_ok=True)
-            except Exception:
-                pass
+    # 排队期间可能已由其他进程构建完成
+    cached = _load_ready_txt_cache(file_path, text_path, index_path, known.encoding if known else None)
+    if cached:
+        return cached
 
     if fail_marker.exists():
-        encoding = _detect_txt_encoding(file_path)
-        if encoding and _is_text_sample_valid(file_path, encoding):
+        encoding = known or detect_file_encoding(file_path)
+        if encoding and is_text_sample_valid(file_path, encoding.encoding):
             try:
                 fail_marker.unlink()
             except Exception:
@@ -907,15 +981,15 @@ async def _ensure_txt_cache(file_path: Path) -> Optional[dict]:
         else:
             return None
 
-    binary_hint = _is_probably_binary_file(file_path)
-    encoding = _detect_txt_encoding(file_path)
+    binary_hint = is_probably_binary_file(file_path)
+    encoding = known or detect_file_encoding(file_path)
     if not encoding:
         try:
             fail_marker.touch(exist_ok=True)
         except Exception:
             pass
         return None
-    if binary_hint and not _is_text_sample_valid(file_path, encoding):
+    if binary_hint and not is_text_sample_valid(file_path, encoding.encoding):
         file_size = file_path.stat().st_size
         if file_size > TXT_BINARY_STRICT_MAX_BYTES and file_path.suffix.lower() == ".txt":
             log.warning(f"疑似二进制特征但文件较大，继续尝试按TXT读取: {file_path.name}")
@@ -928,7 +1002,9 @@ async def _ensure_txt_cache(file_path: Path) -> Optional[dict]:
                 pass
             raise HTTPException(status_code=415, detail="疑似非文本文件，可能扩展名错误或文件损坏")
 
-    cache_result = _build_txt_cache_streaming(file_path, text_path, index_path, encoding)
+    cache_result = _build_txt_cache_streaming(
+        file_path, text_path, index_path, encoding, progress=progress
+    )
     if not cache_result:
         try:
             fail_marker.touch(exist_ok=True)
@@ -938,6 +1014,79 @@ async def _ensure_txt_cache(file_path: Path) -> Optional[dict]:
     return cache_result
 
 
+async def _ensure_txt_cache(file_path: Path, version: Optional[BookVersion] = None) -> Optional[dict]:
+    """
+    获取 TXT 缓存，不存在时交给缓存构建线程池构建
+
+    同一文件的并发请求只会触发一次构建，其余请求等待同一结果。
+    传入 version 时使用其保存的编码，并把缓存实际使用的编码写回。
+    """
+    text_path, index_path, _fail_marker, cache_key = _get_txt_cache_paths(file_path)
+    known = EncodingResult.from_version(version) if version is not None else None
+
+    loop = asyncio.get_event_loop()
+    cached = await loop.run_in_executor(
+        None, _load_ready_txt_cache, file_path, text_path, index_path, known.encoding if known else None
+    )
+    if not cached:
+        cached = await txt_cache_builder.build(
+            cache_key,
+            _prepare_txt_cache,
+            file_path,
+            known,
+            label=file_path.name
+        )
+    if cached and version is not None:
+        index = cached["index"]
+        await _remember_txt_encoding(version, index.encoding, index.encoding_confidence)
+    return cached
+
+
+async def prewarm_txt_cache(file_path: Path) -> bool:
+    """
+    预热单个 TXT 文件的阅读缓存（供管理后台批量预热调用）
+
+    Returns:
+        缓存是否可用
+    """
+    try:
+        return await _ensure_txt_cache(file_path) is not None
+    except HTTPException:
+        return False
+    except Exception as e:
+        log.warning(f"预热TXT缓存失败: {file_path}, 错误: {e}")
+        return False
+
+
+@router.get("/books/{book_id}/cache-status")
+async def get_book_cache_status(
+    book: Book = Depends(get_accessible_book),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    查询 TXT 阅读缓存状态（首次打开大文件时用于显示构建进度）
+
+    返回:
+    - state: ready / building / queued / missing
+    - progress: 构建进度（仅构建中返回）
+    """
+    await db.refresh(book, ['versions'])
+
+    version = await _get_valid_version(book)
+    file_path = Path(version.file_path)
+    if version.file_format.lower() not in ['txt', '.txt']:
+        raise HTTPException(status_code=400, detail="仅支持TXT在线阅读，请下载原文件")
+
+    text_path, index_path, _fail_marker, cache_key = _get_txt_cache_paths(file_path)
+    progress = txt_cache_builder.get_progress(cache_key)
+    if progress:
+        return {"state": progress["state"], "progress": progress}
+    if text_path.exists() and index_path.exists():
+        return {"state": "ready", "progress": None}
+    return {"state": "missing", "progress": None}
+
+
 @router.get("/books/{book_id}/content")
 async def get_book_content(
     page: int = Query(0, ge=0, description="页码，从0开始（兼容旧API）"),
@@ -964,10 +1113,19 @@ async def get_book_content(
     # 根据文件格式返回内容
     file_format = version.file_format.lower()
     
+    if file_format in COMIC_FORMATS:
+        from app.core.comic_pages import comic_page_server
+
+        _, images = await asyncio.to_thread(comic_page_server.get_pages, file_path)
+        return {
+            "format": "comic",
+            "images": images,
+        }
+
     if file_format not in ['txt', '.txt']:
         raise HTTPException(status_code=400, detail="仅支持TXT在线阅读，请下载原文件")
 
-    return await _read_txt_content(file_path, page)
+    return await _read_txt_content(file_path, page, version)
 
 
 @router.post("/books/{book_id}/convert")
@@ -1082,10 +1240,26 @@ async def get_converted_book(
     )
 
 
+COMIC_FORMATS = ['zip', '.zip', 'cbz', '.cbz']
+COMIC_CACHE_CONTROL = "private, max-age=86400"
+
+
+async def _get_comic_path(book: Book, db: AsyncSession) -> Path:
+    """获取漫画书籍的文件路径（非漫画格式时返回 400）"""
+    await db.refresh(book, ['versions'])
+
+    version = await _get_valid_version(book)
+    if version.file_format.lower() not in COMIC_FORMATS:
+        raise HTTPException(status_code=400, detail="不是漫画文件")
+    return Path(version.file_path)
+
+
 @router.get("/books/{book_id}/comic/page/{index}")
 async def get_comic_page(
     book_id: int,
     index: int,
+    request: Request,
+    width: Optional[int] = Query(None, ge=1, description="缩放宽度（返回 WebP，原图更窄时返回原图）"),
     book: Book = Depends(get_accessible_book),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -1093,54 +1267,101 @@ async def get_comic_page(
     """
     获取漫画页面图片
     
+    页面列表和压缩包句柄由 comic_page_server 缓存，翻页不再重复解析压缩包。
+    支持 ETag（304）和 Range 请求。
+    
     Args:
         index: 图片索引（从0开始，对应 TOC 返回的 images 列表索引）
+        width: 可选的缩放宽度
     """
-    from sqlalchemy.orm import selectinload
-    
-    await db.refresh(book, ['versions'])
-    
-    version = await _get_valid_version(book)
-    file_path = Path(version.file_path)
-    file_format = version.file_format.lower()
-    if file_format not in ['zip', '.zip', 'cbz', '.cbz']:
-        raise HTTPException(status_code=400, detail="不是漫画文件")
+    from app.core.comic_pages import comic_page_server, image_mime_type, key_digest, normalize_width
+    from app.utils.http_cache import bytes_response, etag_matches, make_etag, not_modified
 
-    # 获取图片列表
-    images = ComicParser.get_image_list(file_path)
-    
-    if index < 0 or index >= len(images):
+    file_path = await _get_comic_path(book, db)
+
+    try:
+        if width is not None:
+            width = normalize_width(width)
+            rendition = await asyncio.to_thread(comic_page_server.get_rendition, file_path, index, width)
+            if rendition is None:
+                raise HTTPException(status_code=404, detail="页面索引超出范围")
+            key, rendition_path = rendition
+            if rendition_path is not None:
+                etag = make_etag(key_digest(key), index, f"w{width}")
+                if etag_matches(request, etag):
+                    return not_modified(etag, COMIC_CACHE_CONTROL)
+                return FileResponse(
+                    rendition_path,
+                    media_type="image/webp",
+                    headers={"ETag": etag, "Cache-Control": COMIC_CACHE_CONTROL}
+                )
+
+        page = await asyncio.to_thread(comic_page_server.read_page, file_path, index)
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.error(f"读取漫画页面失败: {file_path} #{index}, 错误: {e}")
+        raise HTTPException(status_code=500, detail="读取图片失败")
+
+    if page is None:
         raise HTTPException(status_code=404, detail="页面索引超出范围")
-        
-    image_info = images[index]
-    filename = image_info['filename']
-    
-    # 获取图片数据
-    image_data = ComicParser.get_image_data(file_path, filename)
+    key, filename, image_data = page
+
+    return bytes_response(
+        request,
+        image_data,
+        image_mime_type(filename),
+        make_etag(key_digest(key), index),
+        COMIC_CACHE_CONTROL
+    )
+
+
+@router.get("/books/{book_id}/comic/prefetch")
+async def prefetch_comic_pages(
+    book_id: int,
+    start: int = Query(..., ge=0, description="起始页面索引"),
+    count: int = Query(3, ge=1, le=10, description="预取页数"),
+    width: Optional[int] = Query(None, ge=1, description="缩放宽度"),
+    book: Book = Depends(get_accessible_book),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    预取提示：预热页面列表，并在后台生成后续页面的缩放版本
     
-    if image_data is None:
-        raise HTTPException(status_code=500, detail="读取图片失败")
-        
-    # 确定 MIME type
-    ext = Path(filename).suffix.lower()
-    mime_type = "image/jpeg"
-    if ext == '.png':
-        mime_type = "image/png"
-    elif ext == '.webp':
-        mime_type = "image/webp"
-    elif ext == '.gif':
-        mime_type = "image/gif"
-        
-    return Response(content=image_data, media_type=mime_type)
+    Returns:
+        后续页面的地址，前端可据此发起低优先级预加载
+    """
+    from app.core.comic_pages import comic_page_server, normalize_width
 
+    file_path = await _get_comic_path(book, db)
+    if width is not None:
+        width = normalize_width(width)
+
+    try:
+        indexes = await asyncio.to_thread(comic_page_server.prefetch, file_path, start, count, width)
+    except Exception as e:
+        log.error(f"漫画预取失败: {file_path}, 错误: {e}")
+        raise HTTPException(status_code=500, detail="读取漫画文件失败")
 
-async def _read_txt_content(file_path: Path, page: int = 0) -> dict:
+    suffix = f"?width={width}" if width is not None else ""
+    return {
+        "width": width,
+        "pages": [
+            {"index": i, "url": f"/api/books/{book_id}/comic/page/{i}{suffix}"}
+            for i in indexes
+        ]
+    }
+
+
+async def _read_txt_content(file_path: Path, page: int = 0, version: Optional[BookVersion] = None) -> dict:
     """
     读取TXT文件内容（支持分页）
     
     Args:
         file_path: 文件路径
         page: 页码（从0开始）
+        version: 书籍版本（提供时复用并回写其编码）
     """
     import re
     
@@ -1149,12 +1370,11 @@ async def _read_txt_content(file_path: Path, page: int = 0) -> dict:
         is_large_file = file_size > LARGE_FILE_THRESHOLD
 
         if is_large_file:
-            cache = await _ensure_txt_cache(file_path)
+            cache = await _ensure_txt_cache(file_path, version)
             if not cache:
                 raise HTTPException(status_code=500, detail="无法读取文件内容")
             index = cache["index"]
-            total_length = index.get("total_length", 0)
-            total_bytes = index.get("total_bytes", 0)
+            total_length = index.total_length
             if total_length <= 0:
                 raise HTTPException(status_code=500, detail="无法读取文件内容")
 
@@ -1167,10 +1387,9 @@ async def _read_txt_content(file_path: Path, page: int = 0) -> dict:
                     detail=f"页码超出范围，最大页码为 {total_pages - 1}"
                 )
 
-            avg_bytes = total_bytes / max(1, total_length)
-            start_byte = int(start * avg_bytes)
-            end_byte = int(min(total_bytes, end * avg_bytes))
-            page_content = _read_txt_range(cache["text_path"], start_byte, end_byte)
+            page_content, start_byte, end_byte = _read_txt_chars(
+                cache["text_path"], index, start, end
+            )
 
             return {
                 "format": "txt",
@@ -1185,12 +1404,15 @@ async def _read_txt_content(file_path: Path, page: int = 0) -> dict:
                 "endByte": end_byte
             }
 
-        content = await _read_txt_file(file_path)
+        known = EncodingResult.from_version(version) if version is not None else None
+        content, encoding = await _read_txt_file_with_encoding(file_path, known)
         if content is None:
             raise HTTPException(
                 status_code=500,
                 detail="无法解码文件内容"
             )
+        if version is not None and encoding:
+            await _remember_txt_encoding(version, encoding.encoding, encoding.confidence)
 
         total_length = len(content)
         total_pages = (total_length + CHARS_PER_PAGE - 1) // CHARS_PER_PAGE
@@ -1266,10 +1488,7 @@ async def download_book(
         raise HTTPException(status_code=401, detail=f"Token 验证失败: {str(e)}")
     
     # 获取用户
-    result = await db.execute(
-        select(User).where(User.username == username)
-    )
-    current_user = result.scalar_one_or_none()
+    current_user = await access_context_cache.get_user(db, username)
     
     if not current_user:
         raise HTTPException(status_code=401, detail="用户不存在")
@@ -1300,7 +1519,7 @@ async def download_book(
 
 @router.get("/books/{book_id}/search")
 async def search_in_book(
-    keyword: str = Query(..., min_length=1, max_length=100, description="搜索关键词"),
+    keyword: str = Query(..., min_length=1, max_length=txt_search.MAX_KEYWORD_CHARS, description="搜索关键词"),
     page: int = Query(0, ge=0, description="结果页码"),
     page_size: int = Query(20, ge=1, le=100, description="每页结果数"),
     book: Book = Depends(get_accessible_book),
@@ -1316,8 +1535,6 @@ async def search_in_book(
     - page: 当前页
     - totalPages: 总页数
     """
-    import re
-    
     await db.refresh(book, ['versions'])
     
     version = await _get_valid_version(book)
@@ -1327,67 +1544,53 @@ async def search_in_book(
     if file_format not in ['txt', '.txt']:
         raise HTTPException(status_code=400, detail="书内搜索仅支持TXT格式")
 
-    # 读取文件内容
-    content = await _read_txt_file(file_path)
-        
-    if content is None:
+    cache = await _ensure_txt_cache(file_path, version)
+    if not cache:
         raise HTTPException(status_code=500, detail="无法读取文件内容")
-    
-    # 解析章节
-    all_chapters = _parse_chapters(content)
-    
-    # 搜索关键词（不区分大小写）
+    index = cache["index"]
+
+    # 基于缓存文本的 n-gram 索引搜索，只扫描候选块并只构建当前页结果
+    loop = asyncio.get_event_loop()
+    result = await loop.run_in_executor(
+        None,
+        txt_search.search_text,
+        cache["text_path"],
+        keyword,
+        page * page_size,
+        page_size,
+        50
+    )
+    if result is None:
+        raise HTTPException(status_code=500, detail="书内搜索索引构建失败")
+    total, raw_matches = result
+
+    # 按字节偏移二分查找所属章节
+    chapter_starts = index.start_bytes
     matches = []
-    keyword_lower = keyword.lower()
-    context_chars = 50  # 上下文字符数
-    
-    # 使用正则搜索，支持中文
-    pattern = re.compile(re.escape(keyword), re.IGNORECASE)
-    
-    for match in pattern.finditer(content):
-        start_pos = match.start()
-        end_pos = match.end()
-        
-        # 找出该位置所属的章节
-        chapter_index = 0
-        chapter_title = "未知章节"
-        chapter_start_offset = 0
-        
-        for i, ch in enumerate(all_chapters):
-            if ch["startOffset"] <= start_pos < ch["endOffset"]:
-                chapter_index = i
-                chapter_title = ch["title"]
-                chapter_start_offset = ch["startOffset"]
-                break
-        
-        # 提取上下文
-        context_start = max(0, start_pos - context_chars)
-        context_end = min(len(content), end_pos + context_chars)
-        context_text = content[context_start:context_end]
-        
-        # 计算关键词在上下文中的位置
-        highlight_start = start_pos - context_start
-        highlight_end = end_pos - context_start
-        
+    for item in raw_matches:
+        chapter_index = max(0, bisect.bisect_right(chapter_starts, item["byte"]) - 1)
+        if len(index):
+            chapter_title = index.title(chapter_index)
+            chapter_start_offset = index.start_offsets[chapter_index]
+        else:
+            chapter_title = "未知章节"
+            chapter_start_offset = 0
+
         matches.append({
             "chapterIndex": chapter_index,
             "chapterTitle": chapter_title,
-            "position": start_pos,
-            "positionInChapter": start_pos - chapter_start_offset,
-            "context": context_text,
-            "highlightStart": highlight_start,
-            "highlightEnd": highlight_end,
+            "position": item["position"],
+            "positionInChapter": max(0, item["position"] - chapter_start_offset),
+            "context": item["context"],
+            "highlightStart": item["highlightStart"],
+            "highlightEnd": item["highlightEnd"],
         })
-    
-    # 分页
-    total = len(matches)
+
     total_pages = (total + page_size - 1) // page_size if total > 0 else 0
-    start_idx = page * page_size
-    end_idx = min(start_idx + page_size, total)
     
     return {
         "keyword": keyword,
-        "matches": matches[start_idx:end_idx],
+        "matches": matches,
         "total": total,
         "page": page,
         "pageSize": page_size,
@@ -1395,10 +1598,17 @@ async def search_in_book(
     }
 
 
+COVER_CACHE_IMMUTABLE = "public, max-age=31536000, immutable"
+COVER_CACHE_REVALIDATE = "public, no-cache"
+
+
 @router.get("/books/{book_id}/cover")
 async def get_book_cover(
     book_id: int,
+    request: Request,
     size: str = Query("original", pattern="^(original|thumbnail)$"),
+    w: Optional[int] = Query(None, ge=1, le=4096, description="目标宽度（对齐到配置的多尺寸封面宽度）"),
+    v: Optional[str] = Query(None, description="封面版本号（列表接口返回的版本化地址）"),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -1407,303 +1617,52 @@ async def get_book_cover(
     
     参数:
     - size: original(原图) 或 thumbnail(缩略图)
+    - w: 目标宽度，指定时按 Accept 头返回 AVIF/WebP/JPEG 多尺寸封面（优先于 size）
+    - v: 封面版本号，与当前封面一致时响应可被永久缓存
+    
+    响应带内容 Hash ETag 和 Last-Modified；封面解析结果缓存在内存中，
+    条件请求命中时不查询数据库，直接返回 304。
+    多尺寸封面在进程池中生成，304 判断在生成之前完成。
     
     注意：如果书籍没有封面，返回404，由前端处理fallback显示
     """
+    import mimetypes
     from app.utils.cover_manager import cover_manager
-    from sqlalchemy.orm import selectinload
-    
-    # 获取书籍
-    result = await db.execute(
-        select(Book).options(selectinload(Book.author)).where(Book.id == book_id)
-    )
-    book = result.scalar_one_or_none()
+    from app.utils.http_cache import is_not_modified, not_modified
     
-    if not book:
-        raise HTTPException(status_code=404, detail="书籍不存在")
+    cover = await cover_manager.resolve_cover(book_id, db, "original" if w else size)
+    if cover is None:
+        # 没有封面时返回404，让前端显示fallback UI
+        raise HTTPException(status_code=404, detail="该书籍没有封面")
     
-    # 如果有封面路径，返回封面
-    if book.cover_path:
-        cover_path = await cover_manager.get_cover_path(book.id, db, size)
-        if cover_path and Path(cover_path).exists():
-            return FileResponse(
-                cover_path,
-                media_type="image/jpeg"
-            )
+    cache_control = COVER_CACHE_IMMUTABLE if v and v == cover.version else COVER_CACHE_REVALIDATE
     
-    # 没有封面时返回404，让前端显示fallback UI
-    raise HTTPException(status_code=404, detail="该书籍没有封面")
-
-
-def _parse_chapters(content: str) -> list:
-    """
-    解析TXT内容中的章节
+    if w:
+        from app.core.cover_renditions import FORMATS, cover_renditions, negotiate_format, snap_width
+        
+        width = snap_width(w)
+        fmt = negotiate_format(request.headers.get("accept"))
+        etag = f'{cover.etag[:-1]}-w{width}-{fmt}"'
+        headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept"}
+        if is_not_modified(request, etag, cover.mtime):
+            response = not_modified(etag, cache_control)
+            response.headers["Vary"] = "Accept"
+            return response
+        
+        path = await cover_renditions.get(cover.path, cover.version, width, fmt)
+        if path is not None:
+            return FileResponse(path, media_type=FORMATS[fmt][1], headers=headers)
+        # 生成失败时返回原图
     
-    返回章节列表，每个章节包含:
-    - title: 章节标题
-    - startOffset: 起始位置
-    - endOffset: 结束位置
-    """
-    import re
+    if is_not_modified(request, cover.etag, cover.mtime):
+        return not_modified(cover.etag, cache_control)
     
-    max_title_len = 50
-    min_gap = 40
-    strong_patterns = [
-        r'^第[零一二三四五六七八九十百千万亿\d]+[章节卷集部篇回].*$',
-        r'^(正文\s*)?第[零一二三四五六七八九十百千万亿\d]+[章节卷集部篇回].*$',
-        r'^Chapter\s+\d+.*$',
-        r'^卷[零一二三四五六七八九十百千万亿\d]+.*$',
-        r'^(序章|楔子|引子|前言|后记|尾声|番外|终章|大结局).*$',
-        r'^[【\[\(].+[】\]\)]$',
-    ]
-    weak_patterns = [
-        r'^\d{1,4}[\.、]\s*.*$',
-        r'^\d{1,4}\s+.*$',
-    ]
-    inline_strong = re.compile(
-        r'(正文\s*)?第[零一二三四五六七八九十百千万亿\d]+[章节卷集部篇回][^\n]{0,40}',
-        re.IGNORECASE
-    )
-
-    lines = content.split('\n')
-    offsets = []
-    pos = 0
-    for line in lines:
-        offsets.append(pos)
-        pos += len(line) + 1
-
-    candidates = []
-    strong_regexes = [re.compile(p, re.IGNORECASE) for p in strong_patterns]
-    weak_regexes = [re.compile(p, re.IGNORECASE) for p in weak_patterns]
-
-    for i, raw_line in enumerate(lines):
-        line = raw_line.strip()
-        if not line:
-            continue
-
-        prev_blank = i == 0 or not lines[i - 1].strip()
-        next_blank = i == len(lines) - 1 or not lines[i + 1].strip()
-        has_blank_neighbor = prev_blank or next_blank
-
-        found = False
-        is_body_only = line in ('正文', '正文：', '正文:')
-
-        if len(line) <= max_title_len:
-            for pattern in strong_regexes:
-                if pattern.match(line):
-                    candidates.append({
-                        "title": line,
-                        "startOffset": offsets[i],
-                        "strength": 3,
-                        "is_body_only": is_body_only
-                    })
-                    found = True
-                    break
-
-        if not found and len(line) <= max_title_len and has_blank_neighbor:
-            for pattern in weak_regexes:
-                if pattern.match(line):
-                    candidates.append({
-                        "title": line,
-                        "startOffset": offsets[i],
-                        "strength": 1,
-                        "is_body_only": is_body_only
-                    })
-                    found = True
-                    break
-
-        if not found:
-            match = inline_strong.search(line)
-            if match:
-                title = match.group().strip()
-                if len(title) <= max_title_len:
-                    candidates.append({
-                        "title": title,
-                        "startOffset": offsets[i] + match.start(),
-                        "strength": 2,
-                        "is_body_only": False
-                    })
-
-    candidates.sort(key=lambda x: x["startOffset"])
-    filtered = []
-    for cand in candidates:
-        if filtered and cand["startOffset"] - filtered[-1]["startOffset"] <= min_gap:
-            if cand["strength"] > filtered[-1]["strength"]:
-                filtered[-1] = cand
-            continue
-        filtered.append(cand)
-
-    if any(not c.get("is_body_only") for c in filtered):
-        filtered = [c for c in filtered if not c.get("is_body_only")]
-
-    chapters = []
-    total_len = len(content)
-    if not filtered:
-        return [{
-            "title": "全文",
-            "startOffset": 0,
-            "endOffset": total_len
-        }]
-
-    for i, match in enumerate(filtered):
-        end_offset = filtered[i + 1]["startOffset"] if i < len(filtered) - 1 else total_len
-        chapters.append({
-            "title": match["title"],
-            "startOffset": match["startOffset"],
-            "endOffset": end_offset
-        })
-
-    if filtered and filtered[0]["startOffset"] > 100:
-        chapters.insert(0, {
-            "title": "序",
-            "startOffset": 0,
-            "endOffset": filtered[0]["startOffset"]
-        })
-
-    return chapters
-
-
-def _parse_chapters_with_bytes(content: str) -> tuple[list, int]:
-    """
-    解析TXT内容中的章节（包含字节偏移）
-    返回 (章节列表, 总字节数)
-    """
-    import re
-
-    max_title_len = 50
-    min_gap = 40
-    strong_patterns = [
-        r'^第[零一二三四五六七八九十百千万亿\d]+[章节卷集部篇回].*$',
-        r'^(正文\s*)?第[零一二三四五六七八九十百千万亿\d]+[章节卷集部篇回].*$',
-        r'^Chapter\s+\d+.*$',
-        r'^卷[零一二三四五六七八九十百千万亿\d]+.*$',
-        r'^(序章|楔子|引子|前言|后记|尾声|番外|终章|大结局).*$',
-        r'^[【\[\(].+[】\]\)]$',
-    ]
-    weak_patterns = [
-        r'^\d{1,4}[\.、]\s*.*$',
-        r'^\d{1,4}\s+.*$',
-    ]
-    inline_strong = re.compile(
-        r'(正文\s*)?第[零一二三四五六七八九十百千万亿\d]+[章节卷集部篇回][^\n]{0,40}',
-        re.IGNORECASE
+    return FileResponse(
+        cover.path,
+        media_type=mimetypes.guess_type(cover.path)[0] or "image/jpeg",
+        headers={"ETag": cover.etag, "Cache-Control": cache_control}
     )
 
-    lines = content.split('\n')
-    offsets = []
-    byte_offsets = []
-    pos = 0
-    byte_pos = 0
-    for line in lines:
-        offsets.append(pos)
-        byte_offsets.append(byte_pos)
-        pos += len(line) + 1
-        byte_pos += len(line.encode('utf-8')) + 1
-
-    candidates = []
-    strong_regexes = [re.compile(p, re.IGNORECASE) for p in strong_patterns]
-    weak_regexes = [re.compile(p, re.IGNORECASE) for p in weak_patterns]
-
-    for i, raw_line in enumerate(lines):
-        line = raw_line.strip()
-        if not line:
-            continue
-
-        prev_blank = i == 0 or not lines[i - 1].strip()
-        next_blank = i == len(lines) - 1 or not lines[i + 1].strip()
-        has_blank_neighbor = prev_blank or next_blank
-
-        found = False
-        is_body_only = line in ('正文', '正文：', '正文:')
-
-        if len(line) <= max_title_len:
-            for pattern in strong_regexes:
-                if pattern.match(line):
-                    candidates.append({
-                        "title": line,
-                        "startOffset": offsets[i],
-                        "startByte": byte_offsets[i],
-                        "strength": 3,
-                        "is_body_only": is_body_only
-                    })
-                    found = True
-                    break
-
-        if not found and len(line) <= max_title_len and has_blank_neighbor:
-            for pattern in weak_regexes:
-                if pattern.match(line):
-                    candidates.append({
-                        "title": line,
-                        "startOffset": offsets[i],
-                        "startByte": byte_offsets[i],
-                        "strength": 1,
-                        "is_body_only": is_body_only
-                    })
-                    found = True
-                    break
-
-        if not found:
-            match = inline_strong.search(line)
-            if match:
-                title = match.group().strip()
-                if len(title) <= max_title_len:
-                    inline_char_offset = match.start()
-                    inline_byte_offset = len(line[:inline_char_offset].encode('utf-8'))
-                    candidates.append({
-                        "title": title,
-                        "startOffset": offsets[i] + inline_char_offset,
-                        "startByte": byte_offsets[i] + inline_byte_offset,
-                        "strength": 2,
-                        "is_body_only": False
-                    })
-
-    candidates.sort(key=lambda x: x["startOffset"])
-    filtered = []
-    for cand in candidates:
-        if filtered and cand["startOffset"] - filtered[-1]["startOffset"] <= min_gap:
-            if cand["strength"] > filtered[-1]["strength"]:
-                filtered[-1] = cand
-            continue
-        filtered.append(cand)
-
-    if any(not c.get("is_body_only") for c in filtered):
-        filtered = [c for c in filtered if not c.get("is_body_only")]
-
-    chapters = []
-    total_len = len(content)
-    total_bytes = len(content.encode('utf-8'))
-
-    if not filtered:
-        return [{
-            "title": "全文",
-            "startOffset": 0,
-            "endOffset": total_len,
-            "startByte": 0,
-            "endByte": total_bytes
-        }], total_bytes
-
-    for i, match in enumerate(filtered):
-        end_offset = filtered[i + 1]["startOffset"] if i < len(filtered) - 1 else total_len
-        end_byte = filtered[i + 1]["startByte"] if i < len(filtered) - 1 else total_bytes
-        chapters.append({
-            "title": match["title"],
-            "startOffset": match["startOffset"],
-            "endOffset": end_offset,
-            "startByte": match["startByte"],
-            "endByte": end_byte
-        })
-
-    if filtered and filtered[0]["startOffset"] > 100:
-        chapters.insert(0, {
-            "title": "序",
-            "startOffset": 0,
-            "endOffset": filtered[0]["startOffset"],
-            "startByte": 0,
-            "endByte": filtered[0]["startByte"]
-        })
-
-    return chapters, total_bytes
-
 
 def _clean_txt_content(content: str) -> str:
     """
@@ -1748,38 +1707,6 @@ def _clean_txt_content(content: str) -> str:
     return content.strip()
 
 
-def _is_probably_binary_file(file_path: Path, sample_size: int = 8192) -> bool:
-    """
-    根据文件头部字节判断是否为二进制文件
-    """
-    try:
-        with open(file_path, 'rb') as f:
-            sample = f.read(sample_size)
-    except Exception as e:
-        log.warning(f"读取文件样本失败: {file_path}, 错误: {e}")
-        return False
-
-    if not sample:
-        return False
-
-    if sample.startswith(b'\xff\xfe') or sample.startswith(b'\xfe\xff'):
-        return False
-
-    if b'\x00' in sample:
-        even_nulls = sum(1 for i in range(0, len(sample), 2) if sample[i] == 0)
-        odd_nulls = sum(1 for i in range(1, len(sample), 2) if sample[i] == 0)
-        if max(even_nulls, odd_nulls) / max(1, len(sample) // 2) > 0.6:
-            return False
-        return True
-
-    control_bytes = 0
-    for b in sample:
-        if b < 32 and b not in (9, 10, 13):
-            control_bytes += 1
-
-    return (control_bytes / len(sample)) > 0.1
-
-
 async def _get_valid_version(book: Book) -> BookVersion:
     """
     获取书籍的有效版本（优先主版本，其次检查文件是否存在）
@@ -1821,10 +1748,7 @@ async def _get_user_from_token(
     if not username:
         raise credentials_exception
 
-    result = await db.execute(
-        select(User).where(User.username == username)
-    )
-    user = result.scalar_one_or_none()
+    user = await access_context_cache.get_user(db, username)
     if not user:
         raise credentials_exception
 
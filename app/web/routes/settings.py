@@ -13,6 +13,7 @@ from app.web.routes.admin import admin_required
 from app.web.routes.auth import get_current_user
 from app.utils.logger import log
 from app.config import settings as app_settings
+from app.core.chapter_detector import DEFAULT_CHAPTER_SETTINGS, invalidate_chapter_rules
 from app.core.kindle_settings import (
     DEFAULT_KINDLE_SETTINGS,
     load_kindle_settings,
@@ -33,21 +34,7 @@ DEFAULT_SETTINGS = {
     "registration_enabled": False,
     "default_theme": "system",
     "default_cover_size": "medium",
-    "chapter_max_title_length": 50,
-    "chapter_min_gap": 40,
-    "chapter_patterns_strong": [
-        r'^第[零一二三四五六七八九十百千万亿\d]+[章节卷集部篇回].*$',
-        r'^(正文\s*)?第[零一二三四五六七八九十百千万亿\d]+[章节卷集部篇回].*$',
-        r'^Chapter\s+\d+.*$',
-        r'^卷[零一二三四五六七八九十百千万亿\d]+.*$',
-        r'^(序章|楔子|引子|前言|后记|尾声|番外|终章|大结局).*$',
-        r'^[【\[\(].+[】\]\)]$',
-    ],
-    "chapter_patterns_weak": [
-        r'^\d{1,4}[\.、]\s*.*$',
-        r'^\d{1,4}\s+.*$',
-    ],
-    "chapter_inline_pattern": r'(正文\s*)?第[零一二三四五六七八九十百千万亿\d]+[章节卷集部篇回][^\n]{0,40}',
+    **DEFAULT_CHAPTER_SETTINGS,
 }
 
 # Telegram 默认设置
@@ -92,6 +79,7 @@ def save_settings(settings: dict) -> bool:
         SETTINGS_FILE.parent.mkdir(parents=True, exist_ok=True)
         with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
             json.dump(settings, f, ensure_ascii=False, indent=2)
+        invalidate_chapter_rules()
         return True
     except Exception as e:
         log.error(f"保存系统设置失败: {e}")
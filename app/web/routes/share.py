@@ -13,6 +13,7 @@ from app.config import settings
 from app.database import get_db
 from app.models import Book, Favorite, User
 from app.security import create_share_token, decode_share_token
+from app.utils.cover_manager import cover_url
 from app.web.routes.auth import get_current_user
 
 router = APIRouter(prefix="/api/share", tags=["share"])
@@ -86,7 +87,7 @@ async def get_shared_favorites(
             "author_name": book.author.name if book.author else None,
             "file_format": book.file_format,
             "added_at": favorite.created_at.isoformat(),
-            "cover_url": f"/books/{book.id}/cover"
+            "cover_url": cover_url(book.id, book.cover_path)
         })
 
     expires_at: Optional[str] = None
@@ -717,8 +717,11 @@ async def change_password(
             detail="新密码不能与当前密码相同"
         )
 
+    from app.core.credential_cache import opds_credential_cache
+
     current_user.password_hash = hash_password(password_data.new_password)
     await db.commit()
+    opds_credential_cache.invalidate_user(current_user.id)
 
     log.info(f"用户 {current_user.username} 修改了密码")
 
@@ -27,6 +27,7 @@ interface BookResponse {
   file_format: string
   file_size: number
   added_at: string
+  cover_url?: string
 }
 
 interface BooksApiResponse {
@@ -365,7 +366,7 @@ export default function LibraryPage() {
         id: book.id,
         title: book.title,
         author_name: book.author_name,
-        cover_url: `/books/${book.id}/cover`,
+        cover_url: book.cover_url ?? `/books/${book.id}/cover`,
         is_new: false,
         added_at: book.added_at,
         file_format: book.file_format,
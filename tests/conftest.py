@@ -0,0 +1,48 @@
+"""
+测试公共夹具
+"""
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.core.txt_cache_index import scan_checkpoints, write_index
+from app.models import Base
+
+
+@pytest_asyncio.fixture
+async def db_session():
+    """建好全部表的内存数据库会话"""
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        yield session
+    await engine.dispose()
+
+
+@pytest.fixture
+def txt_cache(tmp_path):
+    """写入缓存文本和对应的索引文件，返回 (文本路径, 索引路径)"""
+    text_path = tmp_path / "book.utf8.txt"
+    index_path = tmp_path / "book.index.bin"
+    parts = [f"第{i + 1}章 标题{i + 1}\n" + "正文内容。" * 200 + "\n" for i in range(5)]
+    text = "".join(parts)
+    text_path.write_bytes(text.encode("utf-8"))
+
+    chapters = []
+    offset = 0
+    for i, part in enumerate(parts):
+        chapters.append({
+            "title": f"第{i + 1}章 标题{i + 1}",
+            "startOffset": offset,
+            "endOffset": offset + len(part),
+            "startByte": len(text[:offset].encode("utf-8")),
+            "endByte": len(text[:offset + len(part)].encode("utf-8")),
+        })
+        offset += len(part)
+    assert write_index(
+        index_path, chapters, len(text), len(text.encode("utf-8")),
+        source_size=1, source_mtime_ns=1, encoding="utf-8",
+        checkpoints=scan_checkpoints(text_path),
+    )
+    return text_path, index_path
@@ -0,0 +1,29 @@
+"""
+多尺寸封面测试
+"""
+import pytest
+
+from app.core import cover_renditions
+from app.core.cover_renditions import negotiate_format
+
+
+@pytest.fixture(autouse=True)
+def all_formats(monkeypatch):
+    monkeypatch.setattr(cover_renditions, "SUPPORTED_FORMATS", ["avif", "webp", "jpeg"])
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, "jpeg"),
+    ("*/*", "jpeg"),
+    ("image/*", "jpeg"),
+    ("image/avif,image/webp,image/apng,image/*,*/*;q=0.8", "avif"),
+    ("image/webp,*/*", "webp"),
+    ("image/webp;q=0", "jpeg"),
+    ("image/avif;q=0, image/webp", "webp"),
+    ("image/avif; q=0.0, image/webp;q=0", "jpeg"),
+    ("image/avif;q=0.5,image/webp;q=0.9", "webp"),
+    ("image/jpeg,image/webp;q=0.5", "jpeg"),
+    ("image/webp;q=abc", "jpeg"),
+])
+def test_negotiate_format(accept, expected):
+    assert negotiate_format(accept) == expected
@@ -0,0 +1,73 @@
+"""
+压缩包流式读取测试
+"""
+import hashlib
+import os
+import zipfile
+from pathlib import Path
+
+import py7zr
+import pytest
+
+from app.config import settings
+from app.core.extractor import Extractor
+
+
+@pytest.fixture
+def extractor(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings.directories, "temp", str(tmp_path / "temp"))
+    return Extractor()
+
+
+def test_iter_7z_multi_folder(extractor, tmp_path, monkeypatch):
+    """非固实、多 folder 的 7z：每个成员完整且 Hash 正确（py7zr 不得并行回调）"""
+    # py7zr 按 CPU 数并发解压各 folder，单核环境下会退化为顺序执行
+    monkeypatch.setattr(os, "cpu_count", lambda: 4)
+
+    archive = tmp_path / "multi.7z"
+    expected = {}
+    for i in range(8):
+        data = os.urandom(2 * 1024 * 1024 + i)
+        name = f"books/book{i}.txt"
+        expected[name] = hashlib.new(extractor.hash_algorithm, data).hexdigest()
+        # 每次以追加模式写入，各成员位于独立的 folder
+        with py7zr.SevenZipFile(archive, "a" if archive.exists() else "w") as z:
+            z.writestr(data, name)
+    with py7zr.SevenZipFile(archive, "r") as z:
+        assert z.header.main_streams.unpackinfo.numfolders == 8
+
+    seen = {}
+    for member in extractor.iter_ebook_members(archive, tmp_path / "spill"):
+        assert member.path.stat().st_size == member.file_size
+        seen[member.name] = member.file_hash
+    assert seen == expected
+
+
+def test_iter_7z_stop_early(extractor, tmp_path):
+    """提前结束迭代时解压线程退出，不遗留临时文件"""
+    archive = tmp_path / "books.7z"
+    with py7zr.SevenZipFile(archive, "w") as z:
+        for i in range(3):
+            z.writestr(f"book {i}".encode(), f"book{i}.txt")
+
+    spill_dir = tmp_path / "spill"
+    members = extractor.iter_ebook_members(archive, spill_dir)
+    first = next(members)
+    assert first.path.read_bytes() == b"book 0"
+    members.close()
+    assert not any(p.is_file() for p in spill_dir.rglob("*"))
+
+
+def test_iter_reports_skipped_members(extractor, tmp_path, monkeypatch):
+    """超过大小上限和读取失败的嵌套压缩包记入 skipped"""
+    monkeypatch.setattr(extractor, "max_file_size", 1000)
+    archive = tmp_path / "books.zip"
+    with zipfile.ZipFile(archive, "w") as z:
+        z.writestr("small.txt", b"x" * 10)
+        z.writestr("large.txt", b"x" * 2000)
+        z.writestr("broken.zip", b"not a zip")
+
+    skipped = []
+    names = [m.name for m in extractor.iter_ebook_members(archive, tmp_path / "spill", skipped=skipped)]
+    assert names == ["small.txt"]
+    assert skipped == ["large.txt", "broken.zip"]
@@ -0,0 +1,75 @@
+"""
+阅读进度写回缓冲测试
+"""
+from datetime import datetime, timezone
+
+import pytest
+
+from app.core.db_writer import db_writer
+from app.core.progress_buffer import ProgressBuffer
+from app.models import Author, Book, Library, ReadingProgress, ReadingSession, User
+from app.web.routes import api
+
+
+@pytest.fixture
+def broadcasts(monkeypatch):
+    """替换进度缓冲（不自动写入）并记录广播的消息"""
+    buffer = ProgressBuffer(db_writer, 3600)
+    monkeypatch.setattr(api, "progress_buffer", buffer)
+    sent = []
+
+    async def broadcast_to_user(user_id, message):
+        sent.append(message)
+
+    monkeypatch.setattr(api.manager, "broadcast_to_user", broadcast_to_user)
+    yield sent
+    if buffer._task is not None:
+        buffer._task.cancel()
+
+
+async def _reading_session(db):
+    """已保存进度 0.6 的用户和一个阅读会话"""
+    user = User(username="reader", password_hash="x")
+    library = Library(name="库", path="/books")
+    author = Author(name="作者")
+    db.add_all([user, library, author])
+    await db.flush()
+    book = Book(title="书", library_id=library.id, author_id=author.id)
+    db.add(book)
+    await db.flush()
+    db.add(ReadingProgress(
+        user_id=user.id, book_id=book.id, progress=0.6, position="chapter-5",
+        last_read_at=datetime.now(timezone.utc),
+    ))
+    session = ReadingSession(user_id=user.id, book_id=book.id)
+    db.add(session)
+    await db.commit()
+    return user, session
+
+
+@pytest.mark.asyncio
+async def test_heartbeat_broadcast_keeps_saved_progress(db_session, broadcasts):
+    """心跳只带位置、不带进度时，广播的进度不低于已保存的进度"""
+    user, session = await _reading_session(db_session)
+
+    await api.heartbeat_reading_session(
+        api.ReadingHeartbeat(session_id=session.id, duration_seconds=30, position="chapter-6"),
+        db=db_session, current_user=user,
+    )
+    assert broadcasts[-1]["progress"] == 0.6
+    assert broadcasts[-1]["position"] == "chapter-6"
+
+    # 较低的进度同样不会回退
+    await api.heartbeat_reading_session(
+        api.ReadingHeartbeat(session_id=session.id, duration_seconds=60, progress=0.2),
+        db=db_session, current_user=user,
+    )
+    assert broadcasts[-1]["progress"] == 0.6
+    assert broadcasts[-1]["position"] == "chapter-6"
+
+    assert await api.get_progress(session.book_id, db=db_session, current_user=user) == {
+        "progress": 0.6,
+        "position": "chapter-6",
+        "finished": False,
+        "last_read_at": api.progress_buffer.peek(user.id, session.book_id).last_read_at.isoformat(),
+    }
@@ -0,0 +1,63 @@
+"""
+书库扫描测试
+"""
+import os
+import zipfile
+
+import pytest
+from sqlalchemy import select
+
+from app.config import settings
+from app.core.scanner import Scanner
+from app.models import Book, Library
+
+
+def _write_archive(path, members):
+    with zipfile.ZipFile(path, "w") as z:
+        for name, text in members.items():
+            z.writestr(name, text.encode("utf-8"))
+    # 保证重写后 mtime 变化（清单按 mtime/大小判断压缩包是否变化）
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def _body(word):
+    return "第一章 开始\n" + word * 300 + "\n"
+
+
+async def _titles(db):
+    return sorted((await db.execute(select(Book.title))).scalars())
+
+
+@pytest.mark.asyncio
+async def test_archive_prune_requires_complete_read(db_session, tmp_path, monkeypatch):
+    """压缩包有成员被跳过时不删除旧版本，完整读取后才删除已移除成员的版本"""
+    monkeypatch.setattr(settings.directories, "temp", str(tmp_path / "temp"))
+    library_path = tmp_path / "library"
+    library_path.mkdir()
+    archive = library_path / "pack.zip"
+    _write_archive(archive, {
+        "作者甲 - 书一.txt": _body("一"),
+        "作者乙 - 书二.txt": _body("二"),
+        "作者丙 - 书三.txt": _body("三"),
+    })
+    library = Library(name="书库", path=str(library_path))
+    db_session.add(library)
+    await db_session.commit()
+
+    await Scanner(db_session).scan_library(library.id)
+    assert await _titles(db_session) == ["书一", "书三", "书二"]
+
+    # 书一超过大小上限被跳过、书三被移除：无法确认书一仍在包内，不删除任何旧版本
+    _write_archive(archive, {"作者甲 - 书一.txt": _body("一") * 10, "作者乙 - 书二.txt": _body("二")})
+    monkeypatch.setattr(settings.extractor, "max_file_size", len(_body("二").encode("utf-8")) * 2)
+    stats = await Scanner(db_session).scan_library(library.id)
+    assert stats["removed"] == 0
+    assert await _titles(db_session) == ["书一", "书三", "书二"]
+
+    # 完整读取：书一内容已替换、书三已移除
+    monkeypatch.setattr(settings.extractor, "max_file_size", 100 * 1024 * 1024)
+    _write_archive(archive, {"作者甲 - 书一.txt": _body("一") * 10, "作者乙 - 书二.txt": _body("二")})
+    stats = await Scanner(db_session).scan_library(library.id)
+    assert stats["removed"] > 0
+    assert "书三" not in await _titles(db_session)
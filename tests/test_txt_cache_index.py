@@ -0,0 +1,24 @@
+"""
+TXT 缓存索引测试
+"""
+from app.core.txt_cache_index import open_index
+
+
+def test_open_index_roundtrip(txt_cache):
+    text_path, index_path = txt_cache
+    index = open_index(index_path)
+    assert index is not None
+    assert len(index) == 5
+    assert index.title(2) == "第3章 标题3"
+    with open(text_path, "rb") as f:
+        chapter = index.chapter(3)
+        assert index.byte_offset(f, chapter["startOffset"]) == chapter["startByte"]
+
+
+def test_open_index_truncated(txt_cache):
+    """截断的索引文件返回 None（映射可正常关闭），不抛出 BufferError"""
+    _text_path, index_path = txt_cache
+    data = index_path.read_bytes()
+    for size in range(len(data)):
+        index_path.write_bytes(data[:size])
+        assert open_index(index_path) is None, size
@@ -0,0 +1,31 @@
+"""
+TXT 章节预压缩测试
+"""
+import gzip
+
+from app.core.txt_cache_index import open_index
+from app.core.txt_chapter_blobs import blob_path, chapter_body_span, get_blobs, write_blobs
+
+
+def test_get_blobs_roundtrip(txt_cache):
+    text_path, index_path = txt_cache
+    index = open_index(index_path)
+    write_blobs(text_path, index)
+    blobs = get_blobs(text_path, index, "gzip")
+    assert blobs is not None
+    text = index.text_map(text_path)
+    for i in range(len(index)):
+        start, end = chapter_body_span(text, index, i)
+        assert gzip.decompress(blobs.get(i)) == text[start:end]
+
+
+def test_get_blobs_truncated(txt_cache):
+    """截断的预压缩文件返回 None（映射可正常关闭），不抛出 BufferError"""
+    text_path, index_path = txt_cache
+    index = open_index(index_path)
+    write_blobs(text_path, index)
+    path = blob_path(text_path, "gzip")
+    data = path.read_bytes()
+    for size in range(len(data)):
+        path.write_bytes(data[:size])
+        assert get_blobs(text_path, index, "gzip") is None, size
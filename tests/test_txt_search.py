@@ -0,0 +1,39 @@
+"""
+TXT 书内全文索引测试
+"""
+import random
+import re
+
+from app.core import txt_search
+
+
+def _count(text, keyword):
+    return len(re.findall(re.escape(keyword), text, re.IGNORECASE))
+
+
+def test_search_matches_across_utf8_cut_blocks(tmp_path, monkeypatch):
+    """没有换行的文本按 UTF-8 字符边界切块，跨块边界的匹配不遗漏"""
+    monkeypatch.setattr(txt_search, "BLOCK_BYTES", 64)
+    text_path = tmp_path / "book.utf8.txt"
+    # 每块 21 个汉字：关键词横跨第一、二块
+    text = "一" * 19 + "山高水长" + "一" * 40
+    text_path.write_bytes(text.encode("utf-8"))
+
+    total, matches = txt_search.search_text(text_path, "山高水长", 0, 10)
+    assert total == 1
+    assert matches[0]["position"] == 19
+    assert matches[0]["byte"] == 19 * 3
+
+
+def test_search_counts_match_full_scan(tmp_path, monkeypatch):
+    """小块、长段落的随机文本：命中数与整本扫描一致"""
+    monkeypatch.setattr(txt_search, "BLOCK_BYTES", 256)
+    rng = random.Random(7)
+    text_path = tmp_path / "book.utf8.txt"
+    lines = ["".join(rng.choice("天地玄黄宇宙洪荒") for _ in range(rng.randint(50, 400))) for _ in range(40)]
+    text = "\n".join(lines)
+    text_path.write_bytes(text.encode("utf-8"))
+
+    for keyword in ("天地", "玄黄宇", "宇宙洪荒", "洪荒天地玄"):
+        total, _matches = txt_search.search_text(text_path, keyword, 0, 1)
+        assert total == _count(text, keyword), keyword
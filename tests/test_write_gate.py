@@ -0,0 +1,109 @@
+"""
+写事务闸门测试
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import database
+from app.core import background_scanner, scan_manifest
+from app.core.background_scanner import BackgroundScanner
+from app.database import WriteGate
+from app.models import Author, Base, Book, BookVersion, Library, ScanTask, User
+
+
+@pytest_asyncio.fixture
+async def gated_engine(tmp_path, monkeypatch):
+    """文件数据库作为写引擎（写闸门只对写引擎生效）"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'library.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(database, "write_gate", WriteGate(3.0))
+    yield engine
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_web_write_proceeds_during_scan(gated_engine, tmp_path, monkeypatch):
+    """扫描等待解析结果期间，Web 写入不被清单补录占用的写闸门阻塞"""
+    library_path = tmp_path / "library"
+    library_path.mkdir()
+    known = library_path / "known.txt"
+    known.write_text("已入库", encoding="utf-8")
+    (library_path / "new.txt").write_text("新书", encoding="utf-8")
+
+    sessions = async_sessionmaker(gated_engine, expire_on_commit=False)
+    async with sessions() as db:
+        library = Library(name="书库", path=str(library_path))
+        author = Author(name="作者")
+        db.add_all([library, author])
+        await db.flush()
+        book = Book(title="已入库", library_id=library.id, author_id=author.id)
+        db.add(book)
+        await db.flush()
+        # 缺少 mtime 的旧记录：重新扫描时补录（BACKFILL）
+        db.add(BookVersion(
+            book_id=book.id, file_path=scan_manifest.manifest_path(known), file_name=known.name,
+            file_format=".txt", file_size=known.stat().st_size, is_primary=True,
+        ))
+        task = ScanTask(library_id=library.id, status="running")
+        db.add(task)
+        await db.commit()
+        library_id, task_id = library.id, task.id
+
+    backfilled = asyncio.Event()
+    record_stat = scan_manifest.record_stat
+
+    async def recording_record_stat(*args, **kwargs):
+        await record_stat(*args, **kwargs)
+        backfilled.set()
+
+    monkeypatch.setattr(scan_manifest, "record_stat", recording_record_stat)
+
+    web_write_seconds = []
+
+    async def web_write():
+        started = time.monotonic()
+        async with sessions() as db:
+            db.add(User(username="web", password_hash="x"))
+            await db.commit()
+        web_write_seconds.append(time.monotonic() - started)
+
+    class SlowPool:
+        """解析进行中时发起一次 Web 写入，等待其完成后才返回解析结果"""
+        workers = 1
+
+        def __init__(self, *args):
+            pass
+
+        async def process(self, file_path):
+            await backfilled.wait()
+            await asyncio.wait([asyncio.ensure_future(web_write())], timeout=2)
+            return {
+                "path": str(file_path), "metadata": None, "pattern_stats": {},
+                "error": "解析失败", "error_type": "Error",
+            }
+
+        def shutdown(self):
+            pass
+
+    monkeypatch.setattr(background_scanner, "ScanWorkerPool", SlowPool)
+
+    async def update_pattern_stats():
+        pass
+
+    scanner = BackgroundScanner()
+    scanner.txt_parser = SimpleNamespace(
+        custom_patterns=[], pattern_stats={}, update_pattern_stats=update_pattern_stats
+    )
+    async with sessions() as db:
+        task = await db.get(ScanTask, task_id)
+        await scanner._scan_library_optimized(task, library_id, db)
+        assert task.unchanged_files == 1
+
+    assert web_write_seconds and web_write_seconds[0] < 1